@@ -0,0 +1,52 @@
+import argparse
+import json
+import os
+from modules.config import Config
+from modules.services.batch_runner import (
+    BatchRunner, LocalBatchBackend, OpenAIBatchBackend, iter_directory, iter_manifest,
+)
+from modules.services.embedding_service import EmbeddingService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Label and embed a directory or a JSON-lines manifest of documents.")
+    parser.add_argument("source", help="Directory of documents or JSON-lines manifest.")
+    parser.add_argument("--job-dir", help="Directory for the checkpoint and the report. Reuse it to resume a job.")
+    parser.add_argument("--output-dir", help="Directory receiving one JSON file per document.")
+    parser.add_argument("--workers", type=int, default=Config.BATCH_JOB_WORKERS)
+    parser.add_argument("--pattern", default=r".*\.txt$", help="File name pattern when the source is a directory.")
+    parser.add_argument("--id-field", default="id", help="Manifest field holding the document id.")
+    parser.add_argument("--text-field", default="text", help="Manifest field holding inline text.")
+    parser.add_argument("--path-field", default="path", help="Manifest field holding a file path.")
+    parser.add_argument("--batch-api", choices=["none", "local", "openai"], default="none",
+                        help="Send labels and embeddings through a batch backend instead of the worker pool.")
+    parser.add_argument("--window", type=int, default=1000, help="Documents per batch with --batch-api.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    Config.configure_logging()
+    if os.path.isdir(args.source):
+        items = iter_directory(args.source, args.pattern)
+    else:
+        items = iter_manifest(args.source, args.id_field, args.text_field, args.path_field)
+
+    job_name = os.path.splitext(os.path.basename(os.path.normpath(args.source)))[0]
+    job_dir = args.job_dir or os.path.join(Config.BATCH_JOB_DIR, job_name)
+    backend = {"none": None, "local": LocalBatchBackend, "openai": OpenAIBatchBackend}[args.batch_api]
+
+    service = EmbeddingService()
+    try:
+        runner = BatchRunner(
+            service, job_dir, workers=args.workers, output_dir=args.output_dir,
+            backend=backend() if backend else None, window=args.window,
+        )
+        report = runner.run(items)
+    finally:
+        service.close()
+    print(json.dumps(report.to_dict(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
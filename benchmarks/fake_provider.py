@@ -0,0 +1,248 @@
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from modules.config import Config
+from modules.services.provider import openai
+
+DEFINITION_TEMPLATE = {
+    "collection_name": "BenchmarkCollection",
+    "partition_name": "BenchmarkPartition",
+    "description": "Synthetic definition returned by the fake provider.",
+    "dimension": 1536,
+    "metric_type": "cosine",
+}
+
+
+class FakeProvider:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=500, dimension=1536,
+                 host="127.0.0.1", port=0, seed=0):
+        """
+        Initializes a local stand-in for the OpenAI chat-completion and embedding endpoints.
+
+        Responses are deterministic for a given input: embeddings are unit vectors
+        seeded from a hash of the text and definitions are a fixed template. Every
+        request waits `latency_ms` plus up to `jitter_ms` in either direction, and
+        a share `error_rate` of requests fails with `error_status`.
+
+        Args:
+            latency_ms (float): Mean added latency per request in milliseconds.
+            jitter_ms (float): Maximum deviation from the mean latency.
+            error_rate (float): Probability that a request fails.
+            error_status (int): HTTP status of injected failures, e.g. 429 or 500.
+            dimension (int): Length of the returned embeddings.
+            host (str): Address to bind.
+            port (int): Port to listen on; 0 picks a free port.
+            seed (int): Seed for the latency jitter and the injected failures.
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.dimension = dimension
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self.inputs = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """Base URL to use as OPENAI_API_BASE."""
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        """
+        Starts serving from a daemon thread.
+
+        Returns:
+            FakeProvider: The started provider.
+        """
+        provider = self
+
+        class Handler(_ProviderHandler):
+            pass
+        Handler.provider = provider
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name="fake-provider", daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @contextmanager
+    def configured(self, api_key="benchmark"):
+        """
+        Points the in-process provider client at this server for the duration of the block.
+
+        The API key is only replaced when none is configured, so labelers and
+        embedders built inside the block work offline. Server processes started
+        by load.py get the same settings through their environment instead.
+
+        Args:
+            api_key (str): Placeholder key used when OPENAI_API_KEY is not set.
+
+        Yields:
+            FakeProvider: The provider.
+        """
+        client = openai.load()
+        saved = Config.OPENAI_API_KEY, client.api_key, client.api_base
+        Config.OPENAI_API_KEY = Config.OPENAI_API_KEY or api_key
+        client.api_key, client.api_base = Config.OPENAI_API_KEY, self.url
+        try:
+            yield self
+        finally:
+            Config.OPENAI_API_KEY, client.api_key, client.api_base = saved
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        """
+        Returns the request counters.
+
+        Returns:
+            dict: Requests served, injected errors and embedded inputs.
+        """
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "inputs": self.inputs}
+
+    def _next_delay_and_failure(self):
+        """Draw this request's latency and whether it fails."""
+        with self._lock:
+            self.requests += 1
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return max(0.0, self.latency_ms + jitter) / 1000, failed
+
+    def embed(self, text):
+        """
+        Returns the deterministic embedding of a text.
+
+        Args:
+            text (str): The input text.
+
+        Returns:
+            list: A unit vector of `dimension` floats.
+        """
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        vector = rng.standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embeddings_response(self, body):
+        """Build the body of a /v1/embeddings response."""
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with self._lock:
+            self.inputs += len(inputs)
+        tokens = sum(len(str(text).split()) for text in inputs)
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": self.embed(str(text))}
+                     for i, text in enumerate(inputs)],
+            "model": body.get("model", ""),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def chat_response(self, body):
+        """Build the body of a /v1/chat/completions response."""
+        prompt = " ".join(message.get("content", "") for message in body.get("messages", []))
+        content = json.dumps(dict(DEFINITION_TEMPLATE, dimension=self.dimension), indent=2)
+        prompt_tokens, completion_tokens = len(prompt.split()), len(content.split())
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+class _ProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive like the real API
+    provider = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/embeddings"):
+            build = self.provider.embeddings_response
+        elif path.endswith("/chat/completions"):
+            build = self.provider.chat_response
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {path}", "type": "invalid_request_error"}})
+            return
+
+        delay, failed = self.provider._next_delay_and_failure()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            status = self.provider.error_status
+            error_type = "requests" if status == 429 else "server_error"
+            self._send_json(status, {"error": {"message": "Injected failure.", "type": error_type, "code": None}})
+            return
+        self._send_json(200, build(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI-compatible API for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=1536)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    provider = FakeProvider(
+        args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.dimension, args.host, args.port
+    ).start()
+    print(f"Fake provider listening at {provider.url}.")
+    print("Set OPENAI_API_BASE to this URL and OPENAI_API_KEY to any value.")
+    try:
+        while True:
+            time.sleep(86400)
+    except KeyboardInterrupt:
+        provider.stop()
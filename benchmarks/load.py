@@ -0,0 +1,387 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent import futures
+import grpc
+import numpy as np
+from benchmarks.fake_provider import FakeProvider
+from modules.proto.embedding import embedding_buffer_pb2, embedding_buffer_pb2_grpc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENCODINGS = {
+    "json": embedding_buffer_pb2.JSON,
+    "float32": embedding_buffer_pb2.FLOAT32,
+    "float16": embedding_buffer_pb2.FLOAT16,
+    "int8": embedding_buffer_pb2.INT8,
+}
+WORDS = (
+    "the river village clock maker seed king lantern bridge storm harbor garden market winter summer "
+    "child teacher road mountain forest light shadow music letter window stone bread silver golden "
+    "quiet bright ancient small brave wise kind careful hidden open"
+).split()
+
+
+def free_port():
+    """Ask the OS for a port that is free right now."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_document(index, words, rng):
+    """
+    Builds a synthetic document of roughly `words` words that no other index produces.
+
+    Args:
+        index (int): Document number, embedded in the text to keep documents distinct.
+        words (int): Number of words.
+        rng (random.Random): Source of the word choices.
+
+    Returns:
+        bytes: The UTF-8 document.
+    """
+    sentences, sentence = [f"Document {index}."], []
+    for _ in range(max(1, words)):
+        sentence.append(rng.choice(WORDS))
+        if len(sentence) >= 12:
+            sentences.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+    if sentence:
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(sentences).encode("utf-8")
+
+
+def build_workload(requests, doc_words, hit_ratio, hot_documents=16, seed=0):
+    """
+    Builds the documents to send: a warm-up set, then requests hitting it at `hit_ratio`.
+
+    Args:
+        requests (int): Number of timed requests.
+        doc_words (int): Words per document.
+        hit_ratio (float): Share of timed requests that repeat a warmed-up document.
+        hot_documents (int): Number of documents sent once before timing starts.
+        seed (int): Seed for the document text and the hit pattern.
+
+    Returns:
+        tuple: The warm-up documents and the timed documents.
+    """
+    rng = random.Random(seed)
+    hot = [make_document(i, doc_words, rng) for i in range(hot_documents if hit_ratio > 0 else 0)]
+    timed = []
+    for i in range(requests):
+        if hot and rng.random() < hit_ratio:
+            timed.append(rng.choice(hot))
+        else:
+            timed.append(make_document(hot_documents + i, doc_words, rng))
+    return hot, timed
+
+
+def percentiles(latencies):
+    """
+    Summarizes latencies in seconds as milliseconds.
+
+    Args:
+        latencies (list): Latencies in seconds.
+
+    Returns:
+        dict: Mean, p50, p90, p99 and max in milliseconds.
+    """
+    if not latencies:
+        return {}
+    values = np.asarray(latencies) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(p50), 3),
+        "p90": round(float(p90), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def process_memory(pid):
+    """
+    Reads the resident memory of a process from /proc.
+
+    Args:
+        pid (int): Process id.
+
+    Returns:
+        dict: Current and peak resident memory in MiB, or an empty dict where /proc is unavailable.
+    """
+    fields = {"VmRSS": "rss_mb", "VmHWM": "peak_rss_mb"}
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status", "r") as status:
+            for line in status:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+
+def client_peak_memory():
+    """Peak resident memory of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class ServerProcess:
+    def __init__(self, provider_url, port=None, store_dir=None, env=None, log_path=None):
+        """
+        Runs `main.serve` in a child process pointed at a provider URL.
+
+        The child inherits the environment, so SERVER_MODE, LABEL_MODE, BATCHING_ENABLED
+        and the other settings select the configuration under test.
+
+        Args:
+            provider_url (str): Base URL of the OpenAI-compatible API.
+            port (int): gRPC port; a free one is picked by default.
+            store_dir (str): Vector store directory; a temporary one is used by default.
+            env (dict): Extra environment variables for the server.
+            log_path (str): File receiving the server's output; it is discarded by default.
+        """
+        self.provider_url = provider_url
+        self.port = port or free_port()
+        self._own_store = store_dir is None
+        self.store_dir = store_dir or tempfile.mkdtemp(prefix="bench-store-")
+        self.env = env or {}
+        self.log_path = log_path
+        self.process = None
+
+    @property
+    def target(self):
+        return f"127.0.0.1:{self.port}"
+
+    def start(self, timeout=30):
+        """Start the server and wait until it accepts connections."""
+        env = dict(os.environ)
+        env.setdefault("OPENAI_API_KEY", "benchmark")
+        env.setdefault("LOG_LEVEL", "WARNING")
+        env.update({
+            "OPENAI_API_BASE": self.provider_url,
+            "STREAM_SERVICE_PORT": str(self.port),
+            "VECTOR_STORE_DIR": self.store_dir,
+            "METRICS_PORT": "0",
+        })
+        env.update(self.env)
+        output = open(self.log_path, "ab") if self.log_path else subprocess.DEVNULL
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-c", "import main; main.serve()"], cwd=REPO_ROOT, env=env,
+                stdout=output, stderr=output,
+            )
+        finally:
+            if self.log_path:
+                output.close()
+        with grpc.insecure_channel(self.target) as channel:
+            try:
+                grpc.channel_ready_future(channel).result(timeout=timeout)
+            except grpc.FutureTimeoutError:
+                exit_code = self.process.poll()
+                self.stop()
+                state = f"exited with code {exit_code}" if exit_code is not None else "is not listening"
+                raise RuntimeError(f"The server {state} after {timeout}s; see --server-log for its output.")
+        return self
+
+    def memory(self):
+        """Current and peak resident memory of the server."""
+        return process_memory(self.process.pid) if self.process is not None else {}
+
+    def stop(self, timeout=10):
+        """Stop the server the way Ctrl-C would, killing it if it does not exit."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        if self._own_store:
+            shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _send(stub, document, index, rpc, encoding, timeout):
+    """Send one document and read every response."""
+    name = f"doc-{index}.txt"
+    if rpc == "upload":
+        chunks = iter([embedding_buffer_pb2.Chunk(file_name=name, data=document, encoding=encoding)])
+        responses = stub.UploadEmbedding(chunks, timeout=timeout)
+    else:
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name=name, file_stream=document, encoding=encoding)
+        responses = stub.StreamEmbedding(request, timeout=timeout)
+    return sum(1 for _ in responses)
+
+
+def drive(target, documents, concurrency, rpc="stream", encoding=embedding_buffer_pb2.JSON, timeout=60):
+    """
+    Sends documents to a server from `concurrency` threads and times each RPC.
+
+    Args:
+        target (str): Server address.
+        documents (list): Documents to send, in order.
+        concurrency (int): Number of requests in flight.
+        rpc (str): "stream" for StreamEmbedding or "upload" for UploadEmbedding.
+        encoding (int): Vector encoding requested from the server.
+        timeout (float): Deadline of each RPC in seconds.
+
+    Returns:
+        dict: Latencies of the successful requests, error counts by status code and wall time.
+    """
+    latencies, errors = [], {}
+    lock = threading.Lock()
+
+    with grpc.insecure_channel(target) as channel:
+        stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(channel)
+
+        def run(index, document):
+            start = time.perf_counter()
+            try:
+                _send(stub, document, index, rpc, encoding, timeout)
+            except grpc.RpcError as e:
+                with lock:
+                    errors[e.code().name] = errors.get(e.code().name, 0) + 1
+                return
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+        started = time.perf_counter()
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, range(len(documents)), documents))
+        wall = time.perf_counter() - started
+    return {"latencies": latencies, "errors": errors, "elapsed": wall}
+
+
+def run_benchmark(requests=200, concurrency=8, doc_words=300, hit_ratio=0.0, hot_documents=16, rpc="stream",
+                  encoding="json", latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=500,
+                  dimension=1536, target=None, server_env=None, server_log=None, seed=0):
+    """
+    Runs one load benchmark of the full gRPC path and reports the results.
+
+    Unless a `target` is given, a fake provider and a `main.serve` process are
+    started for the run and stopped afterwards.
+
+    Args:
+        requests (int): Number of timed requests.
+        concurrency (int): Number of requests in flight.
+        doc_words (int): Words per document.
+        hit_ratio (float): Share of timed requests repeating an already cached document.
+        hot_documents (int): Documents sent before timing to make cache hits possible.
+        rpc (str): "stream" or "upload".
+        encoding (str): "json", "float32", "float16" or "int8".
+        latency_ms (float): Latency added by the fake provider.
+        jitter_ms (float): Jitter of the fake provider latency.
+        error_rate (float): Share of fake provider requests that fail.
+        error_status (int): HTTP status of the injected failures.
+        dimension (int): Embedding length returned by the fake provider.
+        target (str): Address of an already running server to benchmark instead.
+        server_env (dict): Extra environment variables for the started server.
+        server_log (str): File receiving the started server's output.
+        seed (int): Seed for the workload.
+
+    Returns:
+        dict: The report.
+    """
+    hot, timed = build_workload(requests, doc_words, hit_ratio, hot_documents, seed)
+    encoding_value = ENCODINGS[encoding]
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "doc_words": doc_words,
+        "hit_ratio": hit_ratio,
+        "rpc": rpc,
+        "encoding": encoding,
+    }
+
+    provider = server = None
+    try:
+        if target is None:
+            provider = FakeProvider(latency_ms, jitter_ms, error_rate, error_status, dimension).start()
+            server = ServerProcess(provider.url, env=server_env, log_path=server_log).start()
+            target = server.target
+        if hot:
+            drive(target, hot, concurrency, rpc, encoding_value)
+        result = drive(target, timed, concurrency, rpc, encoding_value)
+
+        succeeded = len(result["latencies"])
+        report.update({
+            "succeeded": succeeded,
+            "errors": result["errors"],
+            "elapsed_seconds": round(result["elapsed"], 3),
+            "throughput_rps": round(succeeded / result["elapsed"], 2) if result["elapsed"] else 0.0,
+            "latency_ms": percentiles(result["latencies"]),
+            "client_peak_rss_mb": client_peak_memory(),
+        })
+        if server is not None:
+            report["server_memory"] = server.memory()
+        if provider is not None:
+            report["provider"] = provider.stats()
+    finally:
+        if server is not None:
+            server.stop()
+        if provider is not None:
+            provider.stop()
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the gRPC service against a fake provider.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8],
+                        help="One or more concurrency levels; each level is a separate run.")
+    parser.add_argument("--doc-words", type=int, default=300)
+    parser.add_argument("--hit-ratio", type=float, default=0.0)
+    parser.add_argument("--hot-documents", type=int, default=16)
+    parser.add_argument("--rpc", choices=["stream", "upload"], default="stream")
+    parser.add_argument("--encoding", choices=sorted(ENCODINGS), default="json")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latency added by the fake provider.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--target", help="Benchmark a running server at host:port instead of starting one.")
+    parser.add_argument("--server-log", help="Append the started server's output to this file.")
+    parser.add_argument("--output", help="Also write the reports to this JSON file.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    reports = []
+    for concurrency in args.concurrency:
+        report = run_benchmark(
+            requests=args.requests, concurrency=concurrency, doc_words=args.doc_words, hit_ratio=args.hit_ratio,
+            hot_documents=args.hot_documents, rpc=args.rpc, encoding=args.encoding, latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms, error_rate=args.error_rate, error_status=args.error_status,
+            dimension=args.dimension, target=args.target, server_log=args.server_log,
+        )
+        print(json.dumps(report, indent=4))
+        reports.append(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import timeit
+import numpy as np
+from modules.proto.embedding.embedding_buffer_pb2 import FLOAT32, INT8
+from modules.services.cache import EmbeddingCache
+from modules.storage import VectorStore
+from modules.template import EmbeddingJSONTemplate, EmbeddingRecord
+
+DEFINITION = json.dumps({
+    "collection_name": "BenchmarkCollection",
+    "partition_name": "BenchmarkPartition",
+    "description": "A definition used by the serialization benchmarks.",
+    "dimension": 1536,
+    "metric_type": "cosine",
+})
+
+
+def measure(function, repeat=5, min_time=0.2):
+    """
+    Times a function like `timeit`, scaling the loop count until one run takes `min_time`.
+
+    Args:
+        function (callable): The operation to time.
+        repeat (int): Number of timed runs; the fastest is reported.
+        min_time (float): Minimum duration of one run in seconds.
+
+    Returns:
+        dict: Microseconds per call of the fastest run and the matching calls per second.
+    """
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"us_per_op": round(best * 1e6, 3), "ops_per_sec": round(1 / best, 1)}
+
+
+def _record(dimension, chunks, rng):
+    """A record with `chunks` chunk embeddings plus a pooled embedding, or a single embedding."""
+    embedding = rng.standard_normal(dimension).astype(np.float32).tolist()
+    if not chunks:
+        return EmbeddingRecord(DEFINITION, embedding)
+    chunk_embeddings = [rng.standard_normal(dimension).astype(np.float32).tolist() for _ in range(chunks)]
+    chunk_dicts = [{"start": i * 100, "end": (i + 1) * 100, "tokens": 512} for i in range(chunks)]
+    return EmbeddingRecord(DEFINITION, embedding, chunk_dicts, chunk_embeddings, chunk_embeddings[0])
+
+
+def run_microbenchmarks(dimension=1536, chunks=16, repeat=5, min_time=0.2, seed=0):
+    """
+    Times the serialization and cache-read paths of one request.
+
+    Args:
+        dimension (int): Embedding length.
+        chunks (int): Chunks in the chunked-record cases.
+        repeat (int): Timed runs per case.
+        min_time (float): Minimum duration of one run in seconds.
+        seed (int): Seed for the vectors.
+
+    Returns:
+        dict: Timings by case name.
+    """
+    rng = np.random.default_rng(seed)
+    single = _record(dimension, 0, rng)
+    chunked = _record(dimension, chunks, rng)
+    cases = {
+        "json_template.to_json": lambda: EmbeddingJSONTemplate(DEFINITION, single.embedding).to_json(),
+        f"record.to_json[{chunks} chunks]": chunked.to_json,
+        "record.to_response[float32]": lambda: single.to_response(FLOAT32),
+        f"record.to_response[float32, {chunks} chunks]": lambda: chunked.to_response(FLOAT32),
+        "record.to_response[int8]": lambda: single.to_response(INT8),
+    }
+
+    store_dir = tempfile.mkdtemp(prefix="bench-cache-")
+    try:
+        cache = EmbeddingCache(store=VectorStore(store_dir))
+        cache.put("single", single)
+        cache.put("chunked", chunked)
+        # A cache without a memory tier reads every record back from the memory-mapped store
+        disk_cache = EmbeddingCache(store=cache.store, max_memory_items=0)
+        cases.update({
+            "cache.get[memory]": lambda: cache.get("single"),
+            "cache.get[disk]": lambda: disk_cache.get("single"),
+            f"cache.get[disk, {chunks} chunks]": lambda: disk_cache.get("chunked"),
+            "cache.get[miss]": lambda: cache.get("missing"),
+        })
+        return {name: measure(function, repeat, min_time) for name, function in cases.items()}
+    finally:
+        shutil.rmtree(store_dir)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lists the cases that got slower than a saved baseline by more than `tolerance`.
+
+    Args:
+        results (dict): Timings from `run_microbenchmarks`.
+        baseline (dict): Timings saved from an earlier run.
+        tolerance (float): Allowed slowdown, e.g. 0.25 for 25%.
+
+    Returns:
+        list: (case, baseline us/op, current us/op) for every regression.
+    """
+    regressions = []
+    for name, timing in results.items():
+        reference = baseline.get(name)
+        if reference and timing["us_per_op"] > reference["us_per_op"] * (1 + tolerance):
+            regressions.append((name, reference["us_per_op"], timing["us_per_op"]))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmark serialization and cache reads.")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--chunks", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timed run.")
+    parser.add_argument("--save", help="Write the timings to this JSON file, e.g. to use as a baseline.")
+    parser.add_argument("--baseline", help="Compare against timings saved with --save.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_microbenchmarks(args.dimension, args.chunks, args.repeat, args.min_time)
+    print(json.dumps(results, indent=4))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for name, before, after in regressions:
+            print(f"Regression in {name}: {before} -> {after} us/op", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
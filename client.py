@@ -1,31 +1,169 @@
+import itertools
 import os
+import threading
 import grpc
 import modules.proto.embedding.embedding_buffer_pb2 as embedding_pb2
 import modules.proto.embedding.embedding_buffer_pb2_grpc as embedding_pb2_grpc
+from modules.config import Config
+from modules.template.binary_template import decode_definition, decode_vectors
+
+class ChannelPool:
+    def __init__(self, target=None, size=None):
+        """
+        Keeps a fixed set of open channels to one server and hands them out in turn.
+
+        Opening a channel costs a TCP and HTTP/2 handshake, so channels are reused
+        across calls instead of being created per request. Each channel has its own
+        connection, which spreads concurrent streams over several connections.
+
+        Args:
+            target (str): Server address. Defaults to STREAM_SERVICE_HOST:STREAM_SERVICE_PORT.
+            size (int): Number of channels. Defaults to CLIENT_CHANNELS.
+        """
+        self.target = target or f"{Config.STREAM_SERVICE_HOST}:{Config.STREAM_SERVICE_PORT}"
+        self.size = size or Config.CLIENT_CHANNELS
+        # A local subchannel pool stops gRPC from sharing one connection between the channels
+        self._channels = [
+            grpc.insecure_channel(self.target, options=[("grpc.use_local_subchannel_pool", 1)])
+            for _ in range(self.size)
+        ]
+        self._next = itertools.cycle(range(self.size))
+        self._lock = threading.Lock()
+
+    def channel(self):
+        """
+        Returns the next channel of the pool.
+
+        Returns:
+            grpc.Channel: An open channel.
+        """
+        with self._lock:
+            return self._channels[next(self._next)]
+
+    def stub(self):
+        """
+        Returns a stub on the next channel of the pool.
+
+        Returns:
+            EmbeddingServiceStub: The stub.
+        """
+        return embedding_pb2_grpc.EmbeddingServiceStub(self.channel())
+
+    def close(self):
+        """Closes every channel."""
+        for channel in self._channels:
+            channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_channel_pool(target=None):
+    """Return the process-wide channel pool for a server address."""
+    target = target or f"{Config.STREAM_SERVICE_HOST}:{Config.STREAM_SERVICE_PORT}"
+    with _pools_lock:
+        if target not in _pools:
+            _pools[target] = ChannelPool(target)
+        return _pools[target]
 
 def get_file_stream(file_path):
     """Read the file and return its content as bytes."""
     with open(file_path, "rb") as file:
         return file.read()
 
-def get_json_stream(file_path, file_stream):
+def print_response(response):
+    """Print a response, unpacking the vectors when a binary encoding was requested."""
+    print(f"Received {response.stage or 'complete'} response from server.")
+    if response.json_stream:
+        print("JSON stream:", response.json_stream)
+        return
+    if response.HasField("definition"):
+        print("Definition:", decode_definition(response.definition))
+    if response.HasField("vectors"):
+        vectors = decode_vectors(response.vectors)
+        print(f"Vectors: {vectors.shape[0]} x {vectors.shape[1]} ({len(response.vectors.data)} bytes)")
+
+def iter_file_chunks(file_path, chunk_size=None, encoding=embedding_pb2.JSON):
+    """Read the file in chunks and yield them as upload messages."""
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    file_name = os.path.basename(file_path)
+    with open(file_path, "rb") as file:
+        while True:
+            data = file.read(chunk_size)
+            if not data:
+                break
+            # Only the first chunk needs to carry the file name
+            yield embedding_pb2.Chunk(file_name=file_name, data=data, encoding=encoding)
+            file_name = ""
+
+def get_json_stream(file_path, file_stream, encoding=embedding_pb2.JSON):
     """Send the file stream and file name via gRPC."""
     try:
-        with grpc.insecure_channel('localhost:50051') as channel:
-            stub = embedding_pb2_grpc.EmbeddingServiceStub(channel)
-            file_name = os.path.basename(file_path)
-            request = embedding_pb2.EmbeddingRequest(file_name=file_name, file_stream=file_stream)
-            response_iterator = stub.StreamEmbedding(request)
+        stub = get_channel_pool().stub()
+        file_name = os.path.basename(file_path)
+        request = embedding_pb2.EmbeddingRequest(file_name=file_name, file_stream=file_stream, encoding=encoding)
+        response_iterator = stub.StreamEmbedding(request)
 
-            for response in response_iterator:
-                print("Received response from server.")
-                print("JSON stream:", response.json_stream)
+        for response in response_iterator:
+            print_response(response)
+
+    except grpc.RpcError as e:
+        print(f"gRPC Error: {e.code()} - {e.details()}")
+
+def upload_json_stream(file_path, chunk_size=None, encoding=embedding_pb2.JSON):
+    """Upload the file in chunks via gRPC so it is never held in memory whole."""
+    try:
+        stub = get_channel_pool().stub()
+        response_iterator = stub.UploadEmbedding(iter_file_chunks(file_path, chunk_size, encoding))
+
+        for response in response_iterator:
+            print_response(response)
+
+    except grpc.RpcError as e:
+        print(f"gRPC Error: {e.code()} - {e.details()}")
+
+def embed_stream(documents, encoding=embedding_pb2.JSON, pool=None):
+    """
+    Sends many documents over one EmbedStream call and yields the results as they finish.
+
+    Documents are read from the iterable lazily, so a continuous source can be fed
+    in; the server stops reading when it has enough documents in progress.
+
+    Args:
+        documents (iterable): (id, file_name, content) tuples, with the content as bytes.
+        encoding (int): Encoding of the returned vectors.
+        pool (ChannelPool): Pool to take the channel from. Defaults to the shared pool.
+
+    Yields:
+        DocumentResponse: One or more responses per document, in completion order.
+    """
+    requests = (
+        embedding_pb2.DocumentRequest(id=str(doc_id), file_name=file_name, file_stream=content, encoding=encoding)
+        for doc_id, file_name, content in documents
+    )
+    stub = (pool or get_channel_pool()).stub()
+    yield from stub.EmbedStream(requests)
+
+def stream_files(file_paths, encoding=embedding_pb2.JSON):
+    """Embed several files over one stream, printing each result as it arrives."""
+    documents = ((path, os.path.basename(path), get_file_stream(path)) for path in file_paths)
+    try:
+        for result in embed_stream(documents, encoding):
+            if result.error:
+                print(f"{result.id}: failed - {result.error}")
+            else:
+                print(f"{result.id}:", end=" ")
+                print_response(result.response)
 
     except grpc.RpcError as e:
         print(f"gRPC Error: {e.code()} - {e.details()}")
 
 if __name__ == "__main__":
     test_file_path = "embed/stories/small_village.txt"
-    file_stream = get_file_stream(test_file_path)
     print("Streaming JSON response:")
-    get_json_stream(test_file_path, file_stream)
+    upload_json_stream(test_file_path)
@@ -1,21 +1,205 @@
+import asyncio
+import logging
+import signal
+import threading
+import time
 import grpc
 from concurrent import futures
-import time
+from modules.config import Config
+from modules.proto.embedding.embedding_buffer_pb2 import HealthRequest, HealthResponse
 from modules.proto.embedding.embedding_buffer_pb2_grpc import add_EmbeddingServiceServicer_to_server
 from modules.services.embedding_service import EmbeddingService  # Import the class
+from modules.services.async_embedding_service import AsyncEmbeddingService
+from modules.services.launcher import ServerLauncher
+from modules.services.metrics import (
+    IN_FLIGHT, STARTUP_SECONDS, AsyncMetricsInterceptor, MetricsInterceptor, process_age, start_metrics_server,
+)
+
+logger = logging.getLogger(__name__)
+
+# Lets the worker processes of the launcher bind the same port; the kernel spreads connections across them
+REUSEPORT_OPTIONS = [("grpc.so_reuseport", 1)]
+
+# Threads of the threaded server beyond one per admitted or queued document, for Health and Search.
+# They are headroom, not a reservation: EmbedStream holds a thread per stream while its documents are
+# admitted one by one, so busy streams can take them. The launcher's probes use a server of their own.
+CONTROL_THREADS = 4
+
+# Threads of the server answering the launcher's health probes
+HEALTH_THREADS = 2
+
+def start_metrics(port=None):
+    """Serve /metrics on METRICS_PORT unless it is disabled."""
+    if not Config.METRICS_PORT:
+        return None
+    port = port or Config.METRICS_PORT
+    server = start_metrics_server(port)
+    logger.info("Metrics available on port %d at /metrics.", port)
+    return server
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    Config.configure_logging()
+    if Config.SERVER_PROCESSES > 1:
+        ServerLauncher(serve_worker).run()
+        return
+
+    start_metrics()  # Runs on a daemon thread for the life of the process
+    if Config.SERVER_MODE == "async":
+        asyncio.run(serve_async())
+        return
+    serve_sync()
+
+def serve_worker(index, health_address):
+    """
+    Serves one worker process of the launcher.
+
+    Args:
+        index (int): Position of the worker; worker N serves metrics on METRICS_PORT + N.
+        health_address (str): Private address where the launcher probes this worker.
+    """
+    Config.configure_logging()
+    if Config.METRICS_PORT:
+        start_metrics(Config.METRICS_PORT + index)
+    if Config.SERVER_MODE == "async":
+        asyncio.run(serve_async([health_address]))
+    else:
+        serve_sync([health_address])
+
+def add_health_servicer_to_server(servicer, server):
+    """Register only the Health RPC of an EmbeddingService servicer on a server."""
+    handler = grpc.unary_unary_rpc_method_handler(
+        servicer.Health, request_deserializer=HealthRequest.FromString,
+        response_serializer=HealthResponse.SerializeToString,
+    )
+    server.add_generic_rpc_handlers(
+        (grpc.method_handlers_generic_handler("embedding.EmbeddingService", {"Health": handler}),)
+    )
+
+def start_health_server(embedding_service, addresses):
+    """
+    Serves Health on the launcher's private addresses from a server and thread pool of its own.
+
+    Document RPCs can hold every thread and RPC slot of the main server; a busy
+    worker must still answer its probes, or the launcher restarts it as hung.
+
+    Args:
+        embedding_service (EmbeddingService): The servicer whose Health RPC is served.
+        addresses (list): Addresses to listen on.
+
+    Returns:
+        grpc.Server: The started server, or None when there are no addresses.
+    """
+    if not addresses:
+        return None
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=HEALTH_THREADS, thread_name_prefix="health"))
+    add_health_servicer_to_server(embedding_service, server)
+    for address in addresses:
+        server.add_insecure_port(address)
+    server.start()
+    return server
+
+async def start_async_health_server(embedding_service, addresses):
+    """Serves Health on the launcher's private addresses from a grpc.aio server without an RPC limit."""
+    if not addresses:
+        return None
+    server = grpc.aio.server()
+    add_health_servicer_to_server(embedding_service, server)
+    for address in addresses:
+        server.add_insecure_port(address)
+    await server.start()
+    return server
+
+def _report_ready(warm_up_seconds):
+    """Record how long the server took to become ready."""
+    STARTUP_SECONDS.labels("warm_up").set(warm_up_seconds)
+    age = process_age()
+    if age is not None:
+        STARTUP_SECONDS.labels("ready").set(age)
+    logger.info("Ready to serve after a %.2f s warm-up.", warm_up_seconds)
+
+def _wait_for_shutdown_signal():
+    """Block until SIGINT or SIGTERM."""
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    while not stop.wait(1):
+        pass
+
+def serve_sync(extra_addresses=()):
     embedding_service = EmbeddingService()  # Instantiate the service
+    # A thread for every document being processed or queued for admission, plus headroom for Health and Search.
+    # gRPC rejects RPCs past that instead of queueing them without bound.
+    admission = embedding_service.admission
+    threads = admission.max_active + admission.max_queue + CONTROL_THREADS
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=threads), interceptors=[MetricsInterceptor()],
+        options=REUSEPORT_OPTIONS, maximum_concurrent_rpcs=threads,
+    )
+    embedding_service.serving = False  # Health reports NOT_SERVING until the warm-up is done
     add_EmbeddingServiceServicer_to_server(embedding_service, server)
-    server.add_insecure_port("[::]:50051")
+    server.add_insecure_port(f"[::]:{Config.STREAM_SERVICE_PORT}")
     server.start()
-    print("Server started, listening on port 50051.")
+    health_server = start_health_server(embedding_service, extra_addresses)
+    logger.info("Server started, listening on port %d.", Config.STREAM_SERVICE_PORT)
+
+    started = time.monotonic()
+    embedding_service.warm_up()
+    embedding_service.serving = True
+    _report_ready(time.monotonic() - started)
+    _wait_for_shutdown_signal()
+
+    # Refuse new RPCs and give the ones in flight time to finish
+    logger.info("Draining for up to %.0f s.", Config.SERVER_SHUTDOWN_GRACE)
+    embedding_service.serving = False
+    stopped = server.stop(Config.SERVER_SHUTDOWN_GRACE)
+    deadline = time.monotonic() + Config.SERVER_SHUTDOWN_GRACE
+    while IN_FLIGHT.total() > 0 and time.monotonic() < deadline and not stopped.wait(0.1):
+        pass
+    # Idle client connections would otherwise hold the shutdown for the whole grace period
+    server.stop(0).wait()
+    if health_server is not None:
+        health_server.stop(0).wait()
+    embedding_service.close()
+
+async def serve_async(extra_addresses=()):
+    # RPCs wait on the event loop instead of holding a thread, so the limit is on RPCs, not workers
+    server = grpc.aio.server(
+        maximum_concurrent_rpcs=Config.MAX_CONCURRENT_RPCS, interceptors=[AsyncMetricsInterceptor()],
+        options=REUSEPORT_OPTIONS,
+    )
+    embedding_service = AsyncEmbeddingService()
+    embedding_service.serving = False  # Health reports NOT_SERVING until the warm-up is done
+    add_EmbeddingServiceServicer_to_server(embedding_service, server)
+    server.add_insecure_port(f"[::]:{Config.STREAM_SERVICE_PORT}")
+    await server.start()
+    # Probes are not counted against MAX_CONCURRENT_RPCS, so a saturated worker still answers them
+    health_server = await start_async_health_server(embedding_service, extra_addresses)
+    logger.info("Async server started, listening on port %d.", Config.STREAM_SERVICE_PORT)
+
+    started = time.monotonic()
+    await embedding_service.warm_up()
+    embedding_service.serving = True
+    _report_ready(time.monotonic() - started)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
     try:
-        while True:
-            time.sleep(86400)  # Keep the server running
-    except KeyboardInterrupt:
-        server.stop(0)
+        await stop.wait()
+    finally:
+        logger.info("Draining for up to %.0f s.", Config.SERVER_SHUTDOWN_GRACE)
+        embedding_service.serving = False
+        stopping = asyncio.create_task(server.stop(Config.SERVER_SHUTDOWN_GRACE))
+        deadline = time.monotonic() + Config.SERVER_SHUTDOWN_GRACE
+        while IN_FLIGHT.total() > 0 and time.monotonic() < deadline and not stopping.done():
+            await asyncio.sleep(0.1)
+        # Idle client connections would otherwise hold the shutdown for the whole grace period
+        await server.stop(0)
+        await stopping
+        if health_server is not None:
+            await health_server.stop(0)
+        await embedding_service.close()
 
 if __name__ == "__main__":
     serve()
@@ -1,3 +1,4 @@
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -11,13 +12,156 @@ class Config:
     OUTPUT_DIR = "embed"
     STREAM_SERVICE_HOST = os.getenv("STREAM_SERVICE_HOST", "localhost")
     STREAM_SERVICE_PORT = int(os.getenv("STREAM_SERVICE_PORT", 50051))
+    CLIENT_CHANNELS = int(os.getenv("CLIENT_CHANNELS", 4))  # Channels kept open per server by the client
     OUTPUT_MODE = os.getenv("OUTPUT_MODE", "file")  # Options: "file" or "stream"
     LABEL_MODEL = os.getenv("LABEL_MODEL", "gpt-3.5-turbo")
+    LABEL_MODE = os.getenv("LABEL_MODE", "llm")  # Options: "llm", "local" or "local+llm"
+    LOCAL_LABEL_SUMMARY_SENTENCES = int(os.getenv("LOCAL_LABEL_SUMMARY_SENTENCES", 2))
+    LOCAL_LABEL_SUMMARY_CHARS = int(os.getenv("LOCAL_LABEL_SUMMARY_CHARS", 300))
+    LABEL_ENRICH_WORKERS = int(os.getenv("LABEL_ENRICH_WORKERS", 2))  # Background model calls in "local+llm" mode
+    LABEL_INPUT_TOKENS = int(os.getenv("LABEL_INPUT_TOKENS", 3000))  # Document tokens per label prompt; 0 for all
+    LABEL_CANDIDATE_SENTENCES = int(os.getenv("LABEL_CANDIDATE_SENTENCES", 400))  # Sentences scored when condensing
+    LABEL_DIVERSITY = float(os.getenv("LABEL_DIVERSITY", 0.3))  # Weight against redundant sentences, 0 to 1
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")  # Options: "openai" or "local"
+    LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", 384))
+    LOCAL_EMBEDDING_IDF_PATH = os.getenv("LOCAL_EMBEDDING_IDF_PATH", "")
+    EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 0))  # Size of the stored vectors; 0 keeps the model's
+    EMBEDDING_REDUCTION = os.getenv("EMBEDDING_REDUCTION", "truncate")  # Options: "truncate" or "pca"
+    EMBEDDING_PCA_PATH = os.getenv("EMBEDDING_PCA_PATH", "")  # Projection written by EmbeddingPostProcessor.fit_pca
+    EMBEDDING_NORMALIZE = os.getenv("EMBEDDING_NORMALIZE", "false").lower() == "true"  # Reduced vectors always are
+    SERVER_MODE = os.getenv("SERVER_MODE", "sync")  # Options: "sync" or "async"
+    SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", 10))
+    # Documents processed at once; 0 uses SERVER_MAX_WORKERS, or HTTP_POOL_SIZE with SERVER_MODE=async
+    ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", 0))
+    ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 32))  # Documents waiting for a slot; more are shed
+    ADMISSION_MAX_BYTES = int(os.getenv("ADMISSION_MAX_BYTES", 256 * 1024 * 1024))  # Request bytes held; 0 disables
+    PRIORITY_METADATA_KEY = os.getenv("PRIORITY_METADATA_KEY", "x-priority")  # "high", "normal" or "low"
+    SERVER_PROCESSES = int(os.getenv("SERVER_PROCESSES", 1))  # Worker processes sharing the port via SO_REUSEPORT
+    SERVER_SHUTDOWN_GRACE = float(os.getenv("SERVER_SHUTDOWN_GRACE", 30))  # Seconds to finish in-flight RPCs
+    HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 5))  # Seconds between worker probes
+    HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 2))
+    HEALTH_CHECK_FAILURES = int(os.getenv("HEALTH_CHECK_FAILURES", 3))  # Failed probes before a restart
+    WORKER_STARTUP_SECONDS = float(os.getenv("WORKER_STARTUP_SECONDS", 30))  # Time to answer the first probe
+    WORKER_RESTART_BACKOFF_MAX = float(os.getenv("WORKER_RESTART_BACKOFF_MAX", 30))
+    MAX_CONCURRENT_RPCS = int(os.getenv("MAX_CONCURRENT_RPCS", 1000))
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+    WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", 4))  # Provider connections opened before readiness
+    EMBEDDED_DIR = os.path.join(OUTPUT_DIR, "embedded")
+    VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(EMBEDDED_DIR, "store"))
+    VECTOR_STORE_SHARD_BYTES = int(os.getenv("VECTOR_STORE_SHARD_BYTES", 64 * 1024 * 1024))
+    CACHE_MEMORY_ITEMS = int(os.getenv("CACHE_MEMORY_ITEMS", 256))
+    CACHE_MAX_DISK_BYTES = int(os.getenv("CACHE_MAX_DISK_BYTES", 1024 * 1024 * 1024))
+    REMOTE_CACHE_URL = os.getenv("REMOTE_CACHE_URL", "")  # "redis://host:6379/0", "memory://" or "" for none
+    REMOTE_CACHE_TTL = float(os.getenv("REMOTE_CACHE_TTL", 7 * 24 * 3600))  # Seconds since the last read; 0 keeps
+    REMOTE_CACHE_ENCODING = os.getenv("REMOTE_CACHE_ENCODING", "float32")  # Options: "float32", "float16" or "int8"
+    REMOTE_CACHE_PREFIX = os.getenv("REMOTE_CACHE_PREFIX", "embedding:")
+    REMOTE_CACHE_POOL_SIZE = int(os.getenv("REMOTE_CACHE_POOL_SIZE", 8))
+    REMOTE_CACHE_TIMEOUT = float(os.getenv("REMOTE_CACHE_TIMEOUT", 0.5))  # Seconds per round trip
+    REMOTE_CACHE_WRITE_QUEUE = int(os.getenv("REMOTE_CACHE_WRITE_QUEUE", 1024))  # Pending writes before dropping
+    SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", 10))
+    SEARCH_METRIC = os.getenv("SEARCH_METRIC", "cosine")  # Options: "cosine", "l2" or "ip"
+    SEARCH_IVF_THRESHOLD = int(os.getenv("SEARCH_IVF_THRESHOLD", 20000))  # Vectors before approximate search
+    SEARCH_NPROBE = int(os.getenv("SEARCH_NPROBE", 8))
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 64 * 1024))
+    UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", 1024 * 1024))
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 2048))  # Provider limit on inputs per request
+    EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 300000))  # Provider limit on tokens per request
+    LABEL_RPM = float(os.getenv("LABEL_RPM", 0))  # Provider rate limits; 0 disables the limit
+    LABEL_TPM = float(os.getenv("LABEL_TPM", 0))
+    EMBEDDING_RPM = float(os.getenv("EMBEDDING_RPM", 0))
+    EMBEDDING_TPM = float(os.getenv("EMBEDDING_TPM", 0))
+    PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", 5))
+    PROVIDER_BACKOFF_BASE = float(os.getenv("PROVIDER_BACKOFF_BASE", 0.5))
+    PROVIDER_BACKOFF_MAX = float(os.getenv("PROVIDER_BACKOFF_MAX", 30))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+    CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", 30))
+    LABEL_PRICE_PER_1K_TOKENS = float(os.getenv("LABEL_PRICE_PER_1K_TOKENS", 0.0005))  # Used for cost reports
+    EMBEDDING_PRICE_PER_1K_TOKENS = float(os.getenv("EMBEDDING_PRICE_PER_1K_TOKENS", 0.00002))
+    BATCH_API_DISCOUNT = float(os.getenv("BATCH_API_DISCOUNT", 0.5))  # Price factor of the provider batch API
+    BATCH_JOB_WORKERS = int(os.getenv("BATCH_JOB_WORKERS", 8))
+    BATCH_JOB_DIR = os.getenv("BATCH_JOB_DIR", os.path.join(OUTPUT_DIR, "jobs"))
+    BATCH_API_POLL_SECONDS = float(os.getenv("BATCH_API_POLL_SECONDS", 30))
+    BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "false").lower() == "true"
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 256))  # Texts collected across requests per embedding call
+    BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 10))
+    BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", 4))
+    CHUNKING_ENABLED = os.getenv("CHUNKING_ENABLED", "false").lower() == "true"
+    CHUNK_WINDOW_TOKENS = int(os.getenv("CHUNK_WINDOW_TOKENS", 512))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 64))
+    CHUNK_BOUNDARIES = os.getenv("CHUNK_BOUNDARIES", "")  # "fixed" or "content" (stable across edits)
+    CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "cl100k_base")
+    CHUNK_POOLING = os.getenv("CHUNK_POOLING", "true").lower() == "true"
+    INCREMENTAL_UPDATES = os.getenv("INCREMENTAL_UPDATES", "false").lower() == "true"  # Reuse unchanged chunks
+    INCREMENTAL_RELABEL_THRESHOLD = float(os.getenv("INCREMENTAL_RELABEL_THRESHOLD", 0.2))  # Changed share to relabel
+    NEAR_DUPLICATES = os.getenv("NEAR_DUPLICATES", "false").lower() == "true"  # Reuse results of near-identical text
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.9))  # Estimated Jaccard similarity
+    NEAR_DUPLICATE_SHINGLE_WORDS = int(os.getenv("NEAR_DUPLICATE_SHINGLE_WORDS", 3))
+    NEAR_DUPLICATE_PERMUTATIONS = int(os.getenv("NEAR_DUPLICATE_PERMUTATIONS", 128))  # MinHash signature length
+    NEAR_DUPLICATE_BANDS = int(os.getenv("NEAR_DUPLICATE_BANDS", 32))  # LSH bands; must divide the permutations
+    PIPELINE_ENABLED = os.getenv("PIPELINE_ENABLED", "false").lower() == "true"  # Embed the source text while labeling
+    STREAM_MAX_IN_FLIGHT = int(os.getenv("STREAM_MAX_IN_FLIGHT", 16))  # Documents in progress per EmbedStream
+    STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", 32))  # Threads shared by all EmbedStream sessions
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))  # HTTP port of the /metrics endpoint; 0 disables it
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_VECTORS = os.getenv("LOG_VECTORS", "false").lower() == "true"  # Include vectors in DEBUG logs
 
     @staticmethod
-    def validate():
-        """Validates that all required configurations are set."""
-        if not Config.OPENAI_API_KEY:
+    def configure_logging():
+        """Sends the service loggers to stderr at LOG_LEVEL."""
+        logging.basicConfig(
+            level=getattr(logging, Config.LOG_LEVEL, logging.INFO),
+            format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        )
+
+    @staticmethod
+    def uses_openai():
+        """Whether the configured labeler or embedding backend calls the OpenAI API."""
+        return Config.LABEL_MODE != "local" or Config.EMBEDDING_BACKEND == "openai"
+
+    @staticmethod
+    def chunk_boundaries():
+        """The configured chunk boundaries; unless set, content-defined with incremental updates and fixed otherwise."""
+        return Config.CHUNK_BOUNDARIES or ("content" if Config.INCREMENTAL_UPDATES else "fixed")
+
+    @staticmethod
+    def validate(require_api_key=True):
+        """
+        Validates that all required configurations are set.
+
+        Args:
+            require_api_key (bool): Whether the configured backends will be created, so that an OpenAI
+                                    API key is needed if they call the API. False when the caller
+                                    supplies its own labeler and embedder.
+        """
+        if require_api_key and Config.uses_openai() and not Config.OPENAI_API_KEY:
             raise ValueError("OpenAI API key is not set. Ensure it is defined in the .env file.")
         if Config.OUTPUT_MODE not in ["file", "stream"]:
             raise ValueError("OUTPUT_MODE must be either 'file' or 'stream'.")
+        if Config.LABEL_MODE not in ["llm", "local", "local+llm"]:
+            raise ValueError("LABEL_MODE must be one of 'llm', 'local' or 'local+llm'.")
+        if Config.EMBEDDING_BACKEND not in ["openai", "local"]:
+            raise ValueError("EMBEDDING_BACKEND must be either 'openai' or 'local'.")
+        if Config.EMBEDDING_REDUCTION not in ["truncate", "pca"]:
+            raise ValueError("EMBEDDING_REDUCTION must be either 'truncate' or 'pca'.")
+        if Config.EMBEDDING_REDUCTION == "pca" and not os.path.isfile(Config.EMBEDDING_PCA_PATH):
+            raise ValueError("EMBEDDING_REDUCTION=pca needs EMBEDDING_PCA_PATH to name a projection saved by "
+                             "EmbeddingPostProcessor.fit_pca.")
+        if Config.EMBEDDING_DIMENSION < 0:
+            raise ValueError("EMBEDDING_DIMENSION must not be negative.")
+        if Config.chunk_boundaries() not in ["fixed", "content"]:
+            raise ValueError("CHUNK_BOUNDARIES must be either 'fixed' or 'content'.")
+        if Config.INCREMENTAL_UPDATES and Config.chunk_boundaries() == "fixed":
+            raise ValueError("INCREMENTAL_UPDATES needs CHUNK_BOUNDARIES=content; fixed boundaries shift every "
+                             "chunk after an edit, so almost nothing could be reused.")
+        if Config.REMOTE_CACHE_ENCODING not in ["float32", "float16", "int8"]:
+            raise ValueError("REMOTE_CACHE_ENCODING must be one of 'float32', 'float16' or 'int8'.")
+        if Config.NEAR_DUPLICATE_BANDS < 1 or Config.NEAR_DUPLICATE_PERMUTATIONS % Config.NEAR_DUPLICATE_BANDS:
+            raise ValueError("NEAR_DUPLICATE_BANDS must divide NEAR_DUPLICATE_PERMUTATIONS.")
+        if Config.SEARCH_METRIC not in ["cosine", "l2", "ip"]:
+            raise ValueError("SEARCH_METRIC must be one of 'cosine', 'l2' or 'ip'.")
+        if Config.LOG_LEVEL not in ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]:
+            raise ValueError("LOG_LEVEL must be one of DEBUG, INFO, WARNING, ERROR or CRITICAL.")
+        if Config.SERVER_MODE not in ["sync", "async"]:
+            raise ValueError("SERVER_MODE must be either 'sync' or 'async'.")
+        if Config.SERVER_PROCESSES < 1:
+            raise ValueError("SERVER_PROCESSES must be at least 1.")
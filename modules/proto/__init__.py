@@ -1 +1 @@
-from modules.proto.embedding import EmbeddingServiceServicer, EmbeddingRequest, EmbeddingResponse, add_EmbeddingServiceServicer_to_server, EmbeddingServiceStub
+from modules.proto.embedding import EmbeddingServiceServicer, EmbeddingRequest, EmbeddingResponse, Chunk, Definition, Vectors, VectorEncoding, SearchRequest, SearchResponse, SearchHit, Metric, add_EmbeddingServiceServicer_to_server, EmbeddingServiceStub
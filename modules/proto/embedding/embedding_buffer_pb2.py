@@ -24,17 +24,45 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x16\x65mbedding_buffer.proto\x12\tembedding\":\n\x10\x45mbeddingRequest\x12\x11\n\tfile_name\x18\x01 \x01(\t\x12\x13\n\x0b\x66ile_stream\x18\x02 \x01(\x0c\"(\n\x11\x45mbeddingResponse\x12\x13\n\x0bjson_stream\x18\x01 \x01(\t2b\n\x10\x45mbeddingService\x12N\n\x0fStreamEmbedding\x12\x1b.embedding.EmbeddingRequest\x1a\x1c.embedding.EmbeddingResponse0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x16\x65mbedding_buffer.proto\x12\tembedding\"g\n\x10\x45mbeddingRequest\x12\x11\n\tfile_name\x18\x01 \x01(\t\x12\x13\n\x0b\x66ile_stream\x18\x02 \x01(\x0c\x12+\n\x08\x65ncoding\x18\x03 \x01(\x0e\x32\x19.embedding.VectorEncoding\"U\n\x05\x43hunk\x12\x11\n\tfile_name\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c\x12+\n\x08\x65ncoding\x18\x03 \x01(\x0e\x32\x19.embedding.VectorEncoding\"z\n\nDefinition\x12\x17\n\x0f\x63ollection_name\x18\x01 \x01(\t\x12\x16\n\x0epartition_name\x18\x02 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x03 \x01(\t\x12\x11\n\tdimension\x18\x04 \x01(\x05\x12\x13\n\x0bmetric_type\x18\x05 \x01(\t\"o\n\x07Vectors\x12+\n\x08\x65ncoding\x18\x01 \x01(\x0e\x32\x19.embedding.VectorEncoding\x12\x0c\n\x04rows\x18\x02 \x01(\x05\x12\x0b\n\x03\x64im\x18\x03 \x01(\x05\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\x12\x0e\n\x06scales\x18\x05 \x03(\x02\"7\n\tChunkSpan\x12\r\n\x05start\x18\x01 \x01(\x05\x12\x0b\n\x03\x65nd\x18\x02 \x01(\x05\x12\x0e\n\x06tokens\x18\x03 \x01(\x05\"\xe7\x01\n\x11\x45mbeddingResponse\x12\x13\n\x0bjson_stream\x18\x01 \x01(\t\x12\r\n\x05stage\x18\x02 \x01(\t\x12)\n\ndefinition\x18\x03 \x01(\x0b\x32\x15.embedding.Definition\x12#\n\x07vectors\x18\x04 \x01(\x0b\x32\x12.embedding.Vectors\x12$\n\x06\x63hunks\x18\x05 \x03(\x0b\x32\x14.embedding.ChunkSpan\x12\x0e\n\x06pooled\x18\x06 \x01(\x08\x12\x14\n\x0c\x64uplicate_of\x18\x07 \x01(\t\x12\x12\n\nsimilarity\x18\x08 \x01(\x02\"r\n\x0f\x44ocumentRequest\x12\n\n\x02id\x18\x01 \x01(\t\x12\x11\n\tfile_name\x18\x02 \x01(\t\x12\x13\n\x0b\x66ile_stream\x18\x03 \x01(\x0c\x12+\n\x08\x65ncoding\x18\x04 \x01(\x0e\x32\x19.embedding.VectorEncoding\"k\n\x10\x44ocumentResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12.\n\x08response\x18\x02 \x01(\x0b\x32\x1c.embedding.EmbeddingResponse\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\x0c\n\x04last\x18\x04 \x01(\x08\"z\n\rSearchRequest\x12\x12\n\nquery_text\x18\x01 \x01(\t\x12\x14\n\x0cquery_vector\x18\x02 \x03(\x02\x12\r\n\x05top_k\x18\x03 \x01(\x05\x12!\n\x06metric\x18\x04 \x01(\x0e\x32\x11.embedding.Metric\x12\r\n\x05\x65xact\x18\x05 \x01(\x08\"R\n\tSearchHit\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05score\x18\x02 \x01(\x02\x12)\n\ndefinition\x18\x03 \x01(\x0b\x32\x15.embedding.Definition\"4\n\x0eSearchResponse\x12\"\n\x04hits\x18\x01 \x03(\x0b\x32\x14.embedding.SearchHit\"\x0f\n\rHealthRequest\"\x92\x01\n\x0eHealthResponse\x12\x37\n\x06status\x18\x01 \x01(\x0e\x32\'.embedding.HealthResponse.ServingStatus\x12\x0b\n\x03pid\x18\x02 \x01(\x05\":\n\rServingStatus\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0b\n\x07SERVING\x10\x01\x12\x0f\n\x0bNOT_SERVING\x10\x02*J\n\x0eVectorEncoding\x12\x08\n\x04JSON\x10\x00\x12\x0b\n\x07\x46LOAT32\x10\x01\x12\x0b\n\x07\x46LOAT16\x10\x02\x12\x08\n\x04INT8\x10\x03\x12\n\n\x06\x42INARY\x10\x04*G\n\x06Metric\x12\x16\n\x12METRIC_UNSPECIFIED\x10\x00\x12\n\n\x06\x43OSINE\x10\x01\x12\x06\n\x02L2\x10\x02\x12\x11\n\rINNER_PRODUCT\x10\x03\x32\xf3\x02\n\x10\x45mbeddingService\x12N\n\x0fStreamEmbedding\x12\x1b.embedding.EmbeddingRequest\x1a\x1c.embedding.EmbeddingResponse0\x01\x12\x45\n\x0fUploadEmbedding\x12\x10.embedding.Chunk\x1a\x1c.embedding.EmbeddingResponse(\x01\x30\x01\x12=\n\x06Search\x12\x18.embedding.SearchRequest\x1a\x19.embedding.SearchResponse\x12J\n\x0b\x45mbedStream\x12\x1a.embedding.DocumentRequest\x1a\x1b.embedding.DocumentResponse(\x01\x30\x01\x12=\n\x06Health\x12\x18.embedding.HealthRequest\x1a\x19.embedding.HealthResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'embedding_buffer_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_VECTORENCODING']._serialized_start=1410
+  _globals['_VECTORENCODING']._serialized_end=1484
+  _globals['_METRIC']._serialized_start=1486
+  _globals['_METRIC']._serialized_end=1557
   _globals['_EMBEDDINGREQUEST']._serialized_start=37
-  _globals['_EMBEDDINGREQUEST']._serialized_end=95
-  _globals['_EMBEDDINGRESPONSE']._serialized_start=97
-  _globals['_EMBEDDINGRESPONSE']._serialized_end=137
-  _globals['_EMBEDDINGSERVICE']._serialized_start=139
-  _globals['_EMBEDDINGSERVICE']._serialized_end=237
+  _globals['_EMBEDDINGREQUEST']._serialized_end=140
+  _globals['_CHUNK']._serialized_start=142
+  _globals['_CHUNK']._serialized_end=227
+  _globals['_DEFINITION']._serialized_start=229
+  _globals['_DEFINITION']._serialized_end=351
+  _globals['_VECTORS']._serialized_start=353
+  _globals['_VECTORS']._serialized_end=464
+  _globals['_CHUNKSPAN']._serialized_start=466
+  _globals['_CHUNKSPAN']._serialized_end=521
+  _globals['_EMBEDDINGRESPONSE']._serialized_start=524
+  _globals['_EMBEDDINGRESPONSE']._serialized_end=755
+  _globals['_DOCUMENTREQUEST']._serialized_start=757
+  _globals['_DOCUMENTREQUEST']._serialized_end=871
+  _globals['_DOCUMENTRESPONSE']._serialized_start=873
+  _globals['_DOCUMENTRESPONSE']._serialized_end=980
+  _globals['_SEARCHREQUEST']._serialized_start=982
+  _globals['_SEARCHREQUEST']._serialized_end=1104
+  _globals['_SEARCHHIT']._serialized_start=1106
+  _globals['_SEARCHHIT']._serialized_end=1188
+  _globals['_SEARCHRESPONSE']._serialized_start=1190
+  _globals['_SEARCHRESPONSE']._serialized_end=1242
+  _globals['_HEALTHREQUEST']._serialized_start=1244
+  _globals['_HEALTHREQUEST']._serialized_end=1259
+  _globals['_HEALTHRESPONSE']._serialized_start=1262
+  _globals['_HEALTHRESPONSE']._serialized_end=1408
+  _globals['_HEALTHRESPONSE_SERVINGSTATUS']._serialized_start=1350
+  _globals['_HEALTHRESPONSE_SERVINGSTATUS']._serialized_end=1408
+  _globals['_EMBEDDINGSERVICE']._serialized_start=1560
+  _globals['_EMBEDDINGSERVICE']._serialized_end=1931
 # @@protoc_insertion_point(module_scope)
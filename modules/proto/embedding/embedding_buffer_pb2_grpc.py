@@ -40,6 +40,26 @@ class EmbeddingServiceStub(object):
                 request_serializer=embedding__buffer__pb2.EmbeddingRequest.SerializeToString,
                 response_deserializer=embedding__buffer__pb2.EmbeddingResponse.FromString,
                 _registered_method=True)
+        self.UploadEmbedding = channel.stream_stream(
+                '/embedding.EmbeddingService/UploadEmbedding',
+                request_serializer=embedding__buffer__pb2.Chunk.SerializeToString,
+                response_deserializer=embedding__buffer__pb2.EmbeddingResponse.FromString,
+                _registered_method=True)
+        self.Search = channel.unary_unary(
+                '/embedding.EmbeddingService/Search',
+                request_serializer=embedding__buffer__pb2.SearchRequest.SerializeToString,
+                response_deserializer=embedding__buffer__pb2.SearchResponse.FromString,
+                _registered_method=True)
+        self.EmbedStream = channel.stream_stream(
+                '/embedding.EmbeddingService/EmbedStream',
+                request_serializer=embedding__buffer__pb2.DocumentRequest.SerializeToString,
+                response_deserializer=embedding__buffer__pb2.DocumentResponse.FromString,
+                _registered_method=True)
+        self.Health = channel.unary_unary(
+                '/embedding.EmbeddingService/Health',
+                request_serializer=embedding__buffer__pb2.HealthRequest.SerializeToString,
+                response_deserializer=embedding__buffer__pb2.HealthResponse.FromString,
+                _registered_method=True)
 
 
 class EmbeddingServiceServicer(object):
@@ -52,6 +72,32 @@ class EmbeddingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def UploadEmbedding(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Search(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def EmbedStream(self, request_iterator, context):
+        """Many documents over one stream; results come back as each document finishes
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Health(self, request, context):
+        """Whether this server process is accepting work; probed by the multi-process launcher
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_EmbeddingServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -60,6 +106,26 @@ def add_EmbeddingServiceServicer_to_server(servicer, server):
                     request_deserializer=embedding__buffer__pb2.EmbeddingRequest.FromString,
                     response_serializer=embedding__buffer__pb2.EmbeddingResponse.SerializeToString,
             ),
+            'UploadEmbedding': grpc.stream_stream_rpc_method_handler(
+                    servicer.UploadEmbedding,
+                    request_deserializer=embedding__buffer__pb2.Chunk.FromString,
+                    response_serializer=embedding__buffer__pb2.EmbeddingResponse.SerializeToString,
+            ),
+            'Search': grpc.unary_unary_rpc_method_handler(
+                    servicer.Search,
+                    request_deserializer=embedding__buffer__pb2.SearchRequest.FromString,
+                    response_serializer=embedding__buffer__pb2.SearchResponse.SerializeToString,
+            ),
+            'EmbedStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.EmbedStream,
+                    request_deserializer=embedding__buffer__pb2.DocumentRequest.FromString,
+                    response_serializer=embedding__buffer__pb2.DocumentResponse.SerializeToString,
+            ),
+            'Health': grpc.unary_unary_rpc_method_handler(
+                    servicer.Health,
+                    request_deserializer=embedding__buffer__pb2.HealthRequest.FromString,
+                    response_serializer=embedding__buffer__pb2.HealthResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'embedding.EmbeddingService', rpc_method_handlers)
@@ -98,3 +164,111 @@ class EmbeddingService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def UploadEmbedding(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/embedding.EmbeddingService/UploadEmbedding',
+            embedding__buffer__pb2.Chunk.SerializeToString,
+            embedding__buffer__pb2.EmbeddingResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Search(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/embedding.EmbeddingService/Search',
+            embedding__buffer__pb2.SearchRequest.SerializeToString,
+            embedding__buffer__pb2.SearchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def EmbedStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/embedding.EmbeddingService/EmbedStream',
+            embedding__buffer__pb2.DocumentRequest.SerializeToString,
+            embedding__buffer__pb2.DocumentResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Health(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/embedding.EmbeddingService/Health',
+            embedding__buffer__pb2.HealthRequest.SerializeToString,
+            embedding__buffer__pb2.HealthResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,3 +1,5 @@
-from modules.services.labeler import Labeler
-from modules.services.embedder import EmbeddingGenerator
+from modules.services.labeler import Labeler, AsyncLabeler
+from modules.services.embedder import EmbeddingGenerator, AsyncEmbeddingGenerator
+from modules.services.cache import EmbeddingCache
 from modules.services.embedding_service import EmbeddingService
+from modules.services.async_embedding_service import AsyncEmbeddingService
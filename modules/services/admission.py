@@ -0,0 +1,413 @@
+import asyncio
+import bisect
+import contextvars
+import itertools
+import threading
+import time
+from concurrent import futures
+from contextlib import asynccontextmanager, contextmanager
+import grpc
+from modules.config import Config
+from modules.services.metrics import ADMISSION_ACTIVE, ADMISSION_WAITING, SHED_REQUESTS
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# time_remaining() reports about 2**63 ns when the client did not set a deadline
+NO_DEADLINE_SECONDS = 1e9
+
+_current_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed because the server is already at capacity."""
+
+
+class InvalidArgument(ValueError):
+    """Raised when a request is malformed, such as a search without a query."""
+
+
+class RequestAborted(Exception):
+    """Raised when nobody is waiting for a request's result any more."""
+
+
+class DeadlineExceeded(RequestAborted):
+    """Raised when the client's deadline passed before the request finished."""
+
+
+class RequestCancelled(RequestAborted):
+    """Raised when the client cancelled the call or went away."""
+
+
+def status_code(error):
+    """
+    Maps an error raised while handling a request to the gRPC status it should end with.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        grpc.StatusCode: RESOURCE_EXHAUSTED, DEADLINE_EXCEEDED, CANCELLED, INVALID_ARGUMENT or INTERNAL.
+    """
+    if isinstance(error, Overloaded):
+        return grpc.StatusCode.RESOURCE_EXHAUSTED
+    if isinstance(error, InvalidArgument):
+        return grpc.StatusCode.INVALID_ARGUMENT
+    if isinstance(error, DeadlineExceeded):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+    if isinstance(error, RequestCancelled):
+        return grpc.StatusCode.CANCELLED
+    return grpc.StatusCode.INTERNAL
+
+
+def request_priority(context):
+    """
+    Reads the priority class a client asked for from the call metadata.
+
+    Args:
+        context (grpc.ServicerContext): Context of the call.
+
+    Returns:
+        str: "high", "normal" or "low"; "normal" when the metadata is missing or unknown.
+    """
+    for key, value in context.invocation_metadata() or ():
+        if key == Config.PRIORITY_METADATA_KEY and value in PRIORITIES:
+            return value
+    return "normal"
+
+
+class Deadline:
+    def __init__(self, timeout=None):
+        """
+        Tracks the time left to answer a request and whether its client is still there.
+
+        Args:
+            timeout (float): Seconds until the deadline, or None if there is none.
+        """
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_context(cls, context):
+        """
+        Creates the deadline of a gRPC call, cancelled when the call ends.
+
+        Args:
+            context (grpc.ServicerContext): Context of the call.
+
+        Returns:
+            Deadline: The deadline.
+        """
+        remaining = context.time_remaining()
+        if not isinstance(remaining, (int, float)) or remaining > NO_DEADLINE_SECONDS:
+            remaining = None
+        deadline = cls(remaining)
+        # Called when the RPC terminates, which includes the client cancelling or disconnecting
+        if hasattr(context, "add_callback") and context.add_callback(deadline.cancel) is False:
+            deadline.cancel()
+        return deadline
+
+    def cancel(self):
+        """Marks the request as abandoned by its client."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def remaining(self):
+        """
+        Returns the time left before the deadline.
+
+        Returns:
+            float: Seconds left, at least 0, or None without a deadline.
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self):
+        """
+        Raises if the result of the request would no longer be received.
+
+        Raises:
+            RequestCancelled: If the client went away.
+            DeadlineExceeded: If the deadline has passed.
+        """
+        if self.cancelled:
+            raise RequestCancelled("The client cancelled the request.")
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded("The request deadline was exceeded.")
+
+    def sleep(self, seconds):
+        """
+        Waits, waking up early if the client goes away.
+
+        Args:
+            seconds (float): How long to wait.
+
+        Raises:
+            RequestAborted: If the request is abandoned, or `seconds` would run past the deadline.
+        """
+        self.check_wait(seconds)
+        self._cancelled.wait(seconds)
+        self.check()
+
+    def check_wait(self, seconds):
+        """
+        Raises unless waiting `seconds` still leaves time before the deadline.
+
+        Args:
+            seconds (float): The intended wait.
+
+        Raises:
+            RequestAborted: If the request is abandoned or the wait would run past the deadline.
+        """
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and seconds >= remaining:
+            raise DeadlineExceeded(f"Waiting {seconds:.2f} s would run past the request deadline.")
+
+
+def current_deadline():
+    """
+    Returns the deadline of the request being handled, for code far from the RPC such as provider calls.
+
+    Returns:
+        Deadline: The deadline set by `use_deadline`, or None.
+    """
+    return _current_deadline.get()
+
+
+@contextmanager
+def use_deadline(deadline):
+    """
+    Makes `deadline` the current deadline for the enclosed block.
+
+    Args:
+        deadline (Deadline): The deadline of the request being handled.
+    """
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current_deadline.reset(token)
+        except ValueError:
+            # A response generator abandoned by its client may be closed from another thread
+            pass
+
+
+class _Waiter:
+    def __init__(self, rank, sequence, size, future):
+        self.rank = rank
+        self.sequence = sequence
+        self.size = size
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.rank, self.sequence) < (other.rank, other.sequence)
+
+
+class Ticket:
+    def __init__(self, controller, size):
+        """
+        An admitted request, holding one processing slot and its bytes until it is released.
+
+        Args:
+            controller (AdmissionController): The controller that admitted the request.
+            size (int): Bytes reserved for the request.
+        """
+        self.controller = controller
+        self.size = size
+
+    def add_bytes(self, size):
+        """
+        Reserves more bytes, for requests whose size is only known as they are read.
+
+        Args:
+            size (int): Additional bytes.
+
+        Raises:
+            Overloaded: If the bytes do not fit under ADMISSION_MAX_BYTES.
+        """
+        with self.controller._lock:
+            self.controller._reserve_bytes(size)
+            self.size += size
+
+
+class AdmissionController:
+    def __init__(self, max_active=None, max_queue=None, max_bytes=None):
+        """
+        Bounds the requests processed at once, the requests waiting for them and the bytes they hold.
+
+        At most `max_active` requests are processed at once. Further requests wait in
+        a queue ordered by priority class and then by arrival. When the queue holds
+        `max_queue` requests, a new request either takes the place of the last
+        queued request of a lower class, which is shed, or is shed itself. Requests
+        are also shed while the bytes held by admitted and queued requests would
+        exceed `max_bytes`. A shed request fails at once with `Overloaded`, so
+        clients can back off or try another server instead of waiting.
+
+        Args:
+            max_active (int): Requests processed at once. Defaults to ADMISSION_MAX_ACTIVE, or SERVER_MAX_WORKERS.
+            max_queue (int): Requests waiting for a slot.
+            max_bytes (int): Bytes held by admitted and queued requests; 0 disables the limit.
+        """
+        self.max_active = max_active or Config.ADMISSION_MAX_ACTIVE or Config.SERVER_MAX_WORKERS
+        self.max_queue = max_queue if max_queue is not None else Config.ADMISSION_QUEUE_SIZE
+        self.max_bytes = max_bytes if max_bytes is not None else Config.ADMISSION_MAX_BYTES
+        self.active = 0
+        self.bytes = 0
+        self.shed = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _new_future(self):
+        return futures.Future()
+
+    def _shed(self, reason, message):
+        """Count a shed request and build the error it fails with."""
+        self.shed += 1
+        SHED_REQUESTS.labels(reason).inc()
+        return Overloaded(message)
+
+    def _reserve_bytes(self, size):
+        """Take `size` bytes from the budget, shedding the request if they do not fit."""
+        if self.max_bytes and self.bytes + size > self.max_bytes:
+            raise self._shed("bytes", f"The server is holding {self.bytes} request bytes; try again later.")
+        self.bytes += size
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_WAITING.set(len(self._queue))
+
+    def _enter(self, priority, size):
+        """
+        Admits a request at once, or queues it.
+
+        Returns:
+            _Waiter: The queue entry to wait on, or None if the request was admitted.
+        """
+        rank = PRIORITIES.get(priority, PRIORITIES["normal"])
+        with self._lock:
+            self._reserve_bytes(size)
+            if self.active < self.max_active and not self._queue:
+                self.active += 1
+                self._update_gauges()
+                return None
+            if len(self._queue) >= self.max_queue:
+                last = self._queue[-1] if self._queue else None
+                if last is None or last.rank <= rank:
+                    self.bytes -= size
+                    raise self._shed("queue", "The server is at capacity; try again later.")
+                # Make room by shedding the newest request of the lowest class
+                self._queue.pop()
+                self.bytes -= last.size
+                last.future.set_exception(self._shed("queue", "The request was shed for a higher priority one."))
+            waiter = _Waiter(rank, next(self._sequence), size, self._new_future())
+            bisect.insort(self._queue, waiter)
+            self._update_gauges()
+            return waiter
+
+    def _withdraw(self, waiter):
+        """Take back a queued request that stopped waiting, releasing its slot if it was admitted meanwhile."""
+        with self._lock:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+                self.bytes -= waiter.size
+                self._update_gauges()
+                return
+        if waiter.future.done() and waiter.future.exception() is None:
+            self._release(waiter.size)
+
+    def _release(self, size):
+        """Free a slot and the request's bytes, admitting the next queued requests."""
+        with self._lock:
+            self.active -= 1
+            self.bytes -= size
+            while self._queue and self.active < self.max_active:
+                waiter = self._queue.pop(0)
+                self.active += 1
+                waiter.future.set_result(None)
+            self._update_gauges()
+
+    @contextmanager
+    def admit(self, priority="normal", size=0, deadline=None):
+        """
+        Holds a processing slot for the enclosed block, waiting for one if needed.
+
+        Args:
+            priority (str): "high", "normal" or "low".
+            size (int): Bytes of the request.
+            deadline (Deadline): Deadline of the request; waiting stops when it passes or the client leaves.
+
+        Yields:
+            Ticket: The admitted request.
+
+        Raises:
+            Overloaded: If the request is shed.
+            RequestAborted: If the deadline passes or the client leaves while the request is queued.
+        """
+        waiter = self._enter(priority, size)
+        if waiter is not None:
+            while True:
+                try:
+                    # Wake up regularly to notice a client that went away
+                    waiter.future.result(timeout=0.1 if deadline is not None else None)
+                    break
+                except futures.TimeoutError:
+                    try:
+                        deadline.check()
+                    except RequestAborted:
+                        self._withdraw(waiter)
+                        raise
+        ticket = Ticket(self, size)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket.size)
+
+
+class AsyncAdmissionController(AdmissionController):
+    """An AdmissionController whose requests wait on the event loop instead of blocking a thread."""
+
+    def _new_future(self):
+        return asyncio.get_running_loop().create_future()
+
+    @asynccontextmanager
+    async def admit(self, priority="normal", size=0, deadline=None):
+        """
+        Holds a processing slot for the enclosed block, waiting for one without blocking.
+
+        Cancelling the waiting task, as grpc.aio does when the client goes away, takes
+        the request out of the queue.
+
+        Args:
+            priority (str): "high", "normal" or "low".
+            size (int): Bytes of the request.
+            deadline (Deadline): Deadline of the request; waiting stops when it passes.
+
+        Yields:
+            Ticket: The admitted request.
+
+        Raises:
+            Overloaded: If the request is shed.
+            DeadlineExceeded: If the deadline passes while the request is queued.
+        """
+        waiter = self._enter(priority, size)
+        if waiter is not None:
+            try:
+                timeout = deadline.remaining() if deadline is not None else None
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except asyncio.TimeoutError:
+                self._withdraw(waiter)
+                raise DeadlineExceeded("The request deadline passed while it was queued.")
+            except asyncio.CancelledError:
+                self._withdraw(waiter)
+                raise
+        ticket = Ticket(self, size)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket.size)
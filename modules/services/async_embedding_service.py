@@ -0,0 +1,408 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from modules.config import Config
+from modules.proto.embedding.embedding_buffer_pb2 import JSON
+from modules.services.admission import (
+    AsyncAdmissionController, Deadline, InvalidArgument, RequestAborted, request_priority, status_code, use_deadline,
+)
+from modules.services.batcher import AsyncEmbeddingBatcher
+from modules.services.cache import EmbeddingCache
+from modules.services.embedder import create_embedding_generator
+from modules.services.embedding_service import EmbeddingService, UploadBuffer
+from modules.services.http_pool import AsyncHTTPPool
+from modules.services.labeler import AsyncLabeler, create_labeler
+from modules.services.local_labeler import enrich_definition
+from modules.services.metrics import time_stage
+from modules.services.postprocess import EmbeddingPostProcessor
+from modules.services.provider import openai
+from modules.services.single_flight import AsyncSingleFlight, FlightAbandoned
+from modules.template import EmbeddingRecord
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEmbeddingService(EmbeddingService):
+    def __init__(self, cache=None, chunker=None, http_pool=None):
+        """
+        Initializes the embedding service for the grpc.aio server.
+
+        The labeler and the embedding generator share one pool of HTTP connections,
+        so the number of concurrent provider requests is bounded by HTTP_POOL_SIZE
+        while any number of RPCs wait on them without holding a thread.
+
+        Args:
+            cache (EmbeddingCache): Cache of processed documents.
+            chunker (TextChunker): Chunker used when chunking is enabled.
+            http_pool (AsyncHTTPPool): Connection pool shared by the provider clients.
+        """
+        # The backends below are created from the configuration, so it is validated before they are
+        Config.validate()
+        self.http_pool = http_pool or AsyncHTTPPool()
+        embedder = self._default_async_embedder()
+        postprocessor = EmbeddingPostProcessor()
+        super().__init__(
+            cache=cache,
+            chunker=chunker,
+            labeler=create_labeler(
+                asynchronous=True, http_pool=self.http_pool,
+                dimension=postprocessor.output_dimension(getattr(embedder, "dimension", None)),
+            ),
+            embedder=embedder,
+            enricher=AsyncLabeler(http_pool=self.http_pool) if Config.LABEL_MODE == "local+llm" else None,
+            postprocessor=postprocessor,
+        )
+        self.flights = AsyncSingleFlight()
+        # Requests wait on the event loop, so as many can be processed as there are pooled connections
+        self.admission = AsyncAdmissionController(Config.ADMISSION_MAX_ACTIVE or Config.HTTP_POOL_SIZE)
+        self._enrichment_tasks = set()
+
+    def _default_async_embedder(self):
+        """Create the async embedder, batching concurrent requests together when enabled."""
+        embedder = create_embedding_generator(asynchronous=True, http_pool=self.http_pool)
+        return AsyncEmbeddingBatcher(embedder) if Config.BATCHING_ENABLED else embedder
+
+    async def warm_up(self):
+        """
+        Warms up the backends and the cache off the event loop, then opens provider connections.
+
+        WARMUP_CONNECTIONS connections are opened in the shared pool. Failing to
+        connect is only logged; the first request connects again.
+        """
+        await asyncio.to_thread(EmbeddingService.warm_up, self)
+        if Config.uses_openai() and Config.WARMUP_CONNECTIONS:
+            try:
+                await self.http_pool.warm_up(openai.api_base, Config.WARMUP_CONNECTIONS)
+            except Exception as e:
+                logger.warning("Could not open connections to the provider during warm-up: %s", e)
+
+    async def close(self):
+        """Flush pending batches, finish the label enrichment and release the pooled connections."""
+        if isinstance(self.embedder, AsyncEmbeddingBatcher):
+            await self.embedder.close()
+        if self._enrichment_tasks:
+            await asyncio.gather(*self._enrichment_tasks, return_exceptions=True)
+        await self.http_pool.close()
+        await asyncio.to_thread(self.cache.close)
+
+    async def _enrich(self, cache_key, definition_json, text):
+        """
+        Ask the model for labels and store them in the cached record without blocking.
+
+        Args:
+            cache_key (str): Cache key of the record to update.
+            definition_json (str): The local definition.
+            text (str): The document text.
+        """
+        try:
+            generated = await self.enricher.create_definition_from_text(text)
+            await asyncio.to_thread(
+                self.cache.update_definition, cache_key, enrich_definition(definition_json, generated)
+            )
+        except Exception as e:
+            logger.warning("Label enrichment failed for %s: %s", cache_key, e)
+
+    def _schedule_enrichment(self, cache_key, definition_json, text):
+        """Run `_enrich` as a background task when a model is configured to enrich local labels."""
+        if self.enricher is None:
+            return
+        task = asyncio.create_task(self._enrich(cache_key, definition_json, text))
+        self._enrichment_tasks.add(task)
+        task.add_done_callback(self._enrichment_tasks.discard)
+
+    async def _cached(self, cache_key):
+        """Look up the cache off the event loop; a disk hit reads the store and a miss may reach the remote tier."""
+        return await asyncio.to_thread(self.cache.get, cache_key)
+
+    async def _persist(self, cache_key, record, text, document=None, sketch=None):
+        """Save a finished record in the cache off the event loop and start the enrichment of its labels."""
+        with time_stage("persist"):
+            await asyncio.to_thread(self.cache.put, cache_key, record, document, sketch)
+        self._schedule_enrichment(cache_key, record.definition, text)
+
+    async def _embed(self, file_name, cache_key, load_text, encoding=JSON):
+        """
+        Serve a document from the cache, or label and embed it without blocking.
+
+        Args:
+            file_name (str): Original file name, used for logging and to find the document's previous version.
+            cache_key (str): Cache key of the document content.
+            load_text (callable): Returns the decoded document text; only called on a cache miss.
+            encoding (int): Encoding of the returned vectors.
+
+        Yields:
+            EmbeddingResponse: The result for the document.
+        """
+        while True:
+            cached_record = await self._cached(cache_key)
+            if cached_record is not None:
+                logger.info("Content of '%s' found in cache (%s). Using the cached embedding.", file_name, cache_key)
+                yield self._response(cached_record, "complete", encoding)
+                return
+
+            flight, leading = self.flights.join(cache_key)
+            if leading:
+                cached_record = await asyncio.to_thread(self._recheck_cache, cache_key)
+                if cached_record is None:
+                    break
+                self.flights.finish(cache_key, flight, cached_record)
+                yield self._response(cached_record, "complete", encoding)
+                return
+
+            logger.info("Content of '%s' is already being processed (%s). Waiting for it.", file_name, cache_key)
+            try:
+                # Shielded so a cancelled waiter does not cancel the leader's result for everyone else
+                record = await asyncio.shield(flight)
+            except FlightAbandoned:
+                continue
+            yield self._response(record, "complete", encoding)
+            return
+
+        try:
+            with time_stage("decode"):
+                text = load_text()
+            # Shingling and hashing are CPU-bound, and the lookup may read the matched record from disk
+            sketch = await asyncio.to_thread(self._sketch, text)
+            duplicate = await asyncio.to_thread(self._near_duplicate, sketch)
+            document = self._document_key(file_name)
+            if duplicate is not None:
+                record = await asyncio.to_thread(self._store_duplicate, cache_key, duplicate, document)
+                response = self._response(record, "complete", encoding)
+            else:
+                previous = await asyncio.to_thread(self._previous_record, document)
+                if self.pipeline and previous is None:
+                    async for response in self._embed_pipelined(cache_key, text, encoding, flight, document, sketch):
+                        yield response
+                    return
+
+                record = await self._create_record(text, previous)
+                response = self._response(record, "complete", encoding)
+                await self._persist(cache_key, record, text, document, sketch)
+        except RequestAborted:
+            self.flights.abandon(cache_key, flight)
+            raise
+        except Exception as e:
+            self.flights.finish(cache_key, flight, error=e)
+            raise
+        except BaseException:
+            # Cancelled, or the client went away mid-stream; let a waiting request take over
+            self.flights.abandon(cache_key, flight)
+            raise
+        self.flights.finish(cache_key, flight, record)
+        yield response
+
+    async def _create_record(self, text, previous=None):
+        """
+        Label and embed a text without blocking.
+
+        Args:
+            text (str): The decoded document text.
+            previous (EmbeddingRecord): Stored record of the document's previous version, whose
+                                        unchanged chunks are reused instead of embedded again.
+
+        Returns:
+            EmbeddingRecord: The finished record.
+        """
+        chunks = self._split(text)
+        update = self._chunk_update(previous, chunks)
+        if update is not None:
+            definition_json = previous.definition
+            if update.relabel:
+                with time_stage("label"):
+                    definition_json = await self.labeler.create_definition_from_text(text)
+            texts = self._update_texts(definition_json, update)
+            embeddings = None
+            if texts:
+                with time_stage("embed"):
+                    embeddings = await self.embedder.get_embeddings(texts)
+            return self._updated_record(definition_json, chunks, update, embeddings)
+
+        if self.pipeline:
+            with time_stage("embed"):
+                embeddings = await self.embedder.get_embeddings(self._source_texts(text, chunks))
+            record = self._build_source_record(chunks, embeddings)
+            with time_stage("label"):
+                record.definition = await self.labeler.create_definition_from_text(text)
+            return record
+
+        with time_stage("label"):
+            definition_json = await self.labeler.create_definition_from_text(text)
+        logger.debug("Definition JSON: %s", definition_json)
+
+        with time_stage("embed"):
+            embeddings = await self.embedder.get_embeddings([definition_json] + [chunk["text"] for chunk in chunks])
+        return self._build_record(definition_json, chunks, embeddings)
+
+    @staticmethod
+    async def _timed(stage, coroutine):
+        """Await a coroutine, timing it as one stage."""
+        with time_stage(stage):
+            return await coroutine
+
+    async def _embed_pipelined(self, cache_key, text, encoding=JSON, flight=None, document=None, sketch=None):
+        """
+        Label the text and embed it concurrently, streaming each half as soon as it is ready.
+
+        Args:
+            cache_key (str): Cache key of the document content.
+            text (str): The decoded document text.
+            encoding (int): Encoding of the returned vectors.
+            flight (Future): Flight of the cache key led by this request, finished once the record is stored.
+            document (str): Identity of the document for incremental updates, if enabled.
+            sketch (tuple): Near-duplicate sketch of the text, if enabled.
+
+        Yields:
+            EmbeddingResponse: An "embedding" and a "definition" response, in the order they finish.
+        """
+        chunks = self._split(text)
+        label_task = asyncio.create_task(self._timed("label", self.labeler.create_definition_from_text(text)))
+        embed_task = asyncio.create_task(
+            self._timed("embed", self.embedder.get_embeddings(self._source_texts(text, chunks)))
+        )
+
+        record, definition_json = None, None
+        pending = {label_task, embed_task}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is embed_task:
+                        record = self._build_source_record(chunks, task.result())
+                        yield self._response(record, "embedding", encoding)
+                    else:
+                        definition_json = task.result()
+                        yield self._response(EmbeddingRecord(definition_json, None), "definition", encoding)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        record.definition = definition_json
+        await self._persist(cache_key, record, text, document, sketch)
+        if flight is not None:
+            self.flights.finish(cache_key, flight, record)
+
+    @asynccontextmanager
+    async def _admitted(self, context, size=0):
+        """
+        Hold a processing slot for a document RPC and make its deadline visible to the provider calls.
+
+        Args:
+            context (grpc.aio.ServicerContext): Context of the call, carrying its deadline and priority.
+            size (int): Bytes of the request, if already known.
+
+        Yields:
+            Ticket: The admitted request.
+        """
+        deadline = Deadline.from_context(context)
+        async with self.admission.admit(request_priority(context), size, deadline) as ticket:
+            with use_deadline(deadline):
+                yield ticket
+
+    async def StreamEmbedding(self, request, context):
+        try:
+            async with self._admitted(context, request.ByteSize()):
+                async for response in self._embed_request(request):
+                    yield response
+
+        except Exception as e:
+            await context.abort(status_code(e), str(e))
+
+    async def UploadEmbedding(self, request_iterator, context):
+        try:
+            async with self._admitted(context) as ticket:
+                with UploadBuffer() as upload:
+                    async for chunk in request_iterator:
+                        # The size of an upload is only known as it arrives
+                        ticket.add_bytes(len(chunk.data))
+                        upload.add(chunk)
+                    content_digest = upload.finish()
+
+                    cache_key = EmbeddingCache.make_key_from_digest(
+                        content_digest, self.labeler.label_model, self.embedder.embedding_model,
+                        self._cache_variant()
+                    )
+                    async for response in self._embed(
+                        upload.file_name, cache_key, upload.load_text, upload.encoding
+                    ):
+                        yield response
+
+        except Exception as e:
+            await context.abort(status_code(e), str(e))
+
+    async def _process_document(self, request, results, priority="normal", deadline=None):
+        """Embed one EmbedStream document, putting each response, or its error, on the results queue."""
+        try:
+            async with self.admission.admit(priority, request.ByteSize(), deadline):
+                with use_deadline(deadline):
+                    index = 0
+                    async for response in self._embed_request(request):
+                        results.put_nowait(self._document_response(request.id, response, index))
+                        index += 1
+        except Exception as e:
+            logger.warning("Document %s of an embedding stream failed: %s", request.id, e)
+            results.put_nowait(self._document_error(request.id, e))
+
+    async def EmbedStream(self, request_iterator, context):
+        """
+        Embeds the documents of a bidirectional stream concurrently on the event loop.
+
+        Behaves like the thread-pool version: responses come back as documents
+        finish, at most STREAM_MAX_IN_FLIGHT documents are in progress per stream,
+        and a failing document gets an error response without ending the stream.
+        """
+        priority, deadline = request_priority(context), Deadline.from_context(context)
+        results = asyncio.Queue()
+        slots = asyncio.Semaphore(Config.STREAM_MAX_IN_FLIGHT)
+        tasks = set()
+
+        async def read():
+            try:
+                async for request in request_iterator:
+                    await slots.acquire()
+                    results.put_nowait(self._SUBMITTED)
+                    task = asyncio.create_task(self._process_document(request, results, priority, deadline))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            except Exception as e:
+                logger.debug("Embedding stream reader stopped: %s", e)
+            finally:
+                results.put_nowait(self._READ_DONE)
+
+        reader = asyncio.create_task(read())
+        reading, outstanding = True, 0
+        try:
+            while reading or outstanding:
+                item = await results.get()
+                if item is self._SUBMITTED:
+                    outstanding += 1
+                elif item is self._READ_DONE:
+                    reading = False
+                else:
+                    yield item
+                    if item.last:
+                        outstanding -= 1
+                        slots.release()
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    async def Health(self, request, context):
+        return self._health_response()
+
+    async def Search(self, request, context):
+        try:
+            if request.query_vector:
+                query = list(request.query_vector)
+            elif request.query_text:
+                # Stored vectors are post-processed; the query has to be in the same space
+                query = self.postprocessor.process(await self.embedder.get_embedding(request.query_text))[0]
+            else:
+                raise InvalidArgument("Either query_text or query_vector is required.")
+
+            # The scan is CPU-bound; run it off the event loop
+            hits = await asyncio.to_thread(self._search, query, request)
+            return self._search_response(hits)
+
+        except Exception as e:
+            await context.abort(status_code(e), str(e))
@@ -0,0 +1,544 @@
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent import futures
+from modules.config import Config
+from modules.services.embedder import EmbeddingGenerator
+from modules.services.labeler import Labeler
+from modules.services.provider import get_provider_client, openai
+from modules.storage.files import atomic_write
+
+CHAT_ENDPOINT = "/v1/chat/completions"
+EMBEDDINGS_ENDPOINT = "/v1/embeddings"
+
+logger = logging.getLogger(__name__)
+BATCH_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchItem:
+    def __init__(self, item_id, name, path=None, text=None):
+        """
+        One document of a batch job, read from a file or given inline.
+
+        Args:
+            item_id (str): Identifier used in the checkpoint and the output file name.
+            name (str): Name used in log messages.
+            path (str): File holding the document.
+            text (str): The document itself, for manifests that carry the text inline.
+        """
+        self.item_id = item_id
+        self.name = name
+        self.path = path
+        self.text = text
+
+    def load(self):
+        """
+        Reads the document.
+
+        Returns:
+            bytes: The raw document content.
+        """
+        if self.text is not None:
+            return self.text.encode("utf-8")
+        with open(self.path, "rb") as file:
+            return file.read()
+
+
+def iter_directory(directory, pattern=r".*\.txt$"):
+    """
+    Lists the documents of a directory tree, in a stable order.
+
+    Args:
+        directory (str): Directory to scan.
+        pattern (str): Regular expression the file names must match.
+
+    Yields:
+        BatchItem: One item per file, identified by its path relative to `directory`.
+    """
+    name_pattern = re.compile(pattern)
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file_name in sorted(files):
+            if name_pattern.match(file_name):
+                path = os.path.join(root, file_name)
+                relative = os.path.relpath(path, directory)
+                yield BatchItem(relative, relative, path=path)
+
+
+def iter_manifest(manifest_path, id_field="id", text_field="text", path_field="path"):
+    """
+    Reads the documents listed in a JSON-lines manifest.
+
+    Each line names a document by `path_field` (relative to the manifest) or
+    carries it inline in `text_field`.
+
+    Args:
+        manifest_path (str): The manifest file.
+        id_field (str): Field holding the document identifier; the line number is used when absent.
+        text_field (str): Field holding inline text.
+        path_field (str): Field holding a file path.
+
+    Yields:
+        BatchItem: One item per line.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            item_id = str(entry.get(id_field, line_number))
+            if entry.get(path_field):
+                yield BatchItem(item_id, entry[path_field], path=os.path.join(base_dir, entry[path_field]))
+            elif entry.get(text_field) is not None:
+                yield BatchItem(item_id, item_id, text=entry[text_field])
+            else:
+                raise ValueError(f"Line {line_number} of {manifest_path} has neither '{path_field}' nor '{text_field}'.")
+
+
+class Checkpoint:
+    def __init__(self, path):
+        """
+        Records the outcome of every item of a job in a JSON-lines file, so a rerun skips finished items.
+
+        Args:
+            path (str): The checkpoint file.
+        """
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from an interrupted run; that item is simply redone.
+                        break
+                    self.entries[entry["id"]] = entry
+
+    def is_done(self, item_id):
+        """
+        Checks whether an item already succeeded. Failed items are retried.
+
+        Args:
+            item_id (str): Identifier of the item.
+
+        Returns:
+            bool: True if the item can be skipped.
+        """
+        return self.entries.get(item_id, {}).get("status") == "ok"
+
+    def record(self, item_id, status, **fields):
+        """
+        Appends the outcome of an item.
+
+        Args:
+            item_id (str): Identifier of the item.
+            status (str): "ok" or "failed".
+            **fields: Extra JSON-serializable details, such as the cache key or the error.
+        """
+        entry = dict(fields, id=item_id, status=status)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry) + "\n")
+            self.entries[item_id] = entry
+
+
+class BatchReport:
+    def __init__(self):
+        """Counts the outcome, throughput and estimated cost of a batch job."""
+        self.total = 0
+        self.skipped = 0
+        self.succeeded = 0
+        self.cached = 0
+        self.failed = 0
+        self.failures = []
+        self.label_tokens = 0
+        self.embedding_tokens = 0
+        self.cost = 0.0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, status, cached=False, item_id=None, error=None):
+        """Count one finished item."""
+        with self._lock:
+            if status == "ok":
+                self.succeeded += 1
+                if cached:
+                    self.cached += 1
+            else:
+                self.failed += 1
+                self.failures.append({"id": item_id, "error": error})
+
+    def finish(self):
+        """Stop the clock."""
+        self.elapsed = time.monotonic() - self.started
+
+    def to_dict(self):
+        """
+        Returns the report.
+
+        Returns:
+            dict: Item counts, documents per second, estimated tokens and cost, and the first failures.
+        """
+        processed = self.succeeded + self.failed
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "succeeded": self.succeeded,
+            "cached": self.cached,
+            "failed": self.failed,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "documents_per_second": round(processed / self.elapsed, 3) if self.elapsed else 0.0,
+            "label_tokens": self.label_tokens,
+            "embedding_tokens": self.embedding_tokens,
+            "estimated_cost": round(self.cost, 6),
+            "failures": self.failures[:100],
+        }
+
+
+class LocalBatchBackend:
+    def __init__(self, handlers=None):
+        """
+        Stand-in for the provider batch API that sends each request through the regular endpoints.
+
+        Args:
+            handlers (dict): Maps an endpoint to a function taking a request body and
+                             returning the response body. Defaults to the OpenAI endpoints.
+        """
+        self.handlers = handlers or {
+            CHAT_ENDPOINT: lambda body: get_provider_client("label").call(openai.ChatCompletion.create, **body),
+            EMBEDDINGS_ENDPOINT: lambda body: get_provider_client("embedding").call(openai.Embedding.create, **body),
+        }
+
+    def run(self, endpoint, requests):
+        """
+        Runs a batch of requests.
+
+        Args:
+            endpoint (str): CHAT_ENDPOINT or EMBEDDINGS_ENDPOINT.
+            requests (list): Dicts with a "custom_id" and a "body".
+
+        Returns:
+            dict: The response body, or the exception raised, for each custom_id.
+        """
+        results = {}
+        for request in requests:
+            try:
+                results[request["custom_id"]] = self.handlers[endpoint](request["body"])
+            except Exception as e:
+                results[request["custom_id"]] = e
+        return results
+
+
+class OpenAIBatchBackend:
+    def __init__(self, poll_seconds=None):
+        """
+        Runs requests through the OpenAI Batch API, which is cheaper but completes within 24 hours.
+
+        Args:
+            poll_seconds (float): Delay between status checks.
+        """
+        self.poll_seconds = poll_seconds if poll_seconds is not None else Config.BATCH_API_POLL_SECONDS
+
+    def run(self, endpoint, requests):
+        """
+        Uploads the requests, waits for the batch to complete and downloads the results.
+
+        Args:
+            endpoint (str): CHAT_ENDPOINT or EMBEDDINGS_ENDPOINT.
+            requests (list): Dicts with a "custom_id" and a "body".
+
+        Returns:
+            dict: The response body, or an exception describing the failure, for each custom_id.
+        """
+        lines = "\n".join(
+            json.dumps({"custom_id": r["custom_id"], "method": "POST", "url": endpoint, "body": r["body"]})
+            for r in requests
+        )
+        upload = openai.File.create(file=io.BytesIO(lines.encode("utf-8")), purpose="batch",
+                                    user_provided_filename="batch.jsonl")
+        requestor = openai.api_requestor.APIRequestor()
+        response, _, _ = requestor.request("post", "/batches", params={
+            "input_file_id": upload["id"], "endpoint": endpoint, "completion_window": "24h",
+        })
+        batch = response.data
+        logger.info("Submitted provider batch %s with %d request(s).", batch["id"], len(requests))
+        while batch["status"] not in BATCH_FINAL_STATES:
+            time.sleep(self.poll_seconds)
+            response, _, _ = requestor.request("get", f"/batches/{batch['id']}")
+            batch = response.data
+        if batch["status"] != "completed":
+            raise RuntimeError(f"Provider batch {batch['id']} ended with status '{batch['status']}'.")
+
+        results = {}
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            for line in openai.File.download(file_id).decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                item_response = item.get("response") or {}
+                if item_response.get("status_code") == 200:
+                    results[item["custom_id"]] = item_response["body"]
+                else:
+                    error = item.get("error") or item_response.get("body", {}).get("error")
+                    results[item["custom_id"]] = RuntimeError(f"Provider batch request failed: {error}")
+        return results
+
+
+def _provider_of(component):
+    """Find the ProviderClient used by a labeler or embedder, looking through a batcher."""
+    provider = getattr(component, "provider", None)
+    if provider is None and hasattr(component, "embedder"):
+        provider = getattr(component.embedder, "provider", None)
+    return provider
+
+
+class BatchRunner:
+    def __init__(self, service, job_dir, workers=None, output_dir=None, backend=None, window=1000):
+        """
+        Initializes a job that labels and embeds many documents with an EmbeddingService.
+
+        Documents go through the service's content cache, so finished documents are
+        never paid for twice. Each outcome is appended to a checkpoint in `job_dir`,
+        and a rerun of the same job skips the documents that already succeeded.
+
+        Without a `backend`, documents are processed by a pool of `workers` threads.
+        With one, they are processed `window` at a time: all labels of a window are
+        sent as one batch, then all embeddings.
+
+        Args:
+            service (EmbeddingService): Service doing the labeling, embedding and caching.
+            job_dir (str): Directory holding the checkpoint and the report.
+            workers (int): Number of documents processed concurrently.
+            output_dir (str): Optional directory receiving one JSON file per document.
+            backend (LocalBatchBackend | OpenAIBatchBackend): Optional batch backend.
+            window (int): Number of documents per batch when a backend is used.
+        """
+        self.service = service
+        self.job_dir = job_dir
+        self.workers = workers or Config.BATCH_JOB_WORKERS
+        self.output_dir = output_dir
+        self.backend = backend
+        self.window = window
+        os.makedirs(job_dir, exist_ok=True)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.checkpoint = Checkpoint(os.path.join(job_dir, "checkpoint.jsonl"))
+
+    def run(self, items):
+        """
+        Runs the job.
+
+        Args:
+            items (iterable): The BatchItems to process.
+
+        Returns:
+            BatchReport: The outcome of the run, also saved as report.json in the job directory.
+        """
+        report = BatchReport()
+        pending = []
+        for item in items:
+            report.total += 1
+            if self.checkpoint.is_done(item.item_id):
+                report.skipped += 1
+            else:
+                pending.append(item)
+
+        if self.backend is None:
+            usage_before = self._usage()
+            self._run_pool(pending, report)
+            usage_after = self._usage()
+            report.label_tokens = usage_after["label"] - usage_before["label"]
+            report.embedding_tokens = usage_after["embedding"] - usage_before["embedding"]
+            report.cost = self._cost(report, 1.0)
+        else:
+            for start in range(0, len(pending), self.window):
+                self._run_window(pending[start:start + self.window], report)
+            report.cost = self._cost(report, Config.BATCH_API_DISCOUNT)
+
+        report.finish()
+        with atomic_write(os.path.join(self.job_dir, "report.json")) as file:
+            json.dump(report.to_dict(), file, indent=4)
+        return report
+
+    def _usage(self):
+        """Read the token counters of the providers used by the service."""
+        usage = {}
+        for name, component in (("label", self.service.labeler), ("embedding", self.service.embedder)):
+            provider = _provider_of(component)
+            usage[name] = provider.usage()["tokens"] if provider is not None else 0
+        return usage
+
+    @staticmethod
+    def _cost(report, factor):
+        """Estimate the provider cost of the tokens counted in the report."""
+        return factor * (
+            report.label_tokens / 1000 * Config.LABEL_PRICE_PER_1K_TOKENS
+            + report.embedding_tokens / 1000 * Config.EMBEDDING_PRICE_PER_1K_TOKENS
+        )
+
+    def _write_output(self, item, record):
+        """Save the rendered record when an output directory is set."""
+        if not self.output_dir:
+            return
+        safe_name = re.sub(r"[^\w.-]+", "_", os.path.splitext(item.item_id)[0])
+        with open(os.path.join(self.output_dir, f"{safe_name}_embedded.json"), "w", encoding="utf-8") as file:
+            file.write(record.to_json())
+
+    def _finish_item(self, item, report, cache_key=None, record=None, cached=False, error=None):
+        """Write the output, the checkpoint line and the report counters of one item."""
+        if error is None:
+            try:
+                self._write_output(item, record)
+            except Exception as e:
+                error = e
+        if error is not None:
+            logger.warning("Failed to embed '%s': %s", item.name, error)
+            self.checkpoint.record(item.item_id, "failed", error=str(error))
+            report.add("failed", item_id=item.item_id, error=str(error))
+        else:
+            self.checkpoint.record(item.item_id, "ok", key=cache_key, cached=cached)
+            report.add("ok", cached=cached)
+
+    def _process(self, item, report):
+        """Embed one document through the service."""
+        try:
+            cache_key, record, cached = self.service.embed_document(item.load(), item.name)
+        except Exception as e:
+            self._finish_item(item, report, error=e)
+            return
+        self._finish_item(item, report, cache_key, record, cached)
+
+    def _run_pool(self, items, report):
+        """Process the items on a thread pool, keeping a bounded number of them in flight."""
+        with futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-job") as executor:
+            in_flight = set()
+            for item in items:
+                if len(in_flight) >= 2 * self.workers:
+                    _, in_flight = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+                in_flight.add(executor.submit(self._process, item, report))
+            futures.wait(in_flight)
+
+    def _run_window(self, items, report):
+        """Process a window of items with one label batch and one embedding batch."""
+        service = self.service
+        loaded = []
+        for item in items:
+            try:
+                content = item.load()
+                loaded.append((item, service._get_cache_key(content), content))
+            except Exception as e:
+                self._finish_item(item, report, error=e)
+
+        # One lookup for the whole window, so a remote cache tier costs one round trip
+        cached = service.cache.get_many([cache_key for _, cache_key, _ in loaded])
+        documents = []
+        for item, cache_key, content in loaded:
+            record = cached.get(cache_key)
+            if record is not None:
+                self._finish_item(item, report, cache_key, record, cached=True)
+                continue
+            try:
+                documents.append((item, cache_key, service.labeler.load_text_from_stream(content)))
+            except Exception as e:
+                self._finish_item(item, report, error=e)
+
+        definitions = self._label_batch(documents, report)
+        documents = [(item, key, text) for item, key, text in documents if item.item_id in definitions]
+        embedded = self._embed_batch(documents, definitions, report)
+
+        for item, cache_key, text in documents:
+            result = embedded[item.item_id]
+            if isinstance(result, Exception):
+                self._finish_item(item, report, error=result)
+                continue
+            chunks, embeddings = result
+            try:
+                definition = definitions[item.item_id]
+                if service.pipeline:
+                    record = service._build_source_record(chunks, embeddings)
+                    record.definition = definition
+                else:
+                    record = service._build_record(definition, chunks, embeddings)
+                record.validate()
+                service._store(cache_key, record, text)
+            except Exception as e:
+                self._finish_item(item, report, error=e)
+                continue
+            self._finish_item(item, report, cache_key, record)
+
+    def _label_batch(self, documents, report):
+        """Label the documents, through the backend when the labeler calls a model."""
+        labeler = self.service.labeler
+        definitions = {}
+        if not isinstance(labeler, Labeler):
+            for item, _, text in documents:
+                try:
+                    definitions[item.item_id] = labeler.create_definition_from_text(text)
+                except Exception as e:
+                    self._finish_item(item, report, error=e)
+            return definitions
+
+        requests = []
+        for item, _, text in documents:
+            request, tokens = labeler._prepare_request(text)
+            report.label_tokens += tokens
+            requests.append({"custom_id": item.item_id, "body": request})
+        results = self.backend.run(CHAT_ENDPOINT, requests) if requests else {}
+        for item, _, _ in documents:
+            result = results.get(item.item_id, RuntimeError("The batch returned no result."))
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                definitions[item.item_id] = result["choices"][0]["message"]["content"].strip()
+            except Exception as e:
+                self._finish_item(item, report, error=e)
+        return definitions
+
+    def _embed_batch(self, documents, definitions, report):
+        """Embed the documents, through the backend when the embedder calls the OpenAI API."""
+        service = self.service
+        embedder = getattr(service.embedder, "embedder", service.embedder)
+        inputs = {}
+        for item, _, text in documents:
+            chunks = service._split(text)
+            if service.pipeline:
+                texts = service._source_texts(text, chunks)
+            else:
+                texts = [definitions[item.item_id]] + [chunk["text"] for chunk in chunks]
+            inputs[item.item_id] = (chunks, texts)
+
+        embedded = {}
+        if not isinstance(embedder, EmbeddingGenerator):
+            for item_id, (chunks, texts) in inputs.items():
+                try:
+                    embedded[item_id] = (chunks, embedder.get_embeddings(texts))
+                except Exception as e:
+                    embedded[item_id] = e
+            return embedded
+
+        requests = []
+        for item_id, (_, texts) in inputs.items():
+            report.embedding_tokens += sum(embedder.tokenizer.count(text) for text in texts)
+            requests.append({"custom_id": item_id, "body": {"model": embedder.embedding_model, "input": texts}})
+        results = self.backend.run(EMBEDDINGS_ENDPOINT, requests) if requests else {}
+        for item_id, (chunks, _) in inputs.items():
+            result = results.get(item_id, RuntimeError("The batch returned no result."))
+            if isinstance(result, Exception):
+                embedded[item_id] = result
+                continue
+            try:
+                embedded[item_id] = (chunks, EmbeddingGenerator._parse_embeddings(result))
+            except Exception as e:
+                embedded[item_id] = e
+        return embedded
@@ -0,0 +1,300 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent import futures
+from modules.config import Config
+
+
+class BatchStats:
+    def __init__(self, max_batch_size):
+        """
+        Counts the batches sent by a batcher and how full they were.
+
+        Args:
+            max_batch_size (int): Number of texts that makes a batch full.
+        """
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.items = 0
+        self.requests = 0
+        self.full_batches = 0
+        self.deadline_batches = 0
+        self._lock = threading.Lock()
+
+    def record(self, requests, items, full):
+        """Record one dispatched batch."""
+        with self._lock:
+            self.batches += 1
+            self.requests += requests
+            self.items += items
+            if full:
+                self.full_batches += 1
+            else:
+                self.deadline_batches += 1
+
+    def snapshot(self):
+        """
+        Returns the batch counters.
+
+        Returns:
+            dict: Batch and item counts, the average batch size and the fill ratio.
+        """
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "items": self.items,
+                "full_batches": self.full_batches,
+                "deadline_batches": self.deadline_batches,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "fill_ratio": self.items / (self.batches * self.max_batch_size) if self.batches else 0.0,
+            }
+
+
+class EmbeddingBatcher:
+    def __init__(self, embedder, max_batch_size=None, max_wait_ms=None, max_in_flight=None):
+        """
+        Collects texts from concurrent callers into shared embedding requests.
+
+        A batch is sent once it holds `max_batch_size` texts or once its first text
+        has waited `max_wait_ms`, whichever comes first. The batcher has the same
+        `get_embeddings` interface as the EmbeddingGenerator it wraps.
+
+        Args:
+            embedder (EmbeddingGenerator): Generator used to send the batches.
+            max_batch_size (int): Maximum number of texts per batch.
+            max_wait_ms (float): Maximum time the first text of a batch waits for others.
+            max_in_flight (int): Maximum number of batches sent concurrently.
+        """
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size or Config.BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else Config.BATCH_MAX_WAIT_MS) / 1000
+        self.stats = BatchStats(self.max_batch_size)
+
+        self._pending = queue.Queue()
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_in_flight or Config.BATCH_MAX_IN_FLIGHT)
+        self._closed = False
+        self._thread = threading.Thread(target=self._collect, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def embedding_model(self):
+        """The embedding model of the wrapped generator."""
+        return self.embedder.embedding_model
+
+    @property
+    def dimension(self):
+        """The vector dimension of the wrapped generator, if it is known."""
+        return getattr(self.embedder, "dimension", None)
+
+    def warm_up(self):
+        """Warms up the wrapped generator."""
+        if hasattr(self.embedder, "warm_up"):
+            self.embedder.warm_up()
+
+    def _collect(self):
+        """Gather pending requests into batches and hand them to the executor."""
+        while True:
+            request = self._pending.get()
+            if request is None:
+                return
+            batch, size = [request], len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._pending.put(None)
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self.stats.record(len(batch), size, size >= self.max_batch_size)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        """Send one batch and hand each caller its slice of the results."""
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            embeddings = self.embedder.get_embeddings(texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for request_texts, future in batch:
+            future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+    def submit(self, texts):
+        """
+        Queues texts for the next batch.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            concurrent.futures.Future: Resolves to one embedding per text, in the same order.
+        """
+        if self._closed:
+            raise RuntimeError("The batcher is closed.")
+        future = futures.Future()
+        self._pending.put((list(texts), future))
+        return future
+
+    def get_embeddings(self, texts):
+        """
+        Embeds texts as part of a shared batch, blocking until the batch returns.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One embedding vector per text, in the same order.
+        """
+        return self.submit(texts).result()
+
+    def get_embedding(self, text):
+        """
+        Embeds a single text as part of a shared batch.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            list: The embedding vector.
+        """
+        return self.get_embeddings([text])[0]
+
+    def close(self):
+        """Send the pending batches and stop the collector."""
+        self._closed = True
+        self._pending.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+
+class AsyncEmbeddingBatcher:
+    def __init__(self, embedder, max_batch_size=None, max_wait_ms=None):
+        """
+        Collects texts from concurrent coroutines into shared embedding requests.
+
+        The asyncio counterpart of EmbeddingBatcher, wrapping an AsyncEmbeddingGenerator.
+        Batches are sent as separate tasks, so collecting the next batch never waits
+        for the previous one to return.
+
+        Args:
+            embedder (AsyncEmbeddingGenerator): Generator used to send the batches.
+            max_batch_size (int): Maximum number of texts per batch.
+            max_wait_ms (float): Maximum time the first text of a batch waits for others.
+        """
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size or Config.BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else Config.BATCH_MAX_WAIT_MS) / 1000
+        self.stats = BatchStats(self.max_batch_size)
+
+        self._pending = None
+        self._collector = None
+        self._dispatches = set()
+
+    @property
+    def embedding_model(self):
+        """The embedding model of the wrapped generator."""
+        return self.embedder.embedding_model
+
+    @property
+    def dimension(self):
+        """The vector dimension of the wrapped generator, if it is known."""
+        return getattr(self.embedder, "dimension", None)
+
+    def warm_up(self):
+        """Warms up the wrapped generator."""
+        if hasattr(self.embedder, "warm_up"):
+            self.embedder.warm_up()
+
+    def _start(self):
+        """Start the collector task in the running event loop on first use."""
+        if self._collector is None or self._collector.done():
+            self._pending = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+
+    async def _collect(self):
+        """Gather pending requests into batches and send each batch as a task."""
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await self._pending.get()
+            batch, size = [request], len(request[0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._pending.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self.stats.record(len(batch), size, size >= self.max_batch_size)
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        """Send one batch and hand each caller its slice of the results."""
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            embeddings = await self.embedder.get_embeddings(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for request_texts, future in batch:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+    async def get_embeddings(self, texts):
+        """
+        Embeds texts as part of a shared batch.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One embedding vector per text, in the same order.
+        """
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._pending.put((list(texts), future))
+        return await future
+
+    async def get_embedding(self, text):
+        """
+        Embeds a single text as part of a shared batch.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            list: The embedding vector.
+        """
+        return (await self.get_embeddings([text]))[0]
+
+    async def close(self):
+        """Stop collecting and wait for the batches already sent."""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
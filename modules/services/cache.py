@@ -0,0 +1,526 @@
+import hashlib
+import json
+import logging
+import struct
+import threading
+import time
+from collections import OrderedDict
+from modules.config import Config
+from modules.proto.embedding.embedding_buffer_pb2 import FLOAT16, FLOAT32, INT8, Vectors
+from modules.services.metrics import CACHE_LOOKUPS
+from modules.services.sketch import decode_signature, encode_signature
+from modules.storage import (
+    BackgroundWriter, RemoteStoreError, SketchIndex, VectorIndex, VectorStore, create_remote_store,
+)
+from modules.template import EmbeddingRecord
+from modules.template.binary_template import decode_vectors, encode_vectors
+
+logger = logging.getLogger(__name__)
+
+REMOTE_ENCODINGS = {"float32": FLOAT32, "float16": FLOAT16, "int8": INT8}
+
+# Remote values start with the length of their JSON metadata
+_METADATA_LENGTH = struct.Struct("<I")
+
+
+class EmbeddingCache:
+    def __init__(self, store=None, max_memory_items=None, remote=None):
+        """
+        Initializes a tiered cache for embedding records keyed by content hash.
+
+        The in-memory tier is a small LRU in front of the on-disk VectorStore. The
+        store is bounded by total size and drops its oldest shards first; entries
+        read from the oldest shard are moved forward so hot records survive.
+
+        An optional remote tier, shared by every server replica, is consulted after
+        both local tiers. Its hits are copied into the local tiers. New records are
+        written to it in the background, so a remote that is slow or down costs
+        misses but never delays a response.
+
+        Args:
+            store (VectorStore): Store used for the on-disk tier.
+            max_memory_items (int): Maximum number of records held in memory.
+            remote (RedisStore or MemoryStore): Store used for the shared tier. Defaults to REMOTE_CACHE_URL.
+        """
+        self.store = store if store is not None else VectorStore()
+        self.max_memory_items = max_memory_items if max_memory_items is not None else Config.CACHE_MEMORY_ITEMS
+        self.remote = remote if remote is not None else create_remote_store()
+        self._remote_writer = None
+        if self.remote is not None:
+            self._remote_writer = BackgroundWriter(self.remote, Config.REMOTE_CACHE_TTL)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._index = None
+        self._sketches = None
+        self._documents = {}
+        self._document_keys = set()
+        # Serializes scans of the store for documents, which read it without holding the cache lock
+        self._scan_lock = threading.Lock()
+        self._documents_scanned = False
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.remote_hits = 0
+
+    @staticmethod
+    def make_key(content, label_model, embedding_model, variant=""):
+        """
+        Builds a cache key from the document content and the models used to process it.
+
+        Args:
+            content (bytes): Raw content of the document.
+            label_model (str): Model used to generate the definition.
+            embedding_model (str): Model used to generate the embedding.
+            variant (str): Any other setting that changes the result, such as the chunking settings.
+
+        Returns:
+            str: A hex digest identifying the content and model combination.
+        """
+        content_digest = hashlib.sha256(content).hexdigest()
+        return EmbeddingCache.make_key_from_digest(content_digest, label_model, embedding_model, variant)
+
+    @staticmethod
+    def make_key_from_digest(content_digest, label_model, embedding_model, variant=""):
+        """
+        Builds a cache key from a sha256 digest of the content, for content that was hashed incrementally.
+
+        Args:
+            content_digest (str): Hex sha256 digest of the raw content.
+            label_model (str): Model used to generate the definition.
+            embedding_model (str): Model used to generate the embedding.
+            variant (str): Any other setting that changes the result, such as the chunking settings.
+
+        Returns:
+            str: A hex digest identifying the content and model combination.
+        """
+        key_source = f"{content_digest}:{label_model}:{embedding_model}"
+        if variant:
+            key_source += f":{variant}"
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _to_stored(record, document=None, sketch=None):
+        """Pack a record into one matrix of rows plus the metadata describing them."""
+        metadata = {"definition": record.definition}
+        if record.chunks is not None:
+            metadata["chunks"] = record.chunks
+        if record.document_embedding is not None:
+            metadata["pooled"] = True
+        if document is not None:
+            metadata["document"] = document
+            metadata["stored_at"] = time.time()
+        if sketch is not None:
+            scope, signature = sketch
+            metadata["sketch"] = encode_signature(signature)
+            metadata["sketch_scope"] = scope
+        if record.duplicate_of is not None:
+            metadata["duplicate_of"] = record.duplicate_of
+            metadata["similarity"] = record.similarity
+        return record.to_matrix(), metadata
+
+    @staticmethod
+    def _from_stored(vectors, metadata):
+        """Unpack a matrix and its metadata written by `_to_stored`."""
+        chunks = metadata.get("chunks")
+        chunk_embeddings = None
+        if chunks is not None:
+            chunk_embeddings = vectors[1:1 + len(chunks)]
+        document_embedding = vectors[-1] if metadata.get("pooled") else None
+        return EmbeddingRecord(
+            metadata["definition"], vectors[0], chunks, chunk_embeddings, document_embedding, matrix=vectors,
+            duplicate_of=metadata.get("duplicate_of"), similarity=metadata.get("similarity"),
+        )
+
+    @staticmethod
+    def _to_remote(matrix, metadata):
+        """Serialize stored rows and their metadata into one compact value for the remote tier."""
+        header = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+        vectors = encode_vectors(matrix, REMOTE_ENCODINGS[Config.REMOTE_CACHE_ENCODING])
+        return _METADATA_LENGTH.pack(len(header)) + header + vectors.SerializeToString()
+
+    @staticmethod
+    def _from_remote(value):
+        """Unpack a value written by `_to_remote` into the rows and their metadata."""
+        (length,) = _METADATA_LENGTH.unpack_from(value)
+        start = _METADATA_LENGTH.size
+        metadata = json.loads(value[start:start + length])
+        return decode_vectors(Vectors.FromString(value[start + length:])), metadata
+
+    @staticmethod
+    def _search_vector(matrix, pooled):
+        """The row that represents the whole document: the pooled embedding if there is one, else the first."""
+        return matrix[-1] if pooled else matrix[0]
+
+    def _index_keys(self, index, keys):
+        """Add the stored vectors of `keys` to the search index."""
+        for key in keys:
+            stored = self.store.get(key)
+            if stored is not None:
+                vectors, metadata = stored
+                index.add(key, self._search_vector(vectors, metadata.get("pooled")))
+
+    def _search_index(self):
+        """Return the search index, building it from the disk tier on first use."""
+        if self._index is None:
+            index = VectorIndex()
+            self._index_keys(index, self.store.keys())
+            self._index = index
+        elif self.store.reload():
+            # Other server processes sharing the store have added entries
+            self._index_keys(self._index, [key for key in self.store.keys() if key not in self._index])
+        return self._index
+
+    def _index_sketches(self, index, keys):
+        """Add the MinHash signatures stored with `keys` to the near-duplicate index."""
+        for key in keys:
+            stored = self.store.get(key)
+            if stored is not None and "sketch" in stored[1]:
+                index.add(key, decode_signature(stored[1]["sketch"]), stored[1].get("sketch_scope", ""))
+
+    def _sketch_index(self):
+        """Return the near-duplicate index, building it from the disk tier on first use."""
+        if self._sketches is None:
+            index = SketchIndex()
+            self._index_sketches(index, self.store.keys())
+            self._sketches = index
+        elif self.store.reload():
+            self._index_sketches(self._sketches, [key for key in self.store.keys() if key not in self._sketches])
+        return self._sketches
+
+    def _index_entry(self, key, matrix, metadata):
+        """Add a new entry to the indexes that have been built."""
+        if self._index is not None:
+            self._index.add(key, self._search_vector(matrix, metadata.get("pooled")))
+        if self._sketches is not None and "sketch" in metadata:
+            self._sketches.add(key, decode_signature(metadata["sketch"]), metadata.get("sketch_scope", ""))
+
+    def warm_up(self, near_duplicates=False):
+        """
+        Builds the search index now, so the first search does not wait for it.
+
+        Args:
+            near_duplicates (bool): Also build the near-duplicate index.
+        """
+        with self._lock:
+            self._search_index()
+            if near_duplicates:
+                self._sketch_index()
+
+    def search(self, query, k=None, metric=None, exact=False):
+        """
+        Finds the cached documents whose vectors are closest to a query vector.
+
+        The index is built from the disk tier on the first search and then kept
+        up to date by `put`.
+
+        Args:
+            query (array-like): The query vector.
+            k (int): Number of results.
+            metric (str): "cosine", "l2" or "ip" (inner product).
+            exact (bool): Scan every vector instead of the closest inverted lists.
+
+        Returns:
+            list: Up to `k` (key, score, definition) tuples, best first.
+        """
+        k = k or Config.SEARCH_TOP_K
+        metric = metric or Config.SEARCH_METRIC
+        with self._lock:
+            index = self._search_index()
+        while True:
+            hits, stale = [], False
+            for key, score in index.search(query, k, metric, exact):
+                stored = self.store.get(key)
+                if stored is None:
+                    # Evicted from the store since it was indexed; search again without it
+                    index.remove(key)
+                    stale = True
+                    continue
+                hits.append((key, score, stored[1]["definition"]))
+            if not stale:
+                return hits
+
+    def search_dimensions(self):
+        """
+        Returns the vector sizes a search can match, building the index on first use.
+
+        Returns:
+            list: The dimensions of the stored search vectors, ascending.
+        """
+        with self._lock:
+            index = self._search_index()
+        return index.dimensions()
+
+    def _remember(self, key, record):
+        """Insert a record into the memory tier, evicting the least recently used one."""
+        self._memory[key] = record
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or key in self.store
+
+    def _get_local(self, key, disk_hits):
+        """
+        Look up a record in the memory tier, then the disk tier, counting the hit. Call with the lock held.
+
+        Keys found on disk are appended to `disk_hits`, to be refreshed in the store once the lock is released.
+        """
+        record = self._memory.get(key)
+        if record is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            self.memory_hits += 1
+            CACHE_LOOKUPS.labels("memory").inc()
+            return record
+
+        stored = self.store.get(key)
+        if stored is None:
+            return None
+
+        record = self._from_stored(*stored)
+        disk_hits.append(key)
+        self._remember(key, record)
+        self.hits += 1
+        self.disk_hits += 1
+        CACHE_LOOKUPS.labels("disk").inc()
+        return record
+
+    def _get_remote(self, keys):
+        """
+        Looks up keys in the remote tier in one round trip.
+
+        Returns:
+            dict: The rows and metadata of each key found; empty if the remote tier is unavailable.
+        """
+        try:
+            values = self.remote.get_many(keys, Config.REMOTE_CACHE_TTL)
+        except RemoteStoreError as e:
+            logger.warning("Remote cache lookup failed; treating %d keys as misses: %s", len(keys), e)
+            return {}
+        found = {}
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            try:
+                found[key] = self._from_remote(value)
+            except Exception as e:
+                logger.warning("Ignoring unreadable remote cache entry %s: %s", key, e)
+        return found
+
+    def get(self, key):
+        """
+        Looks up a record, checking the memory tier, then the disk tier, then the remote tier.
+
+        Args:
+            key (str): Cache key built with `make_key`.
+
+        Returns:
+            EmbeddingRecord: The cached record, or None on a miss.
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """
+        Looks up several records, fetching those missing locally from the remote tier in one round trip.
+
+        Args:
+            keys (list): Cache keys built with `make_key`.
+
+        Returns:
+            dict: The cached record of each key found.
+        """
+        found, disk_hits = {}, []
+        with self._lock:
+            for key in keys:
+                record = self._get_local(key, disk_hits)
+                if record is not None:
+                    found[key] = record
+        for key in disk_hits:
+            # Keep entries that are still read out of the next eviction; usually a no-op without the file lock
+            self.store.refresh(key)
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        # The remote round trip is made without holding the lock
+        remote = self._get_remote(missing) if missing and self.remote is not None else {}
+        with self._lock:
+            for key, (vectors, metadata) in remote.items():
+                # Keep a local copy so later lookups on this replica stay local
+                self.store.put(key, vectors, metadata)
+                record = self._from_stored(vectors, metadata)
+                self._remember(key, record)
+                self._index_entry(key, vectors, metadata)
+                found[key] = record
+            self.hits += len(remote)
+            self.remote_hits += len(remote)
+            self.misses += len(missing) - len(remote)
+        CACHE_LOOKUPS.labels("remote").inc(len(remote))
+        CACHE_LOOKUPS.labels("miss").inc(len(missing) - len(remote))
+        return found
+
+    def _write_remote(self, key, matrix, metadata):
+        """Queue a write of stored rows to the remote tier."""
+        if self._remote_writer is not None:
+            self._remote_writer.submit(key, self._to_remote(matrix, metadata))
+
+    def put(self, key, record, document=None, sketch=None):
+        """
+        Stores a record in the local tiers, and in the remote tier in the background.
+
+        Args:
+            key (str): Cache key built with `make_key`.
+            record (EmbeddingRecord): The record to store.
+            document (str): Optional identity of the document, such as a key built from its name,
+                            under which `latest` finds the record when the document changes.
+            sketch (tuple): Optional (scope, MinHash signature) of the document text,
+                            under which `near_duplicate` finds the record for similar texts.
+        """
+        with self._lock:
+            matrix, metadata = self._to_stored(record, document, sketch)
+            self.store.put(key, matrix, metadata)
+            if document is not None:
+                self._documents[document] = (metadata["stored_at"], key)
+            self._remember(key, record)
+            self._index_entry(key, matrix, metadata)
+        self._write_remote(key, matrix, metadata)
+
+    def near_duplicate(self, signature, scope, threshold):
+        """
+        Finds the stored document most similar to a text, if it is similar enough.
+
+        The lookup does not count as a cache hit or miss. The near-duplicate index
+        is built from the disk tier on first use and then kept up to date by `put`.
+
+        Args:
+            signature (numpy.ndarray): MinHash signature of the text.
+            scope (str): Scope of the signature, as passed to `put`.
+            threshold (float): Minimum estimated Jaccard similarity.
+
+        Returns:
+            tuple: The key, the similarity and the EmbeddingRecord of the document, or None.
+        """
+        with self._lock:
+            index = self._sketch_index()
+            for key, similarity in index.query(signature, scope, threshold):
+                record = self._memory.get(key)
+                if record is None:
+                    stored = self.store.get(key)
+                    if stored is None:
+                        # Evicted from the store since it was indexed
+                        index.remove(key)
+                        continue
+                    record = self._from_stored(*stored)
+                return key, similarity, record
+        return None
+
+    def _scan_documents(self):
+        """Record the documents of the stored entries not seen yet, keeping the latest entry of each."""
+        found = []
+        for key in self.store.keys():
+            if key in self._document_keys:
+                continue
+            self._document_keys.add(key)
+            stored = self.store.get(key)
+            document = stored[1].get("document") if stored is not None else None
+            if document is not None:
+                found.append((document, stored[1].get("stored_at", 0.0), key))
+        with self._lock:
+            for document, stored_at, key in found:
+                if stored_at >= self._documents.get(document, (-1.0, None))[0]:
+                    self._documents[document] = (stored_at, key)
+
+    def latest(self, document):
+        """
+        Looks up the most recently stored record of a document, whatever its content.
+
+        The lookup does not count as a cache hit or miss; it serves to update a
+        document from its previous version rather than to answer a request.
+
+        Args:
+            document (str): Identity of the document passed to `put`.
+
+        Returns:
+            EmbeddingRecord: The latest record of the document, or None if none is stored.
+        """
+        with self._scan_lock:
+            # Other server processes sharing the store may have stored a newer version; only scan when they did
+            if self.store.reload() or not self._documents_scanned:
+                self._scan_documents()
+                self._documents_scanned = True
+        with self._lock:
+            _, key = self._documents.get(document, (None, None))
+            record = self._memory.get(key) if key is not None else None
+        if key is None or record is not None:
+            return record
+        stored = self.store.get(key)
+        if stored is None:
+            # Evicted from the store
+            with self._lock:
+                if self._documents.get(document, (None, None))[1] == key:
+                    del self._documents[document]
+            return None
+        return self._from_stored(*stored)
+
+    def update_definition(self, key, definition):
+        """
+        Replaces the definition of a cached record, keeping its embeddings.
+
+        Args:
+            key (str): Cache key built with `make_key`.
+            definition (str): The new definition.
+
+        Returns:
+            bool: False if the record is no longer cached.
+        """
+        with self._lock:
+            stored = self.store.get(key)
+            if stored is None:
+                self._memory.pop(key, None)
+                return False
+            metadata = dict(stored[1], definition=definition)
+            self.store.update_metadata(key, metadata)
+            record = self._memory.get(key)
+            if record is not None:
+                self._memory[key] = EmbeddingRecord(
+                    definition, record.embedding, record.chunks, record.chunk_embeddings, record.document_embedding,
+                    matrix=record.matrix, duplicate_of=record.duplicate_of, similarity=record.similarity,
+                )
+        self._write_remote(key, stored[0], metadata)
+        return True
+
+    def flush(self):
+        """Waits until the queued writes to the remote tier have been sent."""
+        if self._remote_writer is not None:
+            self._remote_writer.flush()
+
+    def close(self):
+        """Sends the queued remote writes and closes the remote connections."""
+        if self.remote is not None:
+            self.flush()
+            self.remote.close()
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hit and miss counters plus the current tier sizes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "remote_hits": self.remote_hits,
+                "evictions": self.store.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(self.store),
+                "disk_bytes": self.store.total_bytes(),
+                "remote_writes_dropped": self._remote_writer.dropped if self._remote_writer is not None else 0,
+            }
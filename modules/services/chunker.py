@@ -0,0 +1,196 @@
+import hashlib
+import re
+import zlib
+import numpy as np
+from modules.config import Config
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a word/punctuation approximation
+    tiktoken = None
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class Tokenizer:
+    def __init__(self, encoding_name=None):
+        """
+        Initializes a tokenizer used to measure and split text in model tokens.
+
+        Uses tiktoken when it is installed, otherwise approximates tokens as words
+        and punctuation marks, which slightly undercounts for long or rare words.
+
+        Args:
+            encoding_name (str): tiktoken encoding to use, e.g. "cl100k_base".
+        """
+        self.encoding_name = encoding_name or Config.CHUNK_TOKENIZER
+        self._loaded_encoding = None
+
+    @property
+    def _encoding(self):
+        """The tiktoken encoding, loaded on first use since reading its vocabulary slows down startup."""
+        if self._loaded_encoding is None and tiktoken is not None:
+            self._loaded_encoding = tiktoken.get_encoding(self.encoding_name)
+        return self._loaded_encoding
+
+    @property
+    def name(self):
+        """Identifies the tokenizer, for use in cache keys."""
+        return self.encoding_name if tiktoken else "regex"
+
+    def warm_up(self):
+        """Loads the encoding now instead of on the first text."""
+        self.count("")
+
+    def count(self, text):
+        """
+        Counts the tokens in a text.
+
+        Args:
+            text (str): The text to measure.
+
+        Returns:
+            int: The number of tokens.
+        """
+        if not isinstance(text, str):
+            raise TypeError("Text must be a string.")
+        if self._encoding:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+    def spans(self, text):
+        """
+        Splits a text into tokens and returns their character offsets.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list: (start, end) character offsets, one per token.
+        """
+        if self._encoding:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            _, offsets = self._encoding.decode_with_offsets(tokens)
+            ends = offsets[1:] + [len(text)]
+            return list(zip(offsets, ends))
+        return [match.span() for match in TOKEN_PATTERN.finditer(text)]
+
+
+class TextChunker:
+    def __init__(self, window=None, overlap=None, tokenizer=None, boundaries=None):
+        """
+        Initializes a chunker that splits text into overlapping token windows.
+
+        With "fixed" boundaries each chunk starts `window - overlap` tokens after the
+        previous one, so inserting or removing a single token moves every later
+        boundary. With "content" boundaries a chunk ends at a token whose hash picks
+        it as a cut point, once the chunk is a quarter of the way to its maximum
+        size. Boundaries then depend on the nearby text only, and an edit changes
+        the chunks around it while the chunks before and after it stay the same,
+        which lets updated documents reuse the vectors of their unchanged chunks.
+
+        Args:
+            window (int): Maximum number of tokens per chunk.
+            overlap (int): Number of tokens shared by consecutive chunks.
+            tokenizer (Tokenizer): Tokenizer used to measure the windows.
+            boundaries (str): "fixed" or "content"; defaults to `Config.chunk_boundaries()`.
+        """
+        self.window = window or Config.CHUNK_WINDOW_TOKENS
+        self.overlap = overlap if overlap is not None else Config.CHUNK_OVERLAP_TOKENS
+        self.boundaries = boundaries or Config.chunk_boundaries()
+        if not 0 <= self.overlap < self.window:
+            raise ValueError("Chunk overlap must be smaller than the chunk window.")
+        if self.boundaries not in ("fixed", "content"):
+            raise ValueError("Chunk boundaries must be either 'fixed' or 'content'.")
+        self.tokenizer = tokenizer or Tokenizer()
+
+    @property
+    def signature(self):
+        """Identifies the chunking settings, for use in cache keys."""
+        signature = f"chunks:{self.window}:{self.overlap}:{self.tokenizer.name}"
+        return signature if self.boundaries == "fixed" else f"{signature}:content"
+
+    def _fixed_windows(self, spans):
+        """Yield the first and last token of every chunk, starting a chunk every `window - overlap` tokens."""
+        step = self.window - self.overlap
+        for first in range(0, len(spans), step):
+            last = min(first + self.window, len(spans)) - 1
+            yield first, last
+            if last == len(spans) - 1:
+                return
+
+    def _content_windows(self, text, spans):
+        """Yield the first and last token of every chunk, cutting after tokens chosen by their hash."""
+        step = self.window - self.overlap
+        min_tokens = max(1, step // 4)
+        hashes = np.fromiter(
+            (zlib.crc32(text[start:end].encode("utf-8")) for start, end in spans), dtype=np.uint32, count=len(spans)
+        )
+        # About one token in step / 2 is a cut point, so chunks average about three quarters of the step
+        cuts = np.flatnonzero(hashes % max(1, step // 2) == 0)
+        first = 0
+        while first < len(spans):
+            last = min(first + step, len(spans)) - 1
+            cut = np.searchsorted(cuts, first + min_tokens - 1)
+            if cut < len(cuts) and cuts[cut] < last:
+                last = int(cuts[cut])
+            # The overlap is taken from the end of the previous chunk
+            yield max(0, first - self.overlap), last
+            first = last + 1
+
+    def split(self, text):
+        """
+        Splits a text into chunks of at most `window` tokens.
+
+        Chunk boundaries fall on token boundaries. Every chunk carries a hash of its
+        text, so a later version of the document can tell which chunks are unchanged.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list: One dict per chunk with the chunk text, its character offsets, token count and hash.
+        """
+        spans = self.tokenizer.spans(text)
+        if self.boundaries == "fixed":
+            windows = self._fixed_windows(spans)
+        else:
+            windows = self._content_windows(text, spans)
+        chunks = []
+        for first, last in windows:
+            start, end = spans[first][0], spans[last][1]
+            chunks.append({
+                "text": text[start:end], "start": start, "end": end, "tokens": last - first + 1,
+                "hash": chunk_hash(text[start:end]),
+            })
+        return chunks
+
+
+def chunk_hash(text):
+    """
+    Hashes the text of a chunk.
+
+    Args:
+        text (str): The chunk text.
+
+    Returns:
+        str: A short hex digest identifying the text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def pool_embeddings(vectors, weights=None):
+    """
+    Pools chunk embeddings into a single L2-normalized document embedding.
+
+    Args:
+        vectors (array-like): Matrix of chunk embeddings, one row per chunk.
+        weights (list): Optional weight per chunk, such as its token count.
+
+    Returns:
+        numpy.ndarray: The pooled float32 vector.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    pooled = np.average(matrix, axis=0, weights=weights).astype(np.float32)
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm else pooled
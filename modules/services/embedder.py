@@ -1,41 +1,164 @@
-import openai
+import asyncio
+import logging
 from modules.config import Config
+from modules.services.chunker import Tokenizer
+from modules.services.http_pool import AsyncHTTPPool
+from modules.services.local_embedder import AsyncHashingEmbeddingGenerator, HashingEmbeddingGenerator
+from modules.services.provider import get_provider_client, openai
 
-# Ensure all required configurations are set
-Config.validate()
+logger = logging.getLogger(__name__)
+
+# Output dimension of the OpenAI embedding models, reported in local definitions
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
 
 
 class EmbeddingGenerator:
-    def __init__(self, embedding_model=None):
+    def __init__(self, embedding_model=None, batch_size=None, batch_tokens=None, provider=None):
         """
         Initializes the embedding generator with the specified models.
         Args:
-            model (str): OpenAI model for generating embeddings.
-            label_model (str): OpenAI model for generating labels.
+            embedding_model (str): OpenAI model for generating embeddings.
+            batch_size (int): Maximum number of inputs sent in one API request.
+            batch_tokens (int): Maximum number of tokens sent in one API request.
+            provider (ProviderClient): Client applying rate limits and retries to API calls.
         """
         self.embedding_model = embedding_model or Config.DEFAULT_MODEL
-        
-        openai.api_key = Config.OPENAI_API_KEY
-        print("OpenAI API key set successfully for embedding generation.")
+        self.dimension = MODEL_DIMENSIONS.get(self.embedding_model)
+        self.provider = provider or get_provider_client("embedding")
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.batch_tokens = batch_tokens or Config.EMBEDDING_BATCH_TOKENS
+        self.tokenizer = Tokenizer()
+
+    def warm_up(self):
+        """Imports the OpenAI client and loads the tokenizer ahead of the first request."""
+        openai.load()
+        self.tokenizer.warm_up()
+
+    def _batches(self, texts):
+        """Group texts into batches that respect the input and token limits of one request."""
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = self.tokenizer.count(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.batch_tokens):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch, batch_tokens
+
+    @staticmethod
+    def _parse_embeddings(response):
+        """Extract the embeddings from an API response in input order."""
+        # The API may return the items out of order; restore the input order.
+        data = sorted(response['data'], key=lambda item: item.get('index', 0))
+        return [item['embedding'] for item in data]
+
+    def get_embeddings(self, texts):
+        """
+        Fetches the embeddings for many texts, packing as many as allowed into each API request.
+        Args:
+            texts (list): The texts to embed.
+        Returns:
+            list: One embedding vector per text, in the same order.
+        """
+        try:
+            embeddings = []
+            for batch, tokens in self._batches(texts):
+                response = self.provider.call(
+                    openai.Embedding.create,
+                    tokens=tokens,
+                    model=self.embedding_model,
+                    input=batch
+                )
+                embeddings.extend(self._parse_embeddings(response))
+            logger.debug("Embedding generation completed for %d input(s).", len(embeddings))
+            return embeddings
+        except Exception as e:
+            logger.error("Failed to generate embedding: %s", e)
+            raise
 
     def get_embedding(self, text):
         """
         Fetches the embedding for the given text using OpenAI's API.
         Args:
             text (str): The text to embed.
-            model (str): The embedding model to use. Defaults to self.model.
         Returns:
             list: The embedding vector.
         """
-        try:
-            response = openai.Embedding.create(
-                model=self.embedding_model,
-                input=[text]
+        return self.get_embeddings([text])[0]
+
+
+class AsyncEmbeddingGenerator(EmbeddingGenerator):
+    def __init__(self, embedding_model=None, batch_size=None, batch_tokens=None, provider=None, http_pool=None):
+        """
+        Initializes an embedding generator whose API calls do not block the event loop.
+        Args:
+            embedding_model (str): OpenAI model for generating embeddings.
+            batch_size (int): Maximum number of inputs sent in one API request.
+            batch_tokens (int): Maximum number of tokens sent in one API request.
+            provider (ProviderClient): Client applying rate limits and retries to API calls.
+            http_pool (AsyncHTTPPool): Pool of HTTP connections shared with other async clients.
+        """
+        super().__init__(embedding_model, batch_size, batch_tokens, provider)
+        self.http_pool = http_pool or AsyncHTTPPool()
+
+    async def _get_batch(self, batch, tokens):
+        """Embed one batch through the shared connection pool."""
+        async with self.http_pool.session():
+            response = await self.provider.acall(
+                openai.Embedding.acreate, tokens=tokens, model=self.embedding_model, input=batch
             )
-            print("Connection to OpenAI API successful for embedding generation.")
-            embedding = response['data'][0]['embedding']
-            print("Embedding generation completed successfully.")
-            return embedding
+        return self._parse_embeddings(response)
+
+    async def get_embeddings(self, texts):
+        """
+        Fetches the embeddings for many texts, sending the batches concurrently.
+        Args:
+            texts (list): The texts to embed.
+        Returns:
+            list: One embedding vector per text, in the same order.
+        """
+        try:
+            # Counting tokens to pack the batches is CPU-bound
+            batches = await asyncio.to_thread(lambda: list(self._batches(texts)))
+            results = await asyncio.gather(*(self._get_batch(batch, tokens) for batch, tokens in batches))
+            return [embedding for batch in results for embedding in batch]
         except Exception as e:
-            print(f"Failed to generate embedding: {e}")
-            raise
\ No newline at end of file
+            logger.error("Failed to generate embedding: %s", e)
+            raise
+
+    async def get_embedding(self, text):
+        """
+        Fetches the embedding for the given text without blocking.
+        Args:
+            text (str): The text to embed.
+        Returns:
+            list: The embedding vector.
+        """
+        return (await self.get_embeddings([text]))[0]
+
+
+def create_embedding_generator(asynchronous=False, http_pool=None):
+    """
+    Creates the embedding generator selected by EMBEDDING_BACKEND.
+
+    Every generator exposes `embedding_model`, `get_embeddings(texts)` and
+    `get_embedding(text)`; the async variants expose the same methods as coroutines.
+
+    Args:
+        asynchronous (bool): Create the asyncio variant.
+        http_pool (AsyncHTTPPool): Connection pool for the async OpenAI generator.
+
+    Returns:
+        The embedding generator.
+    """
+    if Config.EMBEDDING_BACKEND == "local":
+        return AsyncHashingEmbeddingGenerator() if asynchronous else HashingEmbeddingGenerator()
+    if asynchronous:
+        return AsyncEmbeddingGenerator(http_pool=http_pool)
+    return EmbeddingGenerator()
@@ -1,77 +1,911 @@
+import codecs
+import contextvars
+import hashlib
+import logging
 import os
-from modules.proto.embedding.embedding_buffer_pb2 import EmbeddingResponse
-from modules.services import Labeler, EmbeddingGenerator
-from modules.template import EmbeddingJSONTemplate
+import queue
+import tempfile
+import threading
+from concurrent import futures
+from contextlib import contextmanager
+import grpc
+from modules.config import Config
+from modules.proto.embedding.embedding_buffer_pb2 import (
+    COSINE, INNER_PRODUCT, JSON, L2, DocumentResponse, EmbeddingResponse, HealthResponse, SearchResponse,
+)
+from modules.services import Labeler, EmbeddingCache
+from modules.services.admission import (
+    AdmissionController, Deadline, InvalidArgument, RequestAborted, current_deadline, request_priority, status_code,
+    use_deadline,
+)
+from modules.services.batcher import EmbeddingBatcher
+from modules.services.embedder import create_embedding_generator
+from modules.services.chunker import TextChunker, pool_embeddings
+from modules.services.incremental import ChunkUpdate
+from modules.services.labeler import create_labeler
+from modules.services.local_labeler import enrich_definition
+from modules.services.metrics import NEAR_DUPLICATES, UPDATED_CHUNKS, time_stage, timed_stage
+from modules.services.postprocess import EmbeddingPostProcessor
+from modules.services.single_flight import FlightAbandoned, SingleFlight
+from modules.services.sketch import MinHasher
+from modules.template import EmbeddingRecord
+from modules.template.binary_template import encode_definition
 
-class EmbeddingService:
+METRIC_NAMES = {COSINE: "cosine", L2: "l2", INNER_PRODUCT: "ip"}
+
+logger = logging.getLogger(__name__)
+
+class UploadBuffer:
     def __init__(self):
-        self.labeler = Labeler()
-        self.embedder = EmbeddingGenerator()
-        self.embedded_dir = "embed/embedded"
-        os.makedirs(self.embedded_dir, exist_ok=True)  # Ensure the directory exists
-
-    def _get_embedded_file_path(self, file_name):
-        """Construct the path to the embedded file based on the file name."""
-        name, _ = os.path.splitext(file_name)  # Extract the base name without extension
-        return os.path.join(self.embedded_dir, f"{name}_embedded.json")
-
-    def _read_embedded_file(self, file_path):
-        """Read the content of an existing embedded file."""
-        with open(file_path, "r", encoding="utf-8") as file:
-            return file.read()
-
-    def _save_embedded_file(self, file_path, content):
-        """Save the content to an embedded file."""
-        with open(file_path, "w", encoding="utf-8") as file:
-            file.write(content)
-        print(f"Embedded file saved at: {file_path}")
+        """
+        Accumulates an upload chunk by chunk.
 
-    def StreamEmbedding(self, request, context):
+        Each chunk is hashed and decoded as it arrives and then dropped; the decoded
+        text is spooled to disk once it outgrows UPLOAD_SPOOL_BYTES.
+        """
+        self.file_name = None
+        self.encoding = JSON
+        self.received = 0
+        self._hasher = hashlib.sha256()
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._spool = tempfile.SpooledTemporaryFile(max_size=Config.UPLOAD_SPOOL_BYTES, mode="w+", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._spool.close()
+
+    def _decode(self, data, final=False):
+        """Decode the next bytes, keeping incomplete characters for the next chunk."""
+        try:
+            self._spool.write(self._decoder.decode(data, final=final))
+        except UnicodeDecodeError:
+            raise ValueError("The file stream could not be decoded as UTF-8.")
+
+    def add(self, chunk):
+        """
+        Hashes and decodes one uploaded chunk.
+
+        Args:
+            chunk (Chunk): The next chunk of the upload.
+        """
+        if self.file_name is None:
+            self.file_name = chunk.file_name
+            self.encoding = chunk.encoding
+            if not self.file_name:
+                raise ValueError("File name is missing in the first chunk.")
+        self._hasher.update(chunk.data)
+        self.received += len(chunk.data)
+        self._decode(chunk.data)
+
+    def finish(self):
+        """
+        Completes the upload.
+
+        Returns:
+            str: Hex sha256 digest of the uploaded bytes.
+        """
+        if self.file_name is None:
+            raise ValueError("No chunks were received.")
+        if not self.received:
+            raise ValueError("File stream is empty.")
+        self._decode(b"", final=True)
+        return self._hasher.hexdigest()
+
+    def load_text(self):
+        """
+        Reads back the decoded text.
+
+        Returns:
+            str: The decoded upload.
+        """
+        self._spool.seek(0)
+        return self._spool.read()
+
+
+class EmbeddingService:
+    # Markers passed from an EmbedStream reader to the response loop
+    _SUBMITTED = object()
+    _READ_DONE = object()
+
+    def __init__(self, cache=None, chunker=None, labeler=None, embedder=None, enricher=None, postprocessor=None):
+        # Ensure all required configurations are set; injected backends do not need the API key
+        Config.validate(require_api_key=labeler is None or embedder is None or (
+            enricher is None and Config.LABEL_MODE == "local+llm"
+        ))
+        self.embedder = embedder or self._default_embedder()
+        self.postprocessor = postprocessor or EmbeddingPostProcessor()
+        self.labeler = labeler or create_labeler(dimension=self._output_dimension())
+        self.cache = cache or EmbeddingCache()
+        self.chunker = chunker or (TextChunker() if Config.CHUNKING_ENABLED else None)
+        self.pool_chunks = Config.CHUNK_POOLING
+        self.enricher = enricher or (Labeler() if Config.LABEL_MODE == "local+llm" else None)
+        self.pipeline = Config.PIPELINE_ENABLED
+        self.incremental = Config.INCREMENTAL_UPDATES
+        self.hasher = MinHasher() if Config.NEAR_DUPLICATES else None
+        self.near_duplicate_threshold = Config.NEAR_DUPLICATE_THRESHOLD
+        self.flights = SingleFlight()
+        self.admission = AdmissionController()
+        self.serving = True
+        self._enrichment = None
+        self._pipeline_executor = None
+        self._stream_executor = None
+        self._stream_executor_lock = threading.Lock()
+
+    def _output_dimension(self):
+        """The size of the stored vectors, reported by the local labeler, if it is known."""
+        return self.postprocessor.output_dimension(getattr(self.embedder, "dimension", None))
+
+    def _default_embedder(self):
+        """Create the embedder, batching concurrent requests together when enabled."""
+        embedder = create_embedding_generator()
+        return EmbeddingBatcher(embedder) if Config.BATCHING_ENABLED else embedder
+
+    def warm_up(self):
+        """
+        Loads what the first request would otherwise wait for.
+
+        The backends import their provider client and tokenizer, and the cache
+        builds its search index from the vector store. Run it before reporting
+        that the server is ready.
+        """
+        for component in (self.embedder, self.labeler, self.enricher):
+            if hasattr(component, "warm_up"):
+                component.warm_up()
+        self.cache.warm_up(near_duplicates=self.hasher is not None)
+
+    def close(self):
+        """Flush pending batches, finish the label enrichment already started and send the pending cache writes."""
+        if isinstance(self.embedder, EmbeddingBatcher):
+            self.embedder.close()
+        if self._enrichment is not None:
+            self._enrichment.shutdown(wait=True)
+        if self._pipeline_executor is not None:
+            self._pipeline_executor.shutdown(wait=True)
+        if self._stream_executor is not None:
+            self._stream_executor.shutdown(wait=True)
+        self.cache.close()
+
+    def _enrich(self, cache_key, definition_json, text):
+        """
+        Ask the model for labels and store them in the cached record.
+
+        The embeddings are kept as they are; only the definition is replaced.
+
+        Args:
+            cache_key (str): Cache key of the record to update.
+            definition_json (str): The local definition.
+            text (str): The document text.
+        """
         try:
-            # Extract file name from the request
-            file_name = request.file_name
-            if not file_name:
-                raise ValueError("File name is missing in the request.")
-
-            # Determine the path to the embedded file
-            embedded_file_path = self._get_embedded_file_path(file_name)
-
-            # Check if the embedded file already exists
-            if os.path.exists(embedded_file_path):
-                print(f"Embedded file '{embedded_file_path}' already exists. Using the cached file.")
-                cached_content = self._read_embedded_file(embedded_file_path)
-                yield EmbeddingResponse(json_stream=cached_content)
+            generated = self.enricher.create_definition_from_text(text)
+            self.cache.update_definition(cache_key, enrich_definition(definition_json, generated))
+        except Exception as e:
+            logger.warning("Label enrichment failed for %s: %s", cache_key, e)
+
+    def _schedule_enrichment(self, cache_key, definition_json, text):
+        """Run `_enrich` in the background when a model is configured to enrich local labels."""
+        if self.enricher is None:
+            return
+        if self._enrichment is None:
+            self._enrichment = futures.ThreadPoolExecutor(
+                max_workers=Config.LABEL_ENRICH_WORKERS, thread_name_prefix="label-enrichment"
+            )
+        self._enrichment.submit(self._enrich, cache_key, definition_json, text)
+
+    def _cache_variant(self):
+        """Describe the settings besides the models that change the stored result."""
+        parts = []
+        if self.postprocessor.signature:
+            parts.append(self.postprocessor.signature)
+        if self.chunker is not None:
+            parts.append(f"{self.chunker.signature}:pooled" if self.pool_chunks else self.chunker.signature)
+        if self.pipeline:
+            # Pipelined records hold vectors of the source text instead of the definition
+            parts.append("source")
+        return ":".join(parts)
+
+    def _get_cache_key(self, file_content):
+        """Build the cache key for the content and the models that will process it."""
+        return EmbeddingCache.make_key(
+            file_content, self.labeler.label_model, self.embedder.embedding_model, self._cache_variant()
+        )
+
+    def _document_key(self, file_name):
+        """
+        Identify a document by its name and the settings that process it, when incremental updates are enabled.
+
+        Args:
+            file_name (str): Name of the document sent by the client.
+
+        Returns:
+            str: The key under which the cache tracks the document's latest version, or None.
+        """
+        if not self.incremental or self.chunker is None or not file_name:
+            return None
+        return EmbeddingCache.make_key(
+            file_name.encode("utf-8"), self.labeler.label_model, self.embedder.embedding_model, self._cache_variant()
+        )
+
+    def _recheck_cache(self, cache_key):
+        """Look up a key again after taking the lead of its flight, without counting a second miss."""
+        return self.cache.get(cache_key) if cache_key in self.cache else None
+
+    @staticmethod
+    def _wait_for_flight(flight):
+        """
+        Wait for the result of a flight led by another request, as long as this request's result is still wanted.
+
+        Args:
+            flight (Future): The flight returned by `SingleFlight.join`.
+
+        Returns:
+            EmbeddingRecord: The leader's record.
+
+        Raises:
+            FlightAbandoned: If the leader went away; the caller should take over.
+            RequestAborted: If the deadline passes or the client leaves while waiting.
+        """
+        deadline = current_deadline()
+        while True:
+            try:
+                # Wake up regularly to notice a client that went away
+                return flight.result(timeout=0.1 if deadline is not None else None)
+            except futures.TimeoutError:
+                deadline.check()
+
+    def _previous_record(self, document):
+        """Return the stored record of the document's previous version, if there is one."""
+        return self.cache.latest(document) if document is not None else None
+
+    def _sketch(self, text):
+        """
+        Sketch a text for near-duplicate detection, when it is enabled.
+
+        Args:
+            text (str): The decoded document text.
+
+        Returns:
+            tuple: The scope and MinHash signature to look up and store with the record, or None.
+        """
+        if self.hasher is None:
+            return None
+        with time_stage("sketch"):
+            signature = self.hasher.signature(text)
+        if signature is None:
+            return None
+        # Only documents processed by the same models and settings can share a result
+        scope = f"{self.hasher.name}:{self.labeler.label_model}:{self.embedder.embedding_model}:{self._cache_variant()}"
+        return scope, signature
+
+    def _near_duplicate(self, sketch):
+        """Return the key, similarity and record of a stored document nearly identical to the sketched text."""
+        if sketch is None:
+            return None
+        scope, signature = sketch
+        duplicate = self.cache.near_duplicate(signature, scope, self.near_duplicate_threshold)
+        if duplicate is not None:
+            NEAR_DUPLICATES.inc()
+            logger.info("Reusing the result of near-duplicate %s (similarity %.2f).", duplicate[0], duplicate[1])
+        return duplicate
+
+    def _store_duplicate(self, cache_key, duplicate, document=None):
+        """
+        Save the reused result of a near-duplicate under the document's own cache key.
+
+        Repeats of the document are then plain cache hits. The record is marked with
+        the document it came from, so every response for it says so. It is not
+        sketched, so later near-duplicates match the original document.
+
+        Args:
+            cache_key (str): Cache key of the document content.
+            duplicate (tuple): The key, similarity and record found by `_near_duplicate`.
+            document (str): Identity of the document for incremental updates, if enabled.
+
+        Returns:
+            EmbeddingRecord: The stored record.
+        """
+        key, similarity, found = duplicate
+        record = EmbeddingRecord(
+            found.definition, found.embedding, found.chunks, found.chunk_embeddings, found.document_embedding,
+            matrix=found.matrix, duplicate_of=key, similarity=similarity,
+        )
+        with time_stage("persist"):
+            self.cache.put(cache_key, record, document)
+        return record
+
+    def _split(self, text):
+        """Split the text into chunks when chunking is enabled."""
+        return self.chunker.split(text) if self.chunker is not None else []
+
+    def _postprocess(self, embeddings):
+        """Validate, reduce and normalize the embeddings returned by the embedder as one matrix."""
+        if Config.LOG_VECTORS:
+            logger.debug("Embedding vectors: %s", embeddings)
+        return self.postprocessor.process(embeddings)
+
+    @staticmethod
+    def _source_texts(text, chunks):
+        """The texts embedded by the pipeline: the chunks, or the whole text when it was not split."""
+        return [chunk["text"] for chunk in chunks] if chunks else [text]
+
+    def _build_source_record(self, chunks, embeddings):
+        """
+        Assemble the embeddings of the source text into a record still waiting for its definition.
+
+        Args:
+            chunks (list): The chunks produced by `_split`.
+            embeddings (list): One embedding per text returned by `_source_texts`.
+
+        Returns:
+            EmbeddingRecord: The record, with the document vector pooled from the chunks when chunked.
+        """
+        return self._source_record(chunks, self._postprocess(embeddings))
+
+    @staticmethod
+    def _source_record(chunks, embeddings, definition_json=None):
+        """Assemble post-processed embeddings of the source text into a record."""
+        if not chunks:
+            return EmbeddingRecord(definition_json, embeddings[0])
+        return EmbeddingRecord(
+            definition_json,
+            pool_embeddings(embeddings, [chunk["tokens"] for chunk in chunks]),
+            [{key: value for key, value in chunk.items() if key != "text"} for chunk in chunks],
+            embeddings,
+        )
+
+    def _build_record(self, definition_json, chunks, embeddings):
+        """
+        Validate the embeddings and assemble them into a record.
+
+        Args:
+            definition_json (str): The definition produced by the labeler.
+            chunks (list): The chunks produced by `_split`.
+            embeddings (list): The definition embedding followed by one embedding per chunk.
+
+        Returns:
+            EmbeddingRecord: The record to cache and return.
+        """
+        embeddings = self._postprocess(embeddings)
+        return self._record(definition_json, embeddings[0], chunks, embeddings[1:])
+
+    def _record(self, definition_json, definition_embedding, chunks, chunk_embeddings):
+        """Assemble the post-processed embeddings of the definition and the chunks into a record."""
+        record = EmbeddingRecord(definition_json, definition_embedding)
+        if self.chunker is not None:
+            record.chunks = [{key: value for key, value in chunk.items() if key != "text"} for chunk in chunks]
+            record.chunk_embeddings = chunk_embeddings
+            if self.pool_chunks and chunks:
+                record.document_embedding = pool_embeddings(
+                    record.chunk_embeddings, [chunk["tokens"] for chunk in chunks]
+                )
+        return record
+
+    @staticmethod
+    def _response(record, stage, encoding):
+        """
+        Render a record, or one half of it, in the encoding the client asked for.
+
+        Args:
+            record (EmbeddingRecord): The record to send.
+            stage (str): "complete", "embedding" or "definition".
+            encoding (int): JSON for the JSON stream, or a packed vector encoding.
+
+        Returns:
+            EmbeddingResponse: The response.
+        """
+        with time_stage("serialize"):
+            if encoding != JSON:
+                response = record.to_response(encoding, stage)
+            elif stage == "embedding":
+                response = EmbeddingResponse(json_stream=record.embeddings_to_json(), stage=stage)
+            elif stage == "definition":
+                response = EmbeddingResponse(json_stream=record.definition_to_json(), stage=stage)
+            else:
+                response = EmbeddingResponse(json_stream=record.to_json(), stage=stage)
+        if record.duplicate_of is not None:
+            response.duplicate_of = record.duplicate_of
+            response.similarity = record.similarity
+        return response
+
+    def _embed(self, file_name, cache_key, load_text, encoding=JSON):
+        """
+        Serve a document from the cache, or label and embed it.
+
+        Args:
+            file_name (str): Original file name, used for logging and to find the document's previous version.
+            cache_key (str): Cache key of the document content.
+            load_text (callable): Returns the decoded document text; only called on a cache miss.
+            encoding (int): Encoding of the returned vectors.
+
+        Yields:
+            EmbeddingResponse: The result for the document.
+        """
+        while True:
+            # Check if the same content was already processed with the same models
+            cached_record = self.cache.get(cache_key)
+            if cached_record is not None:
+                logger.info("Content of '%s' found in cache (%s). Using the cached embedding.", file_name, cache_key)
+                yield self._response(cached_record, "complete", encoding)
+                return
+
+            flight, leading = self.flights.join(cache_key)
+            if leading:
+                # A flight for the same content may have finished since the lookup above
+                cached_record = self._recheck_cache(cache_key)
+                if cached_record is None:
+                    break
+                self.flights.finish(cache_key, flight, cached_record)
+                yield self._response(cached_record, "complete", encoding)
                 return
 
-            # Read file content from the stream
-            file_content = request.file_stream
-            if not file_content:
-                raise ValueError("File stream is empty.")
+            # The same content is being processed for another request; share its result
+            logger.info("Content of '%s' is already being processed (%s). Waiting for it.", file_name, cache_key)
+            try:
+                record = self._wait_for_flight(flight)
+            except FlightAbandoned:
+                continue
+            yield self._response(record, "complete", encoding)
+            return
 
-            # Use the Labeler to create a definition from the file content
-            definition_json = self.labeler.create_definition_from_content(file_content)
-            print("Definition JSON:", definition_json)
+        try:
+            with time_stage("decode"):
+                text = load_text()
+            sketch = self._sketch(text)
+            duplicate = self._near_duplicate(sketch)
+            document = self._document_key(file_name)
+            if duplicate is not None:
+                record = self._store_duplicate(cache_key, duplicate, document)
+                response = self._response(record, "complete", encoding)
+            else:
+                previous = self._previous_record(document)
+                if self.pipeline and previous is None:
+                    yield from self._embed_pipelined(cache_key, text, encoding, flight, document, sketch)
+                    return
 
-            # Use the EmbeddingGenerator to get embeddings for the text
-            embedding_vector = self.embedder.get_embedding(definition_json)
-            print("Embedding Vector:", embedding_vector)
-            print("Type of Embedding Vector:", type(embedding_vector))
+                # Render the response first so an invalid definition is never cached
+                record = self._create_record(text, previous)
+                response = self._response(record, "complete", encoding)
 
-            # Ensure embedding_vector is a list of floats
-            if not isinstance(embedding_vector, list) or not all(isinstance(x, float) for x in embedding_vector):
-                raise ValueError("Embedding vector must be a list of floats.")
+                # Save the record in the content-addressed cache
+                self._store(cache_key, record, text, document, sketch)
+        except RequestAborted:
+            # Nobody waits for this request any more; a request waiting on the flight may still want the result
+            self.flights.abandon(cache_key, flight)
+            raise
+        except Exception as e:
+            self.flights.finish(cache_key, flight, error=e)
+            raise
+        except BaseException:
+            # The client went away mid-stream; let a waiting request take over
+            self.flights.abandon(cache_key, flight)
+            raise
+        self.flights.finish(cache_key, flight, record)
 
-            # Create a JSON stream using the EmbeddingJSONTemplate
-            stream = EmbeddingJSONTemplate(definition_json, embedding_vector)
-            json_content = stream.to_json()
+        # Respond with the generated result
+        yield response
 
-            # Save the JSON content to the embedded file
-            self._save_embedded_file(embedded_file_path, json_content)
+    def _create_record(self, text, previous=None):
+        """
+        Label and embed a text, one step after the other.
 
-            # Respond with the generated JSON stream
-            yield EmbeddingResponse(json_stream=json_content)
+        Args:
+            text (str): The decoded document text.
+            previous (EmbeddingRecord): Stored record of the document's previous version, whose
+                                        unchanged chunks are reused instead of embedded again.
+
+        Returns:
+            EmbeddingRecord: The finished record.
+        """
+        # Split the text into chunks so they can share the embedding request with the definition
+        chunks = self._split(text)
+        update = self._chunk_update(previous, chunks)
+        if update is not None:
+            definition_json = previous.definition
+            if update.relabel:
+                with time_stage("label"):
+                    definition_json = self.labeler.create_definition_from_text(text)
+            texts = self._update_texts(definition_json, update)
+            embeddings = None
+            if texts:
+                with time_stage("embed"):
+                    embeddings = self.embedder.get_embeddings(texts)
+            return self._updated_record(definition_json, chunks, update, embeddings)
+
+        if self.pipeline:
+            with time_stage("embed"):
+                embeddings = self.embedder.get_embeddings(self._source_texts(text, chunks))
+            record = self._build_source_record(chunks, embeddings)
+            with time_stage("label"):
+                record.definition = self.labeler.create_definition_from_text(text)
+            return record
+
+        # Use the Labeler to create a definition from the file content
+        with time_stage("label"):
+            definition_json = self.labeler.create_definition_from_text(text)
+        logger.debug("Definition JSON: %s", definition_json)
+
+        # Use the EmbeddingGenerator to get embeddings for the definition and every chunk
+        with time_stage("embed"):
+            embeddings = self.embedder.get_embeddings([definition_json] + [chunk["text"] for chunk in chunks])
+        return self._build_record(definition_json, chunks, embeddings)
+
+    @staticmethod
+    def _chunk_update(previous, chunks):
+        """Compare the chunks with the previous version of the document, if it has chunk vectors to reuse."""
+        if previous is None or not chunks or not previous.chunks or previous.chunk_embeddings is None:
+            return None
+        update = ChunkUpdate(previous, chunks)
+        logger.info(
+            "Updating a document from its previous version: %d of %d chunks changed (%.0f%% of the tokens)%s.",
+            len(update.missing), len(chunks), 100 * update.changed_share,
+            ", labeling it again" if update.relabel else "",
+        )
+        UPDATED_CHUNKS.labels("reused").inc(len(update.reused))
+        UPDATED_CHUNKS.labels("embedded").inc(len(update.missing))
+        return update
+
+    def _update_texts(self, definition_json, update):
+        """The texts to embed for an update: the changed chunks, after the new definition if it is embedded."""
+        texts = update.missing_texts()
+        if update.relabel and not self.pipeline:
+            texts.insert(0, definition_json)
+        return texts
+
+    def _updated_record(self, definition_json, chunks, update, embeddings):
+        """
+        Assemble the record of an updated document from its reused and its new vectors.
+
+        Args:
+            definition_json (str): The new definition, or the previous one if it was kept.
+            chunks (list): The chunks of the new version.
+            update (ChunkUpdate): The comparison with the previous version.
+            embeddings (list): The vectors of `_update_texts`, or None if there was nothing to embed.
+
+        Returns:
+            EmbeddingRecord: The record of the new version.
+        """
+        matrix = self._postprocess(embeddings) if embeddings is not None else None
+        embeds_definition = update.relabel and not self.pipeline
+        if matrix is not None and embeds_definition:
+            definition_embedding, matrix = matrix[0], matrix[1:]
+        else:
+            definition_embedding = update.previous.embedding
+        chunk_embeddings = update.chunk_embeddings(matrix if matrix is not None and len(matrix) else None)
+        if self.pipeline:
+            return self._source_record(chunks, chunk_embeddings, definition_json)
+        return self._record(definition_json, definition_embedding, chunks, chunk_embeddings)
+
+    def _store(self, cache_key, record, text, document=None, sketch=None):
+        """Save a finished record in the cache and start the enrichment of its labels."""
+        with time_stage("persist"):
+            self.cache.put(cache_key, record, document, sketch)
+        self._schedule_enrichment(cache_key, record.definition, text)
+
+    def embed_document(self, content, name=None):
+        """
+        Serves a document from the cache, or labels and embeds it, outside of an RPC.
+
+        Args:
+            content (bytes): Raw content of the document.
+            name (str): Name of the document, under which its previous version is found for incremental updates.
+
+        Returns:
+            tuple: The cache key, the EmbeddingRecord and whether it came from the cache.
+        """
+        cache_key = self._get_cache_key(content)
+        while True:
+            record = self.cache.get(cache_key)
+            if record is not None:
+                return cache_key, record, True
+
+            flight, leading = self.flights.join(cache_key)
+            if leading:
+                record = self._recheck_cache(cache_key)
+                if record is None:
+                    break
+                self.flights.finish(cache_key, flight, record)
+                return cache_key, record, True
+            try:
+                return cache_key, self._wait_for_flight(flight), True
+            except FlightAbandoned:
+                continue
+
+        try:
+            with time_stage("decode"):
+                text = self.labeler.load_text_from_stream(content)
+            sketch = self._sketch(text)
+            duplicate = self._near_duplicate(sketch)
+            document = self._document_key(name)
+            if duplicate is not None:
+                record = self._store_duplicate(cache_key, duplicate, document)
+            else:
+                record = self._create_record(text, self._previous_record(document))
+                record.validate()
+                self._store(cache_key, record, text, document, sketch)
+        except BaseException as e:
+            self.flights.finish(cache_key, flight, error=e)
+            raise
+        self.flights.finish(cache_key, flight, record)
+        return cache_key, record, duplicate is not None
+
+    def _embed_pipelined(self, cache_key, text, encoding=JSON, flight=None, document=None, sketch=None):
+        """
+        Label the text and embed it at the same time, streaming each half as soon as it is ready.
+
+        Args:
+            cache_key (str): Cache key of the document content.
+            text (str): The decoded document text.
+            encoding (int): Encoding of the returned vectors.
+            flight (Future): Flight of the cache key led by this request, finished once the record is stored.
+            document (str): Identity of the document for incremental updates, if enabled.
+            sketch (tuple): Near-duplicate sketch of the text, if enabled.
+
+        Yields:
+            EmbeddingResponse: An "embedding" and a "definition" response, in the order they finish.
+        """
+        if self._pipeline_executor is None:
+            self._pipeline_executor = futures.ThreadPoolExecutor(
+                max_workers=2 * Config.SERVER_MAX_WORKERS, thread_name_prefix="embedding-pipeline"
+            )
+        chunks = self._split(text)
+        # Each half runs in a copy of this context, so provider calls see the request deadline
+        label_future = self._pipeline_executor.submit(
+            contextvars.copy_context().run, timed_stage("label", self.labeler.create_definition_from_text), text
+        )
+        embed_future = self._pipeline_executor.submit(
+            contextvars.copy_context().run, timed_stage("embed", self.embedder.get_embeddings),
+            self._source_texts(text, chunks),
+        )
+
+        record, definition_json = None, None
+        for future in futures.as_completed([label_future, embed_future]):
+            if future is embed_future:
+                record = self._build_source_record(chunks, future.result())
+                yield self._response(record, "embedding", encoding)
+            else:
+                definition_json = future.result()
+                yield self._response(EmbeddingRecord(definition_json, None), "definition", encoding)
+
+        record.definition = definition_json
+        self._store(cache_key, record, text, document, sketch)
+        if flight is not None:
+            self.flights.finish(cache_key, flight, record)
+
+    def _embed_request(self, request):
+        """
+        Validate a single-document request and serve it with `_embed`.
+
+        Args:
+            request (EmbeddingRequest or DocumentRequest): The document and the requested encoding.
+
+        Yields:
+            EmbeddingResponse: The result for the document.
+        """
+        # Extract file name from the request
+        file_name = request.file_name
+        if not file_name:
+            raise ValueError("File name is missing in the request.")
+
+        # Read file content from the stream
+        file_content = request.file_stream
+        if not file_content:
+            raise ValueError("File stream is empty.")
+
+        cache_key = self._get_cache_key(file_content)
+        return self._embed(
+            file_name, cache_key, lambda: self.labeler.load_text_from_stream(file_content), request.encoding
+        )
+
+    @staticmethod
+    def _document_response(document_id, response, index):
+        """
+        Tag a response of an EmbedStream document with the document's ID.
+
+        A "complete" response is the only one for its document; with pipelining the
+        second of the "embedding" and "definition" halves is the last.
+
+        Args:
+            document_id (str): ID chosen by the client.
+            response (EmbeddingResponse): The response.
+            index (int): Number of responses already sent for the document.
+
+        Returns:
+            DocumentResponse: The tagged response.
+        """
+        last = response.stage == "complete" or index > 0
+        return DocumentResponse(id=document_id, response=response, last=last)
+
+    @contextmanager
+    def _admitted(self, context, size=0):
+        """
+        Hold a processing slot for a document RPC and make its deadline visible to the provider calls.
+
+        Args:
+            context (grpc.ServicerContext): Context of the call, carrying its deadline and priority.
+            size (int): Bytes of the request, if already known.
+
+        Yields:
+            Ticket: The admitted request.
+        """
+        deadline = Deadline.from_context(context)
+        with self.admission.admit(request_priority(context), size, deadline) as ticket, use_deadline(deadline):
+            yield ticket
+
+    @staticmethod
+    def _document_error(document_id, error):
+        """
+        Build the response of an EmbedStream document that failed.
+
+        Errors other than internal ones are prefixed with the status an RPC would end
+        with, so clients can tell a shed document (RESOURCE_EXHAUSTED) from a failed one.
+
+        Args:
+            document_id (str): ID chosen by the client.
+            error (Exception): The error.
+
+        Returns:
+            DocumentResponse: The last response of the document.
+        """
+        code = status_code(error)
+        message = str(error) if code == grpc.StatusCode.INTERNAL else f"{code.name}: {error}"
+        return DocumentResponse(id=document_id, error=message, last=True)
+
+    def StreamEmbedding(self, request, context):
+        try:
+            with self._admitted(context, request.ByteSize()):
+                yield from self._embed_request(request)
+
+        except Exception as e:
+            context.set_details(str(e))
+            context.set_code(status_code(e))
+            raise
+
+    def UploadEmbedding(self, request_iterator, context):
+        try:
+            with UploadBuffer() as upload, self._admitted(context) as ticket:
+                for chunk in request_iterator:
+                    # The size of an upload is only known as it arrives
+                    ticket.add_bytes(len(chunk.data))
+                    upload.add(chunk)
+                content_digest = upload.finish()
+
+                cache_key = EmbeddingCache.make_key_from_digest(
+                    content_digest, self.labeler.label_model, self.embedder.embedding_model,
+                    self._cache_variant()
+                )
+                yield from self._embed(upload.file_name, cache_key, upload.load_text, upload.encoding)
+
+        except Exception as e:
+            context.set_details(str(e))
+            context.set_code(status_code(e))
+            raise
+
+    def _get_stream_executor(self):
+        """Return the pool that processes the documents of every EmbedStream session."""
+        with self._stream_executor_lock:
+            if self._stream_executor is None:
+                self._stream_executor = futures.ThreadPoolExecutor(
+                    max_workers=Config.STREAM_WORKERS, thread_name_prefix="embed-stream"
+                )
+            return self._stream_executor
+
+    def _process_document(self, request, results, priority="normal", deadline=None):
+        """Embed one EmbedStream document, putting each response, or its error, on the results queue."""
+        try:
+            with self.admission.admit(priority, request.ByteSize(), deadline), use_deadline(deadline):
+                for index, response in enumerate(self._embed_request(request)):
+                    results.put(self._document_response(request.id, response, index))
+        except Exception as e:
+            logger.warning("Document %s of an embedding stream failed: %s", request.id, e)
+            results.put(self._document_error(request.id, e))
+
+    def EmbedStream(self, request_iterator, context):
+        """
+        Embeds the documents of a bidirectional stream concurrently.
+
+        Responses are sent as each document finishes, so they may come back in a
+        different order than the requests; every response carries the document's ID.
+        At most STREAM_MAX_IN_FLIGHT documents are in progress per stream: past it
+        the server stops reading requests, and gRPC flow control holds the client
+        back until responses have been sent. A failing document gets an error
+        response and does not end the stream; so does a document shed by admission
+        control, whose error starts with RESOURCE_EXHAUSTED.
+        """
+        priority, deadline = request_priority(context), Deadline.from_context(context)
+        results = queue.Queue()
+        slots = threading.Semaphore(Config.STREAM_MAX_IN_FLIGHT)
+        closed = threading.Event()
+        executor = self._get_stream_executor()
+
+        def read():
+            try:
+                for request in request_iterator:
+                    # Wait for a free slot, giving up if the response side has gone away
+                    while not slots.acquire(timeout=0.1):
+                        if closed.is_set():
+                            return
+                    results.put(self._SUBMITTED)
+                    executor.submit(self._process_document, request, results, priority, deadline)
+            except Exception as e:
+                # The client cancelled or the connection broke; finish what was submitted
+                logger.debug("Embedding stream reader stopped: %s", e)
+            finally:
+                results.put(self._READ_DONE)
+
+        threading.Thread(target=read, name="embed-stream-reader", daemon=True).start()
+        reading, outstanding = True, 0
+        try:
+            while reading or outstanding:
+                item = results.get()
+                if item is self._SUBMITTED:
+                    outstanding += 1
+                elif item is self._READ_DONE:
+                    reading = False
+                else:
+                    yield item
+                    if item.last:
+                        outstanding -= 1
+                        slots.release()
+        finally:
+            closed.set()
+
+    def _health_response(self):
+        """Report whether the service accepts work; `serving` is cleared while the server drains."""
+        status = HealthResponse.SERVING if self.serving else HealthResponse.NOT_SERVING
+        return HealthResponse(status=status, pid=os.getpid())
+
+    def Health(self, request, context):
+        return self._health_response()
+
+    def _search(self, query, request):
+        """
+        Search the stored vectors for a query, rejecting queries no stored vector can match.
+
+        Args:
+            query (list): The query vector, in the space of the stored vectors.
+            request (SearchRequest): The request, giving the number of results, the metric and exactness.
+
+        Returns:
+            list: The hits returned by `EmbeddingCache.search`.
+
+        Raises:
+            InvalidArgument: If vectors are stored but none has the query's dimension.
+        """
+        dimensions = self.cache.search_dimensions()
+        if dimensions and len(query) not in dimensions:
+            raise InvalidArgument(
+                f"The query vector has {len(query)} dimensions; the stored vectors have "
+                f"{', '.join(str(dimension) for dimension in dimensions)}."
+            )
+        return self.cache.search(query, request.top_k, METRIC_NAMES.get(request.metric), request.exact)
+
+    @staticmethod
+    def _search_response(hits):
+        """Convert the hits returned by `EmbeddingCache.search` into a SearchResponse."""
+        response = SearchResponse()
+        for key, score, definition in hits:
+            hit = response.hits.add(key=key, score=score)
+            try:
+                hit.definition.CopyFrom(encode_definition(definition))
+            except ValueError:
+                # Model-written definitions may miss fields; the hit is still useful without them
+                pass
+        return response
+
+    def Search(self, request, context):
+        try:
+            if request.query_vector:
+                query = list(request.query_vector)
+            elif request.query_text:
+                # Stored vectors are post-processed; the query has to be in the same space
+                query = self.postprocessor.process(self.embedder.get_embedding(request.query_text))[0]
+            else:
+                raise InvalidArgument("Either query_text or query_vector is required.")
+            return self._search_response(self._search(query, request))
 
         except Exception as e:
             context.set_details(str(e))
-            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_code(status_code(e))
             raise
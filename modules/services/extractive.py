@@ -0,0 +1,180 @@
+import re
+import numpy as np
+
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+[\"')\]]*|$)")
+WORD_PATTERN = re.compile(r"[^\W\d_]+", re.UNICODE)
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves one two also said says every many much
+upon into onto would could shall may might must like even still yet ever never always again away back
+""".split())
+
+
+def split_sentences(text):
+    """
+    Splits text into sentences on terminal punctuation and line breaks.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The non-empty sentences, stripped of surrounding whitespace.
+    """
+    return [match.group().strip() for match in SENTENCE_PATTERN.finditer(text) if match.group().strip()]
+
+
+def content_words(text):
+    """
+    Extracts the lowercase words of a text, leaving out stopwords and very short words.
+
+    Args:
+        text (str): The text to scan.
+
+    Returns:
+        list: The content words in order of appearance.
+    """
+    return [word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 2 and word not in STOPWORDS]
+
+
+def term_matrix(sentences):
+    """
+    Builds a sentence-by-term TF-IDF matrix with L2-normalized rows.
+
+    Args:
+        sentences (list): The sentences to index.
+
+    Returns:
+        tuple: The (sentences, terms) float32 matrix and the list of terms.
+    """
+    vocabulary = {}
+    rows, columns = [], []
+    for row, sentence in enumerate(sentences):
+        for word in content_words(sentence):
+            rows.append(row)
+            columns.append(vocabulary.setdefault(word, len(vocabulary)))
+
+    matrix = np.zeros((len(sentences), len(vocabulary)), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)), 1.0)
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)).astype(np.float32) + 1
+    matrix = np.log1p(matrix) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix, list(vocabulary)
+
+
+def keywords(text, top_k=5):
+    """
+    Picks the most characteristic words of a text.
+
+    Words are ranked by frequency, with ties broken by first appearance, so the
+    result is deterministic for a given text.
+
+    Args:
+        text (str): The text to scan.
+        top_k (int): Number of keywords to return.
+
+    Returns:
+        list: Up to `top_k` keywords, most important first.
+    """
+    counts = {}
+    for word in content_words(text):
+        counts[word] = counts.get(word, 0) + 1
+    # dicts keep insertion order, so sorting by count alone keeps first-appearance order for ties
+    return [word for word, _ in sorted(counts.items(), key=lambda item: -item[1])[:top_k]]
+
+
+def centrality(matrix):
+    """
+    Scores each sentence by its cosine similarity to the document centroid.
+
+    Args:
+        matrix (numpy.ndarray): Row-normalized sentence-by-term matrix from `term_matrix`.
+
+    Returns:
+        numpy.ndarray: One score per sentence.
+    """
+    if not matrix.size:
+        return np.zeros(matrix.shape[0], dtype=np.float32)
+    centroid = matrix.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return matrix @ (centroid / norm) if norm else np.zeros(matrix.shape[0], dtype=np.float32)
+
+
+def summarize(text, max_sentences=2, max_chars=None):
+    """
+    Builds an extractive summary from the most central sentences, kept in document order.
+
+    Args:
+        text (str): The text to summarize.
+        max_sentences (int): Maximum number of sentences in the summary.
+        max_chars (int): Optional cap on the summary length.
+
+    Returns:
+        str: The summary.
+    """
+    sentences = split_sentences(text)
+    if len(sentences) <= max_sentences:
+        chosen = sentences
+    else:
+        matrix, _ = term_matrix(sentences)
+        scores = centrality(matrix)
+        # A stable sort keeps earlier sentences first among equal scores
+        top = np.argsort(-scores, kind="stable")[:max_sentences]
+        chosen = [sentences[i] for i in sorted(top)]
+
+    summary = " ".join(chosen)
+    if max_chars and len(summary) > max_chars:
+        summary = summary[:max_chars].rsplit(" ", 1)[0].rstrip(",;:") + "..."
+    return summary
+
+
+def condense(text, max_tokens, count_tokens, max_candidates=400, diversity=0.3):
+    """
+    Shortens a text to at most `max_tokens` tokens by keeping representative sentences.
+
+    Sentences are picked by maximal marginal relevance: each pick is the sentence
+    most central to the document, less its similarity to the sentences already
+    picked, so that the result covers the document instead of repeating its main
+    point. Long texts are first sampled down to `max_candidates` evenly spaced
+    sentences, which bounds the work whatever the size of the text. The picked
+    sentences are returned in document order.
+
+    Args:
+        text (str): The text to shorten.
+        max_tokens (int): Token budget of the result.
+        count_tokens (callable): Returns the number of tokens in a string.
+        max_candidates (int): Maximum number of sentences considered.
+        diversity (float): Weight of redundancy against centrality, between 0 and 1.
+
+    Returns:
+        str: The condensed text; empty if no sentence fits in the budget.
+    """
+    sentences = split_sentences(text)
+    if len(sentences) > max_candidates:
+        picks = np.linspace(0, len(sentences) - 1, max_candidates).astype(np.int64)
+        sentences = [sentences[i] for i in picks]
+    if not sentences:
+        return ""
+
+    matrix, _ = term_matrix(sentences)
+    relevance = centrality(matrix)
+    # One token more per sentence for the space joining it to the previous one
+    lengths = np.array([count_tokens(sentence) + 1 for sentence in sentences])
+    redundancy = np.zeros(len(sentences), dtype=np.float32)
+    available = lengths <= max_tokens
+    budget = max_tokens
+    chosen = []
+    while available.any():
+        scores = (1 - diversity) * relevance - diversity * redundancy
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        chosen.append(best)
+        budget -= lengths[best]
+        np.maximum(redundancy, matrix @ matrix[best], out=redundancy)
+        available[best] = False
+        available &= lengths <= budget
+    return " ".join(sentences[i] for i in sorted(chosen))
@@ -0,0 +1,74 @@
+import asyncio
+from contextlib import asynccontextmanager
+from modules.config import Config
+from modules.services.lazy import LazyModule
+from modules.services.provider import openai
+
+aiohttp = LazyModule("aiohttp")
+
+
+class AsyncHTTPPool:
+    def __init__(self, max_connections=None):
+        """
+        Initializes a pool of HTTP connections shared by the async OpenAI clients.
+
+        The underlying aiohttp session is created on first use, inside the running
+        event loop, and caps the number of concurrent provider requests.
+
+        Args:
+            max_connections (int): Maximum number of concurrent connections to the provider.
+        """
+        self.max_connections = max_connections or Config.HTTP_POOL_SIZE
+        self._session = None
+        self._lock = None
+
+    async def _get_session(self):
+        """Create the aiohttp session on first use."""
+        if self._session is None or self._session.closed:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(limit=self.max_connections)
+                    self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        Makes the OpenAI client use the pooled session for calls made inside the block.
+
+        Yields:
+            aiohttp.ClientSession: The shared session.
+        """
+        session = await self._get_session()
+        token = openai.aiosession.set(session)
+        try:
+            yield session
+        finally:
+            openai.aiosession.reset(token)
+
+    async def warm_up(self, url, connections):
+        """
+        Opens connections to the provider before the first call needs them.
+
+        The requests are sent concurrently, so each one opens its own connection,
+        and their responses are read so the connections go back to the pool.
+
+        Args:
+            url (str): An address on the provider, such as the API base.
+            connections (int): Number of connections to open, up to the pool size.
+        """
+        session = await self._get_session()
+
+        async def connect():
+            async with session.head(url) as response:
+                await response.read()
+
+        await asyncio.gather(*(connect() for _ in range(min(connections, self.max_connections))))
+
+    async def close(self):
+        """Close the session and every pooled connection."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,73 @@
+import numpy as np
+from modules.config import Config
+
+
+class ChunkUpdate:
+    def __init__(self, previous, chunks, relabel_threshold=None):
+        """
+        Compares the chunks of a new version of a document with the stored previous version.
+
+        Chunks are matched by the hash of their text, wherever they sit in the
+        document, so only the chunks whose text changed need to be embedded again.
+        The share of changed tokens decides whether the document is labeled again:
+        below `relabel_threshold` the previous definition is kept.
+
+        Args:
+            previous (EmbeddingRecord): The stored record of the previous version, with its chunks.
+            chunks (list): The chunks of the new version, as returned by `TextChunker.split`.
+            relabel_threshold (float): Share of changed tokens above which the document is labeled again.
+        """
+        self.previous = previous
+        self.chunks = chunks
+        threshold = relabel_threshold if relabel_threshold is not None else Config.INCREMENTAL_RELABEL_THRESHOLD
+
+        previous_rows = {}
+        for row, chunk in enumerate(previous.chunks):
+            # Records stored before chunks were hashed have nothing to match
+            if "hash" in chunk:
+                previous_rows.setdefault(chunk["hash"], row)
+        self.reused = {}
+        self.missing = []
+        for index, chunk in enumerate(chunks):
+            row = previous_rows.get(chunk["hash"])
+            if row is None:
+                self.missing.append(index)
+            else:
+                self.reused[index] = row
+
+        previous_tokens = sum(chunk["tokens"] for chunk in previous.chunks)
+        tokens = sum(chunk["tokens"] for chunk in chunks)
+        shared_tokens = sum(chunks[index]["tokens"] for index in self.reused)
+        total = previous_tokens + tokens
+        self.changed_share = max(0.0, 1.0 - 2.0 * shared_tokens / total) if total else 0.0
+        self.relabel = self.changed_share > threshold
+
+    def missing_texts(self):
+        """
+        Returns the texts of the chunks that have to be embedded.
+
+        Returns:
+            list: The text of every new or changed chunk, in document order.
+        """
+        return [self.chunks[index]["text"] for index in self.missing]
+
+    def chunk_embeddings(self, embeddings=None):
+        """
+        Combines the reused vectors with the vectors of the changed chunks.
+
+        Args:
+            embeddings (numpy.ndarray): Post-processed vectors of `missing_texts`, or None if nothing changed.
+
+        Returns:
+            numpy.ndarray: One row per chunk of the new version.
+        """
+        previous = np.asarray(self.previous.chunk_embeddings)
+        dtype = previous.dtype if embeddings is None else np.result_type(previous, embeddings)
+        matrix = np.empty((len(self.chunks), previous.shape[1]), dtype=dtype)
+        if self.reused:
+            matrix[list(self.reused)] = previous[list(self.reused.values())]
+        if self.missing:
+            if embeddings is None or len(embeddings) != len(self.missing) or embeddings.shape[1] != matrix.shape[1]:
+                raise ValueError("Expected one vector of the stored size for every changed chunk.")
+            matrix[self.missing] = embeddings
+        return matrix
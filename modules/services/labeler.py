@@ -1,19 +1,41 @@
-import openai
+import asyncio
 import json
+import logging
 from modules.config import Config
+from modules.services.chunker import Tokenizer
+from modules.services.extractive import condense
+from modules.services.http_pool import AsyncHTTPPool
+from modules.services.local_labeler import AsyncLocalLabeler, LocalLabeler
+from modules.services.metrics import LABEL_TOKENS
+from modules.services.provider import get_provider_client, openai
 from modules.template import EmbeddingJSONTemplate
 
+logger = logging.getLogger(__name__)
+
 
 class Labeler:
-    def __init__(self, label_model=None):
+    def __init__(self, label_model=None, provider=None, max_input_tokens=None):
         """
         Initializes the labeler with the specified model and host.
+
+        Documents longer than `max_input_tokens` are condensed to their most
+        representative sentences before they are put into the prompt, so the cost
+        and latency of labeling stop growing with the document size.
+
         Args:
             label_model (str): OpenAI model for generating labels.
+            provider (ProviderClient): Client applying rate limits and retries to API calls.
+            max_input_tokens (int): Tokens of document text per prompt; 0 sends the whole document.
         """
         self.label_model = label_model or Config.LABEL_MODEL
-        openai.api_key = Config.OPENAI_API_KEY
-        print("OpenAI API key set successfully.")
+        self.provider = provider or get_provider_client("label")
+        self.max_input_tokens = max_input_tokens if max_input_tokens is not None else Config.LABEL_INPUT_TOKENS
+        self.tokenizer = Tokenizer()
+
+    def warm_up(self):
+        """Imports the OpenAI client and loads the tokenizer ahead of the first request."""
+        openai.load()
+        self.tokenizer.warm_up()
 
     def load_text_from_stream(self, file_stream):
         """
@@ -44,35 +66,104 @@ class Labeler:
         """
         # Load the text content from the file stream
         input_text = self.load_text_from_stream(file_stream)
+        return self.create_definition_from_text(input_text)
 
-        try:
-            # Construct the prompt for the model
-            prompt = (
-                f"Based on the following text content, create a structured definition for an embedding-based "
-                f"collection. Include fields: collection_name, partition_name, description, dimension, and metric_type. "
-                f"Ensure the response is concise and follows JSON-like formatting.\n\n"
-                f"{input_text}\n\n"
-                f"Example output:\n"
-                f"{{\n"
-                f"  \"collection_name\": \"ExampleCollection\",\n"
-                f"  \"partition_name\": \"ExamplePartition\",\n"
-                f"  \"description\": \"Detailed description of the collection.\",\n"
-                f"  \"dimension\": 128,\n"
-                f"  \"metric_type\": \"cosine\"\n"
-                f"}}"
-            )
+    def _fit_budget(self, input_text):
+        """
+        Shortens a text to the prompt budget, keeping its most representative sentences.
+
+        Args:
+            input_text (str): Text content of the file.
+
+        Returns:
+            str: The text itself if it fits, else a condensed version of at most `max_input_tokens` tokens.
+        """
+        if not self.max_input_tokens:
+            return input_text
+        tokens = self.tokenizer.count(input_text)
+        LABEL_TOKENS.labels("document").observe(tokens)
+        if tokens <= self.max_input_tokens:
+            return input_text
+        condensed = condense(input_text, self.max_input_tokens, self.tokenizer.count,
+                             Config.LABEL_CANDIDATE_SENTENCES, Config.LABEL_DIVERSITY)
+        if not condensed:
+            # Not a single sentence fits: keep the beginning, cut at a token boundary
+            spans = self.tokenizer.spans(input_text[:self.max_input_tokens * 16])[:self.max_input_tokens]
+            condensed = input_text[:spans[-1][1]] if spans else ""
+        logger.debug("Condensed a document of %d tokens to %d characters for labeling.", tokens, len(condensed))
+        return condensed
+
+    def _build_request(self, input_text):
+        """
+        Builds the Chat Completion arguments for labeling the given text.
+
+        Args:
+            input_text (str): Text content of the file.
 
+        Returns:
+            dict: Keyword arguments for the Chat Completion API.
+        """
+        input_text = self._fit_budget(input_text)
+        # Construct the prompt for the model
+        prompt = (
+            f"Based on the following text content, create a structured definition for an embedding-based "
+            f"collection. Include fields: collection_name, partition_name, description, dimension, and metric_type. "
+            f"Ensure the response is concise and follows JSON-like formatting.\n\n"
+            f"{input_text}\n\n"
+            f"Example output:\n"
+            f"{{\n"
+            f"  \"collection_name\": \"ExampleCollection\",\n"
+            f"  \"partition_name\": \"ExamplePartition\",\n"
+            f"  \"description\": \"Detailed description of the collection.\",\n"
+            f"  \"dimension\": 128,\n"
+            f"  \"metric_type\": \"cosine\"\n"
+            f"}}"
+        )
+        return {
+            "model": self.label_model,
+            "messages": [
+                {"role": "system", "content": "You are a helpful assistant for creating structured definitions."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": 200,
+            "temperature": 0.7
+        }
+
+    def _estimate_tokens(self, request):
+        """Estimate the tokens a Chat Completion request uses: the prompt plus the completion limit."""
+        prompt_tokens = sum(self.tokenizer.count(message["content"]) for message in request["messages"])
+        return prompt_tokens + request["max_tokens"]
+
+    def _prepare_request(self, input_text):
+        """Build the request for a text, together with its token estimate for the rate limiter."""
+        request = self._build_request(input_text)
+        return request, self._estimate_tokens(request)
+
+    @staticmethod
+    def _record_usage(response):
+        """Record the prompt and completion tokens the provider reports for a request."""
+        usage = response.get("usage") or {}
+        for kind in ("prompt", "completion"):
+            if f"{kind}_tokens" in usage:
+                LABEL_TOKENS.labels(kind).observe(usage[f"{kind}_tokens"])
+
+    def create_definition_from_text(self, input_text):
+        """
+        Generates a definition for embedding-based collections using OpenAI's API
+        and already decoded text content.
+
+        Args:
+            input_text (str): Text content of the file.
+
+        Returns:
+            str: The generated definition as a JSON-like string.
+        """
+        try:
             # Call the OpenAI Chat Completion API
-            response = openai.ChatCompletion.create(
-                model=self.label_model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant for creating structured definitions."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=0.7
-            )
-            print("Connection to OpenAI API successful.")
+            request, tokens = self._prepare_request(input_text)
+            response = self.provider.call(openai.ChatCompletion.create, tokens=tokens, **request)
+            logger.debug("Connection to OpenAI API successful.")
+            self._record_usage(response)
 
             # Parse the generated definition as JSON
             generated_definition_str = response['choices'][0]['message']['content'].strip()
@@ -82,3 +173,73 @@ class Labeler:
             raise ValueError(f"Failed to parse the generated definition as JSON: {e}")
         except Exception as e:
             raise Exception(f"Failed to generate definition using the model: {e}")
+
+
+class AsyncLabeler(Labeler):
+    def __init__(self, label_model=None, provider=None, http_pool=None, max_input_tokens=None):
+        """
+        Initializes a labeler whose model calls do not block the event loop.
+
+        Args:
+            label_model (str): OpenAI model for generating labels.
+            provider (ProviderClient): Client applying rate limits and retries to API calls.
+            http_pool (AsyncHTTPPool): Pool of HTTP connections shared with other async clients.
+            max_input_tokens (int): Tokens of document text per prompt; 0 sends the whole document.
+        """
+        super().__init__(label_model, provider, max_input_tokens)
+        self.http_pool = http_pool or AsyncHTTPPool()
+
+    async def create_definition_from_content(self, file_stream):
+        """
+        Generates a definition from the content of a file stream without blocking.
+
+        Args:
+            file_stream (bytes): Binary content of the file.
+
+        Returns:
+            str: The generated definition as a JSON-like string.
+        """
+        return await self.create_definition_from_text(self.load_text_from_stream(file_stream))
+
+    async def create_definition_from_text(self, input_text):
+        """
+        Generates a definition from already decoded text without blocking.
+
+        Args:
+            input_text (str): Text content of the file.
+
+        Returns:
+            str: The generated definition as a JSON-like string.
+        """
+        try:
+            # Condensing a long document and counting its tokens is CPU work; keep it off the event loop
+            request, tokens = await asyncio.to_thread(self._prepare_request, input_text)
+            async with self.http_pool.session():
+                response = await self.provider.acall(openai.ChatCompletion.acreate, tokens=tokens, **request)
+            self._record_usage(response)
+            return response['choices'][0]['message']['content'].strip()
+        except Exception as e:
+            raise Exception(f"Failed to generate definition using the model: {e}")
+
+
+def create_labeler(asynchronous=False, http_pool=None, dimension=None):
+    """
+    Creates the labeler selected by LABEL_MODE.
+
+    In "local" and "local+llm" modes the definition is built locally; in
+    "local+llm" mode the service additionally asks the model for better labels
+    in the background.
+
+    Args:
+        asynchronous (bool): Create the asyncio variant.
+        http_pool (AsyncHTTPPool): Connection pool for the async OpenAI labeler.
+        dimension (int): Vector dimension of the embedding backend, used by the local labeler.
+
+    Returns:
+        The labeler.
+    """
+    if Config.LABEL_MODE in ("local", "local+llm"):
+        return AsyncLocalLabeler(dimension) if asynchronous else LocalLabeler(dimension)
+    if asynchronous:
+        return AsyncLabeler(http_pool=http_pool)
+    return Labeler()
@@ -0,0 +1,218 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import grpc
+from modules.config import Config
+from modules.proto.embedding.embedding_buffer_pb2 import HealthRequest, HealthResponse
+from modules.proto.embedding.embedding_buffer_pb2_grpc import EmbeddingServiceStub
+
+logger = logging.getLogger(__name__)
+
+# A worker that stayed up this long is no longer considered to be crash-looping
+STABLE_SECONDS = 60
+# Probe channels open before the worker binds its socket; keep retrying it quickly instead of backing off
+PROBE_CHANNEL_OPTIONS = [("grpc.initial_reconnect_backoff_ms", 100), ("grpc.max_reconnect_backoff_ms", 1000)]
+
+
+class _Worker:
+    def __init__(self, index, health_address):
+        """State the launcher keeps about one server process."""
+        self.index = index
+        self.health_address = health_address
+        self.process = None
+        self.stub = None
+        self.channel = None
+        self.started_at = 0.0
+        self.healthy = False  # Answered a probe since it was started
+        self.failures = 0  # Consecutive failed probes
+        self.crashes = 0  # Consecutive exits without a stable run in between
+        self.restart_at = 0.0
+        self.restarts = 0
+
+    def close_channel(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel, self.stub = None, None
+
+
+class ServerLauncher:
+    def __init__(self, target, processes=None, health_interval=None, health_timeout=None, health_failures=None,
+                 startup_seconds=None, shutdown_grace=None):
+        """
+        Runs several server processes on one port and keeps them healthy.
+
+        Every worker runs `target(index, health_address)` in a freshly spawned
+        process. It listens on the shared port with SO_REUSEPORT, so the kernel
+        spreads connections across the workers, and on a private Unix socket at
+        `health_address` where the launcher probes its Health RPC. Workers that
+        exit are restarted with an exponential backoff; workers that fail
+        `health_failures` probes in a row are killed and restarted. On shutdown
+        every worker is asked to drain and is killed if it is still running
+        `shutdown_grace` seconds later.
+
+        Args:
+            target (callable): Module-level function serving one worker.
+            processes (int): Number of workers.
+            health_interval (float): Seconds between probes.
+            health_timeout (float): Deadline of one probe in seconds.
+            health_failures (int): Failed probes in a row before a worker is restarted.
+            startup_seconds (float): Time a new worker has to answer its first probe.
+            shutdown_grace (float): Seconds a draining worker has to finish its RPCs.
+        """
+        self.target = target
+        self.processes = processes or Config.SERVER_PROCESSES
+        self.health_interval = health_interval or Config.HEALTH_CHECK_INTERVAL
+        self.health_timeout = health_timeout or Config.HEALTH_CHECK_TIMEOUT
+        self.health_failures = health_failures or Config.HEALTH_CHECK_FAILURES
+        self.startup_seconds = startup_seconds if startup_seconds is not None else Config.WORKER_STARTUP_SECONDS
+        self.shutdown_grace = shutdown_grace if shutdown_grace is not None else Config.SERVER_SHUTDOWN_GRACE
+        # Spawned rather than forked: gRPC does not survive a fork once the launcher has opened channels
+        self._context = multiprocessing.get_context("spawn")
+        self._run_dir = None
+        self._stopping = False
+        self.workers = []
+
+    def start(self):
+        """
+        Starts every worker.
+
+        Returns:
+            ServerLauncher: The started launcher.
+        """
+        self._run_dir = tempfile.mkdtemp(prefix="embedding-workers-")
+        self.workers = [
+            _Worker(index, f"unix:{os.path.join(self._run_dir, f'worker-{index}.sock')}")
+            for index in range(self.processes)
+        ]
+        for worker in self.workers:
+            self._start(worker)
+        logger.info("Started %d server processes.", self.processes)
+        return self
+
+    def _start(self, worker):
+        """Spawn the process of a worker and open the channel used to probe it."""
+        worker.process = self._context.Process(
+            target=self.target, args=(worker.index, worker.health_address),
+            name=f"embedding-worker-{worker.index}", daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.healthy, worker.failures = False, 0
+        worker.channel = grpc.insecure_channel(worker.health_address, options=PROBE_CHANNEL_OPTIONS)
+        worker.stub = EmbeddingServiceStub(worker.channel)
+
+    def _backoff(self, crashes):
+        """Delay before restarting a worker that exited `crashes` times in a row."""
+        return min(Config.WORKER_RESTART_BACKOFF_MAX, 0.5 * 2 ** (crashes - 1))
+
+    def _reap(self, now):
+        """Notice workers that exited and restart them once their backoff has passed."""
+        for worker in self.workers:
+            if worker.process is not None and not worker.process.is_alive():
+                if now - worker.started_at > STABLE_SECONDS:
+                    worker.crashes = 0
+                worker.crashes += 1
+                worker.restart_at = now + self._backoff(worker.crashes)
+                logger.warning(
+                    "Server process %d (pid %d) exited with code %s; restarting in %.1f s.",
+                    worker.index, worker.process.pid, worker.process.exitcode, worker.restart_at - now,
+                )
+                worker.process, worker.healthy = None, False
+                worker.close_channel()
+            if worker.process is None and now >= worker.restart_at:
+                worker.restarts += 1
+                self._start(worker)
+
+    def _probe(self, now):
+        """Probe every running worker at once and restart the ones that stopped answering."""
+        probes = []
+        for worker in self.workers:
+            if worker.process is not None:
+                probe = worker.stub.Health.future(HealthRequest(), timeout=self.health_timeout, wait_for_ready=True)
+                probes.append((worker, probe))
+
+        for worker, probe in probes:
+            try:
+                serving = probe.result().status == HealthResponse.SERVING
+            except grpc.RpcError:
+                serving = False
+            if serving:
+                worker.healthy, worker.failures = True, 0
+                continue
+            if not worker.healthy and now - worker.started_at < self.startup_seconds:
+                continue  # Still starting up
+            worker.failures += 1
+            if worker.failures >= self.health_failures:
+                logger.warning(
+                    "Server process %d (pid %d) failed %d health checks; restarting it.",
+                    worker.index, worker.process.pid, worker.failures,
+                )
+                self._terminate(worker, grace=self.health_timeout)
+
+    def check(self, probe=True):
+        """
+        Runs one round of supervision.
+
+        Args:
+            probe (bool): Probe the running workers as well as restarting the exited ones.
+        """
+        if self._stopping:
+            return
+        now = time.monotonic()
+        self._reap(now)
+        if probe:
+            self._probe(now)
+
+    def _terminate(self, worker, grace):
+        """Ask a worker to drain, killing it if it is still running after `grace` seconds."""
+        worker.process.terminate()
+        worker.process.join(grace)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+
+    def stop(self):
+        """Drains every worker, killing the ones still running after the shutdown grace, and cleans up."""
+        self._stopping = True
+        for worker in self.workers:
+            worker.close_channel()
+        running = [worker for worker in self.workers if worker.process is not None and worker.process.is_alive()]
+        for worker in running:
+            worker.process.terminate()
+        # Workers stop their servers with SERVER_SHUTDOWN_GRACE; allow a little more for them to exit
+        deadline = time.monotonic() + self.shutdown_grace + 5
+        for worker in running:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.warning("Server process %d did not drain in time; killing it.", worker.index)
+                worker.process.kill()
+                worker.process.join()
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
+        logger.info("All server processes stopped.")
+
+    def run(self):
+        """Starts the workers and supervises them until SIGINT or SIGTERM, then drains them."""
+        stop = threading.Event()
+        handlers = {
+            sig: signal.signal(sig, lambda signum, frame: stop.set()) for sig in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            self.start()
+            next_probe = time.monotonic() + self.health_interval
+            # Exits are noticed every fraction of a second; probes go out every health_interval
+            while not stop.wait(0.2):
+                probe = time.monotonic() >= next_probe
+                self.check(probe)
+                if probe:
+                    next_probe = time.monotonic() + self.health_interval
+        finally:
+            self.stop()
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
@@ -0,0 +1,46 @@
+import importlib
+
+
+class LazyModule:
+    def __init__(self, name, on_load=None):
+        """
+        Stands in for a module that is only imported when one of its attributes is used.
+
+        The OpenAI client pulls in requests and aiohttp, which take most of the time
+        needed to import the server. Modules that reach it through a LazyModule pay
+        for that import on the first provider call, or when the server warms up
+        before reporting that it is ready, and not at all with local backends.
+
+        Args:
+            name (str): Dotted name of the module.
+            on_load (callable): Optional function called with the module once it is imported.
+        """
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_on_load", on_load)
+        object.__setattr__(self, "_module", None)
+
+    @property
+    def loaded(self):
+        """Whether the module has been imported through this stand-in."""
+        return self._module is not None
+
+    def load(self):
+        """
+        Imports the module if it has not been imported yet.
+
+        Returns:
+            module: The imported module.
+        """
+        if self._module is None:
+            # The import lock makes concurrent first uses import the module once
+            module = importlib.import_module(self._name)
+            if self._on_load is not None:
+                self._on_load(module)
+            object.__setattr__(self, "_module", module)
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.load(), name, value)
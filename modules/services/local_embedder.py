@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import os
+import re
+import zlib
+import numpy as np
+from modules.config import Config
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+FEATURE_BITS = 20
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+
+class HashingEmbeddingGenerator:
+    def __init__(self, dimension=None, idf_path=None):
+        """
+        Initializes an offline embedding generator that runs on the CPU without network access.
+
+        Each text is turned into hashed features (words, word bigrams and character
+        trigrams) weighted by sublinear term frequency and, when an IDF table is
+        available, inverse document frequency. The sparse feature vector is then
+        projected to `dimension` values with a signed hash (count-sketch) projection
+        and L2-normalized. The projection is computed for a whole batch at once.
+
+        Args:
+            dimension (int): Size of the output vectors.
+            idf_path (str): Optional .npy file with one IDF weight per hashed feature.
+        """
+        self.dimension = dimension or Config.LOCAL_EMBEDDING_DIM
+        self.idf = None
+        self.embedding_model = f"local-hashing-{self.dimension}"
+        idf_path = idf_path if idf_path is not None else Config.LOCAL_EMBEDDING_IDF_PATH
+        if idf_path and os.path.exists(idf_path):
+            idf = np.load(idf_path).astype(np.float32)
+            if idf.shape != (1 << FEATURE_BITS,):
+                raise ValueError(f"IDF table must have {1 << FEATURE_BITS} entries.")
+            self._set_idf(idf)
+
+    def _set_idf(self, idf):
+        """Use an IDF table and make the model name, and so the cache keys, reflect it."""
+        self.idf = idf
+        digest = hashlib.sha256(idf.tobytes()).hexdigest()[:8]
+        self.embedding_model = f"local-hashing-{self.dimension}-idf-{digest}"
+
+    @staticmethod
+    def _features(text):
+        """Hash the features of a text to feature ids."""
+        if not isinstance(text, str):
+            raise TypeError("Text must be a string.")
+        words = WORD_PATTERN.findall(text.lower())
+        features = list(words)
+        features.extend(f"{first} {second}" for first, second in zip(words, words[1:]))
+        for word in words:
+            padded = f"<{word}>"
+            features.extend("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+        return np.fromiter(
+            (zlib.crc32(feature.encode("utf-8")) & FEATURE_MASK for feature in features),
+            dtype=np.int64,
+            count=len(features),
+        )
+
+    def _project(self, feature_ids):
+        """Map feature ids to output columns and signs with a multiplicative hash."""
+        mixed = (feature_ids * 2654435761) & 0xFFFFFFFF
+        columns = mixed % self.dimension
+        signs = np.where((mixed >> 31) & 1, -1.0, 1.0).astype(np.float32)
+        return columns, signs
+
+    def fit_idf(self, texts, idf_path=None):
+        """
+        Learns IDF weights from a corpus and optionally saves them.
+
+        Args:
+            texts (list): Representative documents.
+            idf_path (str): Where to save the weights as .npy.
+        """
+        document_frequency = np.zeros(1 << FEATURE_BITS, dtype=np.float32)
+        for text in texts:
+            document_frequency[np.unique(self._features(text))] += 1
+        self._set_idf(np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1)
+        if idf_path:
+            np.save(idf_path, self.idf)
+
+    def get_embeddings(self, texts):
+        """
+        Embeds many texts in one vectorized pass.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One embedding vector per text, in the same order.
+        """
+        rows, ids, weights = [], [], []
+        for row, text in enumerate(texts):
+            feature_ids, counts = np.unique(self._features(text), return_counts=True)
+            rows.append(np.full(len(feature_ids), row, dtype=np.int64))
+            ids.append(feature_ids)
+            weights.append(1 + np.log(counts.astype(np.float32)))
+
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if rows:
+            rows, ids, weights = np.concatenate(rows), np.concatenate(ids), np.concatenate(weights)
+            if self.idf is not None:
+                weights = weights * self.idf[ids]
+            columns, signs = self._project(ids)
+            np.add.at(matrix, (rows, columns), weights * signs)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix.tolist()
+
+    def get_embedding(self, text):
+        """
+        Embeds a single text.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            list: The embedding vector.
+        """
+        return self.get_embeddings([text])[0]
+
+
+class AsyncHashingEmbeddingGenerator(HashingEmbeddingGenerator):
+    """Runs the hashing generator in a worker thread so the event loop stays responsive."""
+
+    async def get_embeddings(self, texts):
+        """
+        Embeds many texts in a worker thread.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One embedding vector per text, in the same order.
+        """
+        return await asyncio.to_thread(HashingEmbeddingGenerator.get_embeddings, self, texts)
+
+    async def get_embedding(self, text):
+        """
+        Embeds a single text in a worker thread.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            list: The embedding vector.
+        """
+        return (await self.get_embeddings([text]))[0]
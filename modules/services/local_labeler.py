@@ -0,0 +1,147 @@
+import asyncio
+import json
+from modules.config import Config
+from modules.services.extractive import keywords, summarize
+
+LOCAL_LABEL_MODEL = "local-extractive-v1"
+LABEL_FIELDS = ("collection_name", "partition_name", "description")
+
+
+def _camel_case(words):
+    """Join words into a CamelCase identifier."""
+    return "".join(word.capitalize() for word in words)
+
+
+class LocalLabeler:
+    def __init__(self, dimension=None, metric_type="cosine", summary_sentences=None, summary_chars=None):
+        """
+        Initializes a labeler that builds definitions from the text itself, without a model call.
+
+        The collection and partition names come from the most frequent content words
+        and the description is an extractive summary of the most central sentences.
+        The same text always gives the same definition.
+
+        Args:
+            dimension (int): Dimension of the vectors produced by the embedding backend.
+            metric_type (str): Distance metric recorded in the definition.
+            summary_sentences (int): Maximum number of sentences in the description.
+            summary_chars (int): Maximum length of the description.
+        """
+        self.label_model = LOCAL_LABEL_MODEL
+        self.dimension = dimension
+        self.metric_type = metric_type
+        self.summary_sentences = summary_sentences or Config.LOCAL_LABEL_SUMMARY_SENTENCES
+        self.summary_chars = summary_chars or Config.LOCAL_LABEL_SUMMARY_CHARS
+
+    def load_text_from_stream(self, file_stream):
+        """
+        Loads text content from a file stream.
+
+        Args:
+            file_stream (bytes): Binary content of the file.
+
+        Returns:
+            str: Decoded text content.
+        """
+        try:
+            return file_stream.decode('utf-8')
+        except UnicodeDecodeError:
+            raise ValueError("The file stream could not be decoded as UTF-8.")
+
+    def create_definition(self, input_text):
+        """
+        Builds the definition fields for a text.
+
+        Args:
+            input_text (str): Text content of the file.
+
+        Returns:
+            dict: The definition.
+        """
+        words = keywords(input_text, top_k=4)
+        return {
+            "collection_name": _camel_case(words[:2]) + "Collection" if words else "DocumentCollection",
+            "partition_name": _camel_case(words[2:4]) if len(words) > 2 else "Default",
+            "description": summarize(input_text, self.summary_sentences, self.summary_chars) or "Empty document.",
+            "dimension": self.dimension,
+            "metric_type": self.metric_type,
+        }
+
+    def create_definition_from_content(self, file_stream):
+        """
+        Builds a definition from the content of a file stream.
+
+        Args:
+            file_stream (bytes): Binary content of the file.
+
+        Returns:
+            str: The definition as a JSON string.
+        """
+        return self.create_definition_from_text(self.load_text_from_stream(file_stream))
+
+    def create_definition_from_text(self, input_text):
+        """
+        Builds a definition from already decoded text.
+
+        Args:
+            input_text (str): Text content of the file.
+
+        Returns:
+            str: The definition as a JSON string.
+        """
+        return json.dumps(self.create_definition(input_text), indent=2)
+
+
+class AsyncLocalLabeler(LocalLabeler):
+    """Runs the local labeler in a worker thread so long documents do not stall the event loop."""
+
+    async def create_definition_from_content(self, file_stream):
+        """
+        Builds a definition from the content of a file stream in a worker thread.
+
+        Args:
+            file_stream (bytes): Binary content of the file.
+
+        Returns:
+            str: The definition as a JSON string.
+        """
+        return await self.create_definition_from_text(self.load_text_from_stream(file_stream))
+
+    async def create_definition_from_text(self, input_text):
+        """
+        Builds a definition from already decoded text in a worker thread.
+
+        Args:
+            input_text (str): Text content of the file.
+
+        Returns:
+            str: The definition as a JSON string.
+        """
+        return await asyncio.to_thread(LocalLabeler.create_definition_from_text, self, input_text)
+
+
+def enrich_definition(local_definition, generated_definition):
+    """
+    Replaces the extracted labels with the ones written by a model.
+
+    The dimension and metric type are measured locally and are kept, since the
+    model can only guess them.
+
+    Args:
+        local_definition (str): JSON definition from the LocalLabeler.
+        generated_definition (str): JSON definition returned by the model.
+
+    Returns:
+        str: The merged definition as a JSON string.
+    """
+    definition = json.loads(local_definition)
+    try:
+        generated = json.loads(generated_definition)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Failed to parse the generated definition as JSON: {e}")
+    if not isinstance(generated, dict):
+        raise ValueError("The generated definition is not a JSON object.")
+    for field in LABEL_FIELDS:
+        if isinstance(generated.get(field), str) and generated[field].strip():
+            definition[field] = generated[field].strip()
+    return json.dumps(definition, indent=2)
@@ -0,0 +1,520 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import grpc
+from modules.config import Config
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    """Format a sample value the way the Prometheus text format expects."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(names, values):
+    """Render `{name="value",...}`, escaping the values."""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initializes a metric family whose samples are keyed by label values.
+
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text shown by the metrics endpoint.
+            labelnames (tuple): Names of the labels every sample carries.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Returns the sample for the given label values, creating it on first use.
+
+        Args:
+            *values: One value per label name, in order.
+
+        Returns:
+            The child metric.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}.")
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _samples(self):
+        """Yield (suffix, label names, label values, value) for every sample."""
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            for suffix, names, extra, value in child.samples():
+                yield suffix, self.labelnames + names, values + extra, value
+
+    def render(self):
+        """Render the family in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only increase.")
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield "_total", (), (), self.value
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        """Increase the unlabelled counter."""
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Read the value from `function` each time the gauge is collected."""
+        self.function = function
+
+    @contextmanager
+    def track_inprogress(self):
+        """Count the enclosed block while it runs."""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+    def samples(self):
+        yield "", (), (), self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, such as the number of requests in flight."""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        """Set the unlabelled gauge."""
+        self.labels().set(value)
+
+    def set_function(self, function):
+        """Read the unlabelled gauge from `function` each time it is collected."""
+        self.labels().set_function(function)
+
+    def total(self):
+        """Sum the values set on every label combination, e.g. all RPCs in flight."""
+        with self._lock:
+            children = list(self._children.values())
+        return sum(child.value for child in children)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the enclosed block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield "_bucket", ("le",), (_format_value(bound),), cumulative
+        yield "_sum", (), (), total
+        yield "_count", (), (), cumulative
+
+
+class Histogram(_Metric):
+    """Counts of observations in cumulative buckets, e.g. request latencies."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Initializes a histogram.
+
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text shown by the metrics endpoint.
+            labelnames (tuple): Names of the labels every sample carries.
+            buckets (tuple): Upper bounds of the buckets, in increasing order.
+        """
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        """Record an observation on the unlabelled histogram."""
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Initializes a collection of metric families rendered together by the metrics endpoint."""
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels.")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create or return the counter registered under `name`."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Create or return the gauge registered under `name`."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create or return the histogram registered under `name`."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        """Return the metric registered under `name`, or None."""
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self):
+        """
+        Renders every registered metric.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "embedding_stage_seconds", "Time spent in each stage of handling a document.", ("stage",)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "embedding_cache_lookups", 'Cache lookups by result: "memory", "disk" or "remote" hits, or "miss".', ("result",)
+)
+CACHE_HIT_RATIO = REGISTRY.gauge("embedding_cache_hit_ratio", "Share of cache lookups served from the cache.")
+IN_FLIGHT = REGISTRY.gauge("embedding_rpcs_in_flight", "RPCs currently being handled.", ("method",))
+RPC_SECONDS = REGISTRY.histogram("embedding_rpc_seconds", "Time to handle an RPC, by method and status.",
+                                 ("method", "code"))
+PROVIDER_CALLS = REGISTRY.counter("embedding_provider_calls", "Successful provider API calls.", ("endpoint",))
+PROVIDER_TOKENS = REGISTRY.counter("embedding_provider_tokens", "Estimated tokens sent to the provider API.",
+                                   ("endpoint",))
+PROVIDER_RETRIES = REGISTRY.counter("embedding_provider_retries", "Provider API calls retried after an error.",
+                                    ("endpoint",))
+COALESCED_REQUESTS = REGISTRY.counter(
+    "embedding_coalesced_requests", "Requests that waited for an identical document already in progress."
+)
+ADMISSION_ACTIVE = REGISTRY.gauge("embedding_admission_active", "Documents holding a processing slot.")
+ADMISSION_WAITING = REGISTRY.gauge("embedding_admission_waiting", "Documents queued for a processing slot.")
+SHED_REQUESTS = REGISTRY.counter(
+    "embedding_shed_requests", 'Requests rejected with RESOURCE_EXHAUSTED, by reason: "queue" or "bytes".',
+    ("reason",),
+)
+UPDATED_CHUNKS = REGISTRY.counter(
+    "embedding_updated_chunks", 'Chunks of updated documents: "reused" from the previous version or "embedded".',
+    ("result",),
+)
+LABEL_TOKENS = REGISTRY.histogram(
+    "embedding_label_tokens", 'Tokens used per label request, by kind: "document" text before condensing, '
+    '"prompt" or "completion".', ("kind",),
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000, 256000),
+)
+NEAR_DUPLICATES = REGISTRY.counter(
+    "embedding_near_duplicates", "Documents answered with the result of a near-identical stored document."
+)
+STARTUP_SECONDS = REGISTRY.gauge(
+    "embedding_startup_seconds", 'Time the server took to start: "warm_up", or "ready" since the process started.',
+    ("phase",),
+)
+
+
+def _cache_hit_ratio():
+    hits = sum(CACHE_LOOKUPS.labels(tier).value for tier in ("memory", "disk", "remote"))
+    lookups = hits + CACHE_LOOKUPS.labels("miss").value
+    return hits / lookups if lookups else 0.0
+
+
+CACHE_HIT_RATIO.set_function(_cache_hit_ratio)
+
+
+def process_age():
+    """
+    Returns how long ago this process was started, including interpreter startup and imports.
+
+    Returns:
+        float: Seconds since the process started, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/stat") as stat, open("/proc/uptime") as uptime:
+            # The command name in parentheses may contain spaces; starttime is the 20th field after it
+            started = int(stat.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+            return float(uptime.read().split()[0]) - started
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def time_stage(stage):
+    """
+    Times a block of work as one stage of handling a document.
+
+    Args:
+        stage (str): "decode", "sketch", "label", "embed", "serialize" or "persist".
+
+    Returns:
+        A context manager observing the block's duration.
+    """
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def timed_stage(stage, function):
+    """
+    Wraps a callable so every call is timed as `stage`, e.g. before handing it to an executor.
+
+    Args:
+        stage (str): The stage name.
+        function (callable): The work to time.
+
+    Returns:
+        callable: The wrapped function.
+    """
+    def wrapper(*args, **kwargs):
+        with time_stage(stage):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def _method_name(handler_call_details):
+    """The RPC name without its service prefix."""
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+def _status_code(context, error):
+    """The status an RPC ended with, as its name."""
+    code = context.code() if hasattr(context, "code") else None
+    if code is None:
+        code = grpc.StatusCode.UNKNOWN if error is not None else grpc.StatusCode.OK
+    if isinstance(code, grpc.StatusCode):
+        return code.name
+    return str(code)
+
+
+def _wrap_handler(handler, wrap_unary, wrap_stream):
+    """Rebuild a method handler with its behaviour wrapped according to its response cardinality."""
+    if handler is None:
+        return None
+    if handler.unary_unary:
+        return handler._replace(unary_unary=wrap_unary(handler.unary_unary))
+    if handler.stream_unary:
+        return handler._replace(stream_unary=wrap_unary(handler.stream_unary))
+    if handler.unary_stream:
+        return handler._replace(unary_stream=wrap_stream(handler.unary_stream))
+    return handler._replace(stream_stream=wrap_stream(handler.stream_stream))
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Times every RPC of a thread-pool server and counts the ones in flight."""
+
+    def intercept_service(self, continuation, handler_call_details):
+        method = _method_name(handler_call_details)
+        in_flight = IN_FLIGHT.labels(method)
+
+        def finish(start, context, error):
+            in_flight.dec()
+            RPC_SECONDS.labels(method, _status_code(context, error)).observe(time.perf_counter() - start)
+
+        def wrap_unary(behavior):
+            def wrapper(request, context):
+                start, error = time.perf_counter(), None
+                in_flight.inc()
+                try:
+                    return behavior(request, context)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    finish(start, context, error)
+            return wrapper
+
+        def wrap_stream(behavior):
+            def wrapper(request, context):
+                # Streaming RPCs last until the last response has been produced
+                start, error = time.perf_counter(), None
+                in_flight.inc()
+                try:
+                    yield from behavior(request, context)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    finish(start, context, error)
+            return wrapper
+
+        return _wrap_handler(continuation(handler_call_details), wrap_unary, wrap_stream)
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """Times every RPC of a grpc.aio server and counts the ones in flight."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        method = _method_name(handler_call_details)
+        in_flight = IN_FLIGHT.labels(method)
+
+        def finish(start, context, error):
+            in_flight.dec()
+            RPC_SECONDS.labels(method, _status_code(context, error)).observe(time.perf_counter() - start)
+
+        def wrap_unary(behavior):
+            async def wrapper(request, context):
+                start, error = time.perf_counter(), None
+                in_flight.inc()
+                try:
+                    return await behavior(request, context)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    finish(start, context, error)
+            return wrapper
+
+        def wrap_stream(behavior):
+            async def wrapper(request, context):
+                start, error = time.perf_counter(), None
+                in_flight.inc()
+                try:
+                    async for response in behavior(request, context):
+                        yield response
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    finish(start, context, error)
+            return wrapper
+
+        return _wrap_handler(await continuation(handler_call_details), wrap_unary, wrap_stream)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes arrive every few seconds; keep them out of the service log
+        pass
+
+
+def start_metrics_server(port=None, host="", registry=None):
+    """
+    Serves `/metrics` over HTTP from a daemon thread.
+
+    Args:
+        port (int): Port to listen on. Defaults to METRICS_PORT; 0 picks a free port.
+        host (str): Address to bind.
+        registry (MetricsRegistry): Registry to expose. Defaults to the process-wide one.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call `shutdown()` to stop it.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or REGISTRY})
+    server = ThreadingHTTPServer((host, Config.METRICS_PORT if port is None else port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
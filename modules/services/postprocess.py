@@ -0,0 +1,164 @@
+import hashlib
+import os
+import numpy as np
+from modules.config import Config
+
+
+class EmbeddingPostProcessor:
+    def __init__(self, dimension=None, reduction=None, normalize=None, pca_path=None):
+        """
+        Validates, reduces and normalizes the vectors returned by an embedding generator.
+
+        The vectors of one call are handled as a single contiguous matrix, so every
+        step is one NumPy operation instead of a loop over Python floats. Vectors are
+        reduced to `dimension` values either by keeping their leading values
+        (Matryoshka-style truncation, for models trained so that every prefix is an
+        embedding itself, such as text-embedding-3) or by projecting them onto the
+        principal components learned with `fit_pca`. Reduced vectors are always
+        L2-normalized again, since both reductions change their length.
+
+        Args:
+            dimension (int): Size of the output vectors; 0 keeps the size the model returns.
+            reduction (str): "truncate" or "pca".
+            normalize (bool): L2-normalize vectors that are not reduced as well.
+            pca_path (str): Optional .npz file with the projection saved by `fit_pca`.
+        """
+        self.dimension = dimension if dimension is not None else Config.EMBEDDING_DIMENSION
+        self.reduction = reduction or Config.EMBEDDING_REDUCTION
+        self.normalize = normalize if normalize is not None else Config.EMBEDDING_NORMALIZE
+        self.mean = None
+        self.components = None
+        self._projection_digest = None
+        if self.reduction not in ("truncate", "pca"):
+            raise ValueError("Reduction must be either 'truncate' or 'pca'.")
+        pca_path = pca_path if pca_path is not None else Config.EMBEDDING_PCA_PATH
+        if self.reduction == "pca" and pca_path and os.path.exists(pca_path):
+            with np.load(pca_path) as projection:
+                self._set_projection(projection["mean"], projection["components"])
+
+    def _set_projection(self, mean, components):
+        """Use a PCA projection and make the signature, and so the cache keys, reflect it."""
+        if components.ndim != 2 or mean.shape != (components.shape[1],):
+            raise ValueError("The PCA projection must hold a mean and one component per output value.")
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.dimension = self.components.shape[0]
+        digest = hashlib.sha256(self.mean.tobytes() + self.components.tobytes()).hexdigest()[:8]
+        self._projection_digest = digest
+
+    @property
+    def signature(self):
+        """Short description of the settings that change the output vectors; empty when they pass through."""
+        parts = []
+        if self.dimension:
+            parts.append(f"pca{self.dimension}-{self._projection_digest}" if self.reduction == "pca"
+                         else f"truncate{self.dimension}")
+        elif self.normalize:
+            parts.append("normalized")
+        return ":".join(parts)
+
+    def output_dimension(self, input_dimension):
+        """
+        Returns the size of the vectors produced for inputs of a given size.
+
+        Args:
+            input_dimension (int): Size of the vectors returned by the model, or None if unknown.
+
+        Returns:
+            int: The output size, or None if it cannot be known in advance.
+        """
+        return self.dimension or input_dimension
+
+    @staticmethod
+    def validate(embeddings):
+        """
+        Checks that embeddings are equally long vectors of finite floats.
+
+        Args:
+            embeddings (array-like): One vector, or a list or matrix of vectors.
+
+        Returns:
+            numpy.ndarray: A C-contiguous (rows, dim) matrix with the precision of the input.
+
+        Raises:
+            ValueError: If the embeddings are ragged, empty, not floats or not finite.
+        """
+        try:
+            matrix = np.asarray(embeddings)
+        except ValueError:
+            raise ValueError("Embedding vectors must all have the same size.")
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.ndim != 2 or matrix.shape[1] == 0 or matrix.dtype.kind != "f":
+            raise ValueError("Embedding vector must be a list of floats.")
+        if not np.isfinite(matrix).all():
+            raise ValueError("Embedding vectors must not contain NaN or infinite values.")
+        return np.ascontiguousarray(matrix)
+
+    @staticmethod
+    def l2_normalize(matrix):
+        """
+        Scales every row to unit length, leaving zero rows as they are.
+
+        Args:
+            matrix (numpy.ndarray): A (rows, dim) float matrix; it is not modified.
+
+        Returns:
+            numpy.ndarray: The normalized matrix.
+        """
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+    def _reduce(self, matrix):
+        """Truncate or project the rows to `dimension` values."""
+        if self.reduction == "pca":
+            if self.components is None:
+                raise ValueError("PCA reduction needs a projection; fit one with fit_pca or set EMBEDDING_PCA_PATH.")
+            if self.components.shape[1] != matrix.shape[1]:
+                raise ValueError(
+                    f"The PCA projection expects {self.components.shape[1]}-dimensional embeddings, "
+                    f"got {matrix.shape[1]}."
+                )
+            return (matrix - self.mean) @ self.components.T
+        if self.dimension > matrix.shape[1]:
+            raise ValueError(f"Cannot truncate {matrix.shape[1]}-dimensional embeddings to {self.dimension} values.")
+        return matrix[:, :self.dimension]
+
+    def process(self, embeddings):
+        """
+        Validates the embeddings and reduces and normalizes them as configured.
+
+        Args:
+            embeddings (array-like): The vectors returned by the embedding generator.
+
+        Returns:
+            numpy.ndarray: A C-contiguous (rows, dimension) matrix. Vectors that are
+                           neither reduced nor normalized keep the precision they came in.
+        """
+        matrix = self.validate(embeddings)
+        if self.dimension:
+            return self.l2_normalize(self._reduce(matrix))
+        if self.normalize:
+            return self.l2_normalize(matrix)
+        return matrix
+
+    def fit_pca(self, embeddings, pca_path=None):
+        """
+        Learns the PCA projection to `dimension` values from a sample of embeddings and optionally saves it.
+
+        Args:
+            embeddings (array-like): Representative embeddings, at least `dimension` of them.
+            pca_path (str): Where to save the projection as .npz.
+        """
+        if not self.dimension:
+            raise ValueError("PCA needs an output dimension.")
+        matrix = self.validate(embeddings).astype(np.float64)
+        if min(matrix.shape) < self.dimension:
+            raise ValueError(f"PCA to {self.dimension} values needs at least {self.dimension} embeddings of that size.")
+        mean = matrix.mean(axis=0)
+        # The right singular vectors of the centred sample are its principal components, largest first
+        _, _, components = np.linalg.svd(matrix - mean, full_matrices=False)
+        self.reduction = "pca"
+        self._set_projection(mean, components[:self.dimension])
+        if pca_path:
+            np.savez(pca_path, mean=self.mean, components=self.components)
@@ -0,0 +1,427 @@
+import asyncio
+import random
+import threading
+import time
+from modules.config import Config
+from modules.services.admission import RequestAborted, current_deadline
+from modules.services.lazy import LazyModule
+from modules.services.metrics import PROVIDER_CALLS, PROVIDER_RETRIES, PROVIDER_TOKENS
+
+# Imported on the first provider call or warm-up; every module talking to OpenAI goes through this one
+openai = LazyModule("openai", on_load=lambda module: setattr(module, "api_key", Config.OPENAI_API_KEY))
+
+
+def retryable_errors():
+    """The OpenAI errors that are always transient, looked up when needed so openai is imported lazily."""
+    return (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.APIConnectionError,
+        openai.error.Timeout,
+        openai.error.TryAgain,
+    )
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call to a failing provider."""
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        """
+        Initializes a token bucket refilled continuously at `per_minute` tokens per minute.
+
+        Callers reserve tokens up front and are told how long to wait before using
+        them, so concurrent callers queue in arrival order instead of retrying.
+
+        Args:
+            per_minute (float): Refill rate. Zero or None disables the bucket.
+            capacity (float): Maximum burst size. Defaults to one minute of tokens.
+        """
+        self.rate = (per_minute or 0) / 60.0
+        self.capacity = capacity or per_minute or 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """
+        Takes tokens from the bucket, going into debt when it is empty.
+
+        Args:
+            amount (float): Number of tokens to take.
+
+        Returns:
+            float: Seconds to wait before the reserved tokens may be used.
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        """
+        Initializes a limiter for both requests per minute and tokens per minute.
+
+        Args:
+            requests_per_minute (float): Request rate limit. Zero disables it.
+            tokens_per_minute (float): Token rate limit. Zero disables it.
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        """
+        Holds back every caller for `seconds`, e.g. when the provider asks to retry later.
+
+        Args:
+            seconds (float): How long to pause.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def reserve(self, tokens=0):
+        """
+        Reserves capacity for one request using `tokens` tokens.
+
+        Args:
+            tokens (int): Estimated number of tokens the request will use.
+
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        paused = max(0.0, self._paused_until - time.monotonic())
+        return max(paused, self.requests.reserve(1), self.tokens.reserve(tokens))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        """
+        Initializes a circuit breaker that stops calls to a provider after repeated failures.
+
+        After `failure_threshold` consecutive failures the circuit opens and calls fail
+        fast. Once `reset_timeout` seconds have passed, one trial call is let through;
+        its outcome closes the circuit or opens it again.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a trial call.
+        """
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout if reset_timeout is not None else Config.CIRCUIT_RESET_SECONDS
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """The breaker state: "closed", "open" or "half-open"."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_in_progress):
+                raise CircuitOpenError("The provider circuit is open after repeated failures.")
+            if state == "half-open":
+                self._trial_in_progress = True
+
+    def record_success(self):
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def release(self):
+        """End a trial call whose outcome says nothing about the provider's health."""
+        with self._lock:
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        """Count a failed call, opening the circuit past the threshold."""
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_progress or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+class ProviderClient:
+    def __init__(self, rate_limiter=None, circuit_breaker=None, max_retries=None, backoff_base=None,
+                 backoff_max=None, name="default"):
+        """
+        Initializes a client that paces, retries and guards calls to the provider API.
+
+        Args:
+            rate_limiter (RateLimiter): Limiter applied before every attempt.
+            circuit_breaker (CircuitBreaker): Breaker tracking provider failures.
+            max_retries (int): Number of retries after the first attempt.
+            backoff_base (float): Base delay in seconds for exponential backoff.
+            backoff_max (float): Maximum delay in seconds between attempts.
+            name (str): Endpoint name under which calls and tokens are reported in the metrics.
+        """
+        self.name = name
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.max_retries = max_retries if max_retries is not None else Config.PROVIDER_MAX_RETRIES
+        self.backoff_base = backoff_base if backoff_base is not None else Config.PROVIDER_BACKOFF_BASE
+        self.backoff_max = backoff_max if backoff_max is not None else Config.PROVIDER_BACKOFF_MAX
+        self.retries = 0
+        self.calls = 0
+        self.tokens = 0
+        self._usage_lock = threading.Lock()
+
+    def _record_usage(self, tokens):
+        """Count a successful call and the tokens it was estimated to use."""
+        with self._usage_lock:
+            self.calls += 1
+            self.tokens += tokens
+        PROVIDER_CALLS.labels(self.name).inc()
+        PROVIDER_TOKENS.labels(self.name).inc(tokens)
+
+    def usage(self):
+        """
+        Returns the number of successful calls and the tokens they were estimated to use.
+
+        Returns:
+            dict: The "calls" and "tokens" counters.
+        """
+        with self._usage_lock:
+            return {"calls": self.calls, "tokens": self.tokens}
+
+    @staticmethod
+    def is_retryable(error):
+        """
+        Checks whether an error is transient: throttling, a 5xx response or a connection problem.
+
+        Args:
+            error (Exception): The error raised by the provider call.
+
+        Returns:
+            bool: True if the call should be retried.
+        """
+        if isinstance(error, openai.error.RateLimitError):
+            # An exhausted quota is not going to recover by waiting.
+            return error.code != "insufficient_quota"
+        if isinstance(error, retryable_errors()):
+            return True
+        if isinstance(error, openai.error.APIError):
+            return error.http_status is None or error.http_status >= 500
+        return False
+
+    @staticmethod
+    def retry_after(error):
+        """
+        Reads the delay requested by the provider from the Retry-After headers.
+
+        Args:
+            error (Exception): The error raised by the provider call.
+
+        Returns:
+            float: The requested delay in seconds, or None if none was given.
+        """
+        headers = getattr(error, "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms") is not None:
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after") is not None:
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            pass
+        return None
+
+    def _backoff(self, attempt, error):
+        """Delay before the next attempt: full-jitter exponential backoff, at least Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _should_retry(self, attempt, error):
+        """Record the failure and decide whether to retry."""
+        if not self.is_retryable(error):
+            self.circuit_breaker.release()
+            return False
+        if isinstance(error, openai.error.RateLimitError):
+            # Throttling means the provider is up; queue callers behind Retry-After instead of tripping the breaker.
+            self.circuit_breaker.release()
+            retry_after = self.retry_after(error)
+            if retry_after is not None:
+                self.rate_limiter.pause(min(retry_after, self.backoff_max))
+        else:
+            self.circuit_breaker.record_failure()
+        if attempt >= self.max_retries:
+            return False
+        self.retries += 1
+        PROVIDER_RETRIES.labels(self.name).inc()
+        return True
+
+    @staticmethod
+    def _bounded(deadline, kwargs):
+        """
+        Stop before calling the provider for a request nobody waits for, and bound the call by its deadline.
+
+        Args:
+            deadline (Deadline): Deadline of the request being handled, or None.
+            kwargs (dict): Arguments for the provider function.
+
+        Returns:
+            dict: The arguments, with a request timeout ending at the deadline.
+        """
+        if deadline is None:
+            return kwargs
+        deadline.check()
+        remaining = deadline.remaining()
+        if remaining is None:
+            return kwargs
+        return dict(kwargs, request_timeout=remaining)
+
+    def _check_aborted(self, deadline, error):
+        """
+        Re-raise an attempt that failed because its request was abandoned, without counting it against the provider.
+
+        A call cut short by the request deadline times out like a slow provider would,
+        but retrying it is pointless and it must not trip the circuit breaker.
+        """
+        if isinstance(error, RequestAborted):
+            self.circuit_breaker.release()
+            raise error
+        if deadline is not None:
+            try:
+                deadline.check()
+            except RequestAborted as aborted:
+                self.circuit_breaker.release()
+                raise aborted from error
+
+    @staticmethod
+    def _sleep(deadline, seconds):
+        """Wait before an attempt, giving up if the request would miss its deadline meanwhile."""
+        if deadline is None:
+            time.sleep(seconds)
+        else:
+            deadline.sleep(seconds)
+
+    def call(self, fn, tokens=0, **kwargs):
+        """
+        Calls a provider function with rate limiting and retries.
+
+        When the call serves an RPC, it is not made once the client has gone away or
+        its deadline has passed, each attempt times out at the deadline, and waits
+        that would end past the deadline are not started.
+
+        Args:
+            fn (callable): The provider function, e.g. openai.Embedding.create.
+            tokens (int): Estimated number of tokens the call will use.
+            **kwargs: Arguments for the provider function.
+
+        Returns:
+            The provider response.
+
+        Raises:
+            RequestAborted: If the request is abandoned or its deadline passes.
+        """
+        deadline = current_deadline()
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            try:
+                wait = self.rate_limiter.reserve(tokens)
+                if wait:
+                    self._sleep(deadline, wait)
+                response = fn(**self._bounded(deadline, kwargs))
+            except Exception as e:
+                self._check_aborted(deadline, e)
+                if not self._should_retry(attempt, e):
+                    raise
+                self._sleep(deadline, self._backoff(attempt, e))
+                attempt += 1
+                continue
+            self.circuit_breaker.record_success()
+            self._record_usage(tokens)
+            return response
+
+    @staticmethod
+    async def _async_sleep(deadline, seconds):
+        """Wait before an attempt without blocking, giving up if the request would miss its deadline meanwhile."""
+        if deadline is not None:
+            deadline.check_wait(seconds)
+        await asyncio.sleep(seconds)
+
+    async def acall(self, fn, tokens=0, **kwargs):
+        """
+        Calls an async provider function with rate limiting and retries, without blocking.
+
+        The deadline of the RPC bounds the call as in `call`; a client going away
+        cancels the task awaiting it.
+
+        Args:
+            fn (callable): The async provider function, e.g. openai.Embedding.acreate.
+            tokens (int): Estimated number of tokens the call will use.
+            **kwargs: Arguments for the provider function.
+
+        Returns:
+            The provider response.
+        """
+        deadline = current_deadline()
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            try:
+                wait = self.rate_limiter.reserve(tokens)
+                if wait:
+                    await self._async_sleep(deadline, wait)
+                response = await fn(**self._bounded(deadline, kwargs))
+            except asyncio.CancelledError:
+                # The client went away; the call says nothing about the provider
+                self.circuit_breaker.release()
+                raise
+            except Exception as e:
+                self._check_aborted(deadline, e)
+                if not self._should_retry(attempt, e):
+                    raise
+                await self._async_sleep(deadline, self._backoff(attempt, e))
+                attempt += 1
+                continue
+            self.circuit_breaker.record_success()
+            self._record_usage(tokens)
+            return response
+
+
+_shared_clients = {}
+_shared_lock = threading.Lock()
+
+
+def get_provider_client(name):
+    """
+    Returns the process-wide client for a provider endpoint, so all callers share its limits.
+
+    Args:
+        name (str): "label" for chat completions or "embedding" for embeddings.
+
+    Returns:
+        ProviderClient: The shared client.
+    """
+    with _shared_lock:
+        if name not in _shared_clients:
+            if name == "label":
+                limiter = RateLimiter(Config.LABEL_RPM, Config.LABEL_TPM)
+            elif name == "embedding":
+                limiter = RateLimiter(Config.EMBEDDING_RPM, Config.EMBEDDING_TPM)
+            else:
+                raise ValueError(f"Unknown provider endpoint: {name}")
+            _shared_clients[name] = ProviderClient(rate_limiter=limiter, name=name)
+        return _shared_clients[name]
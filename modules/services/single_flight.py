@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from concurrent import futures
+from modules.services.metrics import COALESCED_REQUESTS
+
+
+class FlightAbandoned(Exception):
+    """The request computing a result went away before finishing; a waiting request should take over."""
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Coalesces concurrent computations of the same key into one.
+
+        The first caller to `join` a key leads: it computes the result and hands
+        it to `finish`. Callers that join while it is in flight get the leader's
+        future and wait on it instead of repeating the work. Errors are shared
+        the same way, so a burst of retries for a failing document costs one call.
+        """
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.coalesced = 0
+
+    def _new_future(self):
+        return futures.Future()
+
+    def join(self, key):
+        """
+        Joins the computation of a key, starting it if none is in flight.
+
+        Args:
+            key (str): Identifier of the result, such as a cache key.
+
+        Returns:
+            tuple: The future of the result and whether the caller leads, i.e. must compute it.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                COALESCED_REQUESTS.inc()
+                return future, False
+            future = self._flights[key] = self._new_future()
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        """
+        Ends a flight, handing its result or error to the callers waiting on it.
+
+        Args:
+            key (str): Identifier passed to `join`.
+            future (Future): The future `join` returned to the leader.
+            result: The computed result.
+            error (BaseException): The error to raise in the waiting callers instead.
+        """
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def abandon(self, key, future):
+        """
+        Ends a flight whose leader gave up, so one of the waiting callers leads a new one.
+
+        Args:
+            key (str): Identifier passed to `join`.
+            future (Future): The future `join` returned to the leader.
+        """
+        self.finish(key, future, error=FlightAbandoned(key))
+
+    def in_flight(self):
+        """
+        Returns the number of keys being computed.
+
+        Returns:
+            int: Flights started and not yet finished.
+        """
+        with self._lock:
+            return len(self._flights)
+
+
+class AsyncSingleFlight(SingleFlight):
+    """Coalesces concurrent computations on one event loop; waiters await the leader's asyncio future."""
+
+    def _new_future(self):
+        return asyncio.get_running_loop().create_future()
+
+    def finish(self, key, future, result=None, error=None):
+        super().finish(key, future, result, error)
+        if error is not None and not future.cancelled():
+            # Nobody may be waiting; mark the error as retrieved so asyncio does not log it
+            future.exception()
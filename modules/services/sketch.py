@@ -0,0 +1,111 @@
+import base64
+import re
+import zlib
+import numpy as np
+from modules.config import Config
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# A prime above 2**32, so that (a * x + b) % PRIME permutes 32-bit shingle hashes
+PRIME = np.uint64(4294967311)
+MASK_32 = np.uint64(0xFFFFFFFF)
+# Shingles hashed per matrix product, bounding the memory of long documents
+BLOCK_SHINGLES = 4096
+
+
+class MinHasher:
+    def __init__(self, permutations=None, shingle_words=None, seed=1):
+        """
+        Initializes a MinHash sketcher estimating how much two texts overlap.
+
+        A text is lowercased and reduced to its words, so changes of whitespace,
+        punctuation or case do not count, and described by its set of shingles of
+        `shingle_words` consecutive words. The signature keeps, for each of
+        `permutations` random hash functions, the smallest hash of any shingle. The
+        share of equal values in two signatures estimates the Jaccard similarity of
+        the shingle sets. The hash functions are applied to blocks of shingles as
+        one NumPy operation.
+
+        Args:
+            permutations (int): Number of hash functions, i.e. the length of a signature.
+            shingle_words (int): Words per shingle.
+            seed (int): Seed of the hash functions; texts are only comparable under the same seed.
+        """
+        self.permutations = permutations or Config.NEAR_DUPLICATE_PERMUTATIONS
+        self.shingle_words = shingle_words or Config.NEAR_DUPLICATE_SHINGLE_WORDS
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # Below 2**32, so a * x + b stays within 64 bits for 32-bit x
+        self._a = rng.integers(1, 1 << 32, size=self.permutations, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=self.permutations, dtype=np.uint64)
+
+    @property
+    def name(self):
+        """Identifies the sketch settings; signatures are only comparable under the same name."""
+        return f"minhash:{self.permutations}:{self.shingle_words}:{self.seed}"
+
+    def shingles(self, text):
+        """
+        Hashes the shingles of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            numpy.ndarray: The distinct 32-bit shingle hashes, as uint64.
+        """
+        words = WORD_PATTERN.findall(text.lower())
+        if not words:
+            return np.zeros(0, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+        width = min(self.shingle_words, len(hashes))
+        count = len(hashes) - width + 1
+        combined = np.zeros(count, dtype=np.uint64)
+        for offset in range(width):
+            # FNV-style mixing; uint64 arithmetic wraps around
+            combined = combined * np.uint64(0x100000001B3) ^ hashes[offset:offset + count]
+        return np.unique(combined & MASK_32)
+
+    def signature(self, text):
+        """
+        Computes the MinHash signature of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            numpy.ndarray: `permutations` uint32 values, or None if the text has no words.
+        """
+        shingles = self.shingles(text)
+        if not shingles.size:
+            return None
+        signature = np.full(self.permutations, PRIME, dtype=np.uint64)
+        for start in range(0, len(shingles), BLOCK_SHINGLES):
+            block = shingles[start:start + BLOCK_SHINGLES]
+            hashed = (np.outer(self._a, block) + self._b[:, None]) % PRIME
+            np.minimum(signature, hashed.min(axis=1), out=signature)
+        return (signature & MASK_32).astype(np.uint32)
+
+
+def similarity(first, second):
+    """
+    Estimates the Jaccard similarity of the texts behind two signatures.
+
+    Args:
+        first (numpy.ndarray): A signature from `MinHasher.signature`.
+        second (numpy.ndarray): A signature of the same length.
+
+    Returns:
+        float: The share of equal values, between 0 and 1.
+    """
+    return float(np.mean(first == second))
+
+
+def encode_signature(signature):
+    """Packs a signature into a string, to store it in entry metadata."""
+    return base64.b64encode(np.asarray(signature, dtype="<u4").tobytes()).decode("ascii")
+
+
+def decode_signature(value):
+    """Unpacks a signature packed by `encode_signature`."""
+    return np.frombuffer(base64.b64decode(value), dtype="<u4").astype(np.uint32)
@@ -0,0 +1,5 @@
+from modules.storage.files import FileLock, atomic_write
+from modules.storage.vector_store import VectorStore
+from modules.storage.vector_index import VectorIndex
+from modules.storage.sketch_index import SketchIndex
+from modules.storage.remote import BackgroundWriter, MemoryStore, RedisStore, RemoteStoreError, create_remote_store
@@ -0,0 +1,88 @@
+import argparse
+import glob
+import json
+import logging
+import os
+from modules.config import Config
+from modules.storage.vector_store import VectorStore
+
+LEGACY_SUFFIX = "_embedded.json"
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_key(name):
+    """Key used for a legacy file whose source document cannot be found."""
+    return f"legacy:{name}"
+
+
+def convert_json_files(json_dir, store, key_for=None, remove=False):
+    """
+    Converts pretty-printed `<name>_embedded.json` files into a vector store.
+
+    Args:
+        json_dir (str): Directory containing the legacy JSON files.
+        store (VectorStore): Store receiving the converted entries.
+        key_for (callable): Maps a document name to its store key. Defaults to `legacy_key`.
+        remove (bool): Delete each JSON file once it has been converted.
+
+    Returns:
+        list: The keys written to the store.
+    """
+    key_for = key_for or legacy_key
+    keys = []
+    for path in sorted(glob.glob(os.path.join(json_dir, f"*{LEGACY_SUFFIX}"))):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+
+        name = os.path.basename(path)[:-len(LEGACY_SUFFIX)]
+        key = key_for(name)
+        store.put(key, data["embeddings"], {"definition": json.dumps(data["definition"])})
+        keys.append(key)
+        logger.info("Converted '%s' to store entry %s.", path, key)
+
+        if remove:
+            os.remove(path)
+    return keys
+
+
+def source_key_for(source_dir, label_model, embedding_model):
+    """
+    Builds a `key_for` function that keys entries by the content of their source document.
+
+    Args:
+        source_dir (str): Directory holding the original `<name>.txt` documents.
+        label_model (str): Model the legacy definitions were generated with.
+        embedding_model (str): Model the legacy embeddings were generated with.
+
+    Returns:
+        callable: Maps a document name to a content-addressed cache key.
+    """
+    from modules.services.cache import EmbeddingCache
+
+    def key_for(name):
+        candidates = glob.glob(os.path.join(source_dir, f"{glob.escape(name)}.*"))
+        if not candidates:
+            return legacy_key(name)
+        with open(candidates[0], "rb") as file:
+            return EmbeddingCache.make_key(file.read(), label_model, embedding_model)
+
+    return key_for
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert legacy embedded JSON files into the vector store.")
+    parser.add_argument("--json-dir", default=Config.EMBEDDED_DIR)
+    parser.add_argument("--store-dir", default=Config.VECTOR_STORE_DIR)
+    parser.add_argument("--source-dir", default=os.path.join(Config.OUTPUT_DIR, "stories"),
+                        help="Directory of the original documents, used to derive content-addressed keys.")
+    parser.add_argument("--remove", action="store_true", help="Delete the JSON files after converting them.")
+    args = parser.parse_args()
+
+    Config.configure_logging()
+    convert_json_files(
+        args.json_dir,
+        VectorStore(args.store_dir),
+        key_for=source_key_for(args.source_dir, Config.LABEL_MODEL, Config.DEFAULT_MODEL),
+        remove=args.remove,
+    )
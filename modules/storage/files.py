@@ -0,0 +1,89 @@
+import contextlib
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; only threads of this process are then excluded
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path):
+        """
+        Initializes an exclusive lock shared by every process that opens the same lock file.
+
+        The lock is an advisory `flock` on `path`, taken on top of an in-process lock
+        so threads are excluded as well. It is reentrant within a thread.
+
+        Args:
+            path (str): The lock file; created on first use.
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        """Blocks until this process holds the lock."""
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._file = open(self.path, "a")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        """Releases the lock once every `acquire` of this thread has been matched."""
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            # Closing the file drops the flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w", encoding="utf-8"):
+    """
+    Opens a temporary file next to `path` and renames it over `path` once the block succeeds.
+
+    Readers see either the old file or the complete new one, never a partial write;
+    if the block raises, `path` is left untouched.
+
+    Args:
+        path (str): The file to write.
+        mode (str): "w" for text or "wb" for bytes.
+        encoding (str): Encoding of text writes.
+
+    Yields:
+        file: The temporary file to write to.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
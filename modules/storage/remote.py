@@ -0,0 +1,330 @@
+import logging
+import queue
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+from modules.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteStoreError(Exception):
+    """Raised when the remote cache cannot be reached or answers with an error."""
+
+
+def _encode_command(args):
+    """Encode one command as a RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, (int, float)):
+            arg = str(arg).encode("ascii")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    """Read one RESP reply; error replies are returned as RemoteStoreError instead of raised."""
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise RemoteStoreError("The connection to the remote cache was closed.")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode("utf-8")
+    if kind == b"-":
+        return RemoteStoreError(body.decode("utf-8"))
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise RemoteStoreError("The connection to the remote cache was closed.")
+        return data[:-2]
+    if kind == b"*":
+        length = int(body)
+        return None if length < 0 else [_read_reply(reader) for _ in range(length)]
+    raise RemoteStoreError(f"Unexpected reply from the remote cache: {line!r}")
+
+
+class _Connection:
+    def __init__(self, host, port, timeout):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.socket.makefile("rb")
+
+    def execute(self, commands):
+        """Send every command in one write, then read one reply per command."""
+        self.socket.sendall(b"".join(_encode_command(command) for command in commands))
+        return [_read_reply(self.reader) for _ in commands]
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+class RedisStore:
+    def __init__(self, url=None, pool_size=None, timeout=None, prefix=None):
+        """
+        Initializes a client for a server speaking the Redis protocol (RESP), such as Redis or Valkey.
+
+        Connections are pooled: each batch of commands borrows one, sends every
+        command in a single write and reads the replies back, so a lookup of many
+        keys costs one round trip. A connection that fails is closed instead of
+        being returned to the pool.
+
+        Args:
+            url (str): Address such as "redis://:password@host:6379/0".
+            pool_size (int): Maximum number of open connections.
+            timeout (float): Seconds to wait for a connection or a reply.
+            prefix (str): Prepended to every key, to share a server with other applications.
+        """
+        parsed = urlparse(url or Config.REMOTE_CACHE_URL)
+        if parsed.scheme not in ("redis", ""):
+            raise ValueError(f"Unsupported remote cache URL: {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.strip("/") or 0)
+        self.pool_size = pool_size or Config.REMOTE_CACHE_POOL_SIZE
+        self.timeout = timeout if timeout is not None else Config.REMOTE_CACHE_TIMEOUT
+        self.prefix = prefix if prefix is not None else Config.REMOTE_CACHE_PREFIX
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+
+    def _connect(self):
+        """Open a connection, authenticating and selecting the database."""
+        connection = _Connection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in connection.execute(setup):
+                if isinstance(reply, RemoteStoreError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection, opening one if none is idle."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RemoteStoreError("No remote cache connection became free in time.")
+        connection = None
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            yield connection
+            self._idle.put(connection)
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            raise
+        finally:
+            self._slots.release()
+
+    def execute(self, commands):
+        """
+        Sends a pipeline of commands and returns their replies.
+
+        Args:
+            commands (list): Commands as tuples of arguments, e.g. ("GET", key).
+
+        Returns:
+            list: One reply per command.
+
+        Raises:
+            RemoteStoreError: If the server cannot be reached or rejects a command.
+        """
+        try:
+            with self._connection() as connection:
+                replies = connection.execute(commands)
+        except OSError as e:
+            raise RemoteStoreError(f"The remote cache at {self.host}:{self.port} is unavailable: {e}")
+        for reply in replies:
+            if isinstance(reply, RemoteStoreError):
+                raise reply
+        return replies
+
+    def get_many(self, keys, ttl=None):
+        """
+        Looks up several keys in one round trip.
+
+        Args:
+            keys (list): Keys to read.
+            ttl (float): If set, the time to live of every key found is reset to `ttl` seconds.
+
+        Returns:
+            list: The value of each key, or None where it is missing.
+        """
+        if not keys:
+            return []
+        commands = []
+        for key in keys:
+            commands.append(("GET", self.prefix + key))
+            if ttl:
+                commands.append(("PEXPIRE", self.prefix + key, int(ttl * 1000)))
+        replies = self.execute(commands)
+        return replies[::2] if ttl else replies
+
+    def set_many(self, items, ttl=None):
+        """
+        Writes several values in one round trip.
+
+        Args:
+            items (list): (key, value) pairs; values are bytes.
+            ttl (float): Time to live in seconds; None keeps the values until they are evicted.
+        """
+        if not items:
+            return
+        if ttl:
+            self.execute([("SET", self.prefix + key, value, "PX", int(ttl * 1000)) for key, value in items])
+        else:
+            self.execute([("SET", self.prefix + key, value) for key, value in items])
+
+    def close(self):
+        """Closes the idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class MemoryStore:
+    def __init__(self):
+        """
+        An in-process stand-in for RedisStore, for tests and single-node development.
+
+        Several caches given the same instance share it like replicas sharing a server.
+        """
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        """Return the entry of a key unless it has expired."""
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry
+
+    def get_many(self, keys, ttl=None):
+        """Looks up several keys, resetting the time to live of those found when `ttl` is set."""
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._live(key, now)
+                if entry is not None and ttl:
+                    self._values[key] = (entry[0], now + ttl)
+                values.append(entry[0] if entry is not None else None)
+        return values
+
+    def set_many(self, items, ttl=None):
+        """Writes several values, expiring after `ttl` seconds when it is set."""
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            for key, value in items:
+                self._values[key] = (bytes(value), expires_at)
+
+    def close(self):
+        pass
+
+
+class BackgroundWriter:
+    def __init__(self, remote, ttl=None, max_pending=None, batch_size=64):
+        """
+        Writes values to a remote store on a background thread, off the response path.
+
+        Pending writes are sent together in pipelines of up to `batch_size` values.
+        When `max_pending` writes are already waiting, new ones are dropped: the
+        remote tier is a cache, and a missing entry only costs a later miss.
+
+        Args:
+            remote (RedisStore or MemoryStore): The store to write to.
+            ttl (float): Time to live of the written values in seconds.
+            max_pending (int): Writes waiting to be sent before new ones are dropped.
+            batch_size (int): Values sent per pipeline.
+        """
+        self.remote = remote
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_pending or Config.REMOTE_CACHE_WRITE_QUEUE)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, key, value):
+        """
+        Queues a write.
+
+        Args:
+            key (str): The key.
+            value (bytes): The value.
+
+        Returns:
+            bool: False if the write was dropped because too many are pending.
+        """
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="remote-cache-writer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((key, value))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.remote.set_many(items, self.ttl)
+                self.written += len(items)
+            except Exception as e:
+                self.failed += len(items)
+                logger.warning("Could not write %d entries to the remote cache: %s", len(items), e)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Waits until every queued write has been sent or has failed."""
+        if self._thread is not None:
+            self._queue.join()
+
+
+def create_remote_store(url=None):
+    """
+    Creates the remote cache tier configured by REMOTE_CACHE_URL.
+
+    Args:
+        url (str): "redis://host:port/db", or "memory://" for an in-process MemoryStore.
+
+    Returns:
+        RedisStore or MemoryStore: The store, or None when no remote tier is configured.
+    """
+    url = url if url is not None else Config.REMOTE_CACHE_URL
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryStore()
+    return RedisStore(url)
@@ -0,0 +1,99 @@
+import threading
+from collections import defaultdict
+import numpy as np
+from modules.config import Config
+
+
+class SketchIndex:
+    def __init__(self, bands=None):
+        """
+        Initializes an in-memory LSH index for finding stored documents with a similar MinHash signature.
+
+        Each signature is cut into `bands` bands of consecutive values, and a
+        document is a candidate for a query when at least one band is identical.
+        With r values per band, two documents of Jaccard similarity s share a band
+        with probability 1 - (1 - s^r)^bands, so near-identical documents are
+        almost always candidates while unrelated ones almost never are. Candidates
+        are then scored on their full signatures. Signatures are kept apart by
+        scope, since signatures from different sketch settings or of documents
+        processed by different models must not match.
+
+        Args:
+            bands (int): Number of bands; must divide the signature length.
+        """
+        self.bands = bands or Config.NEAR_DUPLICATE_BANDS
+        self._buckets = defaultdict(set)
+        self._signatures = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._signatures)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._signatures
+
+    def _band_keys(self, signature, scope):
+        """The bucket of each band of a signature."""
+        if len(signature) % self.bands:
+            raise ValueError(f"A signature of {len(signature)} values cannot be cut into {self.bands} bands.")
+        rows = len(signature) // self.bands
+        return [(scope, band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, key, signature, scope=""):
+        """
+        Adds or replaces the signature of a document.
+
+        Args:
+            key (str): Key of the document.
+            signature (numpy.ndarray): Its MinHash signature.
+            scope (str): Only signatures of the same scope are compared.
+        """
+        signature = np.asarray(signature, dtype=np.uint32)
+        with self._lock:
+            self._remove(key)
+            for bucket in self._band_keys(signature, scope):
+                self._buckets[bucket].add(key)
+            self._signatures[key] = (scope, signature)
+
+    def _remove(self, key):
+        entry = self._signatures.pop(key, None)
+        if entry is None:
+            return
+        scope, signature = entry
+        for bucket in self._band_keys(signature, scope):
+            keys = self._buckets[bucket]
+            keys.discard(key)
+            if not keys:
+                del self._buckets[bucket]
+
+    def remove(self, key):
+        """Removes a document, if it is indexed."""
+        with self._lock:
+            self._remove(key)
+
+    def query(self, signature, scope="", threshold=0.0):
+        """
+        Finds the documents whose signatures are similar to `signature`.
+
+        Args:
+            signature (numpy.ndarray): The MinHash signature to look up.
+            scope (str): Scope of the signature.
+            threshold (float): Minimum estimated Jaccard similarity.
+
+        Returns:
+            list: (key, similarity) tuples, most similar first.
+        """
+        signature = np.asarray(signature, dtype=np.uint32)
+        with self._lock:
+            candidates = set()
+            for bucket in self._band_keys(signature, scope):
+                candidates.update(self._buckets.get(bucket, ()))
+            if not candidates:
+                return []
+            keys = sorted(candidates)
+            stacked = np.stack([self._signatures[key][1] for key in keys])
+        similarities = (stacked == signature).mean(axis=1)
+        order = np.argsort(-similarities, kind="stable")
+        return [(keys[i], float(similarities[i])) for i in order if similarities[i] >= threshold]
@@ -0,0 +1,207 @@
+import threading
+import numpy as np
+from modules.config import Config
+
+METRICS = ("cosine", "l2", "ip")
+
+
+class _Partition:
+    def __init__(self, dim):
+        """Vectors of one dimension, with their inverted lists once the partition is large enough."""
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.lists = np.zeros(0, dtype=np.int32)
+        self.keys = []
+        self.size = 0
+        self.centroids = None
+        self.trained_on = 0
+
+    def append(self, key, vector):
+        """Add a row, doubling the arrays when they are full."""
+        if self.size == len(self.vectors):
+            capacity = max(64, 2 * self.size)
+            for name in ("vectors", "norms", "alive", "lists"):
+                old = getattr(self, name)
+                new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+        row = self.size
+        self.vectors[row] = vector
+        self.norms[row] = np.linalg.norm(vector)
+        self.alive[row] = True
+        self.lists[row] = self.nearest_list(vector[None, :])[0] if self.centroids is not None else -1
+        self.keys.append(key)
+        self.size += 1
+        return row
+
+    def nearest_list(self, vectors):
+        """Assign vectors to their closest centroid by L2 distance."""
+        distances = (self.centroids ** 2).sum(axis=1) - 2 * vectors @ self.centroids.T
+        return np.argmin(distances, axis=1).astype(np.int32)
+
+
+class VectorIndex:
+    def __init__(self, ivf_threshold=None, nprobe=None, kmeans_iterations=10, seed=0):
+        """
+        Initializes an in-memory index for nearest-neighbour search over stored vectors.
+
+        Below `ivf_threshold` vectors a query is one matrix product over all of them.
+        Past it, the vectors are clustered with k-means into about sqrt(n) inverted
+        lists (IVF) and a query only scans the `nprobe` lists closest to it. New
+        vectors are assigned to their nearest list as they are added, and the lists
+        are retrained each time the index has doubled in size since the last training.
+        Vectors of different dimensions are kept apart, since they come from
+        different models.
+
+        Args:
+            ivf_threshold (int): Number of vectors from which the IVF lists are used.
+            nprobe (int): Number of inverted lists scanned per query.
+            kmeans_iterations (int): Lloyd iterations when training the lists.
+            seed (int): Seed for sampling the k-means training set.
+        """
+        self.ivf_threshold = ivf_threshold or Config.SEARCH_IVF_THRESHOLD
+        self.nprobe = nprobe or Config.SEARCH_NPROBE
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self._partitions = {}
+        self._rows = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rows)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._rows
+
+    def add(self, key, vector):
+        """
+        Adds a vector, replacing any earlier vector stored under the same key.
+
+        Args:
+            key (str): Identifier returned by `search`.
+            vector (array-like): The vector.
+        """
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self.remove(key)
+            partition = self._partitions.get(len(vector))
+            if partition is None:
+                partition = self._partitions[len(vector)] = _Partition(len(vector))
+            self._rows[key] = (partition.dim, partition.append(key, vector))
+            live = int(partition.alive[:partition.size].sum())
+            if live >= self.ivf_threshold and live >= 2 * partition.trained_on:
+                self._train(partition)
+
+    def dimensions(self):
+        """
+        Returns the sizes of the indexed vectors.
+
+        Returns:
+            list: The dimension of every partition holding at least one vector, ascending.
+        """
+        with self._lock:
+            return sorted({dim for dim, _ in self._rows.values()})
+
+    def remove(self, key):
+        """
+        Removes a vector. Its row is skipped by searches and dropped at the next retraining.
+
+        Args:
+            key (str): Identifier of the vector.
+        """
+        with self._lock:
+            location = self._rows.pop(key, None)
+            if location is not None:
+                dim, row = location
+                self._partitions[dim].alive[row] = False
+
+    def _compact(self, partition):
+        """Drop removed rows so the arrays hold only live vectors."""
+        live = np.flatnonzero(partition.alive[:partition.size])
+        partition.vectors = partition.vectors[live].copy()
+        partition.norms = partition.norms[live].copy()
+        partition.alive = np.ones(len(live), dtype=bool)
+        partition.lists = partition.lists[live].copy()
+        partition.keys = [partition.keys[row] for row in live]
+        partition.size = len(live)
+        for row, key in enumerate(partition.keys):
+            self._rows[key] = (partition.dim, row)
+
+    def _train(self, partition):
+        """Cluster the partition with k-means and assign every vector to an inverted list."""
+        self._compact(partition)
+        vectors = partition.vectors[:partition.size]
+        nlist = max(1, min(int(np.sqrt(len(vectors))), 4096))
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), 64 * nlist), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            partition.centroids = centroids
+            assignment = partition.nearest_list(sample)
+            counts = np.bincount(assignment, minlength=nlist).astype(np.float32)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            # Empty lists keep their previous centroid
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        partition.centroids = centroids
+        partition.lists[:partition.size] = partition.nearest_list(vectors)
+        partition.trained_on = partition.size
+
+    @staticmethod
+    def _score(vectors, norms, query, metric):
+        """Score rows against the query; higher is better for every metric."""
+        products = vectors @ query
+        if metric == "ip":
+            return products
+        if metric == "cosine":
+            query_norm = np.linalg.norm(query)
+            denominator = norms * query_norm
+            return np.divide(products, denominator, out=np.zeros_like(products), where=denominator > 0)
+        # Negative squared L2 distance, so that sorting is the same as for the other metrics
+        return 2 * products - norms ** 2 - query @ query
+
+    def search(self, query, k=10, metric="cosine", exact=False):
+        """
+        Finds the stored vectors closest to a query.
+
+        Args:
+            query (array-like): The query vector.
+            k (int): Number of results.
+            metric (str): "cosine", "l2" or "ip" (inner product).
+            exact (bool): Scan every vector even when the IVF lists are trained.
+
+        Returns:
+            list: Up to `k` (key, score) pairs, best first. The score is the cosine
+                  similarity, the L2 distance or the inner product.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Metric must be one of {', '.join(METRICS)}.")
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            partition = self._partitions.get(len(query))
+            if partition is None or k <= 0:
+                return []
+            candidates = partition.alive[:partition.size].copy()
+            if partition.centroids is not None and not exact:
+                centroid_scores = self._score(
+                    partition.centroids, np.linalg.norm(partition.centroids, axis=1), query, metric
+                )
+                probes = np.argsort(-centroid_scores)[:self.nprobe]
+                candidates &= np.isin(partition.lists[:partition.size], probes)
+            rows = np.flatnonzero(candidates)
+            scores = self._score(partition.vectors[rows], partition.norms[rows], query, metric)
+            keys = partition.keys
+
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if metric == "l2":
+            return [(keys[rows[i]], float(np.sqrt(max(0.0, -scores[i])))) for i in top]
+        return [(keys[rows[i]], float(scores[i])) for i in top]
@@ -0,0 +1,342 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from modules.config import Config
+from modules.storage.files import FileLock, atomic_write
+
+INDEX_FILE = "index.jsonl"
+LOCK_FILE = "store.lock"
+SHARD_TEMPLATE = "shard-{:05d}.f32"
+ITEM_SIZE = np.dtype(np.float32).itemsize
+
+
+class VectorStore:
+    def __init__(self, store_dir=None, max_shard_bytes=None, max_bytes=None):
+        """
+        Initializes an append-only vector store backed by float32 shard files.
+
+        Vectors are written as contiguous float32 rows to the active shard, and a
+        JSON-lines index records where each entry lives together with its metadata.
+        Reads return NumPy views over memory-mapped shards, so no data is copied.
+
+        Several processes can share one directory: writes hold a lock file and first
+        catch up with the index lines and shard sizes other processes have written,
+        and a lookup that misses rereads the index before giving up.
+
+        Args:
+            store_dir (str): Directory holding the shards and the index.
+            max_shard_bytes (int): Size at which the active shard is rolled over.
+            max_bytes (int): Total size budget; the oldest shards are dropped past it.
+        """
+        self.store_dir = store_dir or Config.VECTOR_STORE_DIR
+        self.max_shard_bytes = max_shard_bytes or Config.VECTOR_STORE_SHARD_BYTES
+        self.max_bytes = max_bytes or Config.CACHE_MAX_DISK_BYTES
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(self.store_dir, LOCK_FILE))
+        self._maps = {}
+        self._entries = OrderedDict()
+        self._shard_sizes = {}
+        self._index_inode = None
+        self._index_position = 0
+        self.evictions = 0
+        self._load()
+
+    def _index_path(self):
+        """Construct the path to the metadata index."""
+        return os.path.join(self.store_dir, INDEX_FILE)
+
+    def _shard_path(self, shard):
+        """Construct the path to a shard file."""
+        return os.path.join(self.store_dir, SHARD_TEMPLATE.format(shard))
+
+    def _load(self):
+        """Replay the index and pick up the shard sizes from disk."""
+        self._read_index()
+        self._scan_shards()
+
+        # Drop index entries that point past the end of their shard.
+        for key, entry in list(self._entries.items()):
+            if entry["offset"] + entry["rows"] * entry["dim"] * ITEM_SIZE > self._shard_sizes.get(entry["shard"], 0):
+                del self._entries[key]
+
+    def _read_index(self):
+        """
+        Apply the index lines appended since the last read, by this or another process.
+
+        Returns:
+            bool: True if any line was applied.
+        """
+        try:
+            stat = os.stat(self._index_path())
+        except FileNotFoundError:
+            return False
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_position:
+            # First read, or another process compacted the index: replay it from the start
+            self._entries.clear()
+            self._index_inode = stat.st_ino
+            self._index_position = 0
+        if stat.st_size == self._index_position:
+            return False
+
+        with open(self._index_path(), "rb") as file:
+            file.seek(self._index_position)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # Still being written by another process, or torn by an interrupted write
+                    break
+                self._index_position += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The torn tail of an interrupted write that a later append landed on
+                    continue
+                self._apply(entry)
+        return True
+
+    def _scan_shards(self):
+        """Pick up the shard sizes from disk, including shards other processes created or dropped."""
+        self._shard_sizes = {}
+        for name in os.listdir(self.store_dir):
+            if name.startswith("shard-") and name.endswith(".f32"):
+                shard = int(name[len("shard-"):-len(".f32")])
+                self._shard_sizes[shard] = os.path.getsize(os.path.join(self.store_dir, name))
+
+        self._active_shard = max(self._shard_sizes, default=0)
+        self._shard_sizes.setdefault(self._active_shard, 0)
+
+    def _sync(self):
+        """Catch up with other processes before a write; called with the file lock held."""
+        self._read_index()
+        self._scan_shards()
+
+    def _lookup(self, key):
+        """Find the index entry of a key, rereading the index once on a miss."""
+        entry = self._entries.get(key)
+        if entry is None and self._read_index():
+            entry = self._entries.get(key)
+        return entry
+
+    def _apply(self, entry):
+        """Apply a single index line to the in-memory index."""
+        if "drop_shard" in entry:
+            for key in [k for k, e in self._entries.items() if e["shard"] == entry["drop_shard"]]:
+                del self._entries[key]
+            self._maps.pop(entry["drop_shard"], None)
+        elif entry.get("deleted"):
+            self._entries.pop(entry["key"], None)
+        else:
+            self._entries.pop(entry["key"], None)
+            self._entries[entry["key"]] = entry
+
+    def _append_index(self, entry):
+        """Append a line to the index and apply it; called with the file lock held, after `_sync`."""
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(self._index_path(), "ab") as file:
+            if file.tell() > self._index_position:
+                # The tail of an interrupted write; end it so this entry starts on a line of its own
+                line = b"\n" + line
+            file.write(line)
+            self._index_position = file.tell()
+        if self._index_inode is None:
+            self._index_inode = os.stat(self._index_path()).st_ino
+        self._apply(entry)
+
+    def _map(self, shard, end):
+        """Return a memory map of the shard covering at least `end` bytes."""
+        mapped = self._maps.get(shard)
+        if mapped is None or len(mapped) < end:
+            mapped = np.memmap(self._shard_path(shard), dtype=np.uint8, mode="r")
+            self._maps[shard] = mapped
+        return mapped
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def reload(self):
+        """
+        Picks up the entries other processes have written or removed since the last read.
+
+        Returns:
+            bool: True if anything changed.
+        """
+        with self._lock:
+            return self._read_index()
+
+    def keys(self):
+        """
+        Returns the stored keys, oldest first.
+
+        Returns:
+            list: The keys currently in the store.
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def put(self, key, vectors, metadata=None):
+        """
+        Appends vectors and their metadata to the store.
+
+        Args:
+            key (str): Identifier of the entry; an existing entry with the same key is replaced.
+            vectors (array-like): A vector or a matrix of row vectors.
+            metadata (dict): JSON-serializable metadata kept in the index.
+        """
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.ndim != 2:
+            raise ValueError("Vectors must be a vector or a matrix of row vectors.")
+
+        with self._lock, self._file_lock:
+            self._sync()
+            if self._shard_sizes[self._active_shard] + matrix.nbytes > self.max_shard_bytes \
+                    and self._shard_sizes[self._active_shard] > 0:
+                self._active_shard += 1
+                self._shard_sizes[self._active_shard] = 0
+
+            shard = self._active_shard
+            offset = self._shard_sizes[shard]
+            with open(self._shard_path(shard), "ab") as file:
+                file.write(matrix.tobytes())
+            self._shard_sizes[shard] += matrix.nbytes
+
+            self._append_index({
+                "key": key,
+                "shard": shard,
+                "offset": offset,
+                "rows": matrix.shape[0],
+                "dim": matrix.shape[1],
+                "metadata": metadata or {},
+            })
+            self._evict()
+
+    def get(self, key):
+        """
+        Reads an entry without copying its vectors.
+
+        Args:
+            key (str): Identifier of the entry.
+
+        Returns:
+            tuple: A read-only (rows, dim) float32 view and the metadata dict, or None if the key is absent.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            nbytes = entry["rows"] * entry["dim"] * ITEM_SIZE
+            try:
+                mapped = self._map(entry["shard"], entry["offset"] + nbytes)
+            except FileNotFoundError:
+                # Another process dropped the shard since this one last read the index
+                self._read_index()
+                return None
+        raw = mapped[entry["offset"]:entry["offset"] + nbytes]
+        return raw.view(np.float32).reshape(entry["rows"], entry["dim"]), entry["metadata"]
+
+    def _in_oldest_shard(self, entry):
+        """Whether an entry is in the shard evicted next; the active shard is never evicted."""
+        return entry is not None and entry["shard"] == min(self._shard_sizes) and entry["shard"] != self._active_shard
+
+    def refresh(self, key):
+        """
+        Moves an entry out of the oldest shard so it survives the next eviction.
+
+        Most entries are not in the oldest shard, so this is decided from the
+        in-memory index first; only entries that look due for eviction take the
+        file lock and check again against the shards on disk.
+
+        Args:
+            key (str): Identifier of the entry.
+        """
+        with self._lock:
+            if not self._in_oldest_shard(self._entries.get(key)):
+                return
+        with self._lock, self._file_lock:
+            self._sync()
+            if not self._in_oldest_shard(self._entries.get(key)):
+                return
+            vectors, metadata = self.get(key)
+            self.put(key, np.array(vectors), metadata)
+
+    def update_metadata(self, key, metadata):
+        """
+        Replaces the metadata of an entry without rewriting its vectors.
+
+        Args:
+            key (str): Identifier of the entry.
+            metadata (dict): JSON-serializable metadata kept in the index.
+
+        Returns:
+            bool: False if the key is absent.
+        """
+        with self._lock, self._file_lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            self._append_index(dict(entry, metadata=metadata))
+            return True
+
+    def delete(self, key):
+        """
+        Removes an entry from the index. Its bytes are reclaimed when its shard is dropped.
+
+        Args:
+            key (str): Identifier of the entry.
+        """
+        with self._lock, self._file_lock:
+            self._sync()
+            if key in self._entries:
+                self._append_index({"key": key, "deleted": True})
+
+    def total_bytes(self):
+        """
+        Returns the total size of all shards.
+
+        Returns:
+            int: Size in bytes.
+        """
+        with self._lock:
+            return sum(self._shard_sizes.values())
+
+    def _evict(self):
+        """Drop the oldest shards until the store fits its size budget."""
+        dropped = False
+        while sum(self._shard_sizes.values()) > self.max_bytes and len(self._shard_sizes) > 1:
+            dropped = True
+            shard = min(self._shard_sizes)
+            self.evictions += sum(1 for entry in self._entries.values() if entry["shard"] == shard)
+            self._append_index({"drop_shard": shard})
+            del self._shard_sizes[shard]
+            try:
+                os.remove(self._shard_path(shard))
+            except FileNotFoundError:
+                pass
+        if dropped and len(self._entries) * 2 < self._index_lines():
+            self._compact_index()
+
+    def _index_lines(self):
+        """Count the lines in the index file."""
+        with open(self._index_path(), "rb") as file:
+            return sum(1 for _ in file)
+
+    def _compact_index(self):
+        """Rewrite the index with only the live entries."""
+        with atomic_write(self._index_path()) as file:
+            for entry in self._entries.values():
+                file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        stat = os.stat(self._index_path())
+        self._index_inode, self._index_position = stat.st_ino, stat.st_size
@@ -1 +1,2 @@
-from modules.template.json_template import EmbeddingJSONTemplate
\ No newline at end of file
+from modules.template.json_template import EmbeddingJSONTemplate
+from modules.template.record import EmbeddingRecord
\ No newline at end of file
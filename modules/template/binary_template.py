@@ -0,0 +1,146 @@
+import json
+import numpy as np
+from modules.proto.embedding.embedding_buffer_pb2 import (
+    BINARY, FLOAT16, FLOAT32, INT8, Definition, EmbeddingResponse, Vectors,
+)
+from modules.template.json_template import EmbeddingJSONTemplate
+
+PACKED_DTYPES = {
+    FLOAT32: np.dtype("<f4"),
+    FLOAT16: np.dtype("<f2"),
+    INT8: np.dtype("i1"),
+    BINARY: np.dtype("u1"),
+}
+
+
+def encode_vectors(matrix, encoding=FLOAT32):
+    """
+    Packs a matrix of row vectors into a Vectors message.
+
+    Float32 rows are copied as they are, so vectors read from the vector store are
+    sent without any conversion. Int8 rows are scaled symmetrically so that the
+    largest absolute value of each row maps to 127. Binary rows keep one sign bit
+    per value and the mean absolute value of the row as its scale, which is the
+    scale that keeps the unpacked row closest to the original.
+
+    Args:
+        matrix (array-like): A vector or a matrix of row vectors.
+        encoding (int): FLOAT32, FLOAT16, INT8 or BINARY.
+
+    Returns:
+        Vectors: The packed vectors.
+    """
+    if encoding not in PACKED_DTYPES:
+        raise ValueError(f"Vectors cannot be packed with encoding {encoding}.")
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+
+    message = Vectors(encoding=encoding, rows=matrix.shape[0], dim=matrix.shape[1])
+    if encoding == INT8:
+        scales = np.abs(matrix).max(axis=1, initial=0.0) / 127
+        quantized = np.zeros_like(matrix)
+        np.divide(matrix, scales[:, None], out=quantized, where=scales[:, None] > 0)
+        message.data = np.rint(quantized).astype(PACKED_DTYPES[INT8]).tobytes()
+        message.scales.extend(scales.tolist())
+    elif encoding == BINARY:
+        message.data = np.packbits(matrix > 0, axis=1).tobytes()
+        message.scales.extend(np.abs(matrix).mean(axis=1).tolist())
+    else:
+        message.data = np.ascontiguousarray(matrix, dtype=PACKED_DTYPES[encoding]).tobytes()
+    return message
+
+
+def decode_vectors(message):
+    """
+    Unpacks a Vectors message.
+
+    Args:
+        message (Vectors): The packed vectors.
+
+    Returns:
+        numpy.ndarray: A (rows, dim) float32 matrix.
+    """
+    if message.encoding not in PACKED_DTYPES:
+        raise ValueError(f"Vectors cannot be unpacked with encoding {message.encoding}.")
+    scales = np.asarray(message.scales, dtype=np.float32)[:, None]
+    if message.encoding == BINARY:
+        packed = np.frombuffer(message.data, dtype=PACKED_DTYPES[BINARY]).reshape(message.rows, -1)
+        bits = np.unpackbits(packed, axis=1, count=message.dim)
+        return np.where(bits, scales, -scales).astype(np.float32)
+    matrix = np.frombuffer(message.data, dtype=PACKED_DTYPES[message.encoding])
+    matrix = matrix.reshape(message.rows, message.dim).astype(np.float32)
+    if message.encoding == INT8:
+        matrix *= scales
+    return matrix
+
+
+def encode_definition(definition):
+    """
+    Converts a definition JSON string into a Definition message.
+
+    Args:
+        definition (str): A JSON string containing collection_name, partition_name,
+                          description, dimension, and metric_type.
+
+    Returns:
+        Definition: The structured definition.
+    """
+    fields = EmbeddingJSONTemplate._parse_and_validate_definition(definition)
+    try:
+        dimension = int(fields["dimension"] or 0)
+    except (TypeError, ValueError):
+        # Model-written definitions sometimes describe the dimension in words
+        dimension = 0
+    return Definition(
+        collection_name=str(fields["collection_name"]),
+        partition_name=str(fields["partition_name"]),
+        description=str(fields["description"]),
+        dimension=dimension,
+        metric_type=str(fields["metric_type"]),
+    )
+
+
+def decode_definition(message):
+    """
+    Converts a Definition message back into a definition JSON string.
+
+    Args:
+        message (Definition): The structured definition.
+
+    Returns:
+        str: The definition as a JSON string.
+    """
+    return json.dumps({
+        "collection_name": message.collection_name,
+        "partition_name": message.partition_name,
+        "description": message.description,
+        "dimension": message.dimension,
+        "metric_type": message.metric_type,
+    })
+
+
+def build_response(definition=None, matrix=None, chunks=None, pooled=False, encoding=FLOAT32, stage="complete"):
+    """
+    Builds a typed EmbeddingResponse.
+
+    Args:
+        definition (str): The definition JSON string, or None to leave it out.
+        matrix (array-like): The record's vectors, or None to leave them out.
+        chunks (list): Optional chunk dicts with start, end and tokens.
+        pooled (bool): Whether the last row is the pooled document embedding.
+        encoding (int): FLOAT32, FLOAT16, INT8 or BINARY.
+        stage (str): The stage of the response.
+
+    Returns:
+        EmbeddingResponse: The response.
+    """
+    response = EmbeddingResponse(stage=stage)
+    if definition is not None:
+        response.definition.CopyFrom(encode_definition(definition))
+    if matrix is not None:
+        response.vectors.CopyFrom(encode_vectors(matrix, encoding))
+        response.pooled = pooled
+    for chunk in chunks or []:
+        response.chunks.add(start=chunk["start"], end=chunk["end"], tokens=chunk["tokens"])
+    return response
@@ -1,8 +1,13 @@
+import itertools
 import json
+import logging
+from modules.storage.files import atomic_write
+
+logger = logging.getLogger(__name__)
 
 
 class EmbeddingJSONTemplate:
-    def __init__(self, definition: str, embedding: list):
+    def __init__(self, definition: str, embedding: list, chunks: list = None, document_embedding: list = None):
         """
         Initializes the JSON template with a given definition and embeddings.
 
@@ -10,15 +15,22 @@ class EmbeddingJSONTemplate:
             definition (str): A JSON string containing collection_name, partition_name,
                               description, dimension, and metric_type.
             embedding (list): A list of embeddings.
+            chunks (list): Optional list of chunk dicts with start, end, tokens and embedding.
+            document_embedding (list): Optional embedding pooled from the chunk embeddings.
         """
         self.template = {
             "definition": self._parse_and_validate_definition(definition),
             "embeddings": self._flatten_embedding(embedding)
         }
+        if chunks is not None:
+            self.template["chunks"] = chunks
+        if document_embedding is not None:
+            self.template["document_embedding"] = document_embedding
         # Automatically generate JSON
         self.to_json()
 
-    def _parse_and_validate_definition(self, definition: str):
+    @staticmethod
+    def _parse_and_validate_definition(definition: str):
         """
         Parses and validates the definition JSON string.
 
@@ -43,16 +55,20 @@ class EmbeddingJSONTemplate:
 
     def _flatten_embedding(self, embedding: list):
         """
-        Flattens the embedding if it's a list of lists.
+        Flattens the embedding if it's a list of lists or a NumPy array.
+
+        Only the first item is inspected, so a flat vector is not scanned value by value.
 
         Args:
-            embedding (list): A list of embeddings.
+            embedding (list): A list of embeddings, or a NumPy vector or matrix.
 
         Returns:
             list: A flattened list of embeddings.
         """
-        if any(isinstance(i, list) for i in embedding):
-            return [item for sublist in embedding for item in sublist]
+        if hasattr(embedding, "ravel"):
+            return embedding.ravel().tolist()
+        if embedding and isinstance(embedding[0], list):
+            return list(itertools.chain.from_iterable(embedding))
         return embedding
 
     def to_json(self):
@@ -68,11 +84,14 @@ class EmbeddingJSONTemplate:
         """
         Saves the JSON template to a file.
 
+        The file is written under a temporary name and renamed into place, so a
+        reader never sees it half-written.
+
         Args:
             file_path (str): Path to save the JSON file.
         """
-        with open(file_path, 'w') as file:
+        with atomic_write(file_path) as file:
             json.dump(self.template, file, indent=4)
-        print(f"JSON saved to {file_path}")
+        logger.info("JSON saved to %s", file_path)
 
 
@@ -0,0 +1,171 @@
+import json
+import numpy as np
+from modules.template.binary_template import build_response
+from modules.template.json_template import EmbeddingJSONTemplate
+
+
+def _as_list(vector):
+    """Convert a NumPy vector to a list of Python floats, leaving lists untouched."""
+    if hasattr(vector, "tolist"):
+        return vector.tolist()
+    return vector
+
+
+class EmbeddingRecord:
+    def __init__(self, definition: str, embedding: list, chunks: list = None, chunk_embeddings: list = None,
+                 document_embedding: list = None, matrix=None, duplicate_of: str = None, similarity: float = None):
+        """
+        Holds the result of labeling and embedding a single document.
+
+        Args:
+            definition (str): The definition JSON string produced by the labeler.
+            embedding (list): The embedding vector for the definition. Records read
+                              from the vector store hold a read-only NumPy view instead.
+            chunks (list): Optional chunk dicts with start, end and tokens.
+            chunk_embeddings (list): One embedding per chunk, in the same order.
+            document_embedding (list): Optional embedding pooled from the chunk embeddings.
+            matrix (numpy.ndarray): Optional stored matrix the vectors above are views of,
+                                    in the layout returned by `to_matrix`.
+            duplicate_of (str): Cache key of the near-identical document whose result this record reuses.
+            similarity (float): Estimated Jaccard similarity to that document.
+        """
+        self.definition = definition
+        self.embedding = embedding
+        self.chunks = chunks
+        self.chunk_embeddings = chunk_embeddings
+        self.document_embedding = document_embedding
+        self.matrix = matrix
+        self.duplicate_of = duplicate_of
+        self.similarity = similarity
+
+    def to_dict(self):
+        """
+        Converts the record into a plain dictionary.
+
+        Returns:
+            dict: The record as a dictionary.
+        """
+        data = {"definition": self.definition, "embedding": self.embedding_list()}
+        if self.chunks is not None:
+            data["chunks"] = self.chunks
+            data["chunk_embeddings"] = [_as_list(vector) for vector in self.chunk_embeddings]
+        if self.document_embedding is not None:
+            data["document_embedding"] = _as_list(self.document_embedding)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Builds a record from a dictionary created by `to_dict`.
+
+        Args:
+            data (dict): A dictionary with definition and embedding keys.
+
+        Returns:
+            EmbeddingRecord: The restored record.
+        """
+        return cls(
+            data["definition"],
+            data["embedding"],
+            chunks=data.get("chunks"),
+            chunk_embeddings=data.get("chunk_embeddings"),
+            document_embedding=data.get("document_embedding"),
+        )
+
+    def embedding_list(self):
+        """
+        Returns the embedding as a list of Python floats.
+
+        Returns:
+            list: The embedding vector.
+        """
+        return _as_list(self.embedding)
+
+    def validate(self):
+        """
+        Checks that the definition parses and holds every required field.
+
+        Raises:
+            ValueError: If the definition is invalid.
+        """
+        EmbeddingJSONTemplate._parse_and_validate_definition(self.definition)
+
+    def to_matrix(self):
+        """
+        Stacks the vectors of the record into one float32 matrix.
+
+        Returns:
+            numpy.ndarray: The embedding, then one row per chunk, then the pooled document embedding.
+        """
+        if self.matrix is not None:
+            return self.matrix
+        rows = [np.asarray(self.embedding, dtype=np.float32)]
+        if self.chunks is not None:
+            rows.extend(np.asarray(vector, dtype=np.float32) for vector in self.chunk_embeddings)
+        if self.document_embedding is not None:
+            rows.append(np.asarray(self.document_embedding, dtype=np.float32))
+        return np.vstack(rows)
+
+    def to_response(self, encoding, stage="complete"):
+        """
+        Renders the record as a typed EmbeddingResponse with packed vectors.
+
+        Args:
+            encoding (int): FLOAT32, FLOAT16, INT8 or BINARY.
+            stage (str): "complete", or "embedding" / "definition" to send only that half.
+
+        Returns:
+            EmbeddingResponse: The response.
+        """
+        return build_response(
+            definition=self.definition if stage != "embedding" else None,
+            matrix=self.to_matrix() if stage != "definition" else None,
+            chunks=self.chunks if stage != "definition" else None,
+            pooled=self.document_embedding is not None,
+            encoding=encoding,
+            stage=stage,
+        )
+
+    def _chunk_dicts(self):
+        """Combine the chunk metadata with the chunk embeddings."""
+        if self.chunks is None:
+            return None
+        return [dict(chunk, embedding=_as_list(vector)) for chunk, vector in zip(self.chunks, self.chunk_embeddings)]
+
+    def embeddings_to_json(self):
+        """
+        Renders only the vectors, so they can be sent before the definition is ready.
+
+        Returns:
+            str: JSON-formatted string with the embeddings and, when chunked, the chunks.
+        """
+        data = {"embeddings": self.embedding_list()}
+        if self.chunks is not None:
+            data["chunks"] = self._chunk_dicts()
+        if self.document_embedding is not None:
+            data["document_embedding"] = _as_list(self.document_embedding)
+        return json.dumps(data, indent=4)
+
+    def definition_to_json(self):
+        """
+        Renders only the definition, so it can be sent separately from the vectors.
+
+        Returns:
+            str: JSON-formatted string with the validated definition.
+        """
+        return json.dumps(
+            {"definition": EmbeddingJSONTemplate._parse_and_validate_definition(self.definition)}, indent=4
+        )
+
+    def to_json(self):
+        """
+        Renders the record with the EmbeddingJSONTemplate.
+
+        Returns:
+            str: JSON-formatted string of the record.
+        """
+        chunks = self._chunk_dicts()
+        document_embedding = None
+        if self.document_embedding is not None:
+            document_embedding = _as_list(self.document_embedding)
+        return EmbeddingJSONTemplate(self.definition, self.embedding, chunks, document_embedding).to_json()
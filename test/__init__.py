@@ -0,0 +1,5 @@
+from modules.config import Config
+
+# Provider calls are mocked throughout, so the tests must not depend on a key in the environment
+if not Config.OPENAI_API_KEY:
+    Config.OPENAI_API_KEY = "test-key"
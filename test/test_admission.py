@@ -0,0 +1,262 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent import futures
+from unittest.mock import MagicMock
+import grpc
+import openai
+from modules.proto.embedding import embedding_buffer_pb2, embedding_buffer_pb2_grpc
+from modules.services import EmbeddingCache
+from modules.services.admission import (
+    AdmissionController, AsyncAdmissionController, Deadline, DeadlineExceeded, Overloaded, RequestCancelled,
+    use_deadline,
+)
+from modules.services.provider import CircuitBreaker, ProviderClient
+from modules.storage import VectorStore
+from main import EmbeddingService
+
+DEFINITION = json.dumps({
+    "collection_name": "test_collection",
+    "partition_name": "test_partition",
+    "description": "Test collection description",
+    "dimension": 3,
+    "metric_type": "L2"
+})
+
+
+class TestAdmissionController(unittest.TestCase):
+    def _wait_in_thread(self, controller, priority, order):
+        """Start a thread that records `priority` once admitted, or the error it was refused with."""
+        def run():
+            try:
+                with controller.admit(priority):
+                    order.append(priority)
+            except Exception as e:
+                order.append(type(e).__name__)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_queued_requests_are_admitted_by_priority(self):
+        """Test that a freed slot goes to the highest priority class first, then to the oldest request."""
+        controller = AdmissionController(max_active=1, max_queue=4, max_bytes=0)
+        order = []
+        with controller.admit():
+            threads = []
+            for priority in ("low", "normal", "high", "normal"):
+                threads.append(self._wait_in_thread(controller, priority, order))
+                while len(controller._queue) < len(threads):
+                    time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["high", "normal", "normal", "low"])
+        self.assertEqual((controller.active, controller.bytes), (0, 0))
+
+    def test_full_queue_sheds_the_lowest_priority(self):
+        """Test that a full queue sheds new requests, unless a lower class request can make room."""
+        controller = AdmissionController(max_active=1, max_queue=1, max_bytes=0)
+        order = []
+        with controller.admit():
+            low = self._wait_in_thread(controller, "low", order)
+            while len(controller._queue) < 1:
+                time.sleep(0.01)
+            with self.assertRaises(Overloaded):
+                with controller.admit("low"):
+                    pass
+            high = self._wait_in_thread(controller, "high", order)
+            low.join()
+            self.assertEqual(order, ["Overloaded"])
+        high.join()
+        self.assertEqual(order, ["Overloaded", "high"])
+        self.assertEqual(controller.shed, 2)
+
+    def test_bytes_are_bounded(self):
+        """Test that requests are shed while the bytes held would exceed the limit."""
+        controller = AdmissionController(max_active=4, max_queue=4, max_bytes=100)
+        with controller.admit(size=60) as ticket:
+            with self.assertRaises(Overloaded):
+                with controller.admit(size=50):
+                    pass
+            with self.assertRaises(Overloaded):
+                ticket.add_bytes(50)
+            with controller.admit(size=40):
+                self.assertEqual(controller.bytes, 100)
+        self.assertEqual(controller.bytes, 0)
+
+    def test_queued_request_gives_up_at_its_deadline(self):
+        """Test that a queued request fails when its deadline passes and leaves the queue."""
+        controller = AdmissionController(max_active=1, max_queue=2, max_bytes=0)
+        with controller.admit():
+            started = time.monotonic()
+            with self.assertRaises(DeadlineExceeded):
+                with controller.admit(deadline=Deadline(0.2)):
+                    pass
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(len(controller._queue), 0)
+
+            cancelled = Deadline()
+            cancelled.cancel()
+            with self.assertRaises(RequestCancelled):
+                with controller.admit(deadline=cancelled):
+                    pass
+        self.assertEqual(controller.active, 0)
+
+    def test_async_controller(self):
+        """Test that the async controller queues on the event loop and releases cancelled waiters."""
+        async def run():
+            controller = AsyncAdmissionController(max_active=1, max_queue=3, max_bytes=0)
+            order = []
+
+            async def request(priority):
+                async with controller.admit(priority):
+                    order.append(priority)
+
+            async with controller.admit():
+                tasks = [asyncio.create_task(request(priority)) for priority in ("low", "high")]
+                cancelled = asyncio.create_task(request("normal"))
+                await asyncio.sleep(0.01)
+                with self.assertRaises(Overloaded):
+                    async with controller.admit("low"):
+                        pass
+                cancelled.cancel()
+                await asyncio.sleep(0.01)
+                self.assertEqual(len(controller._queue), 2)
+            await asyncio.gather(*tasks)
+            self.assertEqual(order, ["high", "low"])
+            self.assertEqual(controller.active, 0)
+
+        asyncio.run(run())
+
+
+class TestDeadlineAwareProvider(unittest.TestCase):
+    def setUp(self):
+        self.client = ProviderClient(circuit_breaker=CircuitBreaker(failure_threshold=1), max_retries=3,
+                                     backoff_base=5, backoff_max=5)
+
+    def test_call_is_bounded_by_the_deadline(self):
+        """Test that provider calls time out at the request deadline and are not made once it passed."""
+        fn = MagicMock(return_value="ok")
+        with use_deadline(Deadline(10)):
+            self.assertEqual(self.client.call(fn, input="text"), "ok")
+        self.assertLessEqual(fn.call_args.kwargs["request_timeout"], 10)
+
+        with use_deadline(Deadline(0)):
+            with self.assertRaises(DeadlineExceeded):
+                self.client.call(fn, input="text")
+        self.assertEqual(fn.call_count, 1)
+
+    def test_retry_that_would_miss_the_deadline_is_not_made(self):
+        """Test that a backoff longer than the time left ends the call without tripping the breaker."""
+        error = openai.error.RateLimitError("Rate limit reached", http_status=429, headers={"retry-after": "5"})
+        fn = MagicMock(side_effect=error)
+        with use_deadline(Deadline(1)):
+            with self.assertRaises(DeadlineExceeded):
+                self.client.call(fn, input="text")
+        self.assertEqual(fn.call_count, 1)
+        self.assertEqual(self.client.circuit_breaker.state, "closed")
+
+    def test_cancelled_request_makes_no_call(self):
+        """Test that nothing is sent to the provider for a client that went away."""
+        fn = MagicMock(return_value="ok")
+        deadline = Deadline()
+        deadline.cancel()
+        with use_deadline(deadline):
+            with self.assertRaises(RequestCancelled):
+                self.client.call(fn, input="text")
+        fn.assert_not_called()
+
+
+class TestLoadShedding(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.release = threading.Event()
+        self.service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+        self.service.admission = AdmissionController(max_active=1, max_queue=1, max_bytes=0)
+        self.service.labeler.create_definition_from_text = MagicMock(side_effect=self._label)
+        self.service.embedder.get_embeddings = MagicMock(return_value=[[0.1, 0.2, 0.3]])
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
+        embedding_buffer_pb2_grpc.add_EmbeddingServiceServicer_to_server(self.service, self.server)
+        port = self.server.add_insecure_port("localhost:0")
+        self.server.start()
+        self.channel = grpc.insecure_channel(f"localhost:{port}")
+        self.stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(self.channel)
+
+    def tearDown(self):
+        self.release.set()
+        self.channel.close()
+        self.server.stop(None)
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    def _label(self, text):
+        self.release.wait(5)
+        return DEFINITION
+
+    def _embed(self, content, **kwargs):
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="story.txt", file_stream=content)
+        return list(self.stub.StreamEmbedding(request, **kwargs))
+
+    def test_overload_is_shed_with_resource_exhausted(self):
+        """Test that requests past the active and queued limits fail fast instead of waiting."""
+        pool = futures.ThreadPoolExecutor(max_workers=2)
+        busy = [pool.submit(self._embed, f"Story {i}".encode()) for i in range(2)]
+        while self.service.admission.active < 1 or len(self.service.admission._queue) < 1:
+            time.sleep(0.01)
+
+        started = time.monotonic()
+        with self.assertRaises(grpc.RpcError) as raised:
+            self._embed(b"One too many.")
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)
+        self.assertLess(time.monotonic() - started, 1)
+
+        self.release.set()
+        self.assertTrue(all(len(future.result()) == 1 for future in busy))
+        pool.shutdown()
+
+    def test_expired_request_does_not_call_the_provider(self):
+        """Test that a request whose deadline passes while it is queued is dropped before any provider call."""
+        pool = futures.ThreadPoolExecutor(max_workers=1)
+        busy = pool.submit(self._embed, b"Slow story.")
+        while self.service.admission.active < 1:
+            time.sleep(0.01)
+
+        with self.assertRaises(grpc.RpcError) as raised:
+            self._embed(b"Impatient story.", timeout=0.3)
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+        # The client gives up a moment before the server drops the request; free the slot only after that
+        while self.service.admission._queue:
+            time.sleep(0.01)
+        self.release.set()
+        busy.result()
+        pool.shutdown()
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 1)
+
+
+    def test_waiting_on_another_request_stops_at_the_deadline(self):
+        """Test that a request sharing the flight of a slow one gives up its slot when its deadline passes."""
+        self.service.admission = AdmissionController(max_active=2, max_queue=0, max_bytes=0)
+        pool = futures.ThreadPoolExecutor(max_workers=1)
+        leader = pool.submit(self._embed, b"Same story.")
+        while not self.service.flights.in_flight():
+            time.sleep(0.01)
+
+        with self.assertRaises(grpc.RpcError) as raised:
+            self._embed(b"Same story.", timeout=0.3)
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+        self.assertEqual(self.service.flights.coalesced, 1)
+        # The waiting request leaves while the leader is still labeling
+        give_up = time.monotonic() + 2
+        while self.service.admission.active > 1 and time.monotonic() < give_up:
+            time.sleep(0.01)
+        self.assertEqual(self.service.admission.active, 1)
+        self.release.set()
+        self.assertEqual(len(leader.result()), 1)
+        pool.shutdown()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+import grpc
+from modules.proto.embedding import embedding_buffer_pb2, embedding_buffer_pb2_grpc
+from modules.services import AsyncEmbeddingService, EmbeddingCache
+from modules.services.chunker import TextChunker
+from modules.services.sketch import MinHasher
+from modules.storage import VectorStore
+from modules.template import EmbeddingRecord
+
+DEFINITION = json.dumps({
+    "collection_name": "test_collection",
+    "partition_name": "test_partition",
+    "description": "Test collection description",
+    "dimension": 3,
+    "metric_type": "L2"
+})
+
+
+async def fake_chat_completion(**kwargs):
+    await asyncio.sleep(0.2)
+    return {"choices": [{"message": {"content": DEFINITION}}]}
+
+
+async def fake_embedding(model, input):
+    await asyncio.sleep(0.2)
+    return {"data": [{"index": i, "embedding": [0.1, 0.2, 0.3]} for i in range(len(input))]}
+
+
+@patch("openai.Embedding.acreate", side_effect=fake_embedding)
+@patch("openai.ChatCompletion.acreate", side_effect=fake_chat_completion)
+class TestAsyncEmbeddingService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.service = AsyncEmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+        self.server = grpc.aio.server()
+        embedding_buffer_pb2_grpc.add_EmbeddingServiceServicer_to_server(self.service, self.server)
+        port = self.server.add_insecure_port("localhost:0")
+        await self.server.start()
+        self.channel = grpc.aio.insecure_channel(f"localhost:{port}")
+        self.stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(self.channel)
+
+    async def asyncTearDown(self):
+        await self.channel.close()
+        await self.server.stop(None)
+        await self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    async def _embed(self, content):
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="story.txt", file_stream=content)
+        return [response async for response in self.stub.StreamEmbedding(request)]
+
+    async def test_stream_embedding(self, mock_chat, mock_embedding):
+        responses = await self._embed(b"Once upon a time.")
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(json.loads(responses[0].json_stream)["embeddings"], [0.1, 0.2, 0.3])
+
+        await self._embed(b"Once upon a time.")
+        self.assertEqual(mock_chat.call_count, 1)
+
+    async def test_requests_do_not_block_each_other(self, mock_chat, mock_embedding):
+        started = time.monotonic()
+        results = await asyncio.gather(*(self._embed(f"Story {i}".encode()) for i in range(50)))
+        elapsed = time.monotonic() - started
+
+        self.assertTrue(all(len(responses) == 1 for responses in results))
+        # Two sequential 0.2 s provider calls per request; serial handling would take 20 s.
+        self.assertLess(elapsed, 3)
+
+    async def test_identical_requests_are_coalesced(self, mock_chat, mock_embedding):
+        results = await asyncio.gather(*(self._embed(b"Same story.") for _ in range(10)))
+        self.assertTrue(all(len(responses) == 1 for responses in results))
+        self.assertEqual(len({responses[0].json_stream for responses in results}), 1)
+        self.assertEqual(mock_chat.call_count, 1)
+        self.assertEqual(mock_embedding.call_count, 1)
+        self.assertEqual(self.service.flights.coalesced, 9)
+
+    async def test_upload_embedding(self, mock_chat, mock_embedding):
+        chunks = [
+            embedding_buffer_pb2.Chunk(file_name="story.txt", data=b"Once upon "),
+            embedding_buffer_pb2.Chunk(data=b"a time."),
+        ]
+        responses = [response async for response in self.stub.UploadEmbedding(iter(chunks))]
+        self.assertEqual(len(responses), 1)
+
+    async def test_pipelined_stream_embedding(self, mock_chat, mock_embedding):
+        self.service.pipeline = True
+        started = time.monotonic()
+        responses = await self._embed(b"Once upon a time.")
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(sorted(response.stage for response in responses), ["definition", "embedding"])
+        # Labeling and embedding run side by side instead of one after the other.
+        self.assertLess(elapsed, 0.35)
+        mock_embedding.assert_called_once_with(model=self.service.embedder.embedding_model, input=["Once upon a time."])
+
+        cached = await self._embed(b"Once upon a time.")
+        self.assertEqual([response.stage for response in cached], ["complete"])
+
+    async def test_incremental_update(self, mock_chat, mock_embedding):
+        self.service.incremental = True
+        self.service.chunker = TextChunker(window=40, overlap=8, boundaries="content")
+        words = [f"word{i}" for i in range(600)]
+        edited = " ".join(words[:300] + ["inserted"] + words[300:])
+        await self._embed(" ".join(words).encode())
+        responses = await self._embed(edited.encode())
+
+        result = json.loads(responses[0].json_stream)
+        self.assertEqual(len(result["chunks"]), len(self.service.chunker.split(edited)))
+        self.assertEqual(mock_chat.call_count, 1)
+        self.assertLessEqual(len(mock_embedding.call_args.kwargs["input"]), 3)
+
+    async def test_pipelined_update_of_a_stale_record(self, mock_chat, mock_embedding):
+        self.service.pipeline = True
+        self.service.incremental = True
+        self.service.chunker = TextChunker(window=40, overlap=8, boundaries="content")
+        # A previous version stored without chunk vectors cannot be updated chunk by chunk
+        document = self.service._document_key("story.txt")
+        self.service.cache.put("stale", EmbeddingRecord(DEFINITION, [1.0, 0.0, 0.0]), document)
+        text = " ".join(f"word{i}" for i in range(200))
+        responses = await self._embed(text.encode())
+
+        self.assertEqual([response.stage for response in responses], ["complete"])
+        chunks = [chunk["text"] for chunk in self.service.chunker.split(text)]
+        mock_embedding.assert_called_once_with(model=self.service.embedder.embedding_model, input=chunks)
+        result = json.loads(responses[0].json_stream)
+        self.assertEqual(result["definition"], json.loads(DEFINITION))
+        self.assertEqual(len(result["chunks"]), len(chunks))
+
+    async def test_near_duplicate(self, mock_chat, mock_embedding):
+        self.service.hasher = MinHasher()
+        words = [f"word{i}" for i in range(200)]
+        first = await self._embed(" ".join(words).encode())
+        responses = await self._embed(("  ".join(words[:100] + ["changed"] + words[101:]) + "\n").encode())
+
+        self.assertTrue(responses[0].duplicate_of)
+        self.assertGreaterEqual(responses[0].similarity, self.service.near_duplicate_threshold)
+        self.assertEqual(responses[0].json_stream, first[0].json_stream)
+        self.assertEqual(mock_chat.call_count, 1)
+
+    async def test_search(self, mock_chat, mock_embedding):
+        await self._embed(b"Once upon a time.")
+        response = await self.stub.Search(embedding_buffer_pb2.SearchRequest(query_text="a time", top_k=3))
+        self.assertEqual(len(response.hits), 1)
+        self.assertEqual(response.hits[0].definition.collection_name, "test_collection")
+        self.assertAlmostEqual(response.hits[0].score, 1.0, places=6)
+
+    async def test_search_without_a_query_is_invalid(self, mock_chat, mock_embedding):
+        with self.assertRaises(grpc.aio.AioRpcError) as context:
+            await self.stub.Search(embedding_buffer_pb2.SearchRequest(top_k=3))
+        self.assertEqual(context.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+    async def test_error_is_reported(self, mock_chat, mock_embedding):
+        with self.assertRaises(grpc.aio.AioRpcError) as context:
+            await self._embed(b"")
+        self.assertEqual(context.exception.code(), grpc.StatusCode.INTERNAL)
+        self.assertIn("File stream is empty", context.exception.details())
+
+    async def test_embed_stream(self, mock_chat, mock_embedding):
+        requests = [
+            embedding_buffer_pb2.DocumentRequest(id=str(i), file_name=f"{i}.txt", file_stream=f"Story {i}".encode())
+            for i in range(20)
+        ]
+        requests.append(embedding_buffer_pb2.DocumentRequest(id="empty", file_name="empty.txt"))
+        started = time.monotonic()
+        responses = [response async for response in self.stub.EmbedStream(iter(requests))]
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(sorted(response.id for response in responses), sorted(r.id for r in requests))
+        self.assertTrue(all(response.last for response in responses))
+        failed = [response for response in responses if response.error]
+        self.assertEqual([response.id for response in failed], ["empty"])
+        self.assertIn("File stream is empty", failed[0].error)
+        # Documents are processed side by side, 16 at a time by default, not one after the other.
+        self.assertLess(elapsed, 2)
+
+    async def test_embed_stream_limits_documents_in_flight(self, mock_chat, mock_embedding):
+        in_flight, peak = 0, 0
+
+        async def tracked_chat_completion(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+            return {"choices": [{"message": {"content": DEFINITION}}]}
+
+        mock_chat.side_effect = tracked_chat_completion
+        requests = [
+            embedding_buffer_pb2.DocumentRequest(id=str(i), file_name=f"{i}.txt", file_stream=f"Story {i}".encode())
+            for i in range(12)
+        ]
+        with patch("modules.config.Config.STREAM_MAX_IN_FLIGHT", 3):
+            responses = [response async for response in self.stub.EmbedStream(iter(requests))]
+        self.assertEqual(len(responses), 12)
+        self.assertLessEqual(peak, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
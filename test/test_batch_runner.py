@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from modules.services import EmbeddingCache, EmbeddingGenerator, Labeler
+from modules.services.batch_runner import (
+    CHAT_ENDPOINT, EMBEDDINGS_ENDPOINT, BatchRunner, Checkpoint, LocalBatchBackend, iter_directory, iter_manifest,
+)
+from modules.services.embedding_service import EmbeddingService
+from modules.services.local_embedder import HashingEmbeddingGenerator
+from modules.services.local_labeler import LocalLabeler
+from modules.storage import VectorStore
+
+DEFINITION = json.dumps({
+    "collection_name": "test_collection",
+    "partition_name": "test_partition",
+    "description": "Test collection description",
+    "dimension": 3,
+    "metric_type": "L2"
+})
+
+
+class TestBatchSources(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, "b"))
+        for name in ("a.txt", "b/c.txt", "skip.md"):
+            with open(os.path.join(self.directory, name), "w") as file:
+                file.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_iter_directory(self):
+        """Test that matching files are listed recursively in a stable order."""
+        items = list(iter_directory(self.directory))
+        self.assertEqual([item.item_id for item in items], ["a.txt", os.path.join("b", "c.txt")])
+        self.assertEqual(items[1].load(), b"b/c.txt")
+
+    def test_iter_manifest(self):
+        """Test that manifest lines can point to files or carry the text inline."""
+        manifest = os.path.join(self.directory, "manifest.jsonl")
+        with open(manifest, "w") as file:
+            file.write(json.dumps({"request_id": "r1", "file": "a.txt"}) + "\n\n")
+            file.write(json.dumps({"request_id": "r2", "body": "Inline text."}) + "\n")
+        items = list(iter_manifest(manifest, id_field="request_id", text_field="body", path_field="file"))
+        self.assertEqual([item.item_id for item in items], ["r1", "r2"])
+        self.assertEqual([item.load() for item in items], [b"a.txt", b"Inline text."])
+
+    def test_checkpoint_ignores_torn_line(self):
+        """Test that a partly written last line does not stop a resume."""
+        path = os.path.join(self.directory, "checkpoint.jsonl")
+        Checkpoint(path).record("a", "ok")
+        with open(path, "a") as file:
+            file.write('{"id": "b", "sta')
+        checkpoint = Checkpoint(path)
+        self.assertTrue(checkpoint.is_done("a"))
+        self.assertFalse(checkpoint.is_done("b"))
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.directory, "docs")
+        os.makedirs(self.source_dir)
+        for i in range(10):
+            with open(os.path.join(self.source_dir, f"doc{i}.txt"), "w") as file:
+                file.write(f"Story number {i} about a lighthouse keeper.")
+        with open(os.path.join(self.source_dir, "broken.txt"), "wb") as file:
+            file.write(b"\xff\xfe")
+        self.store = VectorStore(os.path.join(self.directory, "store"))
+        self.job_dir = os.path.join(self.directory, "job")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _local_service(self):
+        embedder = HashingEmbeddingGenerator(dimension=16, idf_path="")
+        return EmbeddingService(
+            cache=EmbeddingCache(store=self.store), labeler=LocalLabeler(dimension=16), embedder=embedder
+        )
+
+    def test_pool_run_and_resume(self):
+        """Test that a run embeds every document, records failures and that a rerun only retries failures."""
+        output_dir = os.path.join(self.directory, "out")
+        report = BatchRunner(self._local_service(), self.job_dir, workers=3, output_dir=output_dir).run(
+            iter_directory(self.source_dir)
+        ).to_dict()
+        self.assertEqual((report["total"], report["succeeded"], report["failed"]), (11, 10, 1))
+        self.assertEqual(report["failures"][0]["id"], "broken.txt")
+        self.assertEqual(len(os.listdir(output_dir)), 10)
+        self.assertEqual(len(self.store), 10)
+        with open(os.path.join(self.job_dir, "report.json")) as file:
+            self.assertEqual(json.load(file)["succeeded"], 10)
+
+        service = self._local_service()
+        service.embedder.get_embeddings = MagicMock()
+        report = BatchRunner(service, self.job_dir, workers=3).run(iter_directory(self.source_dir)).to_dict()
+        self.assertEqual((report["skipped"], report["failed"]), (10, 1))
+        service.embedder.get_embeddings.assert_not_called()
+
+    def test_new_job_reuses_the_cache(self):
+        """Test that a different job over the same documents is served from the cache."""
+        BatchRunner(self._local_service(), self.job_dir).run(iter_directory(self.source_dir))
+        report = BatchRunner(self._local_service(), os.path.join(self.directory, "job2")).run(
+            iter_directory(self.source_dir)
+        ).to_dict()
+        self.assertEqual(report["cached"], 10)
+
+    def test_batch_backend(self):
+        """Test that labels and embeddings go through the backend in one batch each, at batch prices."""
+        calls = []
+
+        def chat(body):
+            calls.append(CHAT_ENDPOINT)
+            return {"choices": [{"message": {"content": DEFINITION}}]}
+
+        def embeddings(body):
+            calls.append(EMBEDDINGS_ENDPOINT)
+            return {"data": [{"index": i, "embedding": [0.1, 0.2, 0.3]} for i in range(len(body["input"]))]}
+
+        backend = LocalBatchBackend({CHAT_ENDPOINT: chat, EMBEDDINGS_ENDPOINT: embeddings})
+        backend.run = MagicMock(side_effect=backend.run)
+        service = EmbeddingService(cache=EmbeddingCache(store=self.store), labeler=Labeler(), embedder=EmbeddingGenerator())
+        report = BatchRunner(service, self.job_dir, backend=backend, window=4).run(
+            iter_directory(self.source_dir)
+        ).to_dict()
+
+        self.assertEqual((report["succeeded"], report["failed"]), (10, 1))
+        # Three windows of up to four documents, one label and one embedding batch each
+        self.assertEqual(backend.run.call_count, 6)
+        self.assertEqual(calls.count(CHAT_ENDPOINT), 10)
+        self.assertGreater(report["label_tokens"], 0)
+        self.assertGreater(report["embedding_tokens"], 0)
+        self.assertGreater(report["estimated_cost"], 0)
+        self.assertEqual(len(self.store), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
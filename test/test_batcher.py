@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import unittest
+from concurrent import futures
+from unittest.mock import MagicMock
+from modules.services.batcher import AsyncEmbeddingBatcher, EmbeddingBatcher
+
+
+class FakeEmbedder:
+    embedding_model = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_embeddings(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class FakeAsyncEmbedder(FakeEmbedder):
+    async def get_embeddings(self, texts):
+        return FakeEmbedder.get_embeddings(self, texts)
+
+
+class TestEmbeddingBatcher(unittest.TestCase):
+    def test_concurrent_requests_share_a_batch(self):
+        """Test that texts from concurrent callers are sent together and routed back."""
+        embedder = FakeEmbedder()
+        batcher = EmbeddingBatcher(embedder, max_batch_size=100, max_wait_ms=200)
+        try:
+            with futures.ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda i: batcher.get_embeddings(["x" * i, "y" * (i + 1)]), range(8)))
+        finally:
+            batcher.close()
+
+        for i, result in enumerate(results):
+            self.assertEqual(result, [[float(i)], [float(i + 1)]])
+        self.assertLess(len(embedder.calls), 8)
+        self.assertEqual(batcher.stats.snapshot()["items"], 16)
+
+    def test_full_batch_is_sent_without_waiting(self):
+        """Test that a batch is dispatched as soon as it is full."""
+        embedder = FakeEmbedder()
+        batcher = EmbeddingBatcher(embedder, max_batch_size=2, max_wait_ms=60_000)
+        try:
+            self.assertEqual(batcher.get_embeddings(["a", "bb"]), [[1.0], [2.0]])
+        finally:
+            batcher.close()
+        stats = batcher.stats.snapshot()
+        self.assertEqual(stats["full_batches"], 1)
+        self.assertEqual(stats["fill_ratio"], 1.0)
+
+    def test_errors_reach_every_caller(self):
+        """Test that a failed batch fails every request in it."""
+        embedder = MagicMock(embedding_model="fake-model")
+        embedder.get_embeddings.side_effect = Exception("API connection failed")
+        batcher = EmbeddingBatcher(embedder, max_batch_size=10, max_wait_ms=1)
+        try:
+            with self.assertRaises(Exception) as context:
+                batcher.get_embedding("a")
+        finally:
+            batcher.close()
+        self.assertIn("API connection failed", str(context.exception))
+
+
+class TestAsyncEmbeddingBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_share_a_batch(self):
+        """Test that texts from concurrent coroutines are sent together and routed back."""
+        embedder = FakeAsyncEmbedder()
+        batcher = AsyncEmbeddingBatcher(embedder, max_batch_size=100, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.get_embeddings(["x" * i]) for i in range(20)))
+        await batcher.close()
+
+        self.assertEqual(results, [[[float(i)]] for i in range(20)])
+        self.assertEqual(len(embedder.calls), 1)
+        self.assertEqual(batcher.stats.snapshot()["requests"], 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
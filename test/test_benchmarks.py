@@ -0,0 +1,106 @@
+import json
+import random
+import unittest
+import openai
+from benchmarks.fake_provider import FakeProvider
+from benchmarks.load import build_workload, make_document, percentiles, run_benchmark
+from benchmarks.micro import compare, measure
+from modules.services.embedder import EmbeddingGenerator
+from modules.services.labeler import Labeler
+from modules.services.provider import ProviderClient
+
+
+class TestFakeProvider(unittest.TestCase):
+    def setUp(self):
+        self.provider = FakeProvider(dimension=8).start()
+        self.configured = self.provider.configured()
+        self.configured.__enter__()
+
+    def tearDown(self):
+        self.configured.__exit__(None, None, None)
+        self.provider.stop()
+
+    def test_embeddings_are_deterministic(self):
+        """Test that the embedding endpoint returns one stable unit vector per input."""
+        embedder = EmbeddingGenerator(provider=ProviderClient(max_retries=0))
+        first = embedder.get_embeddings(["alpha", "beta"])
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(first[0]), 8)
+        self.assertAlmostEqual(sum(x * x for x in first[0]), 1.0, places=5)
+        self.assertEqual(embedder.get_embeddings(["alpha"])[0], first[0])
+        self.assertEqual(self.provider.stats()["inputs"], 3)
+
+    def test_chat_returns_definition(self):
+        """Test that the chat endpoint answers with a definition the labeler accepts."""
+        definition = json.loads(Labeler(provider=ProviderClient(max_retries=0)).create_definition_from_text("Hi."))
+        self.assertEqual(definition["collection_name"], "BenchmarkCollection")
+        self.assertEqual(definition["dimension"], 8)
+
+    def test_error_injection(self):
+        """Test that injected failures surface as provider errors with the configured status."""
+        self.provider.error_rate = 1.0
+        self.provider.error_status = 429
+        embedder = EmbeddingGenerator(provider=ProviderClient(max_retries=0))
+        with self.assertRaises(openai.error.RateLimitError):
+            embedder.get_embeddings(["alpha"])
+        self.assertEqual(self.provider.stats()["errors"], 1)
+
+
+class TestLoadHelpers(unittest.TestCase):
+    def test_documents_are_distinct(self):
+        """Test that documents of the same size differ by index."""
+        rng = random.Random(0)
+        self.assertNotEqual(make_document(1, 50, rng), make_document(2, 50, rng))
+        self.assertGreaterEqual(len(make_document(3, 50, rng).split()), 50)
+
+    def test_workload_hit_ratio(self):
+        """Test that roughly `hit_ratio` of the timed documents repeat a warm-up document."""
+        hot, timed = build_workload(1000, 10, 0.3, hot_documents=4)
+        hits = sum(document in hot for document in timed)
+        self.assertEqual(len(hot), 4)
+        self.assertTrue(250 <= hits <= 350, hits)
+
+    def test_workload_without_hits(self):
+        """Test that a zero hit ratio skips the warm-up and never repeats a document."""
+        hot, timed = build_workload(50, 10, 0.0)
+        self.assertEqual(hot, [])
+        self.assertEqual(len(set(timed)), 50)
+
+    def test_percentiles(self):
+        """Test that latencies are summarized in milliseconds."""
+        summary = percentiles([i / 1000 for i in range(1, 101)])
+        self.assertAlmostEqual(summary["p50"], 50.5)
+        self.assertAlmostEqual(summary["max"], 100.0)
+        self.assertEqual(percentiles([]), {})
+
+
+class TestMicroHelpers(unittest.TestCase):
+    def test_measure(self):
+        """Test that a timing reports consistent per-call and per-second figures."""
+        timing = measure(lambda: sum(range(1000)), repeat=2, min_time=0.01)
+        self.assertGreater(timing["us_per_op"], 0)
+        self.assertAlmostEqual(timing["ops_per_sec"] * timing["us_per_op"] / 1e6, 1.0, places=2)
+
+    def test_compare_flags_slowdowns_past_tolerance(self):
+        """Test that only cases slower than the baseline by more than the tolerance are reported."""
+        baseline = {"fast": {"us_per_op": 10.0}, "slow": {"us_per_op": 10.0}}
+        results = {"fast": {"us_per_op": 11.0}, "slow": {"us_per_op": 13.0}, "new": {"us_per_op": 1.0}}
+        self.assertEqual(compare(results, baseline, 0.25), [("slow", 10.0, 13.0)])
+
+
+class TestLoadBenchmark(unittest.TestCase):
+    def test_end_to_end(self):
+        """Test a small run of the gRPC server against the fake provider."""
+        report = run_benchmark(requests=6, concurrency=2, doc_words=20, hit_ratio=0.5, hot_documents=2,
+                               dimension=8, server_env={"LOG_LEVEL": "ERROR"})
+        self.assertEqual(report["succeeded"], 6)
+        self.assertEqual(report["errors"], {})
+        self.assertIn("p99", report["latency_ms"])
+        self.assertGreater(report["throughput_rps"], 0)
+        # Cache hits never reach the provider: one label and one embedding call per distinct document
+        distinct = report["provider"]["inputs"]
+        self.assertEqual(report["provider"]["requests"], 2 * distinct)
+
+
+if __name__ == '__main__':
+    unittest.main()
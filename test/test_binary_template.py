@@ -0,0 +1,90 @@
+import json
+import unittest
+import numpy as np
+from modules.proto.embedding.embedding_buffer_pb2 import BINARY, FLOAT16, FLOAT32, INT8, EmbeddingResponse
+from modules.template import EmbeddingRecord
+from modules.template.binary_template import decode_definition, decode_vectors, encode_definition, encode_vectors
+
+DEFINITION = json.dumps({
+    "collection_name": "test_collection",
+    "partition_name": "test_partition",
+    "description": "Test collection description",
+    "dimension": 3,
+    "metric_type": "L2"
+})
+
+
+class TestBinaryTemplate(unittest.TestCase):
+    def setUp(self):
+        self.matrix = np.random.default_rng(0).standard_normal((4, 64)).astype(np.float32)
+
+    def test_float32_round_trip(self):
+        """Test that float32 vectors are packed without loss."""
+        message = encode_vectors(self.matrix, FLOAT32)
+        self.assertEqual(len(message.data), self.matrix.nbytes)
+        np.testing.assert_array_equal(decode_vectors(message), self.matrix)
+
+    def test_float16_round_trip(self):
+        """Test that float16 vectors take half the space and stay close."""
+        message = encode_vectors(self.matrix, FLOAT16)
+        self.assertEqual(len(message.data), self.matrix.nbytes // 2)
+        np.testing.assert_allclose(decode_vectors(message), self.matrix, rtol=1e-3, atol=1e-3)
+
+    def test_int8_round_trip(self):
+        """Test that int8 vectors are within half a quantization step of the original."""
+        self.matrix[2] = 0.0
+        message = encode_vectors(self.matrix, INT8)
+        self.assertEqual(len(message.data), self.matrix.size)
+        self.assertEqual(len(message.scales), 4)
+        decoded = decode_vectors(message)
+        steps = np.abs(self.matrix).max(axis=1, keepdims=True) / 127
+        self.assertTrue(np.all(np.abs(decoded - self.matrix) <= steps / 2 + 1e-6))
+        np.testing.assert_array_equal(decoded[2], 0.0)
+
+    def test_binary_round_trip(self):
+        """Test that binary vectors take one bit per value and keep the signs and mean magnitude."""
+        matrix = self.matrix[:, :61]
+        message = encode_vectors(matrix, BINARY)
+        self.assertEqual(len(message.data), 4 * 8)
+        decoded = decode_vectors(message)
+        self.assertEqual(decoded.shape, matrix.shape)
+        np.testing.assert_array_equal(np.sign(decoded), np.where(matrix > 0, 1.0, -1.0))
+        np.testing.assert_allclose(np.abs(decoded).mean(axis=1), np.abs(matrix).mean(axis=1), rtol=1e-6)
+
+    def test_single_vector(self):
+        """Test that a single vector is packed as one row."""
+        message = encode_vectors([0.1, 0.2, 0.3])
+        self.assertEqual((message.rows, message.dim), (1, 3))
+
+    def test_definition_round_trip(self):
+        """Test that the structured definition holds the same fields as the JSON one."""
+        message = encode_definition(DEFINITION)
+        self.assertEqual(message.dimension, 3)
+        self.assertEqual(json.loads(decode_definition(message)), json.loads(DEFINITION))
+
+    def test_definition_with_unparseable_dimension(self):
+        """Test that a dimension the model wrote in words becomes 0."""
+        definition = dict(json.loads(DEFINITION), dimension="unknown")
+        self.assertEqual(encode_definition(json.dumps(definition)).dimension, 0)
+
+    def test_response_is_smaller_than_json(self):
+        """Test that a packed response is several times smaller than the JSON stream."""
+        vector = np.random.default_rng(1).standard_normal(1536).astype(np.float32).tolist()
+        record = EmbeddingRecord(DEFINITION, vector)
+        json_size = EmbeddingResponse(json_stream=record.to_json()).ByteSize()
+        self.assertGreater(json_size / record.to_response(FLOAT32).ByteSize(), 3)
+        self.assertGreater(json_size / record.to_response(INT8).ByteSize(), 10)
+
+    def test_stage_responses(self):
+        """Test that the pipeline stages carry only their half of the record."""
+        record = EmbeddingRecord(DEFINITION, [0.1, 0.2, 0.3])
+        embedding = record.to_response(FLOAT32, "embedding")
+        self.assertFalse(embedding.HasField("definition"))
+        self.assertTrue(embedding.HasField("vectors"))
+        definition = record.to_response(FLOAT32, "definition")
+        self.assertTrue(definition.HasField("definition"))
+        self.assertFalse(definition.HasField("vectors"))
+
+
+if __name__ == '__main__':
+    unittest.main()
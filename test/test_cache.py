@@ -0,0 +1,141 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from modules.services.cache import EmbeddingCache
+from modules.storage import VectorStore
+from modules.template import EmbeddingRecord
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        """Create a cache backed by a temporary directory."""
+        self.store_dir = tempfile.mkdtemp()
+        self.cache = EmbeddingCache(store=VectorStore(self.store_dir), max_memory_items=2)
+        self.record = EmbeddingRecord('{"collection_name": "test"}', [0.1, 0.2, 0.3])
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_make_key_depends_on_content_and_models(self):
+        """Test that keys change with content and models but not with anything else."""
+        key = EmbeddingCache.make_key(b"hello", "gpt-3.5-turbo", "text-embedding-3-small")
+        self.assertEqual(key, EmbeddingCache.make_key(b"hello", "gpt-3.5-turbo", "text-embedding-3-small"))
+        self.assertNotEqual(key, EmbeddingCache.make_key(b"hello!", "gpt-3.5-turbo", "text-embedding-3-small"))
+        self.assertNotEqual(key, EmbeddingCache.make_key(b"hello", "gpt-4", "text-embedding-3-small"))
+        self.assertNotEqual(key, EmbeddingCache.make_key(b"hello", "gpt-3.5-turbo", "text-embedding-ada-002"))
+
+    def test_get_miss_and_hit(self):
+        """Test hit and miss counters for both tiers."""
+        self.assertIsNone(self.cache.get("missing"))
+        self.cache.put("key", self.record)
+        self.assertEqual(self.cache.get("key").embedding_list(), [0.1, 0.2, 0.3])
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["memory_hits"], 1)
+
+    def test_disk_tier_survives_restart(self):
+        """Test that a new cache instance serves records written by a previous one."""
+        self.cache.put("key", self.record)
+        reopened = EmbeddingCache(store=VectorStore(self.store_dir), max_memory_items=2)
+        record = reopened.get("key")
+        self.assertEqual(record.definition, self.record.definition)
+        self.assertEqual(len(record.embedding), 3)
+        self.assertEqual(reopened.stats()["disk_hits"], 1)
+
+    def test_memory_tier_is_lru(self):
+        """Test that the memory tier keeps only the most recently used records."""
+        for key in ("a", "b", "c"):
+            self.cache.put(key, self.record)
+        self.assertEqual(self.cache.stats()["memory_items"], 2)
+        self.cache.get("a")
+        self.assertEqual(self.cache.stats()["disk_hits"], 1)
+
+    def test_disk_tier_is_size_bounded(self):
+        """Test that the oldest entries are evicted once the disk budget is exceeded."""
+        cache = EmbeddingCache(store=VectorStore(self.store_dir, max_shard_bytes=12, max_bytes=24), max_memory_items=0)
+        for key in ("a", "b", "c"):
+            cache.put(key, self.record)
+        stats = cache.stats()
+        self.assertLessEqual(stats["disk_bytes"], 24)
+        self.assertGreater(stats["evictions"], 0)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_hot_entries_survive_eviction(self):
+        """Test that reading an entry from the oldest shard keeps it alive."""
+        cache = EmbeddingCache(store=VectorStore(self.store_dir, max_shard_bytes=12, max_bytes=24), max_memory_items=0)
+        cache.put("a", self.record)
+        cache.put("b", self.record)
+        cache.get("a")
+        cache.put("c", self.record)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_search_indexes_existing_and_new_records(self):
+        """Test that search covers records already on disk and records put afterwards."""
+        self.cache.put("x", EmbeddingRecord(self.record.definition, [1.0, 0.0, 0.0]))
+        reopened = EmbeddingCache(store=VectorStore(self.store_dir), max_memory_items=2)
+        self.assertEqual(reopened.search([1.0, 0.1, 0.0], k=1)[0][0], "x")
+        reopened.put("y", EmbeddingRecord(self.record.definition, [0.0, 1.0, 0.0]))
+        key, score, definition = reopened.search([0.0, 1.0, 0.1], k=1)[0]
+        self.assertEqual(key, "y")
+        self.assertEqual(definition, self.record.definition)
+
+    def test_search_sees_records_of_other_processes(self):
+        """Test that an index already built picks up records another server process wrote to the shared store."""
+        self.cache.put("x", EmbeddingRecord(self.record.definition, [1.0, 0.0, 0.0]))
+        self.cache.search([1.0, 0.0, 0.0])
+        other = EmbeddingCache(store=VectorStore(self.store_dir), max_memory_items=2)
+        other.put("y", EmbeddingRecord(self.record.definition, [0.0, 1.0, 0.0]))
+        self.assertEqual(self.cache.search([0.0, 1.0, 0.1], k=1)[0][0], "y")
+
+    def test_search_uses_pooled_embedding(self):
+        """Test that chunked records are found by their pooled document embedding."""
+        record = EmbeddingRecord(
+            self.record.definition, [1.0, 0.0, 0.0], chunks=[{"start": 0, "end": 1, "tokens": 1}],
+            chunk_embeddings=[[0.0, 1.0, 0.0]], document_embedding=[0.0, 0.0, 1.0],
+        )
+        self.cache.put("chunked", record)
+        self.assertAlmostEqual(self.cache.search([0.0, 0.0, 1.0], k=1)[0][1], 1.0, places=6)
+
+    def test_search_skips_evicted_records(self):
+        """Test that records evicted from the disk tier are no longer returned."""
+        cache = EmbeddingCache(store=VectorStore(self.store_dir, max_shard_bytes=12, max_bytes=24), max_memory_items=0)
+        cache.put("a", EmbeddingRecord(self.record.definition, [1.0, 0.0, 0.0]))
+        cache.search([1.0, 0.0, 0.0])
+        cache.put("b", self.record)
+        cache.put("c", self.record)
+        self.assertEqual(sorted(key for key, _, _ in cache.search([1.0, 0.0, 0.0])), ["b", "c"])
+
+
+    def test_latest_record_of_a_document(self):
+        """Test that the latest version of a document is found across processes without counting a lookup."""
+        self.assertIsNone(self.cache.latest("doc"))
+        self.cache.put("v1", EmbeddingRecord(self.record.definition, [1.0, 0.0, 0.0]), document="doc")
+        self.cache.put("other", self.record, document="other-doc")
+        self.assertEqual(self.cache.latest("doc").embedding_list(), [1.0, 0.0, 0.0])
+
+        other = EmbeddingCache(store=VectorStore(self.store_dir), max_memory_items=2)
+        self.assertEqual(other.latest("doc").embedding_list(), [1.0, 0.0, 0.0])
+        other.put("v2", EmbeddingRecord(self.record.definition, [0.0, 1.0, 0.0]), document="doc")
+        self.assertEqual(self.cache.latest("doc").embedding_list(), [0.0, 1.0, 0.0])
+        self.assertEqual(self.cache.stats()["hits"] + self.cache.stats()["misses"], 0)
+
+
+    def test_latest_scans_the_store_only_when_it_changed(self):
+        """Test that looking up a document reads the stored entries again only after another process wrote."""
+        self.cache.put("v1", EmbeddingRecord(self.record.definition, [1.0, 0.0, 0.0]), document="doc")
+        other = EmbeddingCache(store=VectorStore(self.store_dir), max_memory_items=2)
+        with patch.object(other, "_scan_documents", wraps=other._scan_documents) as scan:
+            other.latest("doc")
+            other.latest("doc")
+            self.assertEqual(scan.call_count, 1)
+            self.cache.put("v2", EmbeddingRecord(self.record.definition, [0.0, 1.0, 0.0]), document="doc")
+            self.assertEqual(other.latest("doc").embedding_list(), [0.0, 1.0, 0.0])
+            self.assertEqual(scan.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
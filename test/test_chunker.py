@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+from modules.services.chunker import TextChunker, Tokenizer, pool_embeddings
+
+
+class TestTextChunker(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = Tokenizer()
+        self.text = " ".join(f"word{i}." for i in range(50))
+
+    def test_chunks_respect_window(self):
+        """Test that every chunk fits in the window and the chunks cover the whole text."""
+        chunks = TextChunker(window=16, overlap=4, tokenizer=self.tokenizer).split(self.text)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(chunk["tokens"], 16)
+            self.assertLessEqual(self.tokenizer.count(chunk["text"]), 16)
+            self.assertEqual(self.text[chunk["start"]:chunk["end"]], chunk["text"])
+        self.assertEqual(chunks[0]["start"], 0)
+        self.assertEqual(chunks[-1]["end"], len(self.text))
+
+    def test_chunks_overlap(self):
+        """Test that consecutive chunks share the configured overlap."""
+        chunks = TextChunker(window=16, overlap=4, tokenizer=self.tokenizer).split(self.text)
+        for previous, current in zip(chunks, chunks[1:]):
+            self.assertLess(current["start"], previous["end"])
+
+    def test_short_text_is_one_chunk(self):
+        """Test that text shorter than the window is returned as a single chunk."""
+        chunks = TextChunker(window=512, overlap=64, tokenizer=self.tokenizer).split("A short story.")
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0]["text"], "A short story.")
+
+    def test_invalid_overlap(self):
+        """Test that an overlap as large as the window is rejected."""
+        with self.assertRaises(ValueError):
+            TextChunker(window=8, overlap=8)
+
+    def test_chunks_carry_text_hashes(self):
+        """Test that equal chunk texts get equal hashes and different texts different ones."""
+        chunks = TextChunker(window=16, overlap=4, tokenizer=self.tokenizer).split(self.text)
+        again = TextChunker(window=16, overlap=4, tokenizer=self.tokenizer).split(self.text)
+        self.assertEqual([chunk["hash"] for chunk in chunks], [chunk["hash"] for chunk in again])
+        self.assertEqual(len({chunk["hash"] for chunk in chunks}), len(chunks))
+
+    def test_content_boundaries_survive_an_insertion(self):
+        """Test that content-defined boundaries change only the chunks around an edit."""
+        words = [f"word{i}" for i in range(600)]
+        text = " ".join(words)
+        edited = " ".join(words[:300] + ["inserted"] + words[300:])
+
+        changed = {}
+        for boundaries in ("fixed", "content"):
+            chunker = TextChunker(window=40, overlap=8, tokenizer=self.tokenizer, boundaries=boundaries)
+            chunks = chunker.split(text)
+            for chunk in chunks:
+                self.assertLessEqual(chunk["tokens"], 40)
+                self.assertEqual(text[chunk["start"]:chunk["end"]], chunk["text"])
+            self.assertEqual(chunks[-1]["end"], len(text))
+            hashes = {chunk["hash"] for chunk in chunks}
+            changed[boundaries] = sum(chunk["hash"] not in hashes for chunk in chunker.split(edited))
+
+        self.assertLessEqual(changed["content"], 3)
+        self.assertGreater(changed["fixed"], changed["content"])
+        self.assertNotEqual(TextChunker(window=40, overlap=8, boundaries="content").signature,
+                            TextChunker(window=40, overlap=8, boundaries="fixed").signature)
+
+    def test_pool_embeddings(self):
+        """Test that pooling returns a weighted, L2-normalized mean."""
+        pooled = pool_embeddings([[1.0, 0.0], [0.0, 1.0]], weights=[3, 1])
+        self.assertAlmostEqual(float(np.linalg.norm(pooled)), 1.0, places=6)
+        self.assertGreater(pooled[0], pooled[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -52,6 +52,31 @@ class TestEmbeddingGenerator(unittest.TestCase):
         # Validate the exception message
         self.assertIn("API connection failed", str(context.exception))
 
+    @patch("openai.Embedding.create")
+    def test_get_embeddings_batches_inputs(self, mock_openai_create):
+        """Test that many inputs are packed into as few requests as the limits allow."""
+        generator = EmbeddingGenerator(embedding_model="text-embedding-ada-002", batch_size=2)
+        mock_openai_create.side_effect = lambda model, input: {
+            "data": [{"index": i, "embedding": [float(len(text))]} for i, text in reversed(list(enumerate(input)))]
+        }
+
+        result = generator.get_embeddings(["a", "bb", "ccc", "dddd", "eeeee"])
+
+        self.assertEqual(mock_openai_create.call_count, 3)
+        self.assertEqual(result, [[1.0], [2.0], [3.0], [4.0], [5.0]])
+
+    @patch("openai.Embedding.create")
+    def test_get_embeddings_respects_token_limit(self, mock_openai_create):
+        """Test that a batch is closed before it exceeds the token limit."""
+        generator = EmbeddingGenerator(embedding_model="text-embedding-ada-002", batch_tokens=5)
+        mock_openai_create.side_effect = lambda model, input: {
+            "data": [{"index": i, "embedding": [0.0]} for i in range(len(input))]
+        }
+
+        generator.get_embeddings(["one two three", "four five six", "seven"])
+
+        self.assertEqual([len(call.kwargs["input"]) for call in mock_openai_create.call_args_list], [1, 2])
+
     def test_get_embedding_invalid_text(self):
         """Test handling of invalid text input."""
         invalid_text = None  # Example of invalid input
@@ -1,74 +1,105 @@
+from modules.config import Config
+from modules.services.extractive import term_matrix
 from modules.services.labeler import Labeler
+from modules.services.metrics import LABEL_TOKENS
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
+DEFINITION = (
+    "{\n"
+    "  \"collection_name\": \"SampleCollection\",\n"
+    "  \"partition_name\": \"SamplePartition\",\n"
+    "  \"description\": \"A test collection of sample data.\",\n"
+    "  \"dimension\": 128,\n"
+    "  \"metric_type\": \"cosine\"\n"
+    "}"
+)
 
 
 class TestLabeler(unittest.TestCase):
     def setUp(self):
         """Set up a Labeler instance before each test."""
         self.labeler = Labeler(label_model="gpt-4")
-        self.test_file_path = "test_file.txt"
 
-        # Sample text content for mocking file reads
+        # Sample text content sent as a file stream
         self.sample_text = "This is a sample text file used for testing."
 
-    @patch("builtins.open", new_callable=MagicMock)
-    def test_load_text_file(self, mock_open):
-        """Test loading text from a file."""
-        mock_open.return_value.__enter__.return_value = self.sample_text.splitlines()
-        
-        result = self.labeler.load_text_file(self.test_file_path)
-        expected_result = ["This is a sample text file used for testing."]
-        self.assertEqual(result, expected_result)
+    def test_load_text_from_stream(self):
+        """Test decoding the content of a file stream."""
+        result = self.labeler.load_text_from_stream(self.sample_text.encode("utf-8"))
+        self.assertEqual(result, self.sample_text)
+
+    def test_load_text_from_stream_invalid_utf8(self):
+        """Test that a stream which is not UTF-8 is rejected with a ValueError."""
+        with self.assertRaises(ValueError):
+            self.labeler.load_text_from_stream(b"\xff\xfe\xfa")
 
     @patch("openai.ChatCompletion.create")
-    @patch("modules.services.labeler.Labeler.load_text_file")
-    def test_create_definition(self, mock_load_text_file, mock_openai_create):
+    def test_create_definition_from_content(self, mock_openai_create):
         """Test creating a definition using OpenAI's API."""
-        # Mock the content returned by load_text_file
-        mock_load_text_file.return_value = [self.sample_text]
-
         # Mock the OpenAI ChatCompletion API response
+        mock_openai_create.return_value = {"choices": [{"message": {"content": f"  {DEFINITION}\n"}}]}
+
+        result = self.labeler.create_definition_from_content(self.sample_text.encode("utf-8"))
+
+        self.assertEqual(result, DEFINITION)
+        request = mock_openai_create.call_args.kwargs
+        self.assertEqual(request["model"], "gpt-4")
+        self.assertIn(self.sample_text, request["messages"][1]["content"])
+
+    @patch("openai.ChatCompletion.create")
+    def test_create_definition_from_text_error(self, mock_openai_create):
+        """Test that a failing model call is reported."""
+        mock_openai_create.side_effect = ValueError("bad request")
+        with self.assertRaises(Exception) as raised:
+            self.labeler.create_definition_from_text(self.sample_text)
+        self.assertIn("bad request", str(raised.exception))
+
+
+class TestLabelBudget(unittest.TestCase):
+    def setUp(self):
+        self.labeler = Labeler(label_model="gpt-4", max_input_tokens=200)
+
+    def _document(self, sentences):
+        topics = ["harbor", "storm", "lighthouse", "keeper", "sailor", "dawn", "sails", "boat", "tide", "reef"]
+        return " ".join(
+            f"Sentence {i} tells how the {topics[i % 10]} met the {topics[(i * 3 + 1) % 10]} near the "
+            f"{topics[(i * 7 + 2) % 10]}." for i in range(sentences)
+        )
+
+    @patch("openai.ChatCompletion.create")
+    def test_long_document_is_condensed(self, mock_openai_create):
+        """Test that the document part of the prompt is capped at the budget and token usage is recorded."""
         mock_openai_create.return_value = {
-            "choices": [
-                {
-                    "message": {
-                        "content": (
-                            "{\n"
-                            "  \"collection_name\": \"SampleCollection\",\n"
-                            "  \"partition_name\": \"SamplePartition\",\n"
-                            "  \"description\": \"A test collection of sample data.\",\n"
-                            "  \"dimension\": 128,\n"
-                            "  \"metric_type\": \"cosine\"\n"
-                            "}"
-                        )
-                    }
-                }
-            ]
+            "choices": [{"message": {"content": DEFINITION}}],
+            "usage": {"prompt_tokens": 260, "completion_tokens": 60},
         }
+        prompts_before = sum(LABEL_TOKENS.labels("prompt").counts)
+        document = self._document(1000)
+        self.assertEqual(self.labeler.create_definition_from_text(document), DEFINITION)
 
-        # Call the create_definition method
-        result = self.labeler.create_definition(self.test_file_path)
-
-        # Expected result from the mocked API response
-        expected_result = (
-            "{\n"
-            "  \"collection_name\": \"SampleCollection\",\n"
-            "  \"partition_name\": \"SamplePartition\",\n"
-            "  \"description\": \"A test collection of sample data.\",\n"
-            "  \"dimension\": 128,\n"
-            "  \"metric_type\": \"cosine\"\n"
-            "}"
-        )
+        prompt = mock_openai_create.call_args.kwargs["messages"][1]["content"]
+        template_tokens = self.labeler.tokenizer.count(self.labeler._build_request("")["messages"][1]["content"])
+        self.assertLessEqual(self.labeler.tokenizer.count(prompt), template_tokens + 200 + 2)
+        self.assertIn("Sentence", prompt)
+        self.assertEqual(sum(LABEL_TOKENS.labels("prompt").counts), prompts_before + 1)
+
+    def test_short_document_is_unchanged(self):
+        """Test that a document within the budget is sent as it is."""
+        document = self._document(3)
+        self.assertIn(document, self.labeler._build_request(document)["messages"][1]["content"])
 
-        self.assertEqual(result, expected_result)
+    def test_condensing_work_is_bounded(self):
+        """Test that only a bounded sample of sentences is scored, however long the document is."""
+        with patch("modules.services.extractive.term_matrix", wraps=term_matrix) as scored:
+            self.labeler._fit_budget(self._document(20000))
+        self.assertEqual(len(scored.call_args.args[0]), Config.LABEL_CANDIDATE_SENTENCES)
 
-    def test_create_definition_file_not_found(self):
-        """Test create_definition raises FileNotFoundError for a missing file."""
-        with self.assertRaises(FileNotFoundError):
-            self.labeler.create_definition("nonexistent_file.txt")
+    def test_text_without_sentence_breaks_is_truncated(self):
+        """Test that a single sentence longer than the budget is cut at a token boundary."""
+        document = " ".join(["word"] * 1000)
+        self.assertEqual(self.labeler.tokenizer.count(self.labeler._fit_budget(document)), 200)
 
 
-# if __name__ == "__main__":
-#     unittest.main()
+if __name__ == "__main__":
+    unittest.main()
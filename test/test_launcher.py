@@ -0,0 +1,135 @@
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import grpc
+import main
+from modules.proto.embedding import embedding_buffer_pb2, embedding_buffer_pb2_grpc
+from modules.proto.embedding.embedding_buffer_pb2 import HealthResponse
+from modules.services.launcher import ServerLauncher
+
+
+def _hang(index, health_address):
+    """A worker that starts but never answers its health checks."""
+    time.sleep(60)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+class TestServerLauncher(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.port = _free_port()
+        # Spawned workers read their configuration from the environment
+        self.environment = patch.dict(os.environ, {
+            "STREAM_SERVICE_PORT": str(self.port),
+            "VECTOR_STORE_DIR": self.store_dir,
+            "EMBEDDING_BACKEND": "local",
+            "LABEL_MODE": "local",
+            "METRICS_PORT": "0",
+            "LOG_LEVEL": "ERROR",
+            "SERVER_SHUTDOWN_GRACE": "5",
+        })
+        self.environment.start()
+        self.launcher = None
+
+    def tearDown(self):
+        if self.launcher is not None:
+            self.launcher.stop()
+        self.environment.stop()
+        shutil.rmtree(self.store_dir)
+
+    def _wait_until_healthy(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.launcher.check()
+            if all(worker.healthy for worker in self.launcher.workers):
+                return
+            time.sleep(0.2)
+        self.fail("Workers did not become healthy.")
+
+    def _answering_pids(self, connections=30):
+        """Open separate connections to the shared port and collect the PIDs of the workers that answer."""
+        pids = set()
+        for _ in range(connections):
+            # A local subchannel pool keeps gRPC from reusing the previous channel's connection
+            options = [("grpc.use_local_subchannel_pool", 1)]
+            with grpc.insecure_channel(f"localhost:{self.port}", options=options) as channel:
+                stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(channel)
+                response = stub.Health(embedding_buffer_pb2.HealthRequest(), timeout=10)
+                self.assertEqual(response.status, HealthResponse.SERVING)
+                pids.add(response.pid)
+        return pids
+
+    def test_workers_share_the_port_and_restart_after_a_crash(self):
+        """Test that connections are spread across workers and that a killed worker comes back."""
+        self.launcher = ServerLauncher(main.serve_worker, processes=2, health_timeout=1, startup_seconds=60).start()
+        self._wait_until_healthy()
+        worker_pids = {worker.process.pid for worker in self.launcher.workers}
+        self.assertEqual(self._answering_pids(), worker_pids)
+
+        with grpc.insecure_channel(f"localhost:{self.port}") as channel:
+            stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(channel)
+            request = embedding_buffer_pb2.EmbeddingRequest(file_name="story.txt", file_stream=b"Once upon a time.")
+            self.assertEqual(len(list(stub.StreamEmbedding(request, timeout=30))), 1)
+
+        crashed = self.launcher.workers[0]
+        os.kill(crashed.process.pid, signal.SIGKILL)
+        crashed.process.join(10)
+        self._wait_until_healthy()
+        self.assertEqual(crashed.restarts, 1)
+        self.assertNotIn(crashed.process.pid, worker_pids)
+
+        processes = [worker.process for worker in self.launcher.workers]
+        self.launcher.stop()
+        self.launcher = None
+        # SIGTERM drains each worker, which then exits normally
+        self.assertEqual([process.exitcode for process in processes], [0, 0])
+
+    def test_health_server_answers_only_probes(self):
+        """Test that the probe address serves Health from its own pool and nothing else."""
+        service = MagicMock()
+        service.Health.return_value = HealthResponse(status=HealthResponse.SERVING, pid=os.getpid())
+        address = f"unix:{os.path.join(self.store_dir, 'health.sock')}"
+        server = main.start_health_server(service, [address])
+        try:
+            with grpc.insecure_channel(address) as channel:
+                stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(channel)
+                self.assertEqual(stub.Health(embedding_buffer_pb2.HealthRequest(), timeout=5).pid, os.getpid())
+                with self.assertRaises(grpc.RpcError) as raised:
+                    list(stub.StreamEmbedding(embedding_buffer_pb2.EmbeddingRequest(), timeout=5))
+                self.assertEqual(raised.exception.code(), grpc.StatusCode.UNIMPLEMENTED)
+        finally:
+            server.stop(0).wait()
+        self.assertIsNone(main.start_health_server(service, []))
+
+    def test_unresponsive_worker_is_restarted(self):
+        """Test that a worker failing its health checks is killed and started again."""
+        self.launcher = ServerLauncher(
+            _hang, processes=1, health_timeout=0.2, health_failures=2, startup_seconds=0, shutdown_grace=0
+        ).start()
+        worker = self.launcher.workers[0]
+        first = worker.process
+        self.launcher.check()
+        self.assertTrue(first.is_alive())
+        self.launcher.check()
+        self.assertFalse(first.is_alive())
+        self.launcher.check()
+        self.assertIsNot(worker.process, first)
+        self.assertEqual(worker.restarts, 0)  # The restart waits out the backoff
+        time.sleep(0.6)
+        self.launcher.check(probe=False)
+        self.assertEqual(worker.restarts, 1)
+        self.assertTrue(worker.process.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from modules.services.local_embedder import AsyncHashingEmbeddingGenerator, HashingEmbeddingGenerator
+
+
+class TestHashingEmbeddingGenerator(unittest.TestCase):
+    def setUp(self):
+        self.generator = HashingEmbeddingGenerator(dimension=64, idf_path="")
+
+    def test_shape_and_norm(self):
+        """Test that every vector has the configured dimension and unit length."""
+        embeddings = np.array(self.generator.get_embeddings(["A brave girl.", "A clock maker.", ""]))
+        self.assertEqual(embeddings.shape, (3, 64))
+        np.testing.assert_allclose(np.linalg.norm(embeddings[:2], axis=1), 1.0, rtol=1e-5)
+        self.assertEqual(np.linalg.norm(embeddings[2]), 0.0)
+
+    def test_deterministic_and_batch_independent(self):
+        """Test that a text gets the same vector alone, in a batch, and in a new instance."""
+        alone = self.generator.get_embedding("The golden seed")
+        batched = self.generator.get_embeddings(["Other text", "The golden seed"])[1]
+        fresh = HashingEmbeddingGenerator(dimension=64, idf_path="").get_embedding("The golden seed")
+        np.testing.assert_allclose(alone, batched, rtol=1e-6)
+        np.testing.assert_allclose(alone, fresh, rtol=1e-6)
+
+    def test_similar_texts_are_closer(self):
+        """Test that overlapping texts score higher than unrelated ones."""
+        base, similar, unrelated = np.array(self.generator.get_embeddings([
+            "Luna sailed through the midnight storm.",
+            "Luna sailed through a midnight storm!",
+            "Quarterly revenue grew by four percent.",
+        ]))
+        self.assertGreater(base @ similar, base @ unrelated)
+
+    def test_idf_changes_model_name(self):
+        """Test that fitting IDF weights is reflected in the model name used for cache keys."""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "idf.npy")
+            self.generator.fit_idf(["the storm", "the seed", "the clock"], idf_path=path)
+            loaded = HashingEmbeddingGenerator(dimension=64, idf_path=path)
+            self.assertEqual(loaded.embedding_model, self.generator.embedding_model)
+            self.assertNotEqual(loaded.embedding_model, "local-hashing-64")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_invalid_text(self):
+        """Test that non-string input is rejected."""
+        with self.assertRaises(TypeError):
+            self.generator.get_embedding(None)
+
+
+class TestAsyncHashingEmbeddingGenerator(unittest.IsolatedAsyncioTestCase):
+    async def test_matches_sync_generator(self):
+        generator = AsyncHashingEmbeddingGenerator(dimension=32, idf_path="")
+        expected = HashingEmbeddingGenerator(dimension=32, idf_path="").get_embedding("Small village")
+        np.testing.assert_allclose(await generator.get_embedding("Small village"), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
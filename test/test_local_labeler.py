@@ -0,0 +1,143 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from modules.proto.embedding import embedding_buffer_pb2
+from modules.services.cache import EmbeddingCache
+from modules.services.embedding_service import EmbeddingService
+from modules.services.chunker import Tokenizer
+from modules.services.extractive import condense, keywords, split_sentences, summarize
+from modules.services.local_embedder import HashingEmbeddingGenerator
+from modules.services.local_labeler import AsyncLocalLabeler, LocalLabeler, enrich_definition
+from modules.storage import VectorStore
+
+STORY = (
+    "Luna was a sailor who loved the sea. "
+    "One night a storm broke over the harbor and Luna sailed out to find the lighthouse keeper. "
+    "The storm tore at the sails, but Luna kept the boat steady. "
+    "At dawn she returned with the keeper, and the harbor cheered."
+)
+
+
+class TestExtractive(unittest.TestCase):
+    def test_split_sentences(self):
+        """Test that sentences are split on terminal punctuation and line breaks."""
+        self.assertEqual(split_sentences("One. Two!\nThree"), ["One.", "Two!", "Three"])
+
+    def test_keywords_ranked_by_frequency(self):
+        """Test that frequent content words come first and stopwords are skipped."""
+        self.assertEqual(keywords(STORY, top_k=3), ["luna", "storm", "harbor"])
+
+    def test_summary_keeps_document_order(self):
+        """Test that the summary holds the requested number of sentences in their original order."""
+        summary = summarize(STORY, max_sentences=2)
+        sentences = split_sentences(summary)
+        self.assertEqual(len(sentences), 2)
+        self.assertLess(STORY.index(sentences[0]), STORY.index(sentences[1]))
+
+    def test_summary_length_cap(self):
+        """Test that a long summary is cut at a word boundary."""
+        summary = summarize(STORY, max_sentences=4, max_chars=40)
+        self.assertLessEqual(len(summary), 43)
+        self.assertTrue(summary.endswith("..."))
+
+    def test_condense_fits_the_budget_without_repeating(self):
+        """Test that condensing keeps distinct sentences, in document order, within the token budget."""
+        count = Tokenizer().count
+        text = " ".join([STORY] * 20)
+        condensed = condense(text, 40, count)
+        sentences = split_sentences(condensed)
+        self.assertLessEqual(count(condensed), 40)
+        self.assertGreater(len(sentences), 1)
+        self.assertEqual(len(set(sentences)), len(sentences))
+        self.assertEqual(condense("A sentence far longer than the budget allows.", 3, count), "")
+
+
+class TestLocalLabeler(unittest.TestCase):
+    def setUp(self):
+        self.labeler = LocalLabeler(dimension=384)
+
+    def test_definition_fields(self):
+        """Test that the definition has every field and the backend's dimension."""
+        definition = json.loads(self.labeler.create_definition_from_text(STORY))
+        self.assertEqual(definition["collection_name"], "LunaStormCollection")
+        self.assertEqual(definition["partition_name"], "HarborKeeper")
+        self.assertEqual(definition["dimension"], 384)
+        self.assertEqual(definition["metric_type"], "cosine")
+        self.assertTrue(definition["description"])
+
+    def test_deterministic(self):
+        """Test that the same text always gives the same definition."""
+        self.assertEqual(
+            self.labeler.create_definition_from_text(STORY),
+            LocalLabeler(dimension=384).create_definition_from_text(STORY),
+        )
+
+    def test_empty_text(self):
+        """Test that an empty document still gets a valid definition."""
+        definition = json.loads(self.labeler.create_definition_from_content(b""))
+        self.assertEqual(definition["collection_name"], "DocumentCollection")
+        self.assertEqual(definition["description"], "Empty document.")
+
+    def test_async_matches_sync(self):
+        """Test that the async labeler returns the same definition."""
+        definition = asyncio.run(AsyncLocalLabeler(dimension=384).create_definition_from_text(STORY))
+        self.assertEqual(definition, self.labeler.create_definition_from_text(STORY))
+
+    def test_enrich_definition_keeps_measured_fields(self):
+        """Test that model labels replace the extracted ones but not the dimension or metric."""
+        local = self.labeler.create_definition_from_text(STORY)
+        generated = json.dumps({"collection_name": "SeaTales", "description": "A storm rescue.", "dimension": 128})
+        definition = json.loads(enrich_definition(local, generated))
+        self.assertEqual(definition["collection_name"], "SeaTales")
+        self.assertEqual(definition["description"], "A storm rescue.")
+        self.assertEqual(definition["partition_name"], "HarborKeeper")
+        self.assertEqual(definition["dimension"], 384)
+
+    def test_enrich_definition_rejects_invalid_json(self):
+        """Test that unparseable model output is reported."""
+        with self.assertRaises(ValueError):
+            enrich_definition(self.labeler.create_definition_from_text(STORY), "not json")
+
+
+class TestLocalLabelService(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        embedder = HashingEmbeddingGenerator(dimension=32, idf_path="")
+        self.enricher = MagicMock()
+        self.enricher.create_definition_from_text.return_value = json.dumps({"collection_name": "SeaTales"})
+        self.service = EmbeddingService(
+            cache=EmbeddingCache(store=VectorStore(self.store_dir)),
+            labeler=LocalLabeler(dimension=embedder.dimension),
+            embedder=embedder,
+            enricher=self.enricher,
+        )
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    def test_enrichment_updates_cached_definition(self):
+        """Test that the response uses local labels and the cache later holds the model's labels."""
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="story.txt", file_stream=STORY.encode("utf-8"))
+        responses = list(self.service.StreamEmbedding(request, MagicMock()))
+        first = json.loads(responses[0].json_stream)
+        self.assertEqual(first["definition"]["collection_name"], "LunaStormCollection")
+        self.assertEqual(len(first["embeddings"]), 32)
+
+        self.service._enrichment.shutdown(wait=True)
+        self.enricher.create_definition_from_text.assert_called_once_with(STORY)
+        responses = list(self.service.StreamEmbedding(request, MagicMock()))
+        second = json.loads(responses[0].json_stream)
+        self.assertEqual(second["definition"]["collection_name"], "SeaTales")
+        self.assertEqual(second["embeddings"], first["embeddings"])
+
+        reopened = EmbeddingCache(store=VectorStore(self.store_dir))
+        record = reopened.get(self.service._get_cache_key(STORY.encode("utf-8")))
+        self.assertEqual(json.loads(record.definition)["collection_name"], "SeaTales")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+import urllib.request
+from concurrent import futures
+import grpc
+from modules.proto.embedding import embedding_buffer_pb2, embedding_buffer_pb2_grpc
+from modules.services.cache import EmbeddingCache
+from modules.services.embedding_service import EmbeddingService
+from modules.services.local_embedder import HashingEmbeddingGenerator
+from modules.services.local_labeler import LocalLabeler
+from modules.services.metrics import (
+    CACHE_LOOKUPS, IN_FLIGHT, PROVIDER_CALLS, PROVIDER_TOKENS, RPC_SECONDS, STAGE_SECONDS, MetricsInterceptor,
+    MetricsRegistry, start_metrics_server,
+)
+from modules.services.provider import ProviderClient
+from modules.storage import VectorStore
+
+STORY = "The clock maker fixed every clock in the village. The tower clock was the last to be repaired."
+
+
+def histogram_count(histogram, *labels):
+    """Number of observations recorded under the given labels."""
+    return sum(histogram.labels(*labels).counts)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_render(self):
+        """Test that counters render with the _total suffix and escaped labels."""
+        counter = self.registry.counter("requests", "Requests served.", ("path",))
+        counter.labels('a"b').inc(2)
+        text = self.registry.render()
+        self.assertIn("# TYPE requests counter", text)
+        self.assertIn('requests_total{path="a\\"b"} 2.0', text)
+
+    def test_counter_rejects_decrease(self):
+        """Test that counters cannot go down."""
+        with self.assertRaises(ValueError):
+            self.registry.counter("requests", "Requests served.").inc(-1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that each bucket counts every observation up to its bound."""
+        histogram = self.registry.histogram("latency", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value)
+        text = self.registry.render()
+        self.assertIn('latency_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_bucket{le="1.0"} 2', text)
+        self.assertIn('latency_bucket{le="+Inf"} 3', text)
+        self.assertIn("latency_count 3", text)
+        self.assertIn("latency_sum 5.55", text)
+
+    def test_gauge_function(self):
+        """Test that a gauge can be read from a callback at collection time."""
+        gauge = self.registry.gauge("ratio", "A ratio.")
+        gauge.set_function(lambda: 0.25)
+        self.assertIn("ratio 0.25", self.registry.render())
+
+    def test_register_returns_existing_metric(self):
+        """Test that registering the same name twice returns the first metric, but not with other labels."""
+        counter = self.registry.counter("requests", "Requests served.")
+        self.assertIs(self.registry.counter("requests", "Requests served."), counter)
+        with self.assertRaises(ValueError):
+            self.registry.counter("requests", "Requests served.", ("path",))
+
+    def test_metrics_endpoint(self):
+        """Test that the HTTP endpoint serves the registry and nothing else."""
+        self.registry.counter("requests", "Requests served.").inc()
+        server = start_metrics_server(port=0, host="127.0.0.1", registry=self.registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}"
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                self.assertIn("text/plain", response.headers["Content-Type"])
+                self.assertIn("requests_total 1.0", response.read().decode("utf-8"))
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{url}/other")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestProviderMetrics(unittest.TestCase):
+    def test_usage_is_counted_per_endpoint(self):
+        """Test that successful calls add their tokens to the endpoint's counter."""
+        client = ProviderClient(name="metrics-test")
+        client.call(lambda: "ok", tokens=42)
+        self.assertEqual(PROVIDER_CALLS.labels("metrics-test").value, 1)
+        self.assertEqual(PROVIDER_TOKENS.labels("metrics-test").value, 42)
+
+
+class TestServiceMetrics(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        embedder = HashingEmbeddingGenerator(dimension=16, idf_path="")
+        self.service = EmbeddingService(
+            cache=EmbeddingCache(store=VectorStore(self.store_dir)),
+            labeler=LocalLabeler(dimension=embedder.dimension),
+            embedder=embedder,
+        )
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=2), interceptors=[MetricsInterceptor()])
+        embedding_buffer_pb2_grpc.add_EmbeddingServiceServicer_to_server(self.service, self.server)
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        self.server.start()
+        self.channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+        self.stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(self.channel)
+
+    def tearDown(self):
+        self.channel.close()
+        self.server.stop(0)
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    def test_stage_and_rpc_timings(self):
+        """Test that a miss times every stage, a hit skips labeling, and both RPCs are timed."""
+        stages = ("decode", "label", "embed", "serialize", "persist")
+        before = {stage: histogram_count(STAGE_SECONDS, stage) for stage in stages}
+        rpcs_before = histogram_count(RPC_SECONDS, "StreamEmbedding", "OK")
+        misses, hits = CACHE_LOOKUPS.labels("miss").value, CACHE_LOOKUPS.labels("memory").value
+
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="clock.txt", file_stream=STORY.encode("utf-8"))
+        list(self.stub.StreamEmbedding(request))
+        list(self.stub.StreamEmbedding(request))
+
+        after = {stage: histogram_count(STAGE_SECONDS, stage) for stage in stages}
+        self.assertEqual(after["label"] - before["label"], 1)
+        self.assertEqual(after["embed"] - before["embed"], 1)
+        self.assertEqual(after["persist"] - before["persist"], 1)
+        self.assertEqual(after["serialize"] - before["serialize"], 2)
+        self.assertEqual(histogram_count(RPC_SECONDS, "StreamEmbedding", "OK") - rpcs_before, 2)
+        self.assertEqual(CACHE_LOOKUPS.labels("miss").value - misses, 1)
+        self.assertEqual(CACHE_LOOKUPS.labels("memory").value - hits, 1)
+        self.assertEqual(IN_FLIGHT.labels("StreamEmbedding").value, 0)
+
+    def test_failed_rpc_is_timed_with_its_code(self):
+        """Test that an RPC ending in an error is recorded under its status code."""
+        failed_before = histogram_count(RPC_SECONDS, "StreamEmbedding", "INTERNAL")
+        with self.assertRaises(grpc.RpcError):
+            list(self.stub.StreamEmbedding(embedding_buffer_pb2.EmbeddingRequest(file_name="empty.txt")))
+        self.assertEqual(histogram_count(RPC_SECONDS, "StreamEmbedding", "INTERNAL") - failed_before, 1)
+        self.assertEqual(IN_FLIGHT.labels("StreamEmbedding").value, 0)
+
+    def test_vectors_are_not_written_to_stdout(self):
+        """Test that handling a request does not print the embedding vectors."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.service.embed_document(STORY.encode("utf-8"))
+        self.assertEqual(output.getvalue(), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent import futures
+from unittest.mock import MagicMock
+import numpy as np
+from modules.proto.embedding import embedding_buffer_pb2
+from modules.services import EmbeddingCache
+from modules.services.sketch import MinHasher, decode_signature, encode_signature, similarity
+from modules.storage import SketchIndex, VectorStore
+from main import EmbeddingService
+
+DEFINITION = json.dumps({
+    "collection_name": "test_collection",
+    "partition_name": "test_partition",
+    "description": "Test collection description",
+    "dimension": 3,
+    "metric_type": "L2"
+})
+
+
+def words(count, prefix="word"):
+    return [f"{prefix}{i}" for i in range(count)]
+
+
+class TestMinHasher(unittest.TestCase):
+    def setUp(self):
+        self.hasher = MinHasher(permutations=128, shingle_words=3)
+
+    def test_formatting_changes_do_not_count(self):
+        """Test that whitespace, punctuation and case changes give the same signature."""
+        text = "The storm broke over the harbor. Luna sailed out to find the keeper."
+        reformatted = "the  storm broke over the HARBOR\nLuna sailed out, to find the keeper!"
+        np.testing.assert_array_equal(self.hasher.signature(text), self.hasher.signature(reformatted))
+
+    def test_similarity_follows_overlap(self):
+        """Test that a small edit keeps the estimate high while unrelated texts score low."""
+        text = " ".join(words(500))
+        edited = " ".join(words(250) + ["changed"] + words(500)[251:])
+        signature = self.hasher.signature(text)
+        self.assertGreater(similarity(signature, self.hasher.signature(edited)), 0.9)
+        self.assertLess(similarity(signature, self.hasher.signature(" ".join(words(500, "other")))), 0.1)
+        self.assertIsNone(self.hasher.signature(" ... "))
+
+    def test_signature_is_the_minimum_over_shingles(self):
+        """Test the vectorized signature against hashing every shingle one by one."""
+        hasher = MinHasher(permutations=16, shingle_words=2)
+        text = " ".join(words(5000))
+        shingles = hasher.shingles(text)
+        expected = [min((int(a) * int(x) + int(b)) % 4294967311 for x in shingles) & 0xFFFFFFFF
+                    for a, b in zip(hasher._a, hasher._b)]
+        self.assertEqual(hasher.signature(text).tolist(), expected)
+
+    def test_signature_round_trip(self):
+        """Test that signatures survive being stored as text."""
+        signature = self.hasher.signature("A short story about the sea.")
+        np.testing.assert_array_equal(decode_signature(encode_signature(signature)), signature)
+
+
+class TestSketchIndex(unittest.TestCase):
+    def setUp(self):
+        self.hasher = MinHasher(permutations=64)
+        self.index = SketchIndex(bands=16)
+        self.text = " ".join(words(300))
+
+    def test_query(self):
+        """Test that near duplicates are found, most similar first, and other scopes are ignored."""
+        self.index.add("same", self.hasher.signature(self.text))
+        self.index.add("edited", self.hasher.signature(" ".join(words(300)[:290] + ["x"] * 10)))
+        self.index.add("unrelated", self.hasher.signature(" ".join(words(300, "other"))))
+        self.index.add("other scope", self.hasher.signature(self.text), scope="other")
+
+        hits = self.index.query(self.hasher.signature(self.text), threshold=0.5)
+        self.assertEqual([key for key, _ in hits], ["same", "edited"])
+        self.assertEqual(hits[0][1], 1.0)
+
+        self.index.remove("same")
+        hits = self.index.query(self.hasher.signature(self.text), threshold=0.5)
+        self.assertEqual([key for key, _ in hits], ["edited"])
+        self.assertEqual(len(self.index), 3)
+
+    def test_bands_must_divide_the_signature(self):
+        """Test that a signature that cannot be banded is rejected."""
+        with self.assertRaises(ValueError):
+            SketchIndex(bands=7).add("key", self.hasher.signature(self.text))
+
+
+class TestNearDuplicateService(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.service = self._service()
+        self.context = MagicMock()
+        self.text = " ".join(words(400))
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    def _service(self):
+        service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+        service.hasher = MinHasher()
+        service.labeler.create_definition_from_text = MagicMock(return_value=DEFINITION)
+        service.embedder.get_embeddings = MagicMock(side_effect=lambda texts: [[0.1, 0.2, 0.3] for _ in texts])
+        return service
+
+    def _embed(self, text, service=None):
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="story.txt", file_stream=text.encode())
+        return list((service or self.service).StreamEmbedding(request, self.context))[0]
+
+    def test_near_duplicate_reuses_the_stored_result(self):
+        """Test that a reformatted, slightly edited copy is answered without provider calls and is marked."""
+        first = self._embed(self.text)
+        self.assertEqual(first.duplicate_of, "")
+
+        copy = "\n".join(words(400)[:200] + ["edited"] + words(400)[201:]).upper()
+        response = self._embed(copy)
+        self.assertEqual(response.duplicate_of, self.service._get_cache_key(self.text.encode()))
+        self.assertGreaterEqual(response.similarity, self.service.near_duplicate_threshold)
+        self.assertEqual(json.loads(response.json_stream), json.loads(first.json_stream))
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 1)
+
+    def test_reused_result_is_stored_under_the_new_key(self):
+        """Test that a repeated near-duplicate is a cache hit that is still marked, without sketching again."""
+        self._embed(self.text)
+        copy = self.text.upper()
+        marked = self._embed(copy)
+
+        self.service.hasher = MagicMock(wraps=self.service.hasher)
+        repeated = self._embed(copy)
+        self.service.hasher.signature.assert_not_called()
+        self.assertEqual(repeated.duplicate_of, marked.duplicate_of)
+        self.assertAlmostEqual(repeated.similarity, marked.similarity, places=5)
+        self.assertEqual(self.service.cache.stats()["memory_hits"], 1)
+
+        # The marker survives the disk tier
+        restarted = self._service()
+        self.assertEqual(self._embed(copy, restarted).duplicate_of, marked.duplicate_of)
+        restarted.close()
+
+    def test_waiters_get_the_marked_result(self):
+        """Test that a request waiting on the flight of a near-duplicate gets the same marked response."""
+        self._embed(self.text)
+        copy = self.text.upper()
+        joined = threading.Event()
+        near_duplicate = self.service._near_duplicate
+
+        def wait_for_waiter(sketch):
+            joined.wait(5)
+            return near_duplicate(sketch)
+
+        self.service._near_duplicate = wait_for_waiter
+        with futures.ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(self._embed, copy)
+            while not self.service.flights.in_flight():
+                time.sleep(0.01)
+            waiter = pool.submit(self._embed, copy)
+            while not self.service.flights.coalesced:
+                time.sleep(0.01)
+            joined.set()
+
+        expected = self.service._get_cache_key(self.text.encode())
+        self.assertEqual(leader.result().duplicate_of, expected)
+        self.assertEqual(waiter.result().duplicate_of, expected)
+        self.assertEqual(waiter.result().similarity, leader.result().similarity)
+
+    def test_different_document_is_processed(self):
+        """Test that a document below the threshold is labeled and embedded as usual."""
+        self._embed(self.text)
+        response = self._embed(" ".join(words(200) + words(200, "new")))
+        self.assertEqual(response.duplicate_of, "")
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 2)
+
+    def test_index_is_rebuilt_from_the_store(self):
+        """Test that a restarted server finds near duplicates of documents stored before."""
+        self._embed(self.text)
+        restarted = self._service()
+        restarted.warm_up()
+        self.assertTrue(self._embed(self.text + " end", restarted).duplicate_of)
+        restarted.labeler.create_definition_from_text.assert_not_called()
+        restarted.close()
+
+    def test_disabled_by_default(self):
+        """Test that no sketch is computed or stored unless near-duplicate detection is enabled."""
+        self.service.hasher = None
+        self._embed(self.text)
+        self.assertEqual(self._embed(self.text + " end").duplicate_of, "")
+        stored = self.service.cache.store.get(self.service._get_cache_key(self.text.encode()))
+        self.assertNotIn("sketch", stored[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
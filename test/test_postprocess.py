@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from modules.config import Config
+from modules.services.postprocess import EmbeddingPostProcessor
+
+
+class TestEmbeddingPostProcessor(unittest.TestCase):
+    def setUp(self):
+        self.matrix = np.random.default_rng(0).standard_normal((16, 32))
+
+    def test_passes_vectors_through_by_default(self):
+        """Test that without reduction or normalization the values come back unchanged."""
+        processor = EmbeddingPostProcessor(dimension=0, normalize=False)
+        result = processor.process([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]])
+        self.assertTrue(result.flags["C_CONTIGUOUS"])
+        self.assertEqual(result[0].tolist(), [0.1, 0.2, 0.3])
+        self.assertEqual(processor.signature, "")
+
+    def test_rejects_invalid_embeddings(self):
+        """Test that ragged, non-float, empty and non-finite vectors are rejected."""
+        processor = EmbeddingPostProcessor(dimension=0, normalize=False)
+        for embeddings in ([[0.1, 0.2], [0.3]], [[1, 2, 3]], [["a", "b"]], [], [[0.1, float("nan")]]):
+            with self.assertRaises(ValueError):
+                processor.process(embeddings)
+
+    def test_normalize(self):
+        """Test that rows are scaled to unit length and zero rows are kept."""
+        processor = EmbeddingPostProcessor(dimension=0, normalize=True)
+        result = processor.process([[3.0, 4.0], [0.0, 0.0]])
+        np.testing.assert_allclose(result, [[0.6, 0.8], [0.0, 0.0]])
+        self.assertEqual(processor.signature, "normalized")
+
+    def test_truncate(self):
+        """Test that truncation keeps the leading values and renormalizes them."""
+        processor = EmbeddingPostProcessor(dimension=8, reduction="truncate", normalize=False)
+        result = processor.process(self.matrix)
+        self.assertEqual(result.shape, (16, 8))
+        expected = self.matrix[:, :8] / np.linalg.norm(self.matrix[:, :8], axis=1, keepdims=True)
+        np.testing.assert_allclose(result, expected)
+        self.assertEqual(processor.output_dimension(32), 8)
+        self.assertEqual(processor.signature, "truncate8")
+        with self.assertRaises(ValueError):
+            processor.process(self.matrix[:, :4])
+
+    def test_pca(self):
+        """Test that a fitted projection keeps most of the variance and survives a save and load."""
+        # Vectors that vary along four directions only
+        rng = np.random.default_rng(1)
+        sample = rng.standard_normal((64, 4)) @ rng.standard_normal((4, 32)) + 5.0
+        processor = EmbeddingPostProcessor(dimension=4, reduction="pca", pca_path="")
+        with self.assertRaises(ValueError):
+            processor.process(sample)
+
+        pca_path = os.path.join(tempfile.mkdtemp(), "pca.npz")
+        processor.fit_pca(sample, pca_path)
+        reduced = processor.process(sample)
+        self.assertEqual(reduced.shape, (64, 4))
+        np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1.0, rtol=1e-5)
+
+        # Pairwise distances of the centred vectors are preserved by the projection
+        centred = (sample - sample.mean(axis=0)).astype(np.float32)
+        projected = centred @ processor.components.T
+        np.testing.assert_allclose(
+            np.linalg.norm(projected[0] - projected[1]), np.linalg.norm(centred[0] - centred[1]), rtol=1e-3
+        )
+
+        loaded = EmbeddingPostProcessor(dimension=0, reduction="pca", pca_path=pca_path)
+        self.assertEqual(loaded.dimension, 4)
+        self.assertEqual(loaded.signature, processor.signature)
+        np.testing.assert_allclose(loaded.process(sample), reduced, rtol=1e-5)
+        with self.assertRaises(ValueError):
+            loaded.process(sample[:, :16])
+
+
+    def test_pca_needs_a_saved_projection(self):
+        """Test that the configuration is rejected when PCA reduction has no projection to load."""
+        sample = np.random.default_rng(1).standard_normal((16, 8))
+        pca_path = os.path.join(tempfile.mkdtemp(), "pca.npz")
+        with patch.multiple(Config, EMBEDDING_REDUCTION="pca", EMBEDDING_DIMENSION=4, EMBEDDING_PCA_PATH=""):
+            with self.assertRaises(ValueError):
+                Config.validate(require_api_key=False)
+            EmbeddingPostProcessor().fit_pca(sample, pca_path)
+            with patch.object(Config, "EMBEDDING_PCA_PATH", pca_path):
+                Config.validate(require_api_key=False)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import openai
+from modules.services.provider import (
+    CircuitBreaker, CircuitOpenError, ProviderClient, RateLimiter, TokenBucket
+)
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    return openai.error.RateLimitError("Rate limit reached", http_status=429, headers=headers)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        """Test that a full bucket allows a burst and then asks callers to wait."""
+        bucket = TokenBucket(per_minute=60, capacity=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 1.0, places=1)
+        self.assertAlmostEqual(bucket.reserve(), 2.0, places=1)
+
+    def test_disabled_bucket(self):
+        """Test that a zero rate never makes callers wait."""
+        self.assertEqual(TokenBucket(0).reserve(1_000_000), 0.0)
+
+    def test_limiter_takes_the_longest_wait(self):
+        """Test that the limiter waits for whichever of the two limits is tighter."""
+        limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=60)
+        self.assertEqual(limiter.reserve(tokens=60), 0.0)
+        self.assertAlmostEqual(limiter.reserve(tokens=30), 30.0, places=0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_and_half_opens(self):
+        """Test that the circuit opens after the threshold and lets one trial through after the timeout."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+
+@patch("time.sleep")
+class TestProviderClient(unittest.TestCase):
+    def setUp(self):
+        self.client = ProviderClient(circuit_breaker=CircuitBreaker(failure_threshold=3), max_retries=3,
+                                     backoff_base=0.1, backoff_max=10)
+
+    def test_retries_transient_errors(self, mock_sleep):
+        """Test that 429 and 5xx responses are retried until the call succeeds."""
+        fn = MagicMock(side_effect=[
+            rate_limit_error(),
+            openai.error.APIError("Bad gateway", http_status=502),
+            "ok",
+        ])
+        self.assertEqual(self.client.call(fn, model="m"), "ok")
+        self.assertEqual(fn.call_count, 3)
+        fn.assert_called_with(model="m")
+
+    def test_honours_retry_after(self, mock_sleep):
+        """Test that the delay is at least what Retry-After asks for."""
+        fn = MagicMock(side_effect=[rate_limit_error(retry_after=7), "ok"])
+        self.client.call(fn)
+        self.assertGreaterEqual(max(call.args[0] for call in mock_sleep.call_args_list), 7)
+
+    def test_does_not_retry_client_errors(self, mock_sleep):
+        """Test that errors which will not go away are raised immediately."""
+        fn = MagicMock(side_effect=openai.error.InvalidRequestError("Bad input", param="input"))
+        with self.assertRaises(openai.error.InvalidRequestError):
+            self.client.call(fn)
+        self.assertEqual(fn.call_count, 1)
+
+        fn = MagicMock(side_effect=Exception("API connection failed"))
+        with self.assertRaises(Exception):
+            self.client.call(fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """Test that the last error is raised once the retries are used up."""
+        fn = MagicMock(side_effect=rate_limit_error())
+        with self.assertRaises(openai.error.RateLimitError):
+            self.client.call(fn)
+        self.assertEqual(fn.call_count, 4)
+
+    def test_server_errors_open_the_circuit(self, mock_sleep):
+        """Test that repeated 5xx responses open the circuit and later calls fail fast."""
+        fn = MagicMock(side_effect=openai.error.ServiceUnavailableError("Unavailable", http_status=503))
+        with self.assertRaises(CircuitOpenError):
+            self.client.call(fn)
+        self.assertEqual(fn.call_count, 3)
+        with self.assertRaises(CircuitOpenError):
+            self.client.call(fn)
+        self.assertEqual(fn.call_count, 3)
+
+
+class TestAsyncProviderClient(unittest.IsolatedAsyncioTestCase):
+    async def test_acall_retries(self):
+        """Test that the async path retries transient errors too."""
+        client = ProviderClient(max_retries=2, backoff_base=0.001, backoff_max=0.01)
+        calls = []
+
+        async def fn(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise rate_limit_error()
+            return "ok"
+
+        self.assertEqual(await client.acall(fn, tokens=10, input=["a"]), "ok")
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
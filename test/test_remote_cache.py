@@ -0,0 +1,229 @@
+import json
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+from modules.config import Config
+from modules.services import EmbeddingCache
+from modules.storage import MemoryStore, RedisStore, RemoteStoreError, VectorStore
+from modules.storage.remote import _read_reply
+from modules.template import EmbeddingRecord
+from main import EmbeddingService
+
+DEFINITION = json.dumps({
+    "collection_name": "test_collection",
+    "partition_name": "test_partition",
+    "description": "Test collection description",
+    "dimension": 3,
+    "metric_type": "L2"
+})
+
+
+class CountingStore(MemoryStore):
+    """A MemoryStore that records its round trips."""
+
+    def __init__(self):
+        super().__init__()
+        self.lookups = []
+
+    def get_many(self, keys, ttl=None):
+        self.lookups.append(list(keys))
+        return super().get_many(keys, ttl)
+
+
+class FailingStore(MemoryStore):
+    """A remote tier that cannot be reached."""
+
+    def get_many(self, keys, ttl=None):
+        raise RemoteStoreError("connection refused")
+
+    def set_many(self, items, ttl=None):
+        raise RemoteStoreError("connection refused")
+
+
+class TestRemoteTier(unittest.TestCase):
+    def setUp(self):
+        self.dirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        self.remote = CountingStore()
+        self.record = EmbeddingRecord(
+            DEFINITION, [0.1, 0.2, 0.3], chunks=[{"text": "a"}, {"text": "b"}],
+            chunk_embeddings=[[0.4, 0.5, 0.6], [0.7, 0.8, 0.9]], document_embedding=[0.5, 0.5, 0.5],
+        )
+
+    def tearDown(self):
+        for directory in self.dirs:
+            shutil.rmtree(directory)
+
+    def _replica(self, index, remote=None):
+        return EmbeddingCache(store=VectorStore(self.dirs[index]), remote=remote or self.remote)
+
+    def test_other_replica_is_served_from_the_remote_tier(self):
+        """Test that a record stored by one replica is a remote hit on another, then a local one."""
+        first, second = self._replica(0), self._replica(1)
+        first.put("key", self.record)
+        first.flush()
+
+        record = second.get("key")
+        self.assertEqual(record.definition, DEFINITION)
+        np.testing.assert_allclose(record.matrix, self.record.to_matrix())
+        self.assertEqual(record.chunks, self.record.chunks)
+        self.assertEqual(second.stats()["remote_hits"], 1)
+
+        second.get("key")
+        self.assertEqual(second.stats()["memory_hits"], 1)
+        # The hit was also copied to the replica's disk tier
+        self.assertIn("key", EmbeddingCache(store=VectorStore(self.dirs[1]), remote=MemoryStore()))
+        self.assertEqual(len(self.remote.lookups), 1)
+
+    def test_local_misses_are_fetched_in_one_round_trip(self):
+        """Test that `get_many` asks the remote tier only for the local misses, all at once."""
+        first, second = self._replica(0), self._replica(1)
+        for key in ("a", "b"):
+            first.put(key, self.record)
+        first.flush()
+        second.put("c", self.record)
+
+        found = second.get_many(["a", "b", "c", "d"])
+        self.assertEqual(sorted(found), ["a", "b", "c"])
+        self.assertEqual(self.remote.lookups, [["a", "b", "d"]])
+        stats = second.stats()
+        self.assertEqual((stats["memory_hits"], stats["remote_hits"], stats["misses"]), (1, 2, 1))
+
+    def test_definition_updates_reach_the_remote_tier(self):
+        """Test that replacing the labels of a record also replaces them for other replicas."""
+        first = self._replica(0)
+        first.put("key", self.record)
+        first.update_definition("key", '{"collection_name": "enriched"}')
+        first.flush()
+        self.assertEqual(self._replica(1).get("key").definition, '{"collection_name": "enriched"}')
+
+    def test_unreachable_remote_is_a_miss(self):
+        """Test that remote failures neither fail lookups nor delay writes."""
+        cache = self._replica(0, FailingStore())
+        cache.put("key", self.record)
+        cache.flush()
+        self.assertEqual(cache._remote_writer.failed, 1)
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_compact_encoding(self):
+        """Test that float16 values are smaller and decode close to the original vectors."""
+        matrix, metadata = EmbeddingCache._to_stored(self.record)
+        full = EmbeddingCache._to_remote(matrix, metadata)
+        with patch.object(Config, "REMOTE_CACHE_ENCODING", "float16"):
+            half = EmbeddingCache._to_remote(matrix, metadata)
+        self.assertLess(len(half), len(full))
+        vectors, decoded = EmbeddingCache._from_remote(half)
+        np.testing.assert_allclose(vectors, matrix, atol=1e-3)
+        self.assertEqual(decoded, metadata)
+
+    def test_memory_store_expires_unread_entries(self):
+        """Test that entries expire after the TTL unless they are read again."""
+        store = MemoryStore()
+        store.set_many([("a", b"1"), ("b", b"2")], ttl=0.2)
+        time.sleep(0.12)
+        self.assertEqual(store.get_many(["a"], ttl=0.2), [b"1"])
+        time.sleep(0.12)
+        self.assertEqual(store.get_many(["a", "b"]), [b"1", None])
+
+    def test_service_consults_the_remote_tier(self):
+        """Test that a document embedded by one server is not labeled or embedded again by another."""
+        services = []
+        for directory in self.dirs:
+            service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(directory), remote=self.remote))
+            service.labeler.create_definition_from_text = MagicMock(return_value=DEFINITION)
+            service.embedder.get_embeddings = MagicMock(return_value=[[0.1, 0.2, 0.3]])
+            services.append(service)
+
+        key, record, cached = services[0].embed_document(b"A short story.")
+        self.assertFalse(cached)
+        services[0].close()
+        other_key, other_record, cached = services[1].embed_document(b"A short story.")
+        self.assertTrue(cached)
+        self.assertEqual(other_key, key)
+        np.testing.assert_allclose(other_record.to_matrix(), record.to_matrix())
+        services[1].labeler.create_definition_from_text.assert_not_called()
+        services[1].close()
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    """A minimal server speaking enough of the Redis protocol for RedisStore."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RESPHandler)
+        self.values = {}
+        self.connections = 0
+        self.commands = []
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        while True:
+            try:
+                command = _read_reply(self.rfile)
+            except RemoteStoreError:
+                return
+            server.commands.append(command[0].decode())
+            self.wfile.write(self._reply(server.values, command))
+
+    @staticmethod
+    def _reply(values, command):
+        name = command[0].decode().upper()
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "SET":
+            values[command[1]] = command[2]
+            return b"+OK\r\n"
+        if name == "GET":
+            value = values.get(command[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == "PEXPIRE":
+            return b":1\r\n" if command[1] in values else b":0\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+class TestRedisStore(unittest.TestCase):
+    def setUp(self):
+        self.server = RESPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.store = RedisStore(f"redis://127.0.0.1:{self.server.server_address[1]}", pool_size=2, timeout=2,
+                                prefix="test:")
+
+    def tearDown(self):
+        self.store.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_pipelined_reads_and_writes(self):
+        """Test that values round-trip through pooled connections, with keys prefixed and TTLs refreshed."""
+        self.store.set_many([("a", b"\x00binary\r\n"), ("b", b"2")], ttl=60)
+        self.assertEqual(self.store.get_many(["a", "missing", "b"], ttl=60), [b"\x00binary\r\n", None, b"2"])
+        self.assertEqual(self.store.get_many(["b"]), [b"2"])
+        self.assertEqual(sorted(self.server.values), [b"test:a", b"test:b"])
+        self.assertEqual(self.server.commands.count("PEXPIRE"), 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_errors(self):
+        """Test that error replies and unreachable servers raise RemoteStoreError."""
+        with self.assertRaises(RemoteStoreError):
+            self.store.execute([("FLUSHALL",)])
+        self.assertEqual(self.store.execute([("PING",)]), ["PONG"])
+
+        port = self.server.server_address[1]
+        self.server.shutdown()
+        self.server.server_close()
+        self.store.close()
+        with self.assertRaises(RemoteStoreError):
+            RedisStore(f"redis://127.0.0.1:{port}", timeout=1).get_many(["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,56 +1,426 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 import grpc
+import numpy as np
 from concurrent import futures
+from unittest.mock import MagicMock, patch
+from modules.config import Config
 from modules.proto.embedding import embedding_buffer_pb2, embedding_buffer_pb2_grpc
-from modules.services import Labeler, EmbeddingGenerator
+from modules.services import Labeler, EmbeddingGenerator, EmbeddingCache
+from modules.services.chunker import TextChunker
+from modules.services.postprocess import EmbeddingPostProcessor
+from modules.storage import VectorStore
+from modules.template import EmbeddingRecord
+from modules.template.binary_template import decode_vectors
 from main import EmbeddingService
+from client import ChannelPool, embed_stream
+
+DEFINITION = json.dumps({
+    "collection_name": "test_collection",
+    "partition_name": "test_partition",
+    "description": "Test collection description",
+    "dimension": 3,
+    "metric_type": "L2"
+})
 
 class MockLabeler(Labeler):
-    def create_definition(self, file_path):
-        return '''
-        {
-            "collection_name": "test_collection",
-            "partition_name": "test_partition",
-            "description": "Test collection description",
-            "dimension": 128,
-            "metric_type": "L2"
-        }
-        '''
+    def create_definition_from_text(self, input_text):
+        return DEFINITION
 
 class MockEmbeddingGenerator(EmbeddingGenerator):
-    def get_embedding(self, definition_json):
-        return [0.1, 0.2, 0.3, 0.4, 0.5]
+    def get_embeddings(self, texts):
+        return [[0.1, 0.2, 0.3, 0.4, 0.5] for _ in texts]
 
 class TestEmbeddingService(unittest.TestCase):
     def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
         self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=1))
-        self.service = EmbeddingService()
-        self.service.labeler = MockLabeler()
-        self.service.embedder = MockEmbeddingGenerator()
+        self.service = EmbeddingService(
+            cache=EmbeddingCache(store=VectorStore(self.store_dir)),
+            labeler=MockLabeler(),
+            embedder=MockEmbeddingGenerator(),
+        )
         embedding_buffer_pb2_grpc.add_EmbeddingServiceServicer_to_server(self.service, self.server)
-        self.server.add_insecure_port('[::]:50051')
+        port = self.server.add_insecure_port('localhost:0')
         self.server.start()
-        self.fake_channel = grpc.insecure_channel('localhost:50051')
+        self.fake_channel = grpc.insecure_channel(f'localhost:{port}')
 
     def test_stream_embedding(self):
         stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(self.fake_channel)
-        request = embedding_buffer_pb2.EmbeddingRequest(file_path="mock_file.txt")
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="mock_file.txt", file_stream=b"Once upon a time.")
         responses = stub.StreamEmbedding(request)
         response_list = list(responses)
         self.assertEqual(len(response_list), 1)
         response = response_list[0]
-        
+
+        template = json.loads(response.json_stream)
+        self.assertIn("definition", template)
+        self.assertIn("embeddings", template)
+
         # Use assertAlmostEqual for each element
         expected_embedding = [0.1, 0.2, 0.3, 0.4, 0.5]
-        for actual, expected in zip(response.embedding, expected_embedding):
+        for actual, expected in zip(template["embeddings"], expected_embedding):
             self.assertAlmostEqual(actual, expected, places=7)
 
-        template = response.json_template
-        self.assertIn("definition", template)
-        self.assertIn("embeddings", template)
+    def test_stream_embedding_requires_file_stream(self):
+        stub = embedding_buffer_pb2_grpc.EmbeddingServiceStub(self.fake_channel)
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="mock_file.txt")
+        with self.assertRaises(grpc.RpcError) as raised:
+            list(stub.StreamEmbedding(request))
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.INTERNAL)
+        self.assertIn("File stream is empty", raised.exception.details())
 
     def tearDown(self):
+        self.fake_channel.close()
         self.server.stop(None)
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+class TestUploadEmbedding(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+        self.service.labeler.create_definition_from_text = MagicMock(return_value=DEFINITION)
+        self.service.embedder.get_embeddings = MagicMock(return_value=[[0.1, 0.2, 0.3]])
+        self.context = MagicMock()
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def _chunks(self, content, chunk_size):
+        pieces = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        yield embedding_buffer_pb2.Chunk(file_name="story.txt", data=pieces[0])
+        for piece in pieces[1:]:
+            yield embedding_buffer_pb2.Chunk(data=piece)
+
+    def test_upload_decodes_across_chunk_boundaries(self):
+        content = "Café au lait, crème brûlée.".encode("utf-8")
+        responses = list(self.service.UploadEmbedding(self._chunks(content, 3), self.context))
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(json.loads(responses[0].json_stream)["embeddings"], [0.1, 0.2, 0.3])
+        self.service.labeler.create_definition_from_text.assert_called_once_with(content.decode("utf-8"))
+
+    def test_upload_shares_cache_with_stream_embedding(self):
+        content = b"Once upon a time."
+        list(self.service.UploadEmbedding(self._chunks(content, 4), self.context))
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name="other_name.txt", file_stream=content)
+        responses = list(self.service.StreamEmbedding(request, self.context))
+        self.assertEqual(len(responses), 1)
+        self.service.labeler.create_definition_from_text.assert_called_once()
+
+    def test_upload_with_chunking(self):
+        self.service.chunker = TextChunker(window=4, overlap=1)
+        self.service.embedder.get_embeddings = MagicMock(side_effect=lambda texts: [[1.0, 0.0, 0.0]] * len(texts))
+        content = b"one two three four five six seven"
+        responses = list(self.service.UploadEmbedding(self._chunks(content, 5), self.context))
+        result = json.loads(responses[0].json_stream)
+        self.assertEqual(len(result["chunks"]), 2)
+        self.assertEqual(result["chunks"][0]["embedding"], [1.0, 0.0, 0.0])
+        self.assertEqual(result["document_embedding"], [1.0, 0.0, 0.0])
+        self.assertEqual(self.service.embedder.get_embeddings.call_count, 1)
+
+        cached = self.service.cache.get(self.service._get_cache_key(content))
+        self.assertEqual(json.loads(cached.to_json()), result)
+
+    def test_upload_with_binary_vectors(self):
+        self.service.chunker = TextChunker(window=4, overlap=1)
+        self.service.embedder.get_embeddings = MagicMock(side_effect=lambda texts: [[1.0, 0.0, 0.0]] * len(texts))
+        content = b"one two three four five six seven"
+        chunks = [embedding_buffer_pb2.Chunk(file_name="story.txt", data=content, encoding=embedding_buffer_pb2.FLOAT32)]
+        response = list(self.service.UploadEmbedding(iter(chunks), self.context))[0]
+        self.assertEqual(response.json_stream, "")
+        self.assertEqual(response.definition.collection_name, "test_collection")
+        self.assertEqual([chunk.tokens for chunk in response.chunks], [4, 4])
+        self.assertTrue(response.pooled)
+        np.testing.assert_array_equal(decode_vectors(response.vectors), [[1.0, 0.0, 0.0]] * 4)
+
+        # A new service reads the record back from the store and sends the same bytes.
+        reopened = EmbeddingService(
+            cache=EmbeddingCache(store=VectorStore(self.store_dir)),
+            labeler=self.service.labeler, embedder=self.service.embedder,
+        )
+        reopened.chunker = self.service.chunker
+        cached = list(reopened.UploadEmbedding(iter(chunks), self.context))[0]
+        self.assertEqual(cached.vectors.data, response.vectors.data)
+        self.assertEqual(self.service.embedder.get_embeddings.call_count, 1)
+
+    def test_upload_with_reduced_dimension(self):
+        content = b"Once upon a time."
+        full_key = self.service._get_cache_key(content)
+        self.service.postprocessor = EmbeddingPostProcessor(dimension=2, reduction="truncate")
+        self.service.embedder.get_embeddings = MagicMock(side_effect=lambda texts: [[3.0, 4.0, 5.0]] * len(texts))
+        responses = list(self.service.UploadEmbedding(self._chunks(content, 4), self.context))
+        np.testing.assert_allclose(json.loads(responses[0].json_stream)["embeddings"], [0.6, 0.8])
+        # Reduced vectors are cached apart from full-size ones
+        self.assertNotEqual(self.service._get_cache_key(content), full_key)
+        self.assertEqual(len(self.service.cache.get(self.service._get_cache_key(content)).embedding), 2)
+
+        request = embedding_buffer_pb2.SearchRequest(query_text="time", top_k=1)
+        response = self.service.Search(request, self.context)
+        self.assertAlmostEqual(response.hits[0].score, 1.0, places=6)
+
+    def test_search(self):
+        self.service.embedder.get_embeddings = MagicMock(side_effect=lambda texts: [
+            [1.0, 0.0, 0.0] if "storm" in text else [0.0, 1.0, 0.0] for text in texts
+        ])
+        self.service.labeler.create_definition_from_text = MagicMock(side_effect=lambda text: DEFINITION.replace(
+            "Test collection description", text
+        ))
+        for content in (b"A storm at sea.", b"A quiet meadow."):
+            list(self.service.UploadEmbedding(self._chunks(content, 8), self.context))
+
+        request = embedding_buffer_pb2.SearchRequest(query_text="storm", top_k=1)
+        response = self.service.Search(request, self.context)
+        self.assertEqual(len(response.hits), 1)
+        self.assertEqual(response.hits[0].definition.description, "A storm at sea.")
+        self.assertAlmostEqual(response.hits[0].score, 1.0, places=6)
+
+        request = embedding_buffer_pb2.SearchRequest(query_vector=[0.0, 2.0, 0.0], metric=embedding_buffer_pb2.L2)
+        response = self.service.Search(request, self.context)
+        self.assertEqual([hit.definition.description for hit in response.hits], ["A quiet meadow.", "A storm at sea."])
+        self.assertAlmostEqual(response.hits[0].score, 1.0, places=6)
+
+    def test_search_requires_a_query(self):
+        with self.assertRaises(ValueError):
+            self.service.Search(embedding_buffer_pb2.SearchRequest(), self.context)
+        self.context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+
+    def test_search_rejects_a_query_of_another_dimension(self):
+        self.service.cache.put("key", EmbeddingRecord(DEFINITION, [0.1, 0.2, 0.3]))
+        with self.assertRaises(ValueError):
+            self.service.Search(embedding_buffer_pb2.SearchRequest(query_vector=[1.0, 0.0]), self.context)
+        self.context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+
+    def test_upload_rejects_invalid_utf8(self):
+        with self.assertRaises(ValueError):
+            list(self.service.UploadEmbedding(self._chunks(b"\xff\xfe", 1), self.context))
+        self.context.set_code.assert_called_with(grpc.StatusCode.INTERNAL)
+
+
+class TestIncrementalUpdates(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+        self.service.incremental = True
+        self.service.chunker = TextChunker(window=40, overlap=8, boundaries="content")
+        self.service.labeler.create_definition_from_text = MagicMock(return_value=DEFINITION)
+        self.embedded = []
+
+        def get_embeddings(texts):
+            self.embedded.append(texts)
+            return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+        self.service.embedder.get_embeddings = MagicMock(side_effect=get_embeddings)
+        self.context = MagicMock()
+        self.words = [f"word{i}" for i in range(600)]
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    def _embed(self, words, file_name="story.txt"):
+        request = embedding_buffer_pb2.EmbeddingRequest(file_name=file_name, file_stream=" ".join(words).encode())
+        return json.loads(list(self.service.StreamEmbedding(request, self.context))[0].json_stream)
+
+    def test_small_edit_reembeds_changed_chunks_only(self):
+        first = self._embed(self.words)
+        result = self._embed(self.words[:300] + ["inserted"] + self.words[300:])
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 1)
+        self.assertEqual(len(self.embedded), 2)
+        self.assertLessEqual(len(self.embedded[1]), 3)
+
+        # The stored vectors match what a full pass over the edited document produces
+        edited = " ".join(self.words[:300] + ["inserted"] + self.words[300:])
+        expected = [[float(len(chunk["text"])), 1.0, 0.5] for chunk in self.service.chunker.split(edited)]
+        np.testing.assert_allclose([chunk["embedding"] for chunk in result["chunks"]], expected, rtol=1e-6)
+        self.assertEqual(result["embeddings"], first["embeddings"])
+
+    def test_large_edit_is_labeled_again(self):
+        self._embed(self.words)
+        self._embed(self.words[:100] + [f"new{i}" for i in range(500)])
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 2)
+        # The new definition is embedded with the changed chunks
+        self.assertEqual(self.embedded[1][0], DEFINITION)
+
+    def test_other_documents_are_not_reused(self):
+        self._embed(self.words)
+        self._embed(self.words + ["end"], file_name="other.txt")
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 2)
+        self.assertEqual(len(self.embedded[1]), len(self.embedded[0]))
+
+    def test_incremental_updates_imply_content_boundaries(self):
+        settings = dict(INCREMENTAL_UPDATES=True, CHUNKING_ENABLED=True, CHUNK_WINDOW_TOKENS=40,
+                        CHUNK_OVERLAP_TOKENS=8, CHUNK_BOUNDARIES="")
+        with patch.multiple(Config, **settings):
+            service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+            with self.assertRaises(ValueError):
+                with patch.object(Config, "CHUNK_BOUNDARIES", "fixed"):
+                    Config.validate()
+        service.labeler.create_definition_from_text = self.service.labeler.create_definition_from_text
+        service.embedder.get_embeddings = self.service.embedder.get_embeddings
+        self.service.close()
+        self.service = service
+        self.assertEqual(service.chunker.boundaries, "content")
+
+        # An insertion near the start leaves the chunks after it as they were
+        first = self._embed(self.words)
+        self._embed(self.words[:5] + ["inserted"] + self.words[5:])
+        self.assertGreater(len(first["chunks"]), 10)
+        self.assertLessEqual(len(self.embedded[1]), 3)
+
+
+class TestPipelinedEmbedding(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+        self.service.pipeline = True
+        self.label_released = threading.Event()
+
+        def slow_label(text):
+            self.label_released.wait(5)
+            return DEFINITION
+
+        self.service.labeler.create_definition_from_text = MagicMock(side_effect=slow_label)
+        self.service.embedder.get_embeddings = MagicMock(side_effect=lambda texts: [[1.0, 0.0, 0.0]] * len(texts))
+        self.request = embedding_buffer_pb2.EmbeddingRequest(file_name="story.txt", file_stream=b"Once upon a time.")
+
+    def tearDown(self):
+        self.label_released.set()
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    def test_embedding_streams_before_definition(self):
+        responses = self.service.StreamEmbedding(self.request, MagicMock())
+        first = next(responses)
+        self.assertEqual(first.stage, "embedding")
+        self.assertEqual(json.loads(first.json_stream), {"embeddings": [1.0, 0.0, 0.0]})
+        self.service.embedder.get_embeddings.assert_called_once_with(["Once upon a time."])
+
+        self.label_released.set()
+        second = next(responses)
+        self.assertEqual(second.stage, "definition")
+        self.assertEqual(json.loads(second.json_stream)["definition"]["collection_name"], "test_collection")
+        self.assertEqual(list(responses), [])
+
+        cached = list(self.service.StreamEmbedding(self.request, MagicMock()))
+        self.assertEqual([response.stage for response in cached], ["complete"])
+        result = json.loads(cached[0].json_stream)
+        self.assertEqual(result["embeddings"], [1.0, 0.0, 0.0])
+        self.assertEqual(result["definition"]["collection_name"], "test_collection")
+
+    def test_pipelined_chunks_are_pooled(self):
+        self.label_released.set()
+        self.service.chunker = TextChunker(window=2, overlap=0)
+        responses = list(self.service.StreamEmbedding(self.request, MagicMock()))
+        embedding = json.loads(next(r for r in responses if r.stage == "embedding").json_stream)
+        self.assertEqual(len(embedding["chunks"]), 3)
+        self.assertEqual(embedding["embeddings"], [1.0, 0.0, 0.0])
+        texts = self.service.embedder.get_embeddings.call_args[0][0]
+        self.assertEqual(len(texts), 3)
+        self.assertNotIn(DEFINITION, texts)
+
+    def test_pipeline_uses_separate_cache_entries(self):
+        key = self.service._get_cache_key(b"Once upon a time.")
+        self.service.pipeline = False
+        self.assertNotEqual(key, self.service._get_cache_key(b"Once upon a time."))
+
+
+class TestEmbedStream(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.in_flight, self.peak = 0, 0
+        self.lock = threading.Lock()
+        self.service = EmbeddingService(
+            cache=EmbeddingCache(store=VectorStore(self.store_dir)),
+            labeler=MockLabeler(),
+            embedder=MockEmbeddingGenerator(),
+        )
+        self.service.labeler.create_definition_from_text = MagicMock(side_effect=self._label)
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        embedding_buffer_pb2_grpc.add_EmbeddingServiceServicer_to_server(self.service, self.server)
+        port = self.server.add_insecure_port('localhost:0')
+        self.server.start()
+        self.pool = ChannelPool(f'localhost:{port}', size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop(None)
+        self.service.close()
+        shutil.rmtree(self.store_dir)
+
+    def _label(self, text):
+        """Label slowly, tracking how many documents are labeled at once; "slow" documents take longer."""
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(0.3 if text.startswith("slow") else 0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return DEFINITION
+
+    def _documents(self, count):
+        return [(str(i), f"{i}.txt", f"Story {i}".encode()) for i in range(count)]
+
+    def test_documents_complete_out_of_order(self):
+        documents = [("slow", "slow.txt", b"slow story")] + self._documents(5)
+        responses = list(embed_stream(documents, pool=self.pool))
+        self.assertEqual(sorted(response.id for response in responses), sorted(doc[0] for doc in documents))
+        self.assertTrue(all(response.last and not response.error for response in responses))
+        # The slow first document does not hold back the ones sent after it
+        self.assertEqual(responses[-1].id, "slow")
+        self.assertEqual(json.loads(responses[0].response.json_stream)["embeddings"], [0.1, 0.2, 0.3, 0.4, 0.5])
+
+    def test_failed_document_does_not_end_the_stream(self):
+        documents = self._documents(2) + [("empty", "empty.txt", b"")] + self._documents(4)[2:]
+        responses = {response.id: response for response in embed_stream(documents, pool=self.pool)}
+        self.assertEqual(len(responses), 5)
+        self.assertIn("File stream is empty", responses["empty"].error)
+        self.assertFalse(responses["empty"].HasField("response"))
+        self.assertEqual(responses["3"].error, "")
+
+    def test_documents_in_flight_are_bounded(self):
+        with patch("modules.config.Config.STREAM_MAX_IN_FLIGHT", 2):
+            responses = list(embed_stream(self._documents(8), pool=self.pool))
+        self.assertEqual(len(responses), 8)
+        self.assertEqual(self.peak, 2)
+
+    def test_pipelined_halves(self):
+        self.service.pipeline = True
+        responses = list(embed_stream(self._documents(3), pool=self.pool))
+        self.assertEqual(len(responses), 6)
+        for doc_id in ("0", "1", "2"):
+            halves = [response for response in responses if response.id == doc_id]
+            self.assertEqual(sorted(response.response.stage for response in halves), ["definition", "embedding"])
+            self.assertEqual([response.last for response in halves], [False, True])
+
+    def test_identical_documents_are_processed_once(self):
+        """Test that concurrent requests for the same new content share one labeling and embedding."""
+        documents = [(str(i), f"{i}.txt", b"slow and identical") for i in range(5)]
+        responses = list(embed_stream(documents, pool=self.pool))
+        self.assertEqual(sorted(response.id for response in responses), ["0", "1", "2", "3", "4"])
+        self.assertTrue(all(response.last and not response.error for response in responses))
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 1)
+        self.assertEqual(self.service.flights.coalesced, 4)
+
+    def test_identical_documents_share_an_error(self):
+        """Test that a failure reaches every request waiting for the same content without a retry each."""
+        self.service.labeler.create_definition_from_text.side_effect = lambda text: time.sleep(0.3) or 1 / 0
+        documents = [(str(i), f"{i}.txt", b"identical") for i in range(3)]
+        responses = list(embed_stream(documents, pool=self.pool))
+        self.assertEqual(len(responses), 3)
+        self.assertTrue(all("division by zero" in response.error for response in responses))
+        self.assertEqual(self.service.labeler.create_definition_from_text.call_count, 1)
+        self.assertEqual(self.service.flights.in_flight(), 0)
+
+    def test_channel_pool_round_robin(self):
+        channels = [self.pool.channel() for _ in range(4)]
+        self.assertIsNot(channels[0], channels[1])
+        self.assertIs(channels[0], channels[2])
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
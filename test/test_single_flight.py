@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import unittest
+from concurrent import futures
+from modules.services.single_flight import AsyncSingleFlight, FlightAbandoned, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+
+    def test_only_the_first_caller_leads(self):
+        """Test that callers joining an in-flight key wait on the leader's future."""
+        flight, leading = self.flights.join("key")
+        follower, following_leads = self.flights.join("key")
+        self.assertTrue(leading)
+        self.assertFalse(following_leads)
+        self.assertIs(follower, flight)
+        self.assertEqual(self.flights.coalesced, 1)
+
+        self.flights.finish("key", flight, "result")
+        self.assertEqual(follower.result(timeout=1), "result")
+        self.assertEqual(self.flights.in_flight(), 0)
+        # A finished key starts a new flight
+        self.assertTrue(self.flights.join("key")[1])
+
+    def test_errors_are_shared(self):
+        """Test that waiting callers get the leader's error."""
+        flight, _ = self.flights.join("key")
+        follower, _ = self.flights.join("key")
+        self.flights.finish("key", flight, error=ValueError("provider down"))
+        with self.assertRaises(ValueError):
+            follower.result(timeout=1)
+
+    def test_abandoned_flight_can_be_taken_over(self):
+        """Test that abandoning a flight wakes the waiters and frees the key for a new leader."""
+        flight, _ = self.flights.join("key")
+        follower, _ = self.flights.join("key")
+        self.flights.abandon("key", flight)
+        with self.assertRaises(FlightAbandoned):
+            follower.result(timeout=1)
+        self.assertTrue(self.flights.join("key")[1])
+
+    def test_finishing_twice_leaves_the_next_flight_alone(self):
+        """Test that a stale finish does not end a newer flight of the same key."""
+        flight, _ = self.flights.join("key")
+        self.flights.finish("key", flight, "first")
+        newer, _ = self.flights.join("key")
+        self.flights.finish("key", flight, error=ValueError("late"))
+        self.assertFalse(newer.done())
+        self.assertEqual(self.flights.in_flight(), 1)
+
+    def test_concurrent_callers_compute_once(self):
+        """Test that threads asking for the same key at once run the computation once."""
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def compute():
+            barrier.wait()
+            flight, leading = self.flights.join("key")
+            if not leading:
+                return flight.result(timeout=5)
+            calls.append(1)
+            threading.Event().wait(0.1)
+            self.flights.finish("key", flight, "result")
+            return "result"
+
+        with futures.ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: compute(), range(8)))
+        self.assertEqual(results, ["result"] * 8)
+        self.assertEqual(len(calls), 1)
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_waiters_await_the_leader(self):
+        """Test that coroutines joining an in-flight key await the leader's result."""
+        flights = AsyncSingleFlight()
+        flight, _ = flights.join("key")
+        waiter = asyncio.ensure_future(asyncio.shield(flights.join("key")[0]))
+        await asyncio.sleep(0)
+        flights.finish("key", flight, "result")
+        self.assertEqual(await waiter, "result")
+
+    async def test_unawaited_error_is_not_logged(self):
+        """Test that an error nobody waited for does not trigger asyncio's unretrieved-exception log."""
+        flights = AsyncSingleFlight()
+        flight, _ = flights.join("key")
+        with self.assertNoLogs("asyncio"):
+            flights.finish("key", flight, error=ValueError("provider down"))
+            del flight
+            await asyncio.sleep(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from modules.config import Config
+from modules.proto.embedding.embedding_buffer_pb2 import HealthRequest, HealthResponse
+from modules.services.cache import EmbeddingCache
+from modules.services.embedding_service import EmbeddingService
+from modules.services.http_pool import AsyncHTTPPool
+from modules.services.lazy import LazyModule
+from modules.services.metrics import process_age
+from modules.storage import VectorStore
+from modules.template import EmbeddingRecord
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestLazyModule(unittest.TestCase):
+    def setUp(self):
+        self.module = types.ModuleType("lazy_test_module")
+        self.module.value = 1
+        sys.modules["lazy_test_module"] = self.module
+        self.loads = []
+
+    def tearDown(self):
+        del sys.modules["lazy_test_module"]
+
+    def test_imports_on_first_use(self):
+        """Test that the module is imported once, on the first attribute access, and that writes reach it."""
+        lazy = LazyModule("lazy_test_module", on_load=self.loads.append)
+        self.assertFalse(lazy.loaded)
+        self.assertEqual(lazy.value, 1)
+        self.assertEqual(self.loads, [self.module])
+        lazy.value = 2
+        self.assertEqual(self.module.value, 2)
+        self.assertIs(lazy.load(), self.module)
+        self.assertEqual(len(self.loads), 1)
+
+    def test_server_import_skips_the_provider_client(self):
+        """Test that importing the server does not import openai or aiohttp."""
+        script = "import sys, main; print('openai' in sys.modules, 'aiohttp' in sys.modules)"
+        env = dict(os.environ, OPENAI_API_KEY="x")
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True,
+                                check=True).stdout
+        self.assertEqual(output.split(), ["False", "False"])
+
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.env = patch.multiple(Config, LABEL_MODE="local", EMBEDDING_BACKEND="local")
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.store_dir)
+
+    def test_warm_up_builds_the_search_index(self):
+        """Test that warming up indexes the stored vectors before the first search."""
+        EmbeddingCache(store=VectorStore(self.store_dir)).put("key", EmbeddingRecord("{}", [1.0, 0.0]))
+        service = EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+        self.assertIsNone(service.cache._index)
+        service.serving = False
+        self.assertEqual(service.Health(HealthRequest(), None).status, HealthResponse.NOT_SERVING)
+
+        service.warm_up()
+        self.assertIn("key", service.cache._index)
+        service.close()
+
+    def test_injected_backends_need_no_api_key(self):
+        """Test that the API key is only required when the service creates provider backends itself."""
+        with patch.multiple(Config, OPENAI_API_KEY=None, LABEL_MODE="llm", EMBEDDING_BACKEND="openai"):
+            with self.assertRaises(ValueError):
+                EmbeddingService(cache=EmbeddingCache(store=VectorStore(self.store_dir)))
+            service = EmbeddingService(
+                cache=EmbeddingCache(store=VectorStore(self.store_dir)), labeler=object(), embedder=object()
+            )
+        self.assertIsNotNone(service.labeler)
+
+    def test_process_age(self):
+        """Test that the process age covers the time since the interpreter started."""
+        age = process_age()
+        if age is None:
+            self.skipTest("/proc is not available")
+        self.assertGreater(age, 0.0)
+
+
+class TestConnectionWarmUp(unittest.TestCase):
+    def setUp(self):
+        self.clients = set()
+        clients = self.clients
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                clients.add(self.client_address)
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_opens_pooled_connections(self):
+        """Test that the pool opens one connection per concurrent warm-up request, up to its size."""
+        async def warm_up():
+            pool = AsyncHTTPPool(max_connections=3)
+            try:
+                await pool.warm_up(f"http://127.0.0.1:{self.server.server_port}/v1", 5)
+            finally:
+                await pool.close()
+
+        asyncio.run(warm_up())
+        self.assertEqual(len(self.clients), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import numpy as np
+from modules.storage import VectorIndex
+
+
+class TestVectorIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((200, 16)).astype(np.float32)
+        self.index = VectorIndex(ivf_threshold=10000)
+        for i, vector in enumerate(self.vectors):
+            self.index.add(f"doc-{i}", vector)
+        self.query = rng.standard_normal(16).astype(np.float32)
+
+    def test_brute_force_matches_numpy(self):
+        """Test that every metric ranks like a direct NumPy computation."""
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        expected = {
+            "cosine": np.argsort(-(normalized @ self.query)),
+            "ip": np.argsort(-(self.vectors @ self.query)),
+            "l2": np.argsort(np.linalg.norm(self.vectors - self.query, axis=1)),
+        }
+        for metric, order in expected.items():
+            hits = self.index.search(self.query, k=5, metric=metric)
+            self.assertEqual([key for key, _ in hits], [f"doc-{i}" for i in order[:5]], metric)
+
+        distance = self.index.search(self.query, k=1, metric="l2")[0][1]
+        self.assertAlmostEqual(distance, float(np.linalg.norm(self.vectors[order[0]] - self.query)), places=4)
+
+    def test_replace_and_remove(self):
+        """Test that a replaced key returns its new vector and a removed key is never returned."""
+        self.index.add("doc-0", self.query)
+        self.assertEqual(self.index.search(self.query, k=1)[0][0], "doc-0")
+        self.index.remove("doc-0")
+        self.assertNotIn("doc-0", [key for key, _ in self.index.search(self.query, k=200)])
+        self.assertEqual(len(self.index), 199)
+
+    def test_dimensions_are_kept_apart(self):
+        """Test that a query only matches vectors of its own dimension."""
+        self.index.add("small", [1.0, 0.0, 0.0])
+        self.assertEqual(self.index.search([1.0, 0.0, 0.0], k=5), [("small", 1.0)])
+        self.assertEqual(self.index.search([1.0, 0.0], k=5), [])
+        self.index.add("large", [1.0, 0.0, 0.0, 0.0])
+        self.assertEqual(self.index.dimensions(), [3, 4, 16])
+
+    def test_unknown_metric(self):
+        """Test that an unknown metric is rejected."""
+        with self.assertRaises(ValueError):
+            self.index.search(self.query, metric="hamming")
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        centers = rng.standard_normal((20, 32)).astype(np.float32) * 5
+        self.vectors = (centers[rng.integers(0, 20, 3000)] + rng.standard_normal((3000, 32))).astype(np.float32)
+        self.index = VectorIndex(ivf_threshold=1000, nprobe=4)
+        for i, vector in enumerate(self.vectors):
+            self.index.add(i, vector)
+        self.queries = self.vectors[rng.choice(3000, 20, replace=False)] + 0.1
+
+    def test_lists_are_trained_and_retrained(self):
+        """Test that the lists are trained at the threshold and retrained after doubling."""
+        partition = self.index._partitions[32]
+        self.assertIsNotNone(partition.centroids)
+        self.assertEqual(partition.trained_on, 2000)
+        self.assertEqual(len(partition.centroids), 44)
+
+    def test_recall_against_exact_search(self):
+        """Test that approximate search finds most of the exact top 10."""
+        found = 0
+        for query in self.queries:
+            exact = {key for key, _ in self.index.search(query, k=10, exact=True)}
+            approximate = {key for key, _ in self.index.search(query, k=10)}
+            found += len(exact & approximate)
+        self.assertGreater(found / (10 * len(self.queries)), 0.9)
+
+    def test_new_vectors_are_searchable(self):
+        """Test that a vector added after training is assigned to a list and found."""
+        self.index.add("new", self.vectors[0] * 3)
+        self.assertEqual(self.index.search(self.vectors[0] * 3, k=1, metric="l2")[0][0], "new")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from modules.storage import VectorStore, atomic_write
+from modules.storage.convert import convert_json_files
+
+
+def _put_many(store_dir, prefix, count):
+    """Write `count` vectors from a separate process."""
+    store = VectorStore(store_dir, max_shard_bytes=256, max_bytes=1_000_000)
+    for i in range(count):
+        store.put(f"{prefix}{i}", np.full(4, i, dtype=np.float32), {"writer": prefix})
+
+
+class TestVectorStore(unittest.TestCase):
+    def setUp(self):
+        """Create a store backed by a temporary directory."""
+        self.store_dir = tempfile.mkdtemp()
+        self.store = VectorStore(self.store_dir, max_shard_bytes=64, max_bytes=10_000)
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_put_and_get(self):
+        """Test that vectors round-trip as float32 rows with their metadata."""
+        self.store.put("a", [0.1, 0.2, 0.3], {"definition": "{}"})
+        vectors, metadata = self.store.get("a")
+        self.assertEqual(vectors.shape, (1, 3))
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_allclose(vectors[0], [0.1, 0.2, 0.3], rtol=1e-6)
+        self.assertEqual(metadata, {"definition": "{}"})
+        self.assertIsNone(self.store.get("missing"))
+
+    def test_reads_are_views(self):
+        """Test that reads are memory-mapped views and not copies."""
+        self.store.put("a", np.ones((2, 4)))
+        vectors, _ = self.store.get("a")
+        self.assertFalse(vectors.flags.owndata)
+        self.assertFalse(vectors.flags.writeable)
+
+    def test_shards_roll_over_and_reopen(self):
+        """Test that shards roll over and that a reopened store sees every entry."""
+        for i in range(5):
+            self.store.put(str(i), np.full(8, i, dtype=np.float32))
+        self.assertGreater(len([n for n in os.listdir(self.store_dir) if n.endswith(".f32")]), 1)
+
+        reopened = VectorStore(self.store_dir, max_shard_bytes=64, max_bytes=10_000)
+        self.assertEqual(reopened.keys(), ["0", "1", "2", "3", "4"])
+        np.testing.assert_array_equal(reopened.get("3")[0][0], np.full(8, 3))
+
+    def test_oldest_shards_are_evicted(self):
+        """Test that the store drops its oldest shards once over budget."""
+        store = VectorStore(self.store_dir, max_shard_bytes=32, max_bytes=64)
+        for i in range(4):
+            store.put(str(i), np.zeros(8))
+        self.assertLessEqual(store.total_bytes(), 64)
+        self.assertNotIn("0", store)
+        self.assertIn("3", store)
+        self.assertGreater(store.evictions, 0)
+
+    def test_refresh_moves_only_entries_due_for_eviction(self):
+        """Test that only entries in the oldest shard are moved, and that others skip the file lock."""
+        for i in range(3):
+            self.store.put(str(i), np.full(16, i, dtype=np.float32))
+        with patch.object(self.store, "_sync", wraps=self.store._sync) as sync:
+            self.store.refresh("1")
+            self.store.refresh("2")
+            sync.assert_not_called()
+            self.store.refresh("0")
+            sync.assert_called()
+        self.assertEqual(self.store.keys(), ["1", "2", "0"])
+        np.testing.assert_array_equal(self.store.get("0")[0][0], np.zeros(16))
+
+    def test_delete(self):
+        """Test that deleted entries stay deleted after reopening."""
+        self.store.put("a", [1.0])
+        self.store.delete("a")
+        self.assertNotIn("a", VectorStore(self.store_dir))
+
+    def test_stores_sharing_a_directory_see_each_other(self):
+        """Test that two stores on one directory interleave writes without overwriting each other."""
+        other = VectorStore(self.store_dir, max_shard_bytes=64, max_bytes=10_000)
+        for i in range(6):
+            (self.store if i % 2 else other).put(str(i), np.full(8, i, dtype=np.float32))
+
+        for store in (self.store, other):
+            for i in range(6):
+                np.testing.assert_array_equal(store.get(str(i))[0][0], np.full(8, i))
+        other.delete("3")
+        self.store.put("6", np.zeros(8))
+        self.assertNotIn("3", self.store)
+        self.assertEqual(VectorStore(self.store_dir).keys(), ["0", "1", "2", "4", "5", "6"])
+
+    def test_concurrent_processes(self):
+        """Test that processes writing to one store at the same time leave every entry intact."""
+        context = multiprocessing.get_context("fork")
+        writers = [context.Process(target=_put_many, args=(self.store_dir, prefix, 40)) for prefix in "ab"]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join(timeout=30)
+            self.assertEqual(writer.exitcode, 0)
+
+        store = VectorStore(self.store_dir)
+        self.assertEqual(len(store), 80)
+        for prefix in "ab":
+            for i in range(40):
+                vectors, metadata = store.get(f"{prefix}{i}")
+                np.testing.assert_array_equal(vectors[0], np.full(4, i))
+                self.assertEqual(metadata, {"writer": prefix})
+
+    def test_torn_index_line_is_skipped(self):
+        """Test that a line torn by an interrupted write does not hide the entries appended after it."""
+        self.store.put("a", [1.0])
+        with open(os.path.join(self.store_dir, "index.jsonl"), "a") as file:
+            file.write('{"key": "torn", "sha')
+        self.store.put("b", [2.0])
+        self.assertEqual(VectorStore(self.store_dir).keys(), ["a", "b"])
+
+    def test_atomic_write(self):
+        """Test that a failed atomic write leaves the previous file and no temporary file behind."""
+        path = os.path.join(self.store_dir, "output.json")
+        with atomic_write(path) as file:
+            file.write("first")
+        with self.assertRaises(RuntimeError):
+            with atomic_write(path) as file:
+                file.write("second")
+                raise RuntimeError("interrupted")
+        with open(path) as file:
+            self.assertEqual(file.read(), "first")
+        self.assertEqual([name for name in os.listdir(self.store_dir) if name.endswith(".tmp")], [])
+
+    def test_convert_json_files(self):
+        """Test converting a legacy pretty-printed JSON file."""
+        json_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(json_dir, "story_embedded.json"), "w") as file:
+                json.dump({"definition": {"collection_name": "c"}, "embeddings": [0.5, 0.25]}, file, indent=4)
+
+            keys = convert_json_files(json_dir, self.store)
+            self.assertEqual(keys, ["legacy:story"])
+            vectors, metadata = self.store.get("legacy:story")
+            np.testing.assert_array_equal(vectors[0], [0.5, 0.25])
+            self.assertEqual(json.loads(metadata["definition"]), {"collection_name": "c"})
+        finally:
+            shutil.rmtree(json_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()